@@ -23,8 +23,10 @@ import logging
 import os
 import socket
 import subprocess
+import threading
 import time
 from pathlib import Path
+from typing import Any, Callable, Optional, Set
 
 import bpy
 from bpy_extras.io_utils import ImportHelper
@@ -263,7 +265,73 @@ class DeleteRoomOperator(bpy.types.Operator):
         return {"FINISHED"}
 
 
-class DownloadRoomOperator(bpy.types.Operator):
+class RoomTransfer:
+    """
+    A room download or upload run by a thread, with its progress.
+
+    The room_bake functions do not access Blender data, so they can run in a thread while Blender stays responsive.
+    """
+
+    def __init__(self, transfer: Callable[[Callable[[int, Optional[int]], None]], Any]):
+        self.done = 0
+        self.total: Optional[int] = None
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+        self.thread = threading.Thread(target=self._run, args=(transfer,), name="mixer_room_transfer", daemon=True)
+
+    def _run(self, transfer):
+        try:
+            self.result = transfer(self._progress)
+        except Exception as e:
+            logger.error("Room transfer failed", exc_info=True)
+            self.error = e
+
+    def _progress(self, done: int, total: Optional[int]):
+        self.done = done
+        self.total = total
+
+
+class RoomTransferOperator:
+    """
+    Mixin for the operators that transfer a room, reporting the progress in the status bar until the transfer ends.
+    """
+
+    def start_transfer(
+        self, context, transfer: Callable, description: str, finished: Callable[[RoomTransfer], Set[str]]
+    ):
+        """
+        Run transfer in a thread, then return the operator result from finished(transfer) once it ends.
+        """
+        self._transfer = RoomTransfer(transfer)
+        self._description = description
+        self._finished = finished
+        self._transfer.thread.start()
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.2, window=context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 100)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+
+        wm = context.window_manager
+        transfer = self._transfer
+        if transfer.total:
+            wm.progress_update(min(100, 100 * transfer.done // transfer.total))
+        context.workspace.status_text_set(f"{self._description}: {transfer.done} / {transfer.total or '?'} commands")
+        if transfer.thread.is_alive():
+            return {"PASS_THROUGH"}
+
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        return self._finished(transfer)
+
+
+class DownloadRoomOperator(bpy.types.Operator, RoomTransferOperator):
     """Download content of an empty room"""
 
     bl_idname = "mixer.download_room"
@@ -286,22 +354,33 @@ class DownloadRoomOperator(bpy.types.Operator):
         return {"RUNNING_MODAL"}
 
     def execute(self, context):
-        from mixer.broadcaster.room_bake import download_room, save_room
+        from mixer.broadcaster.room_bake import download_room_to_file
 
         prefs = get_mixer_prefs()
         props = get_mixer_props()
         room_index = props.room_index
         room = props.rooms[room_index].name
         protocol = props.rooms[room_index].protocol
-        attributes, commands = download_room(
-            prefs.host, prefs.port, room, bpy.app.version_string, mixer.display_version, protocol == "Generic"
-        )
-        save_room(attributes, commands, self.filepath)
+        host, port, filepath = prefs.host, prefs.port, self.filepath
+        blender_version, mixer_version = bpy.app.version_string, mixer.display_version
+
+        def transfer(progress):
+            return download_room_to_file(
+                host, port, room, blender_version, mixer_version, protocol == "Generic", filepath, progress
+            )
 
+        return self.start_transfer(context, transfer, f"Downloading room {room}", self.download_finished)
+
+    def download_finished(self, transfer: RoomTransfer):
+        if not transfer.result:
+            self.report({"ERROR"}, "Room download failed, see the log")
+            return {"CANCELLED"}
+
+        self.report({"INFO"}, f"Room downloaded to {self.filepath}: {transfer.done} commands")
         return {"FINISHED"}
 
 
-class UploadRoomOperator(bpy.types.Operator):
+class UploadRoomOperator(bpy.types.Operator, RoomTransferOperator):
     """Upload content of an empty room"""
 
     bl_idname = "mixer.upload_room"
@@ -318,14 +397,25 @@ class UploadRoomOperator(bpy.types.Operator):
         )
 
     def execute(self, context):
-        from mixer.broadcaster.room_bake import load_room, upload_room
+        from mixer.broadcaster.room_bake import iter_room_file, read_room_attributes, upload_room
 
         prefs = get_mixer_prefs()
         props = get_mixer_props()
+        host, port = prefs.host, prefs.port
+        room, filepath = props.upload_room_name, props.upload_room_filepath
+
+        def transfer(progress):
+            upload_room(host, port, room, read_room_attributes(filepath), iter_room_file(filepath), progress)
+            return True
 
-        attributes, commands = load_room(props.upload_room_filepath)
-        upload_room(prefs.host, prefs.port, props.upload_room_name, attributes, commands)
+        return self.start_transfer(context, transfer, f"Uploading room {room}", self.upload_finished)
+
+    def upload_finished(self, transfer: RoomTransfer):
+        if transfer.error is not None:
+            self.report({"ERROR"}, f"Room upload failed: {transfer.error!r}")
+            return {"CANCELLED"}
 
+        self.report({"INFO"}, f"Room uploaded: {transfer.done} commands")
         return {"FINISHED"}
 
 
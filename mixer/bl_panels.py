@@ -35,7 +35,7 @@ from mixer.broadcaster.common import ClientAttributes
 from mixer.blender_data.debug_addon import DebugDataPanel, use_debug_addon
 from mixer import display_version
 from mixer import icons
-from mixer.local_data import get_data_directory
+from mixer.local_data import get_data_directory, get_media_cache
 from mixer.vrtist import icons as vrtist_icons
 
 if TYPE_CHECKING:
@@ -294,6 +294,8 @@ def draw_advanced_settings_ui(layout: bpy.types.UILayout):
         box = layout.box()
         box.prop(mixer_prefs, "data_directory", text="Data Directory")
         box.prop(mixer_prefs, "ignore_version_check")
+        box.prop(mixer_prefs, "compression")
+        box.prop(mixer_prefs, "proxy_codec")
         box.prop(mixer_prefs, "log_level")
         box.prop(mixer_prefs, "show_server_console")
         box.prop(mixer_prefs, "vrtist_protocol")
@@ -312,11 +314,32 @@ def draw_developer_settings_ui(layout: bpy.types.UILayout):
         box.prop(mixer_prefs, "send_base_meshes", text="Send Base Meshes")
         box.prop(mixer_prefs, "send_baked_meshes", text="Send Baked Meshes")
         box.prop(mixer_prefs, "commands_send_interval")
+        box.prop(mixer_prefs, "media_chunk_size")
+        box.prop(mixer_prefs, "media_cache_size")
+        draw_media_cache_statistics(box)
         box.prop(mixer_prefs, "display_own_gizmos")
         box.prop(mixer_prefs, "display_ids_gizmos")
         box.prop(mixer_prefs, "display_debugging_tools")
 
 
+def draw_media_cache_statistics(layout: bpy.types.UILayout):
+    mega_byte = 1024 * 1024
+    statistics = get_media_cache().statistics()
+    col = layout.column(align=True)
+    col.label(
+        text=f"Media Cache: {statistics['count']} media, "
+        f"{statistics['size'] / mega_byte:.1f} / {statistics['max_size'] / mega_byte:.0f} MB"
+    )
+    col.label(
+        text=f"Hits: {statistics['hits']} ({statistics['hit_bytes'] / mega_byte:.1f} MB), "
+        f"Misses: {statistics['misses']}"
+    )
+    col.label(
+        text=f"Added: {statistics['added_bytes'] / mega_byte:.1f} MB, "
+        f"Evicted: {statistics['evicted_count']} ({statistics['evicted_bytes'] / mega_byte:.1f} MB)"
+    )
+
+
 def draw_gizmos_settings_ui(layout: bpy.types.UILayout):
     mixer_prefs = get_mixer_prefs()
     mixer_props = get_mixer_props()
@@ -28,9 +28,11 @@ import bpy
 from mixer.bl_panels import draw_preferences_ui, update_panels_category
 from mixer.broadcaster import common
 from mixer.broadcaster.common import ClientAttributes
+from mixer.broadcaster.media_cache import DEFAULT_MEDIA_CACHE_SIZE
+from mixer.broadcaster.media_transfer import DEFAULT_MEDIA_CHUNK_SIZE
 from mixer.os_utils import getuser
 from mixer.share_data import share_data
-from mixer.local_data import get_data_directory
+from mixer.local_data import get_data_directory, set_media_cache_max_size
 
 logger = logging.getLogger(__name__)
 
@@ -74,6 +76,9 @@ class MixerPreferences(bpy.types.AddonPreferences):
         if client and client.is_connected():
             client.set_client_attributes({ClientAttributes.USERCOLOR: list(self.color)})
 
+    def on_media_cache_size_changed(self, context):
+        set_media_cache_max_size(int(self.media_cache_size * 1024 * 1024 * 1024))
+
     category: bpy.props.StringProperty(
         name="Tab Category",
         description="Choose a name for the category of the panel.",
@@ -159,6 +164,22 @@ class MixerPreferences(bpy.types.AddonPreferences):
 
     ignore_version_check: bpy.props.BoolProperty(default=False, name="Ignore Room Version Check")
 
+    proxy_codec: bpy.props.EnumProperty(
+        name="Data Encoding",
+        description="Encoding of the Blender data sent in the rooms created by this client",
+        items=[
+            ("json", "JSON", "", 0),
+            ("binary", "Binary", "About 3 times smaller, but about 2 times slower to encode and decode", 1),
+        ],
+        default="json",
+    )
+
+    compression: bpy.props.BoolProperty(
+        name="Compress Room Content",
+        description="Compress the large commands of the rooms created by this client. Uses less bandwidth and server memory",
+        default=False,
+    )
+
     show_server_console: bpy.props.BoolProperty(name="Show Server Console", default=False)
 
     VRtist: bpy.props.StringProperty(
@@ -197,6 +218,21 @@ class MixerPreferences(bpy.types.AddonPreferences):
         default=0,
     )
 
+    media_chunk_size: bpy.props.IntProperty(
+        name="Media Chunk Size",
+        description="Size in KiB of the chunks of the media files that are sent in several messages.",
+        default=DEFAULT_MEDIA_CHUNK_SIZE // 1024,
+        min=16,
+    )
+    media_cache_size: bpy.props.FloatProperty(
+        name="Media Cache Size",
+        description="Size in GiB above which the least recently used media received from other users are removed "
+        "from the media cache.",
+        default=DEFAULT_MEDIA_CACHE_SIZE / (1024 * 1024 * 1024),
+        min=0.1,
+        update=on_media_cache_size_changed,
+    )
+
     def draw(self, context):
         draw_preferences_ui(self, context)
 
@@ -33,12 +33,13 @@ The main function in this file is BlenderClient.network_consumer, which is the f
 we register.
 """
 
+from collections import deque
 import logging
 import os
 import struct
 import time
 import traceback
-from typing import Dict, Tuple, Optional
+from typing import Deque, Dict, List, Tuple, Optional
 from enum import IntEnum
 
 import bpy
@@ -71,6 +72,9 @@ from mixer.local_data import get_local_or_create_cache_file, get_source_file_pat
 
 logger = logging.getLogger(__name__)
 
+CONSUMER_TIME_BUDGET = 0.03
+"""Seconds spent by network_consumer() to process received commands in one timer run"""
+
 
 class InterpolationTypes(IntEnum):
     CONSTANT = 0
@@ -108,6 +112,36 @@ def get_view_frustum_attributes(region: bpy.types.Region, region_3d: bpy.types.R
     }
 
 
+class SelectionTracker:
+    """
+    Cache of the names of the selected objects of each scene, recomputed after a depsgraph update only.
+
+    Finding the selected objects requires a select_get() call for each object and view layer of each scene, which
+    is too costly for each network_consumer() call, when the selection seldom changes.
+    """
+
+    def __init__(self):
+        self._selection: Optional[Dict[str, List[str]]] = None
+
+    def invalidate(self):
+        self._selection = None
+
+    def scene_selection(self, scene: bpy.types.Scene) -> List[str]:
+        if self._selection is None or scene.name_full not in self._selection:
+            self._selection = {scene.name_full: self._compute(scene) for scene in bpy.data.scenes}
+        return self._selection[scene.name_full]
+
+    @staticmethod
+    def _compute(scene: bpy.types.Scene) -> List[str]:
+        view_layers = scene.view_layers
+        # sorted, so that an unchanged selection produces no attribute update
+        return sorted(
+            obj.name_full
+            for obj in scene.objects
+            if any(obj.select_get(view_layer=view_layer) for view_layer in view_layers)
+        )
+
+
 class SendSceneContentFailed(Exception):
     pass
 
@@ -150,13 +184,62 @@ class BlenderClient(Client):
         self.block_signals = False
         # block_signals is set to True when our timer transforms received commands into scene updates
 
+        # invalidated by the depsgraph update handler
+        self.selection_tracker = SelectionTracker()
+
         self._joining: bool = False
         self._joining_room_name: Optional[str] = None
         self._received_command_count: int = 0
         self._received_byte_size: int = 0
 
+        # commands received from the server and not yet processed by network_consumer()
+        self._received_commands: Deque[common.Command] = deque()
+        # start times of the GROUP_BEGIN commands not yet matched by GROUP_END
+        self._groups: List[float] = []
+        # the creations encoded by worker threads, see mixer.blender_client.data.send_data_creations()
+        self.creation_encoding: Optional[data_api.CreationEncoding] = None
+
         self.command_pack = None
 
+    def leave_room(self, room_name: str):
+        from mixer.handlers import clear_deferred_scene_data
+
+        # commands received for the room that is left are not processed
+        self._received_commands.clear()
+        self._groups.clear()
+        self._joining = False
+        if self.creation_encoding is not None:
+            self.creation_encoding.cancel()
+            self.creation_encoding = None
+        clear_deferred_scene_data()
+        return super().leave_room(room_name)
+
+    def applying_received_commands(self) -> bool:
+        """
+        Tell if the received commands are partially applied, during a room join or within a command group, in which
+        case the local changes must not be diffed against the partial room state.
+        """
+        return self._joining or bool(self._groups)
+
+    def deferring_local_changes(self) -> bool:
+        """
+        Tell if the local changes must be deferred, while the received commands are partially applied or the
+        creations sent by this client are encoded by worker threads.
+        """
+        return self.applying_received_commands() or self.creation_encoding is not None
+
+    def _step_creation_encoding(self, deadline: float) -> bool:
+        """
+        Queue the creations encoded until deadline, then the commands held meanwhile. Return True once done.
+        """
+        encoding = self.creation_encoding
+        if not encoding.step(deadline):
+            return False
+        self.creation_encoding = None
+        for command, compress in encoding.held_commands:
+            super().add_command(command, compress)
+        return True
+
     def send_command_pack(self):
         self.synced_time_messages = False
         if self.command_pack is not None:
@@ -165,12 +248,14 @@ class BlenderClient(Client):
             self.synced_time_messages = False
             super().add_command(command)
 
-    def add_command(self, command: common.Command):
+    def add_command(self, command: common.Command, compress: bool = True):
         # A wrapped message is a message emitted from a frame change event.
         # Right now we wrap this kind of messages adding the client_id.
         # In the future we will probably always add the client_id to all messages. But the difference
         # between synced time messages and the other must remain.
         if self.synced_time_messages:
+            # the wrapper has no room for the compression flag of the wrapped command
+            command = common.decompress_command(command)
             command = common.encode_int(command.type.value) + command.data
             if self.command_pack is None:
                 self.command_pack = common.Command(
@@ -178,8 +263,11 @@ class BlenderClient(Client):
                 )
 
             self.command_pack.data += common.encode_int(len(command)) + command
+        elif self.creation_encoding is not None and not self.creation_encoding.queueing:
+            # sent after the creations that are encoded
+            self.creation_encoding.held_commands.append((command, compress))
         else:
-            super().add_command(command)
+            super().add_command(command, compress)
 
     # returns the path of an object
     def get_object_path(self, obj):
@@ -857,14 +945,11 @@ class BlenderClient(Client):
     def compute_client_custom_attributes(self):
         scene_attributes = {}
         for scene in bpy.data.scenes:
-            scene_attributes[scene.name_full] = {ClientAttributes.USERSCENES_FRAME: scene.frame_current}
-            scene_selection = set()
-            for obj in scene.objects:
-                for view_layer in scene.view_layers:
-                    if obj.select_get(view_layer=view_layer):
-                        scene_selection.add(obj.name_full)
-            scene_attributes[scene.name_full][ClientAttributes.USERSCENES_SELECTED_OBJECTS] = list(scene_selection)
-            scene_attributes[scene.name_full][ClientAttributes.USERSCENES_VIEWS] = dict()
+            scene_attributes[scene.name_full] = {
+                ClientAttributes.USERSCENES_FRAME: scene.frame_current,
+                ClientAttributes.USERSCENES_SELECTED_OBJECTS: self.selection_tracker.scene_selection(scene),
+                ClientAttributes.USERSCENES_VIEWS: dict(),
+            }
 
         # Send information about opened windows and 3d areas
         # Will server later to display view frustums of users
@@ -892,247 +977,267 @@ class BlenderClient(Client):
             ClientAttributes.USERMODE: bpy.context.mode,
         }
 
-    def network_consumer(self):
+    def network_consumer(self, time_budget: float = CONSUMER_TIME_BUDGET) -> bool:
         """
         This method can be considered the entry point of this class. It is meant to be called regularly to send
         pending commands to the server, and receive then process new ones.
 
         Pending commands are accumulated with add_command(), most calls originate from handlers function.
 
-        Incoming commands are read from the socket and directly processed here to update Blender's data. This can
-        be costly and a possible optimization in the future would be to split the processing accross several timer
-        run. This can be challenging because we need to keep the current update state. Maybe this can be solved
-        naturally with coroutines.
+        Incoming commands are fetched from the client I/O thread into a backlog, and processed here to update Blender's data
+        until time_budget seconds have elapsed. The backlog and the open command groups are kept across calls,
+        so that processing a large room join is split across several timer runs and does not freeze the UI. The server
+        closes the groups of a client that leaves the room.
 
         We call it from the timer registered by the addon.
+
+        Returns:
+            True if received commands remain to be processed or encoded creations remain to be queued, in which
+            case this method should be called again without delay
         """
 
         from mixer.bl_panels import redraw as redraw_panels, update_ui_lists
+        from mixer.handlers import send_deferred_scene_data
 
         assert self.is_connected()
 
         set_draw_handlers()
 
-        # Loop remains infinite while we have GROUP_BEGIN commands without their corresponding GROUP_END received
-        # todo Change this -> probably not a good idea because the sending client might disconnect before GROUP_END occurs
-        # or it needs to be guaranteed by the server
-        groups = []
-        while True:
-            received_commands = self.fetch_commands(get_mixer_prefs().commands_send_interval)
-
-            set_dirty = True
-            delayed_messages = []
-            # Process all received commands
-            for command in received_commands:
-                if self._joining and command.type.value > common.MessageType.COMMAND.value:
-                    self._received_byte_size += command.byte_size()
-                    self._received_command_count += 1
-                    if self._joining_room_name in self.rooms_attributes:
-                        get_mixer_props().joining_percentage = (
-                            self._received_byte_size
-                            / self.rooms_attributes[self._joining_room_name][RoomAttributes.BYTE_SIZE]
-                        )
-                        redraw_panels()
+        self._received_commands.extend(self.fetch_commands(get_mixer_prefs().commands_send_interval))
+        deadline = time.monotonic() + time_budget
+
+        encoded_creations = False
+        if self.creation_encoding is not None:
+            # the received commands are not processed meanwhile, since they would modify the proxies being encoded
+            redraw_panels()
+            if not self._step_creation_encoding(deadline):
+                return True
+            encoded_creations = True
+
+        set_dirty = True
+        delayed_messages = []
+        redraw = False
+        # Process the received commands until the time budget is exhausted. The remaining ones are processed by the
+        # next calls, so that the UI stays responsive during a room join. At least one command is processed.
+        processed_count = 0
+        while self._received_commands and (processed_count == 0 or time.monotonic() < deadline):
+            processed_count += 1
+            command = self._received_commands.popleft()
+            if self._joining and command.type.value > common.MessageType.COMMAND.value:
+                self._received_byte_size += command.byte_size()
+                self._received_command_count += 1
+                if self._joining_room_name in self.rooms_attributes:
+                    get_mixer_props().joining_percentage = (
+                        self._received_byte_size
+                        / self.rooms_attributes[self._joining_room_name][RoomAttributes.BYTE_SIZE]
+                    )
+                    redraw = True
 
-                if command.type == MessageType.GROUP_BEGIN:
-                    groups.append(time.monotonic())
-                    continue
+            if command.type == MessageType.GROUP_BEGIN:
+                self._groups.append(time.monotonic())
+                continue
 
-                if command.type == MessageType.GROUP_END:
-                    elapse = time.monotonic() - groups.pop()
-                    group_id = len(groups)
-                    share_data.receive_sanity_check()
-                    logger.warning(f"Command group {group_id} processed in {elapse:.1f} seconds")
-                    continue
+            if command.type == MessageType.GROUP_END:
+                elapse = time.monotonic() - self._groups.pop()
+                group_id = len(self._groups)
+                share_data.receive_sanity_check()
+                logger.warning(f"Command group {group_id} processed in {elapse:.1f} seconds")
+                continue
 
-                if self.has_default_handler(command.type):
-                    if command.type == MessageType.JOIN_ROOM and self._joining:
-                        self._joining = False
-                        get_mixer_props().joining_percentage = 1
+            if self.has_default_handler(command.type):
+                if command.type == MessageType.JOIN_ROOM and self._joining:
+                    self._joining = False
+                    get_mixer_props().joining_percentage = 1
 
-                    update_ui_lists()
-                    self.block_signals = False  # todo investigate why we should but this to false here
-                    continue
+                update_ui_lists()
+                self.block_signals = False  # todo investigate why we should but this to false here
+                continue
+
+            if set_dirty:
+                share_data.set_dirty()
+                set_dirty = False
 
-                if set_dirty:
-                    share_data.set_dirty()
-                    set_dirty = False
-
-                self.block_signals = True
-
-                try:
-                    # manage wrapped commands with this blender id
-                    # time synced command for now
-                    # Consume messages with its client_id to receive commands from other clients
-                    # like play/pause. Ignore all other client_id.
-                    if command.type == MessageType.CLIENT_ID_WRAPPER:
-                        id, index = common.decode_string(command.data, 0)
-                        if id != share_data.client.client_id:
-                            continue
-                        command_type, index = common.decode_int(command.data, index)
-                        command_data = command.data[index:]
-                        command = common.Command(command_type, command_data)
-
-                    if command.type == MessageType.CONTENT:
-                        # The server asks for scene content (at room creation)
-                        try:
-                            assert share_data.client.current_room is not None
-                            self.set_room_attributes(
-                                share_data.client.current_room,
-                                {"vrtist_protocol": get_mixer_prefs().vrtist_protocol},
-                            )
-                            send_scene_content()
-                            # Inform end of content
-                            self.add_command(common.Command(MessageType.CONTENT))
-                        except Exception as e:
-                            raise SendSceneContentFailed() from e
+            self.block_signals = True
+
+            try:
+                # manage wrapped commands with this blender id
+                # time synced command for now
+                # Consume messages with its client_id to receive commands from other clients
+                # like play/pause. Ignore all other client_id.
+                if command.type == MessageType.CLIENT_ID_WRAPPER:
+                    id, index = common.decode_string(command.data, 0)
+                    if id != share_data.client.client_id:
                         continue
+                    command_type, index = common.decode_int(command.data, index)
+                    command_data = command.data[index:]
+                    command = common.Command(command_type, command_data)
+
+                if command.type == MessageType.CONTENT:
+                    # The server asks for scene content (at room creation)
+                    try:
+                        assert share_data.client.current_room is not None
+                        self.set_room_attributes(
+                            share_data.client.current_room,
+                            {"vrtist_protocol": get_mixer_prefs().vrtist_protocol},
+                        )
+                        send_scene_content()
+                        # Inform end of content
+                        self.add_command(common.Command(MessageType.CONTENT))
+                    except Exception as e:
+                        raise SendSceneContentFailed() from e
+                    continue
+
+                # Put this to true by default
+                # todo Check build commands that do not trigger depsgraph update
+                # because it can lead to ignoring real updates when a false positive is encountered
+                command_triggers_depsgraph_update = True
+
+                if command.type == MessageType.GREASE_PENCIL_MESH:
+                    grease_pencil_api.build_grease_pencil_mesh(command.data)
+                elif command.type == MessageType.GREASE_PENCIL_MATERIAL:
+                    grease_pencil_api.build_grease_pencil_material(command.data)
+                elif command.type == MessageType.GREASE_PENCIL_CONNECTION:
+                    grease_pencil_api.build_grease_pencil_connection(command.data)
+
+                elif command.type == MessageType.CLEAR_CONTENT:
+                    clear_scene_content()
+                    self._joining = True
+                    self._received_command_count = 0
+                    self._received_byte_size = 0
+                    get_mixer_props().joining_percentage = 0
+                    redraw_panels()
+                elif command.type == MessageType.MESH:
+                    self.build_mesh(command.data)
+                elif command.type == MessageType.TRANSFORM:
+                    self.build_transform(command.data)
+                elif command.type == MessageType.MATERIAL:
+                    material_api.build_material(command.data)
+                elif command.type == MessageType.ASSIGN_MATERIAL:
+                    material_api.build_assign_material(command.data)
+                elif command.type == MessageType.DELETE:
+                    self.build_delete(command.data)
+                elif command.type == MessageType.CAMERA:
+                    camera_api.build_camera(command.data)
+                elif command.type == MessageType.LIGHT:
+                    light_api.build_light(command.data)
+                elif command.type == MessageType.RENAME:
+                    self.build_rename(command.data)
+                elif command.type == MessageType.DUPLICATE:
+                    self.build_duplicate(command.data)
+                elif command.type == MessageType.SEND_TO_TRASH:
+                    self.build_send_to_trash(command.data)
+                elif command.type == MessageType.RESTORE_FROM_TRASH:
+                    self.build_restore_from_trash(command.data)
+                elif command.type == MessageType.TEXTURE:
+                    self.build_texture_file(command.data)
+
+                elif command.type == MessageType.COLLECTION:
+                    collection_api.build_collection(command.data)
+                elif command.type == MessageType.COLLECTION_REMOVED:
+                    collection_api.build_collection_removed(command.data)
+
+                elif command.type == MessageType.INSTANCE_COLLECTION:
+                    collection_api.build_collection_instance(command.data)
+
+                elif command.type == MessageType.ADD_COLLECTION_TO_COLLECTION:
+                    collection_api.build_collection_to_collection(command.data)
+                elif command.type == MessageType.REMOVE_COLLECTION_FROM_COLLECTION:
+                    collection_api.build_remove_collection_from_collection(command.data)
+                elif command.type == MessageType.ADD_OBJECT_TO_COLLECTION:
+                    collection_api.build_add_object_to_collection(command.data)
+                elif command.type == MessageType.REMOVE_OBJECT_FROM_COLLECTION:
+                    collection_api.build_remove_object_from_collection(command.data)
+
+                elif command.type == MessageType.ADD_COLLECTION_TO_SCENE:
+                    scene_api.build_collection_to_scene(command.data)
+                elif command.type == MessageType.REMOVE_COLLECTION_FROM_SCENE:
+                    scene_api.build_remove_collection_from_scene(command.data)
+                elif command.type == MessageType.ADD_OBJECT_TO_SCENE:
+                    scene_api.build_add_object_to_scene(command.data)
+                elif command.type == MessageType.REMOVE_OBJECT_FROM_SCENE:
+                    scene_api.build_remove_object_from_scene(command.data)
+
+                elif command.type == MessageType.SCENE:
+                    scene_api.build_scene(command.data)
+
+                elif command.type == MessageType.OBJECT_VISIBILITY:
+                    object_api.build_object_visibility(command.data)
+
+                elif command.type == MessageType.FRAME:
+                    self.build_frame(command.data)
+                elif command.type == MessageType.QUERY_CURRENT_FRAME:
+                    self.query_current_frame()
+                elif command.type == MessageType.FRAME_START_END:
+                    self.build_start_end_frame(command.data)
+
+                elif command.type == MessageType.PLAY:
+                    self.build_play(command.data)
+                elif command.type == MessageType.PAUSE:
+                    self.build_pause(command.data)
+                elif command.type == MessageType.ADD_KEYFRAME:
+                    self.build_add_keyframe(command.data)
+                elif command.type == MessageType.REMOVE_KEYFRAME:
+                    self.build_remove_keyframe(command.data)
+                elif command.type == MessageType.MOVE_KEYFRAME:
+                    self.build_move_keyframe(command.data)
+                elif command.type == MessageType.ANIMATION:
+                    self.build_add_animation(command.data)
+                elif command.type == MessageType.QUERY_ANIMATION_DATA:
+                    self.build_query_animation_data(command.data)
+
+                elif command.type == MessageType.CLEAR_ANIMATIONS:
+                    self.build_clear_animations(command.data)
+                elif command.type == MessageType.SHOT_MANAGER_MONTAGE_MODE:
+                    self.build_montage_mode(command.data)
+                elif command.type == MessageType.SHOT_MANAGER_ACTION:
+                    shot_manager.build_shot_manager_action(command.data)
+
+                elif command.type == MessageType.ADD_CONSTRAINT:
+                    constraint_api.build_add_constraint(command.data)
+                elif command.type == MessageType.REMOVE_CONSTRAINT:
+                    constraint_api.build_remove_constraint(command.data)
+                elif command.type == MessageType.ASSET_BANK:
+                    delayed_messages.append(delayed_message_call(asset_bank.receive_message, command.data))
+                elif command.type == MessageType.SAVE:
+                    self.build_save(command.data)
+
+                elif command.type == MessageType.BLENDER_DATA_UPDATE:
+                    data_api.build_data_update(command.data)
+                elif command.type == MessageType.BLENDER_DATA_REMOVE:
+                    data_api.build_data_remove(command.data)
+                elif command.type == MessageType.BLENDER_DATA_CREATE:
+                    data_api.build_data_create(command.data)
+                elif command.type == MessageType.BLENDER_DATA_RENAME:
+                    data_api.build_data_rename(command.data)
+                elif command.type == MessageType.BLENDER_DATA_MEDIA:
+                    data_api.build_data_media(command.data)
+                elif command.type == MessageType.MEDIA_BEGIN:
+                    data_api.build_media_begin(command.data)
+                elif command.type == MessageType.MEDIA_CHUNK:
+                    data_api.build_media_chunk(command.data)
+                elif command.type == MessageType.MEDIA_END:
+                    data_api.build_media_end(command.data)
 
-                    # Put this to true by default
-                    # todo Check build commands that do not trigger depsgraph update
-                    # because it can lead to ignoring real updates when a false positive is encountered
-                    command_triggers_depsgraph_update = True
-
-                    if command.type == MessageType.GREASE_PENCIL_MESH:
-                        grease_pencil_api.build_grease_pencil_mesh(command.data)
-                    elif command.type == MessageType.GREASE_PENCIL_MATERIAL:
-                        grease_pencil_api.build_grease_pencil_material(command.data)
-                    elif command.type == MessageType.GREASE_PENCIL_CONNECTION:
-                        grease_pencil_api.build_grease_pencil_connection(command.data)
-
-                    elif command.type == MessageType.CLEAR_CONTENT:
-                        clear_scene_content()
-                        self._joining = True
-                        self._received_command_count = 0
-                        self._received_byte_size = 0
-                        get_mixer_props().joining_percentage = 0
-                        redraw_panels()
-                    elif command.type == MessageType.MESH:
-                        self.build_mesh(command.data)
-                    elif command.type == MessageType.TRANSFORM:
-                        self.build_transform(command.data)
-                    elif command.type == MessageType.MATERIAL:
-                        material_api.build_material(command.data)
-                    elif command.type == MessageType.ASSIGN_MATERIAL:
-                        material_api.build_assign_material(command.data)
-                    elif command.type == MessageType.DELETE:
-                        self.build_delete(command.data)
-                    elif command.type == MessageType.CAMERA:
-                        camera_api.build_camera(command.data)
-                    elif command.type == MessageType.LIGHT:
-                        light_api.build_light(command.data)
-                    elif command.type == MessageType.RENAME:
-                        self.build_rename(command.data)
-                    elif command.type == MessageType.DUPLICATE:
-                        self.build_duplicate(command.data)
-                    elif command.type == MessageType.SEND_TO_TRASH:
-                        self.build_send_to_trash(command.data)
-                    elif command.type == MessageType.RESTORE_FROM_TRASH:
-                        self.build_restore_from_trash(command.data)
-                    elif command.type == MessageType.TEXTURE:
-                        self.build_texture_file(command.data)
-
-                    elif command.type == MessageType.COLLECTION:
-                        collection_api.build_collection(command.data)
-                    elif command.type == MessageType.COLLECTION_REMOVED:
-                        collection_api.build_collection_removed(command.data)
-
-                    elif command.type == MessageType.INSTANCE_COLLECTION:
-                        collection_api.build_collection_instance(command.data)
-
-                    elif command.type == MessageType.ADD_COLLECTION_TO_COLLECTION:
-                        collection_api.build_collection_to_collection(command.data)
-                    elif command.type == MessageType.REMOVE_COLLECTION_FROM_COLLECTION:
-                        collection_api.build_remove_collection_from_collection(command.data)
-                    elif command.type == MessageType.ADD_OBJECT_TO_COLLECTION:
-                        collection_api.build_add_object_to_collection(command.data)
-                    elif command.type == MessageType.REMOVE_OBJECT_FROM_COLLECTION:
-                        collection_api.build_remove_object_from_collection(command.data)
-
-                    elif command.type == MessageType.ADD_COLLECTION_TO_SCENE:
-                        scene_api.build_collection_to_scene(command.data)
-                    elif command.type == MessageType.REMOVE_COLLECTION_FROM_SCENE:
-                        scene_api.build_remove_collection_from_scene(command.data)
-                    elif command.type == MessageType.ADD_OBJECT_TO_SCENE:
-                        scene_api.build_add_object_to_scene(command.data)
-                    elif command.type == MessageType.REMOVE_OBJECT_FROM_SCENE:
-                        scene_api.build_remove_object_from_scene(command.data)
-
-                    elif command.type == MessageType.SCENE:
-                        scene_api.build_scene(command.data)
-
-                    elif command.type == MessageType.OBJECT_VISIBILITY:
-                        object_api.build_object_visibility(command.data)
-
-                    elif command.type == MessageType.FRAME:
-                        self.build_frame(command.data)
-                    elif command.type == MessageType.QUERY_CURRENT_FRAME:
-                        self.query_current_frame()
-                    elif command.type == MessageType.FRAME_START_END:
-                        self.build_start_end_frame(command.data)
-
-                    elif command.type == MessageType.PLAY:
-                        self.build_play(command.data)
-                    elif command.type == MessageType.PAUSE:
-                        self.build_pause(command.data)
-                    elif command.type == MessageType.ADD_KEYFRAME:
-                        self.build_add_keyframe(command.data)
-                    elif command.type == MessageType.REMOVE_KEYFRAME:
-                        self.build_remove_keyframe(command.data)
-                    elif command.type == MessageType.MOVE_KEYFRAME:
-                        self.build_move_keyframe(command.data)
-                    elif command.type == MessageType.ANIMATION:
-                        self.build_add_animation(command.data)
-                    elif command.type == MessageType.QUERY_ANIMATION_DATA:
-                        self.build_query_animation_data(command.data)
-
-                    elif command.type == MessageType.CLEAR_ANIMATIONS:
-                        self.build_clear_animations(command.data)
-                    elif command.type == MessageType.SHOT_MANAGER_MONTAGE_MODE:
-                        self.build_montage_mode(command.data)
-                    elif command.type == MessageType.SHOT_MANAGER_ACTION:
-                        shot_manager.build_shot_manager_action(command.data)
-
-                    elif command.type == MessageType.ADD_CONSTRAINT:
-                        constraint_api.build_add_constraint(command.data)
-                    elif command.type == MessageType.REMOVE_CONSTRAINT:
-                        constraint_api.build_remove_constraint(command.data)
-                    elif command.type == MessageType.ASSET_BANK:
-                        delayed_messages.append(delayed_message_call(asset_bank.receive_message, command.data))
-                    elif command.type == MessageType.SAVE:
-                        self.build_save(command.data)
-
-                    elif command.type == MessageType.BLENDER_DATA_UPDATE:
-                        data_api.build_data_update(command.data)
-                    elif command.type == MessageType.BLENDER_DATA_REMOVE:
-                        data_api.build_data_remove(command.data)
-                    elif command.type == MessageType.BLENDER_DATA_CREATE:
-                        data_api.build_data_create(command.data)
-                    elif command.type == MessageType.BLENDER_DATA_RENAME:
-                        data_api.build_data_rename(command.data)
-                    elif command.type == MessageType.BLENDER_DATA_MEDIA:
-                        data_api.build_data_media(command.data)
-
-                    else:
-                        # Command is ignored, so no depsgraph update can be triggered
-                        command_triggers_depsgraph_update = False
-
-                    if command_triggers_depsgraph_update:
-                        self.skip_next_depsgraph_update = True
-
-                except Exception as e:
-                    logger.warning(f"Exception during processing of message {str(command.type)}")
-                    for line in traceback.format_exc().splitlines():
-                        logger.warning(line)
-
-                    if isinstance(e, SendSceneContentFailed):
-                        raise
-
-                finally:
-                    self.block_signals = False
-
-            if not groups:
-                break
+                else:
+                    # Command is ignored, so no depsgraph update can be triggered
+                    command_triggers_depsgraph_update = False
+
+                if command_triggers_depsgraph_update:
+                    self.skip_next_depsgraph_update = True
+
+            except Exception as e:
+                logger.warning(f"Exception during processing of message {str(command.type)}")
+                for line in traceback.format_exc().splitlines():
+                    logger.warning(line)
+
+                if isinstance(e, SendSceneContentFailed):
+                    raise
+
+            finally:
+                self.block_signals = False
+
+        if redraw:
+            redraw_panels()
 
         if not set_dirty:
             share_data.update_current_data()
@@ -1164,8 +1269,14 @@ class BlenderClient(Client):
                     parent = ob
             share_data.pending_parenting = remaining_parentings
 
+        if (processed_count or encoded_creations) and not self.deferring_local_changes():
+            # the local changes made while the received commands were partially applied
+            send_deferred_scene_data()
+
         self.set_client_attributes(self.compute_client_custom_attributes())
 
+        return bool(self._received_commands)
+
 
 def update_params(obj):
     # send collection instances
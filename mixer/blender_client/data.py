@@ -20,13 +20,17 @@ Send BLENDER_DATA messages, receive and process them
 """
 from __future__ import annotations
 
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import itertools
 import logging
+import os
+import time
 import traceback
-from typing import List, TYPE_CHECKING
+from typing import AbstractSet, List, Optional, Set, Tuple, TYPE_CHECKING
 
 import bpy
 
+from mixer.blender_data.binary_codec import BinaryCodec
 from mixer.blender_data.json_codec import Codec, DecodeError, EncodeError
 from mixer.blender_data.messages import (
     BlenderDataMessage,
@@ -34,8 +38,16 @@ from mixer.blender_data.messages import (
     BlenderRemoveMessage,
     BlenderRenamesMessage,
 )
-from mixer.broadcaster.common import Command, MessageType
-from mixer.local_data import get_local_or_create_cache_file
+from mixer.broadcaster.common import Command, compress_data, MessageType
+from mixer.broadcaster.media_transfer import (
+    decode_media_begin,
+    decode_media_chunk,
+    decode_media_end,
+    MediaDownload,
+    MediaTransferError,
+    MediaUpload,
+)
+from mixer.local_data import add_downloaded_cache_file, get_download_cache_file, get_local_or_create_cache_file
 from mixer.share_data import share_data
 
 if TYPE_CHECKING:
@@ -47,13 +59,18 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+_codecs = {"json": Codec, "binary": BinaryCodec}
+
+
+def _encoding_codec():
+    return _codecs.get(share_data.proxy_codec, Codec)()
 
-def send_media_creations(proxy: DatablockProxy):
-    bytes_ = BlenderMediaMessage.encode(proxy)
-    if bytes_ and proxy._media:
-        logger.info("send_media_creations %s: %d bytes", proxy._media[0], len(bytes_))
-        command = Command(MessageType.BLENDER_DATA_MEDIA, bytes_, 0)
-        share_data.client.add_command(command)
+
+def _decode_proxy(message: BlenderDataMessage):
+    # decode with the codec used by the sender
+    if message.proxy_bytes:
+        return BinaryCodec().decode(message.proxy_bytes)
+    return Codec().decode(message.proxy_string)
 
 
 def build_data_media(buffer: bytes):
@@ -61,42 +78,277 @@ def build_data_media(buffer: bytes):
     # The packed data with be saved to file, not a problem
     message = BlenderMediaMessage()
     message.decode(buffer)
-    logger.info("build_data_media %s: %d bytes", message.path, len(message.bytes_))
-    # TODO this does not overwrite outdated local files
-    get_local_or_create_cache_file(message.path, message.bytes_)
+    logger.info("build_data_media %s %s: %d bytes", message.path, message.content_hash, len(message.bytes_))
+    # TODO this does not overwrite outdated local files. The cache files are named after their content
+    get_local_or_create_cache_file(message.path, message.bytes_, message.content_hash)
+    share_data.client.room_media_hashes.add(message.content_hash)
+
+
+def build_media_begin(buffer: bytes):
+    content_hash, path, size = decode_media_begin(buffer)
+    downloads = share_data.media_downloads
+    _, previous = downloads.pop(content_hash, (None, None))
+    if previous is not None:
+        # the sender left the room before the end of the transfer, that is sent again
+        previous.abort()
+
+    cache_path = get_download_cache_file(path, content_hash)
+    if cache_path is None:
+        logger.info("build_media_begin %s %s: %d bytes, available locally", path, content_hash, size)
+        return
+    logger.info("build_media_begin %s %s: %d bytes", path, content_hash, size)
+    downloads[content_hash] = (path, MediaDownload(content_hash, size, cache_path))
+
+
+def build_media_chunk(buffer: bytes):
+    content_hash, offset, chunk = decode_media_chunk(buffer)
+    path, download = share_data.media_downloads.get(content_hash, (None, None))
+    if download is None:
+        return
+    try:
+        download.write(offset, chunk)
+    except (MediaTransferError, OSError) as e:
+        logger.error(f"build_media_chunk {path}: {e!r}")
+        download.abort()
+        share_data.media_downloads[content_hash] = (path, None)
+
+
+def build_media_end(buffer: bytes):
+    content_hash = decode_media_end(buffer)
+    if content_hash not in share_data.media_downloads:
+        # available locally
+        share_data.client.room_media_hashes.add(content_hash)
+        return
+
+    path, download = share_data.media_downloads.pop(content_hash)
+    if download is None:
+        return
+    try:
+        download.finish()
+        add_downloaded_cache_file(path, content_hash, download.file_path)
+    except (MediaTransferError, OSError) as e:
+        logger.error(f"build_media_end {path}: {e!r}")
+        return
+    logger.info("build_media_end %s %s", path, content_hash)
+    share_data.client.room_media_hashes.add(content_hash)
+
+
+PARALLEL_ENCODING_MIN_COUNT = 32
+"""Creation changesets with fewer proxies, like the ones emitted while working in a room, are encoded on the
+main thread. Larger ones, like the initial room content, are encoded by a worker pool."""
+
+ENCODING_WORKERS = min(4, os.cpu_count() or 1)
+
+EncodedMessage = Tuple[MessageType, bytes, bool]
+"""message type, data, True if data is compressed"""
+
+
+def _is_chunked_media(datablock_proxy: DatablockProxy, media_chunk_size: int) -> bool:
+    """
+    Tell if the media of datablock_proxy is sent in chunks rather than in a BLENDER_DATA_MEDIA message.
+    """
+    if datablock_proxy._media is None:
+        return False
+    source = datablock_proxy._media[1]
+    size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+    return size > media_chunk_size
+
+
+def _encode_creation(
+    codec,
+    datablock_proxy: DatablockProxy,
+    compression_threshold: Optional[int],
+    media_hashes: AbstractSet[str],
+    media_chunk_size: int,
+) -> List[EncodedMessage]:
+    """
+    Encode the media and creation messages for datablock_proxy. The media is not encoded if its content hash is in
+    media_hashes, the media that the room already has, or if it is sent in chunks.
+
+    This may run in a worker thread and must not access bpy. The proxy is already loaded and not modified
+    until all messages are encoded.
+    """
+    messages = []
+    media_buffer = b""
+    if datablock_proxy._media_hash not in media_hashes and not _is_chunked_media(datablock_proxy, media_chunk_size):
+        media_buffer = BlenderMediaMessage.encode(datablock_proxy)
+    if media_buffer and datablock_proxy._media:
+        logger.info("send_media_creations %s: %d bytes", datablock_proxy._media[0], len(media_buffer))
+        messages.append((MessageType.BLENDER_DATA_MEDIA, media_buffer))
+
+    encoded_proxy = codec.encode(datablock_proxy)
+    buffer = BlenderDataMessage.encode(datablock_proxy, encoded_proxy)
+    messages.append((MessageType.BLENDER_DATA_CREATE, buffer))
+
+    if compression_threshold is None:
+        return [(message_type, data, False) for message_type, data in messages]
+
+    encoded_messages = []
+    for message_type, data in messages:
+        compressed = compress_data(message_type, data, compression_threshold)
+        if compressed is None:
+            encoded_messages.append((message_type, data, False))
+        else:
+            encoded_messages.append((message_type, compressed, True))
+    return encoded_messages
+
+
+def _add_creation_commands(
+    datablock_proxy: DatablockProxy, messages: List[EncodedMessage], media_hashes: Set[str], compress: bool
+):
+    """
+    Queue the messages encoded for datablock_proxy. A media sent in chunks is queued first, and the creation is sent
+    after it since the datablock cannot be created without its media.
+
+    compress is False if the messages were already compressed when possible.
+    """
+    client = share_data.client
+    commands = []
+    for message_type, data, compressed in messages:
+        if message_type == MessageType.BLENDER_DATA_MEDIA:
+            if datablock_proxy._media_hash in media_hashes:
+                # encoded by a worker before the same media was sent for another datablock
+                continue
+            media_hashes.add(datablock_proxy._media_hash)
+        commands.append(Command(message_type, data, 0, compressed))
+
+    if datablock_proxy._media_hash not in media_hashes and _is_chunked_media(datablock_proxy, client.media_chunk_size):
+        media_hashes.add(datablock_proxy._media_hash)
+        path, source = datablock_proxy._media
+        upload = MediaUpload(datablock_proxy._media_hash, path, source, client.media_chunk_size)
+        logger.info("send_media_creations %s: %d bytes in chunks", path, upload.size)
+        client.add_media_upload(upload, commands, compress)
+        return
+
+    for command in commands:
+        client.add_command(command, compress)
+
+
+def _report_progress(done: int, count: int):
+    from mixer.bl_utils import get_mixer_props
+
+    get_mixer_props().joining_percentage = done / count
+
+
+class CreationEncoding:
+    """
+    The media and creation messages of a large changeset, encoded by a thread pool while Blender stays responsive.
+
+    BlenderClient.network_consumer() calls step() from the timer to queue the encoded messages in the changeset order.
+    The commands added in the meantime are held by BlenderClient.add_command() and queued after the creations, so that
+    the message order is the order of a synchronous encoding. The local changes and the received commands are not
+    processed until all the creations are queued, since they would modify the proxies that the workers encode.
+    """
+
+    def __init__(self, proxies: CreationChangeset):
+        client = share_data.client
+        self._proxies = list(proxies)
+        self._media_hashes = client.room_media_hashes
+        self._queued = 0
+        self.queueing = False
+        """True while step() queues the creation commands, that are not held"""
+
+        self.held_commands: List[Tuple[Command, bool]] = []
+        """Commands added while the creations are encoded, with their compress argument"""
+
+        codec = _encoding_codec()
+        # compress in the workers if the room uses compression
+        compression_threshold = client.compression_threshold
+        # the workers do not see the media added while they run, duplicates are dropped by _add_creation_commands()
+        room_media_hashes = frozenset(self._media_hashes)
+        self._executor = ThreadPoolExecutor(max_workers=ENCODING_WORKERS, thread_name_prefix="mixer_encode")
+        self._futures: List[Future] = [
+            self._executor.submit(
+                _encode_creation,
+                codec,
+                datablock_proxy,
+                compression_threshold,
+                room_media_hashes,
+                client.media_chunk_size,
+            )
+            for datablock_proxy in self._proxies
+        ]
+
+    def step(self, deadline: float) -> bool:
+        """
+        Queue the encoded messages, in the changeset order, until deadline. Return True once all are queued.
+        """
+        count = len(self._proxies)
+        self.queueing = True
+        try:
+            while self._queued < count:
+                datablock_proxy = self._proxies[self._queued]
+                try:
+                    messages = self._futures[self._queued].result(timeout=max(0.0, deadline - time.monotonic()))
+                except FuturesTimeoutError:
+                    return False
+                except Exception as e:
+                    _log_encode_error(datablock_proxy, e)
+                    self.cancel()
+                    return True
+                logger.info("%s %s", "send_data_create", datablock_proxy)
+                self._queued += 1
+                _add_creation_commands(datablock_proxy, messages, self._media_hashes, False)
+                _report_progress(self._queued, count)
+        finally:
+            self.queueing = False
+
+        self._executor.shutdown(wait=False)
+        logger.info("send_data_creations: %d proxies encoded with %d workers", count, ENCODING_WORKERS)
+        return True
+
+    def cancel(self):
+        for future in self._futures[self._queued :]:
+            future.cancel()
+        self._executor.shutdown(wait=False)
 
 
 def send_data_creations(proxies: CreationChangeset):
+    """
+    Send the media and creation messages for proxies, in the changeset order.
+
+    Large changesets are encoded by a thread pool, see CreationEncoding. The JSON encoding holds the GIL, but the
+    binary arrays concatenation and the compression do not. A process pool is not used since proxies are not designed
+    to be pickled and Blender's embedded interpreter cannot reliably spawn workers.
+    """
     if share_data.use_vrtist_protocol():
         return
 
-    codec = Codec()
+    client = share_data.client
+    count = len(proxies)
+    parallel = count >= PARALLEL_ENCODING_MIN_COUNT and ENCODING_WORKERS > 1
+    if parallel and client.creation_encoding is None:
+        client.creation_encoding = CreationEncoding(proxies)
+        return
 
+    codec = _encoding_codec()
+    media_hashes = client.room_media_hashes
+    media_chunk_size = client.media_chunk_size
     for datablock_proxy in proxies:
         logger.info("%s %s", "send_data_create", datablock_proxy)
-        send_media_creations(datablock_proxy)
         try:
-            encoded_proxy = codec.encode(datablock_proxy)
-        except EncodeError as e:
-            logger.error(f"send_data_create: encode exception for {datablock_proxy}")
-            logger.error(f"... {e!r}")
-            return
-        except Exception:
-            logger.error(f"send_data_create: encode exception for {datablock_proxy}")
-            for line in traceback.format_exc().splitlines():
-                logger.error(line)
+            messages = _encode_creation(codec, datablock_proxy, None, media_hashes, media_chunk_size)
+        except Exception as e:
+            _log_encode_error(datablock_proxy, e)
             return
+        _add_creation_commands(datablock_proxy, messages, media_hashes, True)
 
-        buffer = BlenderDataMessage.encode(datablock_proxy, encoded_proxy)
-        command = Command(MessageType.BLENDER_DATA_CREATE, buffer, 0)
-        share_data.client.add_command(command)
+
+def _log_encode_error(datablock_proxy: DatablockProxy, e: Exception):
+    logger.error(f"send_data_create: encode exception for {datablock_proxy}")
+    if isinstance(e, EncodeError):
+        logger.error(f"... {e!r}")
+    else:
+        for line in traceback.format_exception(type(e), e, e.__traceback__):
+            for sub_line in line.splitlines():
+                logger.error(sub_line)
 
 
 def send_data_updates(updates: UpdateChangeset):
     if share_data.use_vrtist_protocol():
         return
 
-    codec = Codec()
+    codec = _encoding_codec()
     for update in updates:
         logger.debug("%s %s", "send_data_update", update)
 
@@ -119,11 +371,10 @@ def build_data_create(buffer):
 
     share_data.set_dirty()
     rename_changeset = None
-    codec = Codec()
     try:
         message = BlenderDataMessage()
         message.decode(buffer)
-        datablock_proxy = codec.decode(message.proxy_string)
+        datablock_proxy = _decode_proxy(message)
         logger.info("%s %s", "build_data_create", datablock_proxy)
         datablock_proxy.arrays = message.arrays
         _, rename_changeset = share_data.bpy_data_proxy.create_datablock(datablock_proxy)
@@ -172,11 +423,10 @@ def build_data_update(buffer: bytes):
         return
 
     share_data.set_dirty()
-    codec = Codec()
     try:
         message = BlenderDataMessage()
         message.decode(buffer)
-        delta: Delta = codec.decode(message.proxy_string)
+        delta: Delta = _decode_proxy(message)
         logger.debug("%s: %s", "build_data_update", delta)
         delta.value.arrays = message.arrays
         share_data.bpy_data_proxy.update_datablock(delta)
@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import struct
+import array
 
 from mixer.blender_client.misc import get_or_create_object_data, get_object_path
 from mixer.broadcaster import common
@@ -28,15 +28,23 @@ def send_grease_pencil_stroke(stroke):
     buffer = common.encode_int(stroke.material_index)
     buffer += common.encode_int(stroke.line_width)
 
-    points = list()
-
-    for point in stroke.points:
-        points.extend(point.co)
-        points.append(point.pressure)
-        points.append(point.strength)
-
-    binary_points_buffer = common.int_to_bytes(len(stroke.points), 4) + struct.pack(f"{len(points)}f", *points)
-    buffer += binary_points_buffer
+    point_count = len(stroke.points)
+    co = array.array("f", [0.0]) * (3 * point_count)
+    pressure = array.array("f", [0.0]) * point_count
+    strength = array.array("f", [0.0]) * point_count
+    stroke.points.foreach_get("co", co)
+    stroke.points.foreach_get("pressure", pressure)
+    stroke.points.foreach_get("strength", strength)
+
+    # interleave as (x, y, z, pressure, strength) per point
+    points = array.array("f", [0.0]) * (5 * point_count)
+    points[0::5] = co[0::3]
+    points[1::5] = co[1::3]
+    points[2::5] = co[2::3]
+    points[3::5] = pressure
+    points[4::5] = strength
+
+    buffer += common.encode_typed_array(points, "f", 5)
     return buffer
 
 
@@ -139,7 +147,8 @@ def build_grease_pencil_connection(data):
 def decode_grease_pencil_stroke(grease_pencil_frame, stroke_index, data, index):
     material_index, index = common.decode_int(data, index)
     line_width, index = common.decode_int(data, index)
-    points, index = common.decode_array(data, index, "5f", 5 * 4)
+    points, index = common.decode_typed_array(data, index, "f", 5)
+    point_count = len(points) // 5
 
     if stroke_index >= len(grease_pencil_frame.strokes):
         stroke = grease_pencil_frame.strokes.new()
@@ -150,18 +159,20 @@ def decode_grease_pencil_stroke(grease_pencil_frame, stroke_index, data, index):
     stroke.line_width = line_width
 
     p = stroke.points
-    if len(points) > len(p):
-        p.add(len(points) - len(p))
-    if len(points) < len(p):
-        max_index = len(points) - 1
+    if point_count > len(p):
+        p.add(point_count - len(p))
+    if point_count < len(p):
+        max_index = point_count - 1
         for _i in range(max_index, len(p)):
             p.pop(max_index)
 
-    for i in range(len(p)):
-        point = points[i]
-        p[i].co = (point[0], point[1], point[2])
-        p[i].pressure = point[3]
-        p[i].strength = point[4]
+    co = array.array("f", [0.0]) * (3 * point_count)
+    co[0::3] = points[0::5]
+    co[1::3] = points[1::5]
+    co[2::3] = points[2::5]
+    p.foreach_set("co", co)
+    p.foreach_set("pressure", points[3::5])
+    p.foreach_set("strength", points[4::5])
     return index
 
 
@@ -86,7 +86,7 @@ def build_material(data):
     material_name_length = common.bytes_to_int(data[:4])
     start = 4
     end = start + material_name_length
-    material_name = data[start:end].decode()
+    material_name = str(data[start:end], "utf-8")
     start = end
 
     material = get_or_create_material(material_name)
@@ -18,11 +18,11 @@
 import logging
 import struct
 import array
+import itertools
 from typing import Optional
 
 import bpy
 import bmesh
-from mathutils import Vector
 
 from mixer.broadcaster import common
 from mixer.blender_client import material as material_api
@@ -35,53 +35,21 @@ def decode_layer_float(elmt, layer, data, index):
     return index
 
 
-def extract_layer_float(elmt, layer):
-    return (elmt[layer],)
-
-
-extract_layer_float.struct = "1f"
-
-
 def decode_layer_int(elmt, layer, data, index):
     elmt[layer], index = common.decode_int(data, index)
     return index
 
 
-def extract_layer_int(elmt, layer):
-    return (elmt[layer],)
-
-
-extract_layer_int.struct = "1i"
-
-
 def decode_layer_vector(elmt, layer, data, index):
     elmt[layer], index = common.decode_vector3(data, index)
     return index
 
 
-def extract_layer_vector3(elmt, layer):
-    v = elmt[layer]
-    return (v[0], v[1], v[2])
-
-
-extract_layer_vector3.struct = "3f"
-
-
 def decode_layer_color(elmt, layer, data, index):
     elmt[layer], index = common.decode_color(data, index)
     return index
 
 
-def extract_layer_color(elmt, layer):
-    color = elmt[layer]
-    if len(color) == 3:
-        return (color[0], color[1], color[2], 1.0)
-    return (color[0], color[1], color[2], color[3])
-
-
-extract_layer_color.struct = "4f"
-
-
 def decode_layer_uv(elmt, layer, data, index):
     pin_uv, index = common.decode_bool(data, index)
     uv, index = common.decode_vector2(data, index)
@@ -90,13 +58,6 @@ def decode_layer_uv(elmt, layer, data, index):
     return index
 
 
-def extract_layer_uv(elmt, layer):
-    return (elmt[layer].pin_uv, *elmt[layer].uv)
-
-
-extract_layer_uv.struct = "1I2f"
-
-
 def decode_bmesh_layer(data, index, layer_collection, element_seq, decode_layer_value_func):
     layer_count, index = common.decode_int(data, index)
     while layer_count > len(layer_collection):
@@ -112,18 +73,74 @@ def decode_bmesh_layer(data, index, layer_collection, element_seq, decode_layer_
     return index
 
 
-def encode_bmesh_layer(layer_collection, element_seq, extract_layer_tuple_func):
-    buffer = []
-    count = 0
-    for i in range(len(layer_collection)):
-        layer = layer_collection[i]
-        for elt in element_seq:
-            buffer.extend(extract_layer_tuple_func(elt, layer))
-            count += 1
+def foreach_get(collection, attribute: str, typecode: str, size: int) -> array.array:
+    """
+    Read attribute for all the items of collection into a new array.array of size values.
+    """
+    values = array.array(typecode, [0]) * size
+    collection.foreach_get(attribute, values)
+    return values
+
+
+MIN_SLICED_FACES = 16
+"""Shorter runs of faces with the same vertex count are encoded face by face, which is faster"""
 
-    binary_buffer = struct.pack("1I", len(layer_collection))
-    if len(layer_collection) > 0:
-        binary_buffer += struct.pack(extract_layer_tuple_func.struct * count, *buffer)
+
+def encode_faces(
+    material_indices: array.array,
+    smooth: array.array,
+    loop_starts: array.array,
+    loop_totals: array.array,
+    loop_vertices: array.array,
+) -> array.array:
+    """
+    Encode the faces as (material index, smooth, vertex count, vertices...) per face.
+
+    Consecutive faces with the same vertex count, like all the quads of a mesh, are interleaved with array slicing.
+    """
+    faces_array = array.array("i")
+    start = 0
+    for loop_total, run in itertools.groupby(loop_totals):
+        stop = start + len(list(run))
+        loop_start = loop_starts[start]
+        loop_stop = loop_start + (stop - start) * loop_total
+        if stop - start >= MIN_SLICED_FACES and loop_starts[start:stop] == array.array(
+            "i", range(loop_start, loop_stop, loop_total)
+        ):
+            columns = [material_indices[start:stop], smooth[start:stop], loop_totals[start:stop]]
+            columns.extend(loop_vertices[loop_start + i : loop_stop : loop_total] for i in range(loop_total))
+            faces_array.extend(common.interleave_arrays("i", columns))
+        else:
+            # few faces, or faces with non contiguous loops
+            for i in range(start, stop):
+                faces_array.extend((material_indices[i], smooth[i], loop_total))
+                faces_array.extend(loop_vertices[loop_starts[i] : loop_starts[i] + loop_total])
+        start = stop
+    return faces_array
+
+
+def encode_bmesh_layer(layers, attributes) -> bytes:
+    """
+    Encode mesh data layers in the format read by decode_bmesh_layer().
+
+    layers is a sequence of collections, one per layer, such as mesh.uv_layers[i].data. attributes is a sequence of
+    (attribute, typecode, width) with 4 bytes typecodes. The attributes are read with foreach_get() and
+    interleaved per element in the order of attributes.
+    """
+    binary_buffer = common.int_to_bytes(len(layers), 4)
+    stride = sum(width for _, _, width in attributes)
+    for elements in layers:
+        count = len(elements)
+        # interleave the attributes as raw 4 bytes words
+        words = array.array("I", [0]) * (stride * count)
+        offset = 0
+        for attribute, typecode, width in attributes:
+            values = array.array("I")
+            values.frombytes(foreach_get(elements, attribute, typecode, width * count).tobytes())
+            for component in range(width):
+                words[offset + component :: stride] = values[component::width]
+            offset += width
+        binary_buffer += words.tobytes()
     return binary_buffer
 
 
@@ -168,26 +185,20 @@ def encode_baked_mesh(obj):
     # get active uv layer
     uvlayer = mesh.uv_layers.active
 
-    vertices = array.array("d", (0.0,)) * len(mesh.vertices) * 3
-    mesh.vertices.foreach_get("co", vertices)
-
-    normals = array.array("d", (0.0,)) * len(mesh.loops) * 3
-    mesh.loops.foreach_get("normal", normals)
+    vertices = foreach_get(mesh.vertices, "co", "f", len(mesh.vertices) * 3)
+    normals = foreach_get(mesh.loops, "normal", "f", len(mesh.loops) * 3)
 
     if uvlayer:
-        uvs = array.array("d", (0.0,)) * len(mesh.loops) * 2
-        mesh.uv_layers[0].data.foreach_get("uv", uvs)
+        uvs = foreach_get(mesh.uv_layers[0].data, "uv", "f", len(mesh.loops) * 2)
     else:
-        uvs = []
+        uvs = array.array("f")
 
-    indices = array.array("i", (0,)) * len(mesh.loops)
-    mesh.loops.foreach_get("vertex_index", indices)
+    indices = foreach_get(mesh.loops, "vertex_index", "i", len(mesh.loops))
 
     if len(obj.material_slots) <= 1:
-        material_indices = []
+        material_indices = array.array("i")
     else:
-        material_indices = array.array("i", (0,)) * len(mesh.polygons)
-        mesh.polygons.foreach_get("material_index", material_indices)
+        material_indices = foreach_get(mesh.polygons, "material_index", "i", len(mesh.polygons))
 
     if obj.type != "MESH":
         obj.to_mesh_clear()
@@ -195,34 +206,14 @@ def encode_baked_mesh(obj):
         original_bm.to_mesh(mesh)
         original_bm.free()
 
-    # Vericex count + binary vertices buffer
-    size = len(vertices) // 3
-    binary_vertices_buffer = common.int_to_bytes(size, 4) + struct.pack(f"{len(vertices)}f", *vertices)
-
-    # Normals count + binary normals buffer
-    size = len(normals) // 3
-    binary_normals_buffer = common.int_to_bytes(size, 4) + struct.pack(f"{len(normals)}f", *normals)
-
-    # UVs count + binary uvs buffer
-    size = len(uvs) // 2
-    binary_uvs_buffer = common.int_to_bytes(size, 4) + struct.pack(f"{len(uvs)}f", *uvs)
-
-    # material indices + binary material indices buffer
-    size = len(material_indices)
-    binary_material_indices_buffer = common.int_to_bytes(size, 4) + struct.pack(
-        f"{len(material_indices)}I", *material_indices
-    )
-
-    # triangle indices count + binary triangle indices buffer
-    size = len(indices) // 3
-    binary_indices_buffer = common.int_to_bytes(size, 4) + struct.pack(f"{len(indices)}I", *indices)
-
+    # The signed arrays match the type of the Blender attributes and are emitted as the unsigned values
+    # of the protocol, indices are never negative
     return (
-        binary_vertices_buffer
-        + binary_normals_buffer
-        + binary_uvs_buffer
-        + binary_material_indices_buffer
-        + binary_indices_buffer
+        common.encode_typed_array(vertices, "f", 3)
+        + common.encode_typed_array(normals, "f", 3)
+        + common.encode_typed_array(uvs, "f", 2)
+        + common.encode_typed_array(material_indices, "i")
+        + common.encode_typed_array(indices, "i", 3)
     )
 
 
@@ -231,19 +222,15 @@ def encode_base_mesh_geometry(mesh_data):
     # We do not synchronize "select" and "hide" state of mesh elements
     # because we consider them user specific.
 
-    bm = bmesh.new()
-    bm.from_mesh(mesh_data)
+    # The encoding matches the content of a bmesh loaded from mesh_data, as decoded by decode_base_mesh(), but is read
+    # from mesh_data with foreach_get(). Vertices, edges, faces and loops have the same order in both.
 
     binary_buffer = bytes()
 
-    logger.debug("Writing %d vertices", len(bm.verts))
-    bm.verts.ensure_lookup_table()
-
-    verts_array = []
-    for vert in bm.verts:
-        verts_array.extend((*vert.co,))
+    vertex_count = len(mesh_data.vertices)
+    logger.debug("Writing %d vertices", vertex_count)
 
-    binary_buffer += struct.pack(f"1I{len(verts_array)}f", len(bm.verts), *verts_array)
+    binary_buffer += common.encode_typed_array(foreach_get(mesh_data.vertices, "co", "f", vertex_count * 3), "f", 3)
 
     # Vertex layers
     # Ignored layers for now:
@@ -253,51 +240,61 @@ def encode_base_mesh_geometry(mesh_data):
     # Other ignored layers:
     # - shape: shape keys are handled with Shape Keys at the mesh and object level
     # - float, int, string: don't really know their role
-    binary_buffer += encode_bmesh_layer(bm.verts.layers.bevel_weight, bm.verts, extract_layer_float)
+    vertex_bevel_layers = [mesh_data.vertices] if mesh_data.use_customdata_vertex_bevel else []
+    binary_buffer += encode_bmesh_layer(vertex_bevel_layers, (("bevel_weight", "f", 1),))
 
-    logger.debug("Writing %d edges", len(bm.edges))
-    bm.edges.ensure_lookup_table()
+    edge_count = len(mesh_data.edges)
+    logger.debug("Writing %d edges", edge_count)
 
-    edges_array = []
-    for edge in bm.edges:
-        edges_array.extend((edge.verts[0].index, edge.verts[1].index, edge.smooth, edge.seam))
+    # (vertex 0, vertex 1, smooth, seam) per edge
+    edge_vertices = foreach_get(mesh_data.edges, "vertices", "i", edge_count * 2)
+    edge_sharp = foreach_get(mesh_data.edges, "use_edge_sharp", "i", edge_count)
+    edge_smooth = array.array("i", [1 - sharp for sharp in edge_sharp])
+    edge_seam = foreach_get(mesh_data.edges, "use_seam", "i", edge_count)
+    edges_array = common.interleave_arrays("i", (edge_vertices[0::2], edge_vertices[1::2], edge_smooth, edge_seam))
 
-    binary_buffer += struct.pack(f"1I{len(edges_array)}I", len(bm.edges), *edges_array)
+    binary_buffer += common.encode_typed_array(edges_array, "i", 4)
 
     # Edge layers
     # Ignored layers for now: None
     # Other ignored layers:
     # - freestyle: of type NotImplementedType, maybe reserved for future dev
     # - float, int, string: don't really know their role
-    binary_buffer += encode_bmesh_layer(bm.edges.layers.bevel_weight, bm.edges, extract_layer_float)
-    binary_buffer += encode_bmesh_layer(bm.edges.layers.crease, bm.edges, extract_layer_float)
+    edge_bevel_layers = [mesh_data.edges] if mesh_data.use_customdata_edge_bevel else []
+    binary_buffer += encode_bmesh_layer(edge_bevel_layers, (("bevel_weight", "f", 1),))
+    edge_crease_layers = [mesh_data.edges] if mesh_data.use_customdata_edge_crease else []
+    binary_buffer += encode_bmesh_layer(edge_crease_layers, (("crease", "f", 1),))
 
-    logger.debug("Writing %d faces", len(bm.faces))
-    bm.faces.ensure_lookup_table()
+    face_count = len(mesh_data.polygons)
+    logger.debug("Writing %d faces", face_count)
 
-    faces_array = []
-    for face in bm.faces:
-        faces_array.extend((face.material_index, face.smooth, len(face.verts)))
-        faces_array.extend((vert.index for vert in face.verts))
+    # (material index, smooth, vertex count, vertices...) per face
+    material_indices = foreach_get(mesh_data.polygons, "material_index", "i", face_count)
+    smooth = foreach_get(mesh_data.polygons, "use_smooth", "i", face_count)
+    loop_starts = foreach_get(mesh_data.polygons, "loop_start", "i", face_count)
+    loop_totals = foreach_get(mesh_data.polygons, "loop_total", "i", face_count)
+    loop_vertices = foreach_get(mesh_data.loops, "vertex_index", "i", len(mesh_data.loops))
+    faces_array = encode_faces(material_indices, smooth, loop_starts, loop_totals, loop_vertices)
 
-    binary_buffer += struct.pack(f"1I{len(faces_array)}I", len(bm.faces), *faces_array)
+    binary_buffer += common.int_to_bytes(face_count, 4) + faces_array.tobytes()
 
     # Face layers
     # Ignored layers for now: None
     # Other ignored layers:
     # - freestyle: of type NotImplementedType, maybe reserved for future dev
     # - float, int, string: don't really know their role
-    binary_buffer += encode_bmesh_layer(bm.faces.layers.face_map, bm.faces, extract_layer_int)
+    face_map_layers = [face_map.data for face_map in mesh_data.face_maps]
+    binary_buffer += encode_bmesh_layer(face_map_layers, (("value", "i", 1),))
 
     # Loops layers
     # A loop is an edge attached to a face (so each edge of a manifold can have 2 loops at most).
     # Ignored layers for now: None
     # Other ignored layers:
     # - float, int, string: don't really know their role
-    binary_buffer += encode_bmesh_layer(bm.loops.layers.uv, loops_iterator(bm), extract_layer_uv)
-    binary_buffer += encode_bmesh_layer(bm.loops.layers.color, loops_iterator(bm), extract_layer_color)
-
-    bm.free()
+    uv_layers = [uv_layer.data for uv_layer in mesh_data.uv_layers]
+    binary_buffer += encode_bmesh_layer(uv_layers, (("pin_uv", "i", 1), ("uv", "f", 2)))
+    color_layers = [vertex_colors.data for vertex_colors in mesh_data.vertex_colors]
+    binary_buffer += encode_bmesh_layer(color_layers, (("color", "f", 4),))
 
     return binary_buffer
 
@@ -332,16 +329,12 @@ def encode_base_mesh(obj):
         for key_block in mesh_data.shape_keys.key_blocks:
             binary_buffer += common.encode_string(key_block.relative_key.name)
         # Encode data
-        shape_keys_buffer = []
-        fmt_str = ""
         for key_block in mesh_data.shape_keys.key_blocks:
-            shape_keys_buffer.extend(
-                (key_block.mute, key_block.value, key_block.slider_min, key_block.slider_max, len(key_block.data))
+            binary_buffer += struct.pack(
+                "1I1f1f1f", key_block.mute, key_block.value, key_block.slider_min, key_block.slider_max
             )
-            fmt_str += f"1I1f1f1f1I{(3 * len(key_block.data))}f"
-            for i in range(len(key_block.data)):
-                shape_keys_buffer.extend(key_block.data[i].co)
-        binary_buffer += struct.pack(f"{fmt_str}", *shape_keys_buffer)
+            co = foreach_get(key_block.data, "co", "f", len(key_block.data) * 3)
+            binary_buffer += common.encode_typed_array(co, "f", 3)
 
         binary_buffer += common.encode_bool(mesh_data.shape_keys.use_relative)
 
@@ -371,10 +364,8 @@ def encode_base_mesh(obj):
 
     if mesh_data.has_custom_normals:
         mesh_data.calc_normals_split()  # Required otherwise all normals are (0, 0, 0)
-        normals = []
-        for loop in mesh_data.loops:
-            normals.extend((*loop.normal,))
-        binary_buffer += struct.pack(f"{len(normals)}f", *normals)
+        normals = foreach_get(mesh_data.loops, "normal", "f", len(mesh_data.loops) * 3)
+        binary_buffer += normals.tobytes()
 
     # UV Maps
     for uv_layer in mesh_data.uv_layers:
@@ -430,8 +421,8 @@ def decode_baked_mesh(obj: Optional[bpy.types.Object], data, index):
     positions, index = common.decode_vector3_array(data, index)
     normals, index = common.decode_vector3_array(data, index)
     uvs, index = common.decode_vector2_array(data, index)
-    material_indices, index = common.decode_int_array(data, index)
-    triangles, index = common.decode_int3_array(data, index)
+    material_indices, index = common.decode_typed_array(data, index, "I")
+    triangles, index = common.decode_typed_array(data, index, "I", 3)
 
     if obj is not None:
         bm = bmesh.new()
@@ -451,11 +442,10 @@ def decode_baked_mesh(obj: Optional[bpy.types.Object], data, index):
             multi_material = True
 
         current_uv_index = 0
-        for i in range(len(triangles)):
-            triangle = triangles[i]
-            i1 = triangle[0]
-            i2 = triangle[1]
-            i3 = triangle[2]
+        for i in range(len(triangles) // 3):
+            i1 = triangles[3 * i]
+            i2 = triangles[3 * i + 1]
+            i3 = triangles[3 * i + 2]
             try:
                 face = bm.faces.new((bm.verts[i1], bm.verts[i2], bm.verts[i3]))
                 if multi_material:
@@ -485,23 +475,20 @@ def decode_baked_mesh(obj: Optional[bpy.types.Object], data, index):
 def decode_base_mesh(client, obj: bpy.types.Object, mesh: bpy.types.Mesh, data, index):
     bm = bmesh.new()
 
-    position_count, index = common.decode_int(data, index)
-    logger.debug("Reading %d vertices", position_count)
+    positions, index = common.decode_vector3_array(data, index)
+    logger.debug("Reading %d vertices", len(positions))
 
-    for _pos_idx in range(position_count):
-        co, index = common.decode_vector3(data, index)
+    for co in positions:
         bm.verts.new(co)
 
     bm.verts.ensure_lookup_table()
 
     index = decode_bmesh_layer(data, index, bm.verts.layers.bevel_weight, bm.verts, decode_layer_float)
 
-    edge_count, index = common.decode_int(data, index)
+    edges_data, index = common.decode_typed_array(data, index, "I", 4)
+    edge_count = len(edges_data) // 4
     logger.debug("Reading %d edges", edge_count)
 
-    edges_data = struct.unpack(f"{edge_count * 4}I", data[index : index + edge_count * 4 * 4])
-    index += edge_count * 4 * 4
-
     for edge_idx in range(edge_count):
         v1 = edges_data[edge_idx * 4]
         v2 = edges_data[edge_idx * 4 + 1]
@@ -556,10 +543,8 @@ def decode_base_mesh(client, obj: bpy.types.Object, mesh: bpy.types.Mesh, data,
             shape_key.value, index = common.decode_float(data, index)
             shape_key.slider_min, index = common.decode_float(data, index)
             shape_key.slider_max, index = common.decode_float(data, index)
-            shape_key_data_size, index = common.decode_int(data, index)
-            for i in range(shape_key_data_size):
-                shape_key.data[i].co = Vector(struct.unpack("3f", data[index : index + 3 * 4]))
-                index += 3 * 4
+            shape_key_data, index = common.decode_typed_array_view(data, index, "f", 3)
+            shape_key.data.foreach_set("co", shape_key_data)
         obj.data.shape_keys.use_relative, index = common.decode_bool(data, index)
 
     # Vertex Groups
@@ -582,10 +567,9 @@ def decode_base_mesh(client, obj: bpy.types.Object, mesh: bpy.types.Mesh, data,
     has_custom_normal, index = common.decode_bool(data, index)
 
     if has_custom_normal:
-        normals = []
-        for _loop in mesh.loops:
-            normal, index = common.decode_vector3(data, index)
-            normals.append(normal)
+        normal_count = len(mesh.loops)
+        normals = list(struct.iter_unpack("3f", data[index : index + normal_count * 3 * 4]))
+        index += normal_count * 3 * 4
         mesh.normals_split_custom_set(normals)
 
     # UV Maps and Vertex Colors are added automatically based on layers in the bmesh
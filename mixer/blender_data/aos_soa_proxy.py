@@ -24,9 +24,11 @@ See synchronization.md
 """
 from __future__ import annotations
 
+from collections import OrderedDict
 import array
+import hashlib
 import logging
-from typing import List, Dict, Optional, Tuple, TYPE_CHECKING
+from typing import List, Dict, Optional, Tuple, TYPE_CHECKING, Union
 
 import bpy
 import bpy.types as T  # noqa
@@ -36,6 +38,7 @@ from mixer.blender_data.json_codec import serialize
 from mixer.blender_data.proxy import DeltaUpdate, Proxy
 from mixer.blender_data.specifics import soa_initializers
 from mixer.blender_data.type_helpers import is_vector
+from mixer.blender_data.types import SoaSpans
 
 if TYPE_CHECKING:
     from mixer.blender_data.proxy import Context
@@ -51,11 +54,95 @@ def soa_initializer(attr_type, length):
     # TODO try to be smart
     element_init = soa_initializers[attr_type]
     if isinstance(element_init, array.array):
-        return array.array(element_init.typecode, element_init.tolist() * length)
+        return array.array(element_init.typecode, element_init) * length
     elif isinstance(element_init, list):
         return element_init * length
 
 
+def soa_digest(buffer: array.array) -> bytes:
+    """Digest used to detect changes in SoaElement arrays without comparing them"""
+    return hashlib.blake2b(buffer, digest_size=16).digest()
+
+
+class ScratchBuffers:
+    """
+    Pool of buffers reused by SoaElement.diff() to read the Blender values, keyed by (typecode, length).
+
+    The least recently used buffers are dropped when the pool size exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        self._buffers: OrderedDict[Tuple[str, int], array.array] = OrderedDict()
+        self._byte_size = 0
+        self._max_bytes = max_bytes
+
+    def acquire(self, typecode: str, length: int) -> array.array:
+        """Return a buffer with undefined contents, that may be given back with release()"""
+        buffer = self._buffers.pop((typecode, length), None)
+        if buffer is None:
+            return array.array(typecode, [0]) * length
+        self._byte_size -= buffer.itemsize * length
+        return buffer
+
+    def release(self, buffer: array.array):
+        key = (buffer.typecode, len(buffer))
+        if key in self._buffers:
+            return
+        self._buffers[key] = buffer
+        self._byte_size += buffer.itemsize * len(buffer)
+        while self._byte_size > self._max_bytes:
+            _, dropped = self._buffers.popitem(last=False)
+            self._byte_size -= dropped.itemsize * len(dropped)
+
+    def clear(self):
+        self._buffers.clear()
+        self._byte_size = 0
+
+
+scratch_buffers = ScratchBuffers()
+
+SPAN_CHUNK_BYTES = 4096
+"""Size of the blocks compared to find the changed spans of an array"""
+
+MAX_SPANS_RATIO = 0.5
+"""The complete array is sent when the changed spans cover more than this ratio of the array"""
+
+
+def changed_spans(
+    old: array.array, new: array.array, chunk_bytes: int = SPAN_CHUNK_BYTES
+) -> Optional[List[Tuple[int, int]]]:
+    """
+    Return the (start, stop) ranges of new that differ from old, with a chunk_bytes granularity.
+
+    Return None if old and new do not have the same layout, or if the spans cover most of new.
+    """
+    if old.typecode != new.typecode or len(old) != len(new):
+        return None
+
+    itemsize = new.itemsize
+    chunk_items = max(1, chunk_bytes // itemsize)
+    chunk_bytes = chunk_items * itemsize
+    max_changed = MAX_SPANS_RATIO * len(new)
+    # do not copy the arrays. Comparing memoryviews is done item by item, so compare chunk copies instead
+    old_bytes = memoryview(old).cast("B")
+    new_bytes = memoryview(new).cast("B")
+    spans: List[Tuple[int, int]] = []
+    changed = 0
+    for offset in range(0, len(new_bytes), chunk_bytes):
+        if old_bytes[offset : offset + chunk_bytes].tobytes() == new_bytes[offset : offset + chunk_bytes].tobytes():
+            continue
+        start = offset // itemsize
+        stop = min(start + chunk_items, len(new))
+        if spans and spans[-1][1] == start:
+            spans[-1] = (spans[-1][0], stop)
+        else:
+            spans.append((start, stop))
+        changed += stop - start
+        if changed > max_changed:
+            return None
+    return spans
+
+
 @serialize
 class AosElement(Proxy):
     """
@@ -117,6 +204,16 @@ class SoaElement(Proxy):
     def __init__(self, member_name: str):
         self._array = array.array("b", [])
         self._member_name = member_name
+        self._digest: Optional[bytes] = None
+        """soa_digest() of _array, computed on demand"""
+
+        self._spans: Optional[List[Tuple[int, int]]] = None
+        """For a delta, the (start, stop) ranges of _array to send, or None to send the complete array"""
+
+    def digest(self) -> bytes:
+        if self._digest is None:
+            self._digest = soa_digest(self._array)
+        return self._digest
 
     def array_attr(self, aos: T.bpy_prop_collection, bl_rna: T.bpy_struct) -> Tuple[int, type]:
         prototype_item = getattr(aos[0], self._member_name)
@@ -156,6 +253,7 @@ class SoaElement(Proxy):
             # it means that the array is ill-formed.
             # Check rna_access.c:rna_raw_access()
             aos.foreach_get(self._member_name, self._array)
+        self._digest = None
         self._attach(context)
         return self
 
@@ -178,8 +276,31 @@ class SoaElement(Proxy):
         """
         assert self._member_name == key
 
-    def save_array(self, aos: T.bpy_prop_collection, member_name, array_: array.array):
+    def _patch(self, aos: T.bpy_prop_collection, soa_spans: SoaSpans) -> Optional[array.array]:
+        """Return the Blender values of this member, updated with soa_spans"""
+        # The proxy array cannot be used as a base, it was replaced by the (empty) array of the received delta
+        # during the proxy update
+        array_ = array.array(soa_spans.typecode, [0]) * soa_spans.length
+        try:
+            aos.foreach_get(self._member_name, array_)
+        except RuntimeError as e:
+            logger.error(f"patching soa {aos!r}[].{self._member_name} failed")
+            logger.error(f"... member size: {len(aos)}, array: ('{soa_spans.typecode}', {soa_spans.length})")
+            logger.error(f"... exception {e!r}")
+            return None
+
+        for start, values in soa_spans.spans:
+            array_[start : start + len(values)] = values
+        return array_
+
+    def save_array(self, aos: T.bpy_prop_collection, member_name, array_: Union[array.array, SoaSpans]):
         assert member_name == self._member_name
+        if isinstance(array_, SoaSpans):
+            # there is no foreach_set() for a range, so update the complete Blender array
+            array_ = self._patch(aos, array_)
+            if array_ is None:
+                return
+
         if logger.isEnabledFor(logging.DEBUG):
             message = f"save_array {aos}.{member_name}"
             if self._array is not None:
@@ -189,6 +310,7 @@ class SoaElement(Proxy):
             logger.debug(message)
 
         self._array = array_
+        self._digest = None
         try:
             aos.foreach_set(member_name, array_)
         except RuntimeError as e:
@@ -218,6 +340,7 @@ class SoaElement(Proxy):
         if update is None:
             return self
         self._array = update._array
+        self._digest = update._digest
         if self._member_name != update._member_name:
             logger.error(f"apply: self._member_name != update._member_name {self._member_name} {update._member_name}")
             return self
@@ -228,8 +351,8 @@ class SoaElement(Proxy):
             return None
 
         array_size, member_type = self.array_attr(aos, prop.bl_rna)
-        typecode = self._array.typecode
-        tmp_array = array.array(typecode, soa_initializer(member_type, array_size))
+        typecode = soa_initializers[member_type].typecode
+        tmp_array = scratch_buffers.acquire(typecode, array_size)
         if logger.isEnabledFor(logging.DEBUG):
             message = (
                 f"diff {aos}.{self._member_name} proxy({len(self._array)} {typecode}) blender'{len(aos)} {member_type}'"
@@ -243,10 +366,16 @@ class SoaElement(Proxy):
             logger.error(f"... member size: {len(aos)}, tmp_array: ('{tmp_array.typecode}', {len(tmp_array)})")
             logger.error(f"... exception {e!r}")
 
-        if self._array == tmp_array:
+        # Compare digests rather than arrays: this is faster for float arrays and only hashes the new values
+        digest = soa_digest(tmp_array)
+        if self._array.typecode == typecode and len(self._array) == array_size and self.digest() == digest:
+            scratch_buffers.release(tmp_array)
             return None
 
+        # the scratch buffer is not released as it becomes the delta and then the proxy value
         diff = self.__class__(self._member_name)
         diff._array = tmp_array
+        diff._digest = digest
+        diff._spans = changed_spans(self._array, tmp_array)
         diff._attach(context)
         return DeltaUpdate(diff)
@@ -24,6 +24,7 @@ from typing import Any, Optional, Union, TYPE_CHECKING
 import bpy
 import bpy.types as T  # noqa
 
+from mixer.blender_data.filter import PropertyKind
 from mixer.blender_data.proxy import Delta, DeltaUpdate, Proxy
 from mixer.blender_data.specifics import is_soable_collection
 from mixer.blender_data.type_helpers import is_vector, is_matrix
@@ -60,15 +61,60 @@ def _read_builtin(attr):
     raise _NotBuiltin
 
 
-def read_attribute(attr: Any, key: Union[int, str], attr_property: T.Property, parent: T.bpy_struct, context: Context):
+def _read_datablock(attr: Optional[T.ID], context: Context):
+    if attr is None:
+        from mixer.blender_data.misc_proxies import NonePtrProxy
+
+        return NonePtrProxy()
+
+    if attr.is_embedded_data:
+        from mixer.blender_data.struct_proxy import StructProxy
+
+        return StructProxy.make(attr).load(attr, context)
+
+    from mixer.blender_data.datablock_ref_proxy import DatablockRefProxy
+
+    return DatablockRefProxy().load(attr, context)
+
+
+def read_attribute(
+    attr: Any,
+    key: Union[int, str],
+    attr_property: T.Property,
+    parent: T.bpy_struct,
+    context: Context,
+    kind: Optional[PropertyKind] = None,
+):
     """
     Load a property into a python object of the appropriate type, be it a Proxy or a native python object
-    """
 
-    try:
-        return _read_builtin(attr)
-    except _NotBuiltin:
-        pass
+    If provided, kind is the PropertyKind of attr_property, taken from a PropertyPlan. It selects the proxy type
+    without inspecting the value type.
+    """
+    if kind is PropertyKind.BUILTIN:
+        try:
+            return _read_builtin(attr)
+        except _NotBuiltin:
+            pass
+    elif kind is PropertyKind.SOABLE:
+        from mixer.blender_data.aos_proxy import AosProxy
+
+        context.visit_state.push(attr_property, key)
+        try:
+            return AosProxy().load(attr, attr_property, context)
+        finally:
+            context.visit_state.pop()
+    elif kind is PropertyKind.DATABLOCK:
+        context.visit_state.push(attr_property, key)
+        try:
+            return _read_datablock(attr, context)
+        finally:
+            context.visit_state.pop()
+    elif kind is None:
+        try:
+            return _read_builtin(attr)
+        except _NotBuiltin:
+            pass
 
     if isinstance(attr, set):
         from mixer.blender_data.misc_proxies import SetProxy
@@ -117,18 +163,10 @@ def read_attribute(attr: Any, key: Union[int, str], attr_property: T.Property, p
             return StructProxy.make(attr).load(attr, context)
 
         if issubclass(attr_type, T.ID):
-            if attr.is_embedded_data:
-                # Embedded datablocks are loaded as StructProxy and DatablockProxy is reserved
-                # for standalone datablocks
-                from mixer.blender_data.struct_proxy import StructProxy
-
-                return StructProxy.make(attr).load(attr, context)
-            else:
-                # Standalone databocks are loaded from DatablockCollectionProxy, so we can only encounter
-                # datablock references here
-                from mixer.blender_data.datablock_ref_proxy import DatablockRefProxy
-
-                return DatablockRefProxy().load(attr, context)
+            # Embedded datablocks are loaded as StructProxy and DatablockProxy is reserved for standalone
+            # datablocks. Standalone databocks are loaded from DatablockCollectionProxy, so we can only encounter
+            # datablock references here
+            return _read_datablock(attr, context)
 
         proxy = PtrToCollectionItemProxy.make(type(parent), key)
         if proxy is not None:
@@ -161,7 +199,11 @@ def get_attribute_value(parent, key):
 
 
 def write_attribute(
-    parent: Union[T.bpy_struct, T.bpy_prop_collection], key: Union[str, int], value: Any, context: Context
+    parent: Union[T.bpy_struct, T.bpy_prop_collection],
+    key: Union[str, int],
+    value: Any,
+    context: Context,
+    prop: Optional[T.Property] = None,
 ):
     """
     Write value into parent.key or parent[key].
@@ -174,6 +216,7 @@ def write_attribute(
         key: an index of member name that identifies the target attribute
         value: the proxy or python builtin value to save parent[key] or parent[key]
         context: proxy and visit state
+        prop: the property of parent.key if known, for instance from a PropertyPlan
     """
     # Like in apply_attribute parent and key are needed to specify a L-value in setattr()
     try:
@@ -192,7 +235,8 @@ def write_attribute(
         else:
             assert isinstance(key, str)
 
-            prop = parent.bl_rna.properties.get(key)
+            if prop is None:
+                prop = parent.bl_rna.properties.get(key)
             if prop is None:
                 # Don't log this, too many messages
                 # f"Attempt to write to non-existent attribute {bl_instance}.{key} : skipped"
@@ -293,7 +337,12 @@ def apply_attribute(
 
 
 def diff_attribute(
-    item: Any, key: Union[int, str], item_property: T.Property, value: Any, context: Context
+    item: Any,
+    key: Union[int, str],
+    item_property: T.Property,
+    value: Any,
+    context: Context,
+    kind: Optional[PropertyKind] = None,
 ) -> Optional[Delta]:
     """
     Computes a difference between a blender item and a proxy value
@@ -302,10 +351,11 @@ def diff_attribute(
         item: the blender item
         item_property: the property of item as found in its enclosing object
         value: a proxy value
+        kind: the PropertyKind of item_property if known, for instance from a PropertyPlan
 
     """
     try:
-        if isinstance(value, Proxy):
+        if kind is not PropertyKind.BUILTIN and isinstance(value, Proxy):
             context.visit_state.push(item, key)
             try:
                 return value.diff(item, key, item_property, context)
@@ -37,7 +37,7 @@ from mixer.blender_data.bpy_data import collections_names
 from mixer.blender_data.changeset import Changeset, RenameChangeset
 from mixer.blender_data.datablock_collection_proxy import DatablockCollectionProxy
 from mixer.blender_data.datablock_proxy import DatablockProxy
-from mixer.blender_data.diff import BpyBlendDiff
+from mixer.blender_data.diff import BpyBlendDiff, CollectionFingerprints
 from mixer.blender_data.filter import SynchronizedProperties, safe_depsgraph_updates, safe_properties
 from mixer.blender_data.proxy import (
     DeltaReplace,
@@ -348,12 +348,19 @@ class BpyDataProxy(Proxy):
         self._delayed_remote_updates: List[Callable[[], None]] = []
         """Remote datablock updates retained until returning to Object mode."""
 
+        self._collection_fingerprints = CollectionFingerprints()
+        """State of the bpy.data collections at their last diff, to skip the unchanged ones"""
+
     def clear(self):
         self._data.clear()
         self.state.proxies.clear()
         self.state._datablocks.clear()
+        self._collection_fingerprints.invalidate()
 
     def reload_datablocks(self):
+        # undo replaces all the datablocks
+        self._collection_fingerprints.invalidate()
+
         datablocks = self.state._datablocks
         datablocks.clear()
 
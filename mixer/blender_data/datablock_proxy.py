@@ -38,7 +38,12 @@ from mixer.blender_data.proxy import Delta, DeltaReplace, DeltaUpdate, ExternalF
 from mixer.blender_data.misc_proxies import CustomPropertiesProxy
 from mixer.blender_data.struct_proxy import StructProxy
 from mixer.blender_data.type_helpers import sub_id_type
-from mixer.local_data import get_resolved_file_path, get_source_file_path
+from mixer.local_data import (
+    compute_content_hash,
+    compute_file_content_hash,
+    get_resolved_file_path,
+    get_source_file_path,
+)
 
 if TYPE_CHECKING:
     from mixer.blender_data.aos_soa_proxy import SoaElement
@@ -64,6 +69,7 @@ class DatablockProxy(StructProxy):
         "_custom_properties",
         "_is_in_shared_folder",
         "_filepath_raw",
+        "_media_hash",
         "_type_name",
     )
 
@@ -87,9 +93,11 @@ class DatablockProxy(StructProxy):
         Serialized as array"""
 
         # TODO move into _arrays
-        self._media: Optional[Tuple[str, bytes]] = None
-        """Media file data.
+        self._media: Optional[Tuple[str, Union[bytes, str]]] = None
+        """Media source path, and media data or path of the local file that contains it.
         Serialized as array"""
+        self._media_hash: Optional[str] = None
+        """Hash of the content of the media file, that identifies the media in the room and in the local cache"""
         self._is_in_shared_folder: Optional[bool] = None
         self._filepath_raw: Optional[str] = None
 
@@ -199,13 +207,11 @@ class DatablockProxy(StructProxy):
         if isinstance(datablock, T.Object):
             context.proxy_state.register_object(datablock)
 
-        properties = context.synchronized_properties.properties(datablock)
-        # this assumes that specifics.py apply only to ID, not Struct
-        properties = specifics.conditional_properties(datablock, properties)
+        plan = context.synchronized_properties.plan(datablock)
         with context.visit_state.enter_datablock(self, datablock):
-            for name, bl_rna_property in properties:
+            for name, bl_rna_property, kind in plan.filtered(datablock):
                 attr = getattr(datablock, name)
-                attr_value = read_attribute(attr, name, bl_rna_property, datablock, context)
+                attr_value = read_attribute(attr, name, bl_rna_property, datablock, context, kind)
                 # Also write None values to reset attributes like Camera.dof.focus_object
                 # TODO for scene, test difference, only send update if dirty as continuous updates to scene
                 # master collection will conflicting writes with Master Collection
@@ -271,7 +277,7 @@ class DatablockProxy(StructProxy):
             return None
 
         if not self._is_in_shared_folder:
-            resolved_filepath = get_resolved_file_path(self._filepath_raw)
+            resolved_filepath = get_resolved_file_path(self._filepath_raw, self._media_hash)
             logger.info(f"resolved_filepath: for {self} not in shared folder ...")
             logger.info(f"... resolve {self._filepath_raw!r} to {resolved_filepath}")
         else:
@@ -299,6 +305,7 @@ class DatablockProxy(StructProxy):
             if packed_file is not None:
                 data = packed_file.data
                 self._media = (get_source_file_path(self._filepath_raw), data)
+                self._media_hash = compute_content_hash(data)
                 return
 
             relative_to_shared_folder_path = self.matches_shared_folder(self._filepath_raw, context)
@@ -306,20 +313,23 @@ class DatablockProxy(StructProxy):
                 self._filepath_raw = relative_to_shared_folder_path
                 self._is_in_shared_folder = True
                 self._media = None
+                self._media_hash = None
                 return
 
             path = get_source_file_path(self._filepath_raw)
             try:
+                # the file is read when sent, possibly in chunks
                 abspath = bpy.path.abspath(path)
-                with open(abspath, "rb") as data_file:
-                    data = data_file.read()
+                content_hash = compute_file_content_hash(abspath)
             except Exception as e:
                 logger.error(f"Error while loading {abspath!r} ...")
                 logger.error(f"... for {datablock!r}. Check shared folders ...")
                 logger.error(f"... {e!r}")
                 self._media = None
+                self._media_hash = None
             else:
-                self._media = (path, data)
+                self._media = (path, abspath)
+                self._media_hash = content_hash
 
     @property
     def collection_name(self) -> str:
@@ -425,9 +435,10 @@ class DatablockProxy(StructProxy):
             logger.warning(f"DatablockProxy.update_standalone_datablock() {self} pre_save returns None")
             return None, None
 
+        properties = context.synchronized_properties.plan(datablock).properties
         with context.visit_state.enter_datablock(self, datablock):
             for k, v in self._data.items():
-                write_attribute(datablock, k, v, context)
+                write_attribute(datablock, k, v, context, properties.get(k))
 
         self._custom_properties.save(datablock)
         return datablock
@@ -465,9 +476,10 @@ class DatablockProxy(StructProxy):
             logger.error(f"DatablockProxy.save() get None after _pre_save({attribute})")
             return None
 
+        properties = context.synchronized_properties.plan(datablock).properties
         with context.visit_state.enter_datablock(self, datablock):
             for k, v in self._data.items():
-                write_attribute(datablock, k, v, context)
+                write_attribute(datablock, k, v, context, properties.get(k))
 
         return datablock
 
@@ -26,15 +26,17 @@ See synchronization.md
 from __future__ import annotations
 
 import logging
-from typing import List, Dict, Tuple, TYPE_CHECKING
+from typing import Dict, Iterable, List, Optional, Set, Tuple, TYPE_CHECKING
 
 import bpy
 import bpy.types as T  # noqa
 
+from mixer.blender_data.bpy_data import rna_identifier_to_collection_name
 from mixer.blender_data.datablock_proxy import DatablockProxy
 from mixer.blender_data.filter import SynchronizedProperties, skip_bpy_data_item
 from mixer.blender_data.proxy import ensure_uuid
 from mixer.blender_data.library_proxies import DatablockLinkProxy
+from mixer.blender_data.type_helpers import sub_id_type
 
 if TYPE_CHECKING:
     from mixer.blender_data.bpy_data_proxy import BpyDataProxy
@@ -51,6 +53,72 @@ logger = logging.getLogger(__name__)
 Uuid = str
 BpyDataCollectionName = str
 
+Fingerprint = Tuple[int, int]
+"""(datablock count, hash of the datablock names)"""
+
+
+def updated_collection_names(datablocks: Iterable[T.ID]) -> Set[BpyDataCollectionName]:
+    """
+    Names of the bpy.data collections of datablocks, e.g. {"objects", "meshes"}.
+
+    Embedded datablocks map to the collection of their type, e.g. "node_groups" for a material node tree.
+    """
+    collection_names = set()
+    for datablock in datablocks:
+        id_type = sub_id_type(type(datablock))
+        if id_type is None:
+            continue
+        collection_name = rna_identifier_to_collection_name().get(id_type.bl_rna.identifier)
+        if collection_name is not None:
+            collection_names.add(collection_name)
+    return collection_names
+
+
+class CollectionFingerprints:
+    """
+    Fingerprints of the bpy.data collections at the time of their last diff.
+
+    A datablock addition or removal changes the count of a collection and a rename changes the hash of its names, so
+    BpyBlendDiff can skip the collections whose fingerprint did not change. Many datablocks, like texts, actions or
+    unused images, are never reported by the depsgraph updates, so the fingerprint is checked for all the collections.
+
+    The replacement of a datablock by another one with the same name does not change the fingerprint, so one
+    collection is diffed in turn on each update whatever its fingerprint.
+    """
+
+    def __init__(self):
+        self._fingerprints: Dict[BpyDataCollectionName, Fingerprint] = {}
+        self._turn = 0
+
+    @staticmethod
+    def fingerprint(collection: T.bpy_prop_collection) -> Fingerprint:
+        return len(collection), hash(tuple(collection.keys()))
+
+    def unchanged(self, collection_name: BpyDataCollectionName, collection: T.bpy_prop_collection) -> bool:
+        previous = self._fingerprints.get(collection_name)
+        if previous is None or previous[0] != len(collection):
+            return False
+        return previous == self.fingerprint(collection)
+
+    def next_turn(self, collection_names: List[BpyDataCollectionName]) -> Optional[BpyDataCollectionName]:
+        """
+        Return the collection to diff on this update even if its fingerprint did not change.
+        """
+        if not collection_names:
+            return None
+        self._turn = (self._turn + 1) % len(collection_names)
+        return collection_names[self._turn]
+
+    def record(self, collection_name: BpyDataCollectionName, collection: T.bpy_prop_collection):
+        self._fingerprints[collection_name] = self.fingerprint(collection)
+
+    def discard(self, collection_name: BpyDataCollectionName):
+        self._fingerprints.pop(collection_name, None)
+
+    def invalidate(self):
+        """Force a full scan on the next diff, e.g. after an undo that replaces all the datablocks."""
+        self._fingerprints.clear()
+
 
 class BpyDataCollectionDiff:
     """
@@ -176,23 +244,58 @@ class BpyBlendDiff:
     def collection_deltas(self):
         return self._collection_deltas
 
-    def diff(self, blend_proxy: BpyDataProxy, synchronized_properties: SynchronizedProperties):
+    def diff(
+        self,
+        blend_proxy: BpyDataProxy,
+        synchronized_properties: SynchronizedProperties,
+        updated_collections: Optional[Set[BpyDataCollectionName]] = None,
+    ):
+        """
+        Compute the datablock additions, removals and renames in bpy.data.
+
+        Args:
+            updated_collections: if None, diff all the synchronized collections. Otherwise only diff these collections
+            (usually from updated_collection_names(depsgraph updates)), the collections whose fingerprint changed
+            since their last diff and one collection in turn
+        """
         self._collection_deltas.clear()
-
-        for collection_name, _ in synchronized_properties.properties(bpy_type=T.BlendData):
-            if collection_name not in blend_proxy._data:
+        fingerprints = blend_proxy._collection_fingerprints
+        collection_names = [
+            collection_name
+            for collection_name, _ in synchronized_properties.properties(bpy_type=T.BlendData)
+            if collection_name in blend_proxy._data
+        ]
+        unhandled_collection_names = list(synchronized_properties.unhandled_bpy_data_collection_names)
+        turn = None
+        if updated_collections is not None:
+            turn = fingerprints.next_turn(collection_names + unhandled_collection_names)
+
+        def skip(collection_name: BpyDataCollectionName) -> bool:
+            if updated_collections is None or collection_name in updated_collections or collection_name == turn:
+                return False
+            return fingerprints.unchanged(collection_name, getattr(bpy.data, collection_name))
+
+        for collection_name in collection_names:
+            if skip(collection_name):
                 continue
             delta = BpyDataCollectionDiff()
             delta.diff(blend_proxy._data[collection_name], collection_name, synchronized_properties)
             if not delta.empty():
                 self._collection_deltas.append((collection_name, delta))
+                # scan again next time, in case the proxy update does not fully apply the delta
+                fingerprints.discard(collection_name)
+            else:
+                fingerprints.record(collection_name, getattr(bpy.data, collection_name))
 
         # Before this change:
         # Only datablocks handled by the generic synchronization system get a uuid.
         # Datablocks of unhandled types get no uuid and DatablockRefProxy references to them are incorrect.
         # What is more, this means trouble for tests since datablocks of unhandled types are assigned
         # a uuid during the message grabbing, which means that they get different uuids on both ends.
-        for collection_name in synchronized_properties.unhandled_bpy_data_collection_names:
+        for collection_name in unhandled_collection_names:
+            if skip(collection_name):
+                continue
             collection = getattr(bpy.data, collection_name)
             for datablock in collection.values():
                 ensure_uuid(datablock)
+            fingerprints.record(collection_name, collection)
@@ -25,14 +25,16 @@ see synchronization.md
 """
 from __future__ import annotations
 
+from enum import IntEnum
 from functools import lru_cache
 import logging
 import sys
-from typing import Any, Dict, ItemsView, Iterable, List, Optional, Set, Union
+from typing import Any, Dict, ItemsView, Iterable, List, Optional, Set, Tuple, Union
 
 from bpy import types as T  # noqa
 
-from mixer.blender_data.type_helpers import is_pointer_to
+from mixer.blender_data import specifics
+from mixer.blender_data.type_helpers import is_pointer, is_pointer_to
 from mixer.blender_data.bpy_data import collections_names
 
 DEBUG = True
@@ -178,6 +180,81 @@ PropertiesOrder = Dict[T.bpy_struct, Set[str]]
 """type: {properties to deliver first}"""
 
 
+class PropertyKind(IntEnum):
+    """How the value of a property is loaded, diffed and saved"""
+
+    BUILTIN = 0
+    """bool, int, float, str and their arrays, mapped to Python builtins"""
+
+    SET = 1
+    """enum with is_enum_flag, loaded as SetProxy"""
+
+    SOABLE = 2
+    """collection loaded as AosProxy"""
+
+    COLLECTION = 3
+    """other collections"""
+
+    DATABLOCK = 4
+    """pointer to an ID, either a reference to a standalone datablock or an embedded datablock"""
+
+    STRUCT = 5
+    """pointer to a Struct that is not an ID"""
+
+
+_builtin_property_rnas = {
+    T.BoolProperty.bl_rna,
+    T.IntProperty.bl_rna,
+    T.FloatProperty.bl_rna,
+    T.StringProperty.bl_rna,
+}
+
+PlanEntry = Tuple[PropertyName, Property, PropertyKind]
+
+
+def property_kind(bl_rna_property: T.Property) -> PropertyKind:
+    """Classify bl_rna_property from its type only, without accessing a value"""
+    bl_rna = bl_rna_property.bl_rna
+    if bl_rna in _builtin_property_rnas:
+        return PropertyKind.BUILTIN
+    if bl_rna is T.EnumProperty.bl_rna:
+        return PropertyKind.SET if bl_rna_property.is_enum_flag else PropertyKind.BUILTIN
+    if bl_rna is T.CollectionProperty.bl_rna:
+        return PropertyKind.SOABLE if specifics.is_soable_collection(bl_rna_property) else PropertyKind.COLLECTION
+    if is_pointer(bl_rna_property):
+        return PropertyKind.DATABLOCK if is_pointer_to(bl_rna_property, T.ID) else PropertyKind.STRUCT
+    return PropertyKind.STRUCT
+
+
+class PropertyPlan:
+    """
+    The properties to synchronize for a type, in order, with their PropertyKind.
+
+    A plan is computed once per bl_rna by SynchronizedProperties.plan() and saves the filtering, sorting and
+    type classification for every struct of this type that is loaded, diffed or saved.
+    """
+
+    def __init__(self, bl_rna: BlRna, properties: Properties):
+        self.bl_rna = bl_rna
+        self.properties = properties
+        self._items = properties.items()
+        self.entries: List[PlanEntry] = [(name, prop, property_kind(prop)) for name, prop in properties.items()]
+        self._kinds = {name: kind for name, _, kind in self.entries}
+        # resolve the conditional_properties() implementation once, rather than for each struct
+        self._conditional_properties = specifics.conditional_properties.dispatch(type(bl_rna))  # type: ignore
+
+    def kind(self, name: PropertyName) -> Optional[PropertyKind]:
+        return self._kinds.get(name)
+
+    def filtered(self, bpy_struct: T.bpy_struct) -> List[PlanEntry]:
+        """The entries of this plan, filtered by specifics.conditional_properties() for bpy_struct"""
+        filtered_items = self._conditional_properties(bpy_struct, self._items)
+        if filtered_items is self._items:
+            return self.entries
+        names = {name for name, _ in filtered_items}
+        return [entry for entry in self.entries if entry[0] in names]
+
+
 class SynchronizedProperties:
     """
     Keeps track of properties to synchronize for all types.
@@ -190,6 +267,7 @@ class SynchronizedProperties:
 
     def __init__(self, filter_stack, properties_order: PropertiesOrder):
         self._properties: Dict[BlRna, Properties] = {}
+        self._plans: Dict[BlRna, PropertyPlan] = {}
         self._filter_stack: FilterStack = filter_stack
         self._unhandled_bpy_data_collection_names: Optional[List[str]] = None
         self._properties_order = properties_order
@@ -236,6 +314,24 @@ class SynchronizedProperties:
             self._properties[bl_rna] = bl_rna_properties
         return bl_rna_properties.items()
 
+    def plan(self, bl_rna_property: T.Property = None, bpy_type=None) -> PropertyPlan:
+        """
+        Return the PropertyPlan for bpy_type, computed on first use
+        """
+        if bl_rna_property is not None:
+            bl_rna = bl_rna_property.bl_rna
+        elif bpy_type is not None:
+            bl_rna = bpy_type.bl_rna
+        else:
+            raise ValueError("One of bl_rna and bpy_type must be provided")
+
+        plan = self._plans.get(bl_rna)
+        if plan is None:
+            self.properties(bl_rna_property, bpy_type)
+            plan = PropertyPlan(bl_rna, self._properties[bl_rna])
+            self._plans[bl_rna] = plan
+        return plan
+
     @property
     def unhandled_bpy_data_collection_names(self) -> List[str]:
         """
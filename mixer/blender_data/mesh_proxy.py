@@ -28,7 +28,6 @@ from typing import Dict, Optional, Tuple, TYPE_CHECKING, Union
 
 import bpy.types as T  # noqa
 
-from mixer.blender_data import specifics
 from mixer.blender_data.attributes import apply_attribute, diff_attribute
 from mixer.blender_data.datablock_proxy import DatablockProxy
 from mixer.blender_data.json_codec import serialize
@@ -189,9 +188,8 @@ class MeshProxy(DatablockProxy):
                 # the order  they are listed in Depsgraph.updates
                 context.visit_state.dirty_vertex_groups.add(struct.mixer_uuid)
 
-            properties = context.synchronized_properties.properties(struct)
-            properties = specifics.conditional_properties(struct, properties)
-            for k, member_property in properties:
+            plan = context.synchronized_properties.plan(struct)
+            for k, member_property, kind in plan.filtered(struct):
                 try:
                     member = getattr(struct, k)
                 except AttributeError:
@@ -200,7 +198,7 @@ class MeshProxy(DatablockProxy):
                     continue
 
                 proxy_data = self._data.get(k)
-                delta = diff_attribute(member, k, member_property, proxy_data, context)
+                delta = diff_attribute(member, k, member_property, proxy_data, context, kind)
 
                 if delta is not None:
                     diff._data[k] = delta
@@ -24,12 +24,14 @@ shared with the VRtist protocol.
 """
 from __future__ import annotations
 
+import array
 import json
 import logging
 import traceback
-from typing import List, Optional, Tuple, TYPE_CHECKING
+from typing import List, Optional, Sequence, Tuple, TYPE_CHECKING, Union
 
-from mixer.blender_data.types import ArrayGroup, ArrayGroups, Path, Soa
+from mixer.blender_data.binary_codec import is_binary
+from mixer.blender_data.types import ArrayGroup, ArrayGroups, Path, Soa, SoaSpans
 
 from mixer.broadcaster.common import (
     decode_int,
@@ -40,13 +42,58 @@ from mixer.broadcaster.common import (
     encode_py_array,
     encode_string,
     encode_string_array,
+    int_to_bytes,
 )
+from mixer.broadcaster.media_cache import map_file
 
 if TYPE_CHECKING:
     from mixer.blender_data.datablock_proxy import DatablockProxy
 
 logger = logging.getLogger(__name__)
 
+SOA_SPANS = "spans"
+"""Written in place of the array typecode for an SoaElement sent as changed spans.
+Must match mixer.broadcaster.room_compaction.SOA_SPANS"""
+
+
+def encode_soa_spans(array_: array.array, spans: Sequence[Tuple[int, int]]) -> List[bytes]:
+    """
+    Encode the (start, stop) ranges of array_.
+    """
+    items = [encode_string(SOA_SPANS), encode_string(array_.typecode), encode_int(len(array_)), encode_int(len(spans))]
+    view = memoryview(array_)
+    for start, stop in spans:
+        values = view[start:stop].tobytes()
+        items.append(encode_int(start))
+        items.append(encode_int(len(values)))
+        items.append(values)
+    return items
+
+
+def decode_soa_member(buffer: bytes, index: int) -> Tuple[Union[array.array, SoaSpans], int]:
+    """
+    Decode an array encoded with encode_py_array() or encode_soa_spans().
+    """
+    typecode, index = decode_string(buffer, index)
+    if typecode != SOA_SPANS:
+        byte_count, index = decode_int(buffer, index)
+        array_ = array.array(typecode, b"")
+        array_.frombytes(buffer[index : index + byte_count])
+        return array_, index + byte_count
+
+    typecode, index = decode_string(buffer, index)
+    length, index = decode_int(buffer, index)
+    span_count, index = decode_int(buffer, index)
+    spans = []
+    for _ in range(span_count):
+        start, index = decode_int(buffer, index)
+        byte_count, index = decode_int(buffer, index)
+        values = array.array(typecode, b"")
+        values.frombytes(buffer[index : index + byte_count])
+        index += byte_count
+        spans.append((start, values))
+    return SoaSpans(typecode, length, spans), index
+
 
 def soa_buffers(datablock_proxy: Optional[DatablockProxy]) -> List[bytes]:
     if datablock_proxy is None:
@@ -65,6 +112,9 @@ def soa_buffers(datablock_proxy: Optional[DatablockProxy]) -> List[bytes]:
     #       number of SoaElement : 1
     #           element name: "vertices"
     #           array
+    #
+    # An array is encoded by encode_py_array(), or by encode_soa_spans() for a delta that only contains the changed
+    # ranges of the array (see SoaElement.diff())
 
     items: List[bytes] = []
     items.append(encode_int(len(datablock_proxy._soas)))
@@ -75,7 +125,11 @@ def soa_buffers(datablock_proxy: Optional[DatablockProxy]) -> List[bytes]:
         for element_name, soa_element in soa_proxies:
             if soa_element._array is not None:
                 items.append(encode_string(element_name))
-                items.append(encode_py_array(soa_element._array))
+                spans = getattr(soa_element, "_spans", None)
+                if spans is None:
+                    items.append(encode_py_array(soa_element._array))
+                else:
+                    items.extend(encode_soa_spans(soa_element._array, spans))
     return items
 
 
@@ -143,7 +197,7 @@ def _decode_soas(buffer: bytes, index: int) -> Tuple[List[Soa], int]:
             members = []
             for _ in range(element_count):
                 name, index = decode_string(buffer, index)
-                array_, index = decode_py_array(buffer, index)
+                array_, index = decode_soa_member(buffer, index)
                 members.append(
                     (name, array_),
                 )
@@ -162,24 +216,37 @@ def _decode_soas(buffer: bytes, index: int) -> Tuple[List[Soa], int]:
 
 class BlenderDataMessage:
     def __init__(self):
+        # proxy encoded by json_codec
         self.proxy_string: str = ""
+        # proxy encoded by binary_codec
+        self.proxy_bytes: bytes = b""
         self.soas: List[Soa] = []
         self.arrays: ArrayGroups = {}
 
     def __lt__(self, other):
         # for sorting by the tests
-        return self.proxy_string < other.proxy_string
+        return (self.proxy_string, self.proxy_bytes) < (other.proxy_string, other.proxy_bytes)
 
     def decode(self, buffer: bytes) -> int:
-        self.proxy_string, index = decode_string(buffer, 0)
+        # the proxy is encoded like a string, but may not be utf-8
+        if is_binary(buffer, 4):
+            length, index = decode_int(buffer, 0)
+            self.proxy_bytes = bytes(buffer[index : index + length])
+            index += length
+        else:
+            self.proxy_string, index = decode_string(buffer, 0)
         self.soas, index = _decode_soas(buffer, index)
         self.arrays, index = decode_arrays(buffer, index)
         return index
 
     @staticmethod
-    def encode(datablock_proxy: DatablockProxy, encoded_proxy: str) -> bytes:
+    def encode(datablock_proxy: DatablockProxy, encoded_proxy: Union[str, bytes]) -> bytes:
         items = []
-        items.append(encode_string(encoded_proxy))
+        if isinstance(encoded_proxy, bytes):
+            items.append(int_to_bytes(len(encoded_proxy), 4))
+            items.append(encoded_proxy)
+        else:
+            items.append(encode_string(encoded_proxy))
         items.extend(soa_buffers(datablock_proxy))
         items.extend(encode_arrays(datablock_proxy))
         return b"".join(items)
@@ -217,6 +284,8 @@ class BlenderRenamesMessage:
 
 class BlenderMediaMessage:
     def __init__(self):
+        # first, so that the server can read it, see mixer.broadcaster.common.media_content_hash()
+        self.content_hash: str = ""
         self.path: str = ""
         self.bytes_: bytes = b""
 
@@ -225,7 +294,8 @@ class BlenderMediaMessage:
         return self.path < other.path
 
     def decode(self, buffer: bytes) -> int:
-        self.path, index = decode_string(buffer, 0)
+        self.content_hash, index = decode_string(buffer, 0)
+        self.path, index = decode_string(buffer, index)
         self.bytes_ = buffer[index:]
         return len(buffer)
 
@@ -235,6 +305,10 @@ class BlenderMediaMessage:
         if media_desc is None:
             return b""
 
-        path, bytes_ = media_desc
-        items = [encode_string(path), bytes_]
+        path, source = media_desc
+        if isinstance(source, str):
+            with map_file(source) as bytes_:
+                return b"".join([encode_string(datablock_proxy._media_hash), encode_string(path), bytes_])
+
+        items = [encode_string(datablock_proxy._media_hash), encode_string(path), source]
         return b"".join(items)
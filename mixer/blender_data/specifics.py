@@ -160,6 +160,7 @@ def dispatch_rna(no_rna_impl: Callable[..., Any]):
     # wrapper.register = register  genarates mypy error
     setattr(wrapper, "register", register)  # noqa B010
     setattr(wrapper, "register_default", register_default)  # noqa B010
+    setattr(wrapper, "dispatch", dispatch)  # noqa B010
     return wrapper
 
 
@@ -28,7 +28,6 @@ from typing import Optional, Tuple, TYPE_CHECKING, Union
 
 import bpy.types as T  # noqa
 
-from mixer.blender_data import specifics
 from mixer.blender_data.attributes import apply_attribute, diff_attribute, read_attribute, write_attribute
 from mixer.blender_data.json_codec import serialize
 from mixer.blender_data.misc_proxies import NonePtrProxy
@@ -99,13 +98,12 @@ class StructProxy(Proxy):
             context: the proxy and visit state
         """
         self.clear_data()
-        properties = context.synchronized_properties.properties(attribute)
         # includes properties from the bl_rna only, not the "view like" properties like MeshPolygon.edge_keys
         # that we do not want to load anyway
-        properties = specifics.conditional_properties(attribute, properties)
-        for name, bl_rna_property in properties:
+        plan = context.synchronized_properties.plan(attribute)
+        for name, bl_rna_property, kind in plan.filtered(attribute):
             attr = getattr(attribute, name)
-            attr_value = read_attribute(attr, name, bl_rna_property, attribute, context)
+            attr_value = read_attribute(attr, name, bl_rna_property, attribute, context, kind)
             self._data[name] = attr_value
 
         return self
@@ -133,8 +131,9 @@ class StructProxy(Proxy):
             logger.info(f"save: attribute is None for {context.visit_state.display_path()}.{key}")
             return
 
+        properties = context.synchronized_properties.plan(attribute).properties
         for k, v in self._data.items():
-            write_attribute(attribute, k, v, context)
+            write_attribute(attribute, k, v, context, properties.get(k))
 
     def apply(
         self,
@@ -245,9 +244,8 @@ class StructProxy(Proxy):
         # _data and the getting the properties with
         #   member_property = struct.bl_rna.properties[k]
         # line to which py-spy attributes 20% of the total diff !
-        properties = context.synchronized_properties.properties(attribute)
-        properties = specifics.conditional_properties(attribute, properties)
-        for k, member_property in properties:
+        plan = context.synchronized_properties.plan(attribute)
+        for k, member_property, kind in plan.filtered(attribute):
             try:
                 member = getattr(attribute, k)
             except AttributeError:
@@ -255,7 +253,7 @@ class StructProxy(Proxy):
                 continue
 
             proxy_data = self._data.get(k)
-            delta = diff_attribute(member, k, member_property, proxy_data, context)
+            delta = diff_attribute(member, k, member_property, proxy_data, context, kind)
 
             if delta is not None:
                 diff._data[k] = delta
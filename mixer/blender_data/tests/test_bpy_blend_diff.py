@@ -154,3 +154,61 @@ class TestDiff(unittest.TestCase):
                 self.assertEqual(0, len(delta.items_renamed), f"renamed count mismatch for {name}")
                 self.assertEqual(0, len(delta.items_removed), f"removed count mismatch for {name}")
                 self.assertEqual(0, len(delta.items_added), f"added count mismatch for {name}")
+
+
+class TestIncrementalDiff(unittest.TestCase):
+    def setUp(self):
+        for w in D.worlds:
+            D.worlds.remove(w)
+        D.worlds.new("W0")
+        self.proxy = BpyDataProxy()
+        self.proxy.load(test_properties)
+
+    def incremental_diff(self, updated_collections=None):
+        diff = BpyBlendDiff()
+        diff.diff(self.proxy, test_properties, updated_collections or set())
+        self.proxy.update(diff, set(), False, test_properties)
+        return dict(diff.collection_deltas)
+
+    def test_unchanged(self):
+        self.assertEqual(self.incremental_diff(), {})
+        self.assertEqual(self.incremental_diff({"worlds"}), {})
+
+    def test_add_remove(self):
+        D.worlds.new("W1")
+        deltas = self.incremental_diff()
+        self.assertEqual([datablock.name for datablock, _ in deltas["worlds"].items_added], ["W1"])
+
+        D.worlds.remove(D.worlds["W0"])
+        deltas = self.incremental_diff()
+        self.assertEqual([proxy.data("name") for proxy in deltas["worlds"].items_removed], ["W0"])
+
+    def test_rename(self):
+        # worlds are not reported by the depsgraph updates
+        D.worlds["W0"].name = "W00"
+        deltas = self.incremental_diff()
+        renamed = [(proxy.data("name"), new_name) for proxy, new_name in deltas["worlds"].items_renamed]
+        self.assertEqual(renamed, [("W0", "W00")])
+        self.assertEqual(self.incremental_diff(), {})
+
+    def test_replace(self):
+        # same count and names, found when the collection is diffed in turn
+        D.worlds.remove(D.worlds["W0"])
+        D.worlds.new("W0")
+        collection_count = len(test_properties.properties(bpy_type=T.BlendData)) + len(
+            test_properties.unhandled_bpy_data_collection_names
+        )
+        for _ in range(collection_count):
+            deltas = self.incremental_diff()
+            if deltas:
+                break
+        self.assertEqual([datablock.name for datablock, _ in deltas["worlds"].items_added], ["W0"])
+        self.assertEqual([proxy.data("name") for proxy in deltas["worlds"].items_removed], ["W0"])
+
+    def test_invalidate(self):
+        # a uuid change does not modify the collection fingerprint and is found by a full scan
+        D.worlds["W0"].mixer_uuid = ""
+        self.proxy.reload_datablocks()
+        deltas = self.incremental_diff()
+        self.assertEqual([datablock.name for datablock, _ in deltas["worlds"].items_added], ["W0"])
+        self.assertEqual([proxy.data("name") for proxy in deltas["worlds"].items_removed], ["W0"])
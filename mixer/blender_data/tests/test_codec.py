@@ -21,6 +21,7 @@ import bpy
 from bpy import data as D  # noqa
 from bpy import types as T  # noqa
 
+from mixer.blender_data.binary_codec import BinaryCodec
 from mixer.blender_data.bpy_data_proxy import BpyDataProxy
 from mixer.blender_data.datablock_proxy import DatablockProxy
 from mixer.blender_data.datablock_ref_proxy import DatablockRefProxy
@@ -52,26 +53,27 @@ class TestCodec(unittest.TestCase):
         cam_proxy_sent._data["name"] = transmit_name
         self.assertIsInstance(cam_proxy_sent, DatablockProxy)
 
-        # encode
-        codec = Codec()
-        message = codec.encode(cam_proxy_sent)
+        for codec in (Codec(), BinaryCodec()):
+            with self.subTest(codec=codec.__class__.__name__):
+                # encode
+                message = codec.encode(cam_proxy_sent)
 
-        #
-        # transmit
-        #
+                #
+                # transmit
+                #
 
-        # decode into proxy
-        cam_proxy_received = codec.decode(message)
+                # decode into proxy
+                cam_proxy_received = codec.decode(message)
 
-        focus_object_proxy = cam_proxy_received.data("dof").data("focus_object")
-        self.assertIsInstance(focus_object_proxy, DatablockRefProxy)
-        self.assertEqual(focus_object_proxy._datablock_uuid, cam_sent.dof.focus_object.mixer_uuid)
+                focus_object_proxy = cam_proxy_received.data("dof").data("focus_object")
+                self.assertIsInstance(focus_object_proxy, DatablockRefProxy)
+                self.assertEqual(focus_object_proxy._datablock_uuid, cam_sent.dof.focus_object.mixer_uuid)
 
-        # save into blender
-        cam_proxy_received._datablock_uuid = "__" + cam_proxy_received._datablock_uuid
-        cam_received, _ = cam_proxy_received.create_standalone_datablock(self.proxy.context())
+                # save into blender
+                cam_proxy_received._datablock_uuid = "__" + cam_proxy_received._datablock_uuid
+                cam_proxy_received._data["name"] = transmit_name + codec.__class__.__name__
+                cam_received, _ = cam_proxy_received.create_standalone_datablock(self.proxy.context())
 
-        self.assertEqual(cam_sent, cam_received)
-        pass
+                self.assertEqual(cam_sent, cam_received)
 
     # TODO Generic test with randomized samples of all IDs ?
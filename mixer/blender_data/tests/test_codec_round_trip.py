@@ -0,0 +1,133 @@
+# GPLv3 License
+#
+# Copyright (C) 2020 Ubisoft
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Round trip tests shared by the proxy codecs, that do not require Blender.
+"""
+import math
+import unittest
+
+from mixer.blender_data.binary_codec import BinaryCodec, is_binary
+from mixer.blender_data import json_codec
+from mixer.blender_data.json_codec import Codec, DecodeError, serialize
+
+
+class _Item:
+    _serialize = ("_data", "_name")
+
+    def __init__(self):
+        self._data = {}
+        self._name = None
+
+
+class _Wrapper:
+    _serialize = ("_value",)
+
+    def __init__(self, value):
+        self._value = value
+
+
+class _Unregistered:
+    pass
+
+
+def _as_dict(obj):
+    """Comparable representation of decoded items"""
+    if isinstance(obj, (_Item, _Wrapper)):
+        return {"class": obj.__class__.__name__, **{k: _as_dict(v) for k, v in vars(obj).items()}}
+    if isinstance(obj, dict):
+        return {k: _as_dict(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_as_dict(v) for v in obj]
+    return obj
+
+
+class TestCodecRoundTrip(unittest.TestCase):
+    codecs = (Codec(), BinaryCodec())
+
+    def setUp(self):
+        # register the test classes for the duration of the test only
+        serialize(_Item)
+        serialize(ctor_args=("_value",))(_Wrapper)
+
+    def tearDown(self):
+        del json_codec._registry[_Item.__name__]
+        del json_codec._registry[_Wrapper.__name__]
+
+    def make_item(self):
+        item = _Item()
+        item._name = "Cube"
+        item._data = {
+            "name": "Cube",
+            "location": (1.0, -2.5, 3.25),
+            "indices": [0, 1, 2, 3],
+            "mixed": [1, 2.0, "three", None, True, False],
+            "big": 2 ** 70,
+            "small": -(2 ** 63),
+            "nested": {"a": {"b": [[1.0, 2.0], []]}, "empty": {}},
+            "wrapped": _Wrapper(_Wrapper("inner")),
+            "items": [_Item(), _Item()],
+            1: "integer key",
+            "unicode": "éàü 日本",
+            "long": "x" * 1000,
+            "nan": float("nan"),
+            "unregistered": _Unregistered(),
+        }
+        return item
+
+    def test_round_trip(self):
+        item = self.make_item()
+        decoded = {}
+        for codec in self.codecs:
+            with self.subTest(codec=codec.__class__.__name__):
+                result = codec.decode(codec.encode(item))
+                self.assertIsInstance(result, _Item)
+                self.assertEqual(result._name, "Cube")
+                self.assertIsInstance(result._data["wrapped"], _Wrapper)
+                self.assertIsInstance(result._data["wrapped"]._value, _Wrapper)
+                self.assertEqual(result._data["wrapped"]._value._value, "inner")
+                self.assertTrue(math.isnan(result._data.pop("nan")))
+                decoded[codec.__class__.__name__] = _as_dict(result)
+
+        # both codecs decode the same items
+        self.assertEqual(decoded["Codec"], decoded["BinaryCodec"])
+        data = decoded["Codec"]["_data"]
+        self.assertEqual(data["location"], [1.0, -2.5, 3.25])
+        self.assertEqual(data["1"], "integer key")
+        self.assertEqual(data["big"], 2 ** 70)
+        self.assertIsNone(data["unregistered"])
+
+    def test_binary_is_smaller(self):
+        item = self.make_item()
+        del item._data["nan"]
+        json_message = Codec().encode(item)
+        binary_message = BinaryCodec().encode(item)
+        self.assertTrue(is_binary(binary_message))
+        self.assertFalse(is_binary(json_message.encode()))
+        self.assertLess(len(binary_message), len(json_message.encode()))
+
+    def test_decode_error(self):
+        for codec, message in ((Codec(), '{"a": 1}'), (BinaryCodec(), BinaryCodec().encode({"a": 1}))):
+            with self.subTest(codec=codec.__class__.__name__):
+                with self.assertRaises(DecodeError):
+                    codec.decode(message)
+
+        with self.assertRaises(DecodeError):
+            BinaryCodec().decode(BinaryCodec().encode(_Item())[:-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,4 @@
+import array
 from pathlib import Path
 
 import unittest
@@ -5,7 +6,7 @@ import unittest
 import bpy
 
 from mixer.blender_data.aos_proxy import AosProxy
-from mixer.blender_data.aos_soa_proxy import SoaElement
+from mixer.blender_data.aos_soa_proxy import changed_spans, SoaElement
 from mixer.blender_data.bpy_data_proxy import BpyDataProxy
 from mixer.blender_data.datablock_proxy import DatablockProxy
 from mixer.blender_data.datablock_ref_proxy import DatablockRefProxy
@@ -287,3 +288,62 @@ class Aos(DifferentialCompute):
         vertices = [[x, y, z] for x, y, z in zip(array_[0::3], array_[1::3], array_[2::3])]
 
         self.assertEqual(vertices, expected_vertices)
+
+    def test_unchanged_then_modified(self):
+        # test_diff_compute.Aos.test_unchanged_then_modified
+        mesh = bpy.data.meshes.new("Mesh")
+        mesh.vertices.add(4)
+
+        self.proxy = BpyDataProxy()
+        self.proxy.load(test_properties)
+        mesh_proxy = self.proxy.data("meshes").search_one("Mesh")
+        self.generate_all_uuids()
+
+        # the scratch buffer used for the comparison is reused
+        for _ in range(2):
+            mesh_delta = mesh_proxy.diff(mesh, mesh.name, None, self.proxy.context())
+            self.assertIsNone(mesh_delta)
+
+        mesh.vertices[3].co = (1.0, 2.0, 3.0)
+        mesh_delta = mesh_proxy.diff(mesh, mesh.name, None, self.proxy.context())
+        co_update = mesh_delta.value.data("vertices", resolve_delta=False).value.data("co", resolve_delta=False).value
+        self.assertEqual(list(co_update._array[9:12]), [1.0, 2.0, 3.0])
+
+        # once applied, the new values are the reference
+        mesh_proxy.apply_to_proxy(mesh, mesh_delta, self.proxy.context())
+        self.assertIsNone(mesh_proxy.diff(mesh, mesh.name, None, self.proxy.context()))
+
+    def test_spans(self):
+        # test_diff_compute.Aos.test_spans
+        mesh = bpy.data.meshes.new("Mesh")
+        mesh.vertices.add(10000)
+
+        self.proxy = BpyDataProxy()
+        self.proxy.load(test_properties)
+        mesh_proxy = self.proxy.data("meshes").search_one("Mesh")
+        self.generate_all_uuids()
+
+        mesh.vertices[5000].co = (1.0, 2.0, 3.0)
+        mesh_delta = mesh_proxy.diff(mesh, mesh.name, None, self.proxy.context())
+        co_update = mesh_delta.value.data("vertices", resolve_delta=False).value.data("co", resolve_delta=False).value
+
+        # one 4096 bytes chunk of floats
+        self.assertEqual(co_update._spans, [(14336, 15360)])
+        self.assertEqual(len(co_update._array), 30000)
+
+    def test_changed_spans(self):
+        # test_diff_compute.Aos.test_changed_spans
+        old = array.array("f", [0.0]) * 10000
+        new = array.array("f", old)
+        new[0] = 1.0
+        new[2000] = 1.0
+        new[9999] = 1.0
+        # 1024 floats per chunk, adjacent chunks are merged
+        self.assertEqual(changed_spans(old, new, 4096), [(0, 2048), (9216, 10000)])
+
+        new[5000] = 1.0
+        new[7000] = 1.0
+        new[8000] = 1.0
+        self.assertIsNone(changed_spans(old, new, 4096))
+
+        self.assertIsNone(changed_spans(old, new[1:], 4096))
@@ -24,6 +24,7 @@ from mixer.blender_data.tests.utils import matches_type
 from mixer.blender_data.filter import (
     FilterStack,
     property_order,
+    PropertyKind,
     SynchronizedProperties,
     TypeFilterIn,
     TypeFilterOut,
@@ -49,3 +50,36 @@ class TestTypeFilterIn(unittest.TestCase):
         props = list(synchronized_properties.properties(T.BlendData))
         self.assertTrue(any([matches_type(p, T.BlendDataCameras) for _, p in props]))
         self.assertFalse(any([matches_type(p, T.StringProperty) for _, p in props]))
+
+
+class TestPropertyPlan(unittest.TestCase):
+    def setUp(self):
+        self.synchronized_properties = SynchronizedProperties(FilterStack(), property_order)
+
+    def test_cached(self):
+        plan = self.synchronized_properties.plan(bpy_type=T.Mesh)
+        self.assertIs(plan, self.synchronized_properties.plan(bpy_type=T.Mesh))
+        self.assertEqual([name for name, _, _ in plan.entries], list(plan.properties.keys()))
+
+    def test_kinds(self):
+        mesh_plan = self.synchronized_properties.plan(bpy_type=T.Mesh)
+        self.assertEqual(mesh_plan.kind("name"), PropertyKind.BUILTIN)
+        self.assertEqual(mesh_plan.kind("vertices"), PropertyKind.SOABLE)
+        self.assertEqual(mesh_plan.kind("materials"), PropertyKind.COLLECTION)
+        self.assertEqual(mesh_plan.kind("shape_keys"), PropertyKind.DATABLOCK)
+
+        object_plan = self.synchronized_properties.plan(bpy_type=T.Object)
+        self.assertEqual(object_plan.kind("location"), PropertyKind.BUILTIN)
+        self.assertEqual(object_plan.kind("display"), PropertyKind.STRUCT)
+
+        light_plan = self.synchronized_properties.plan(bpy_type=T.PointLight)
+        self.assertEqual(light_plan.kind("type"), PropertyKind.BUILTIN)
+
+    def test_conditional(self):
+        empty = D.objects.new("Empty", None)
+        mesh = D.meshes.new("Mesh")
+        obj = D.objects.new("Mesh", mesh)
+        plan = self.synchronized_properties.plan(obj)
+        self.assertIn("instance_collection", [name for name, _, _ in plan.filtered(empty)])
+        self.assertNotIn("instance_collection", [name for name, _, _ in plan.filtered(obj)])
+        self.assertIs(plan.filtered(empty), plan.entries)
@@ -0,0 +1,48 @@
+# GPLv3 License
+#
+# Copyright (C) 2020 Ubisoft
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Tests for the encoding of BLENDER_DATA messages, that do not require Blender.
+"""
+import array
+import unittest
+
+from mixer.blender_data.messages import decode_soa_member, encode_soa_spans
+from mixer.blender_data.types import SoaSpans
+from mixer.broadcaster.common import encode_int, encode_py_array
+
+
+class TestSoaMembers(unittest.TestCase):
+    def test_array(self):
+        array_ = array.array("f", [1.0, 2.0, 3.0])
+        buffer = encode_py_array(array_) + encode_int(42)
+        decoded, index = decode_soa_member(buffer, 0)
+        self.assertEqual(decoded, array_)
+        self.assertEqual(index, len(buffer) - 4)
+
+    def test_spans(self):
+        array_ = array.array("i", range(100))
+        buffer = b"".join(encode_soa_spans(array_, [(0, 2), (50, 53)])) + encode_int(42)
+        decoded, index = decode_soa_member(buffer, 0)
+        self.assertIsInstance(decoded, SoaSpans)
+        self.assertEqual(decoded.typecode, "i")
+        self.assertEqual(decoded.length, 100)
+        self.assertEqual(decoded.spans, [(0, array.array("i", [0, 1])), (50, array.array("i", [50, 51, 52]))])
+        self.assertEqual(index, len(buffer) - 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,10 +26,23 @@ from dataclasses import dataclass
 from typing import Any, Dict, Iterable, List, Tuple, Union
 
 
-SoaMember = Tuple[str, array.array]
+@dataclass
+class SoaSpans:
+    """The changed ranges of a structure of array member, received in place of the complete array"""
+
+    typecode: str
+
+    length: int
+    """length of the complete array"""
+
+    spans: List[Tuple[int, array.array]]
+    """(start index, values) of the changed ranges"""
+
+
+SoaMember = Tuple[str, Union[array.array, SoaSpans]]
 """Member of a structure of array from a Blender array of structure like MeshVertices
 - Name of the structure member, e.g, "co" or "normal"
-- Data to be loaded with foreach_set()
+- Data to be loaded with foreach_set(), or the changed ranges of the data
 """
 
 Path = Iterable[Union[str, int]]
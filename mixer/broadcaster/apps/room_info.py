@@ -0,0 +1,133 @@
+# MIT License
+#
+# Copyright (c) 2020 Ubisoft
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Room file inspection application.
+
+Prints statistics about a room archive, a legacy room file or a room journal, lists the commands of a message type or
+of a datablock, and converts room files to indexed archives.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterable
+
+from mixer.broadcaster.cli_utils import init_logging, add_logging_cli_args
+from mixer.broadcaster.common import MessageType
+from mixer.broadcaster.room_archive import RoomArchive, write_archive
+
+logger = logging.getLogger() if __name__ == "__main__" else logging.getLogger(__name__)
+
+
+def format_bytes(byte_count: float) -> str:
+    if byte_count < 1024:
+        return f"{byte_count:.0f} B"
+    for unit in ("KiB", "MiB", "GiB"):
+        byte_count /= 1024
+        if byte_count < 1024:
+            break
+    return f"{byte_count:.1f} {unit}"
+
+
+def print_table(title: str, rows: Dict[str, Dict[str, Any]], total_bytes: int, extra: str):
+    print(f"\n{title:<40} {'count':>10} {'bytes':>12} {'%':>6} {extra:>12}")
+    for name, stats in sorted(rows.items(), key=lambda item: item[1]["bytes"], reverse=True):
+        ratio = 100.0 * stats["bytes"] / total_bytes if total_bytes else 0.0
+        print(
+            f"{name or '<unknown>':<40} {stats['count']:>10} {format_bytes(stats['bytes']):>12} {ratio:>6.1f} "
+            f"{stats[extra]:>12}"
+        )
+
+
+def print_statistics(archive: RoomArchive):
+    statistics = archive.statistics()
+    print(f"File:       {archive.file_path}")
+    print(f"Version:    {statistics['version'] if statistics['version'] else 'legacy'}")
+    print(f"Indexed:    {statistics['indexed']}")
+    print(f"Commands:   {statistics['commands']}")
+    print(f"Bytes:      {format_bytes(statistics['bytes'])}")
+    print(f"Datablocks: {statistics['datablocks']}")
+    print_table("Message type", statistics["types"], statistics["bytes"], "compressed")
+    print_table("Collection", statistics["collections"], statistics["bytes"], "datablocks")
+
+
+def print_commands(archive: RoomArchive, sequences: Iterable[int]):
+    print(f"{'sequence':>10} {'type':<28} {'bytes':>12} {'compressed':>10} uuids")
+    for sequence in sequences:
+        entry = archive.entries[sequence]
+        uuids = " ".join(archive.command_uuids(sequence))
+        print(f"{sequence:>10} {entry.type.name:<28} {entry.byte_size:>12} {str(entry.compressed):>10} {uuids}")
+
+
+def main():
+    args, args_parser = parse_cli_args()
+    init_logging(args)
+    if args.convert and os.path.abspath(args.convert) == os.path.abspath(args.file):
+        args_parser.error("--convert output must not be the input file")
+
+    with RoomArchive(args.file) as archive:
+        if args.convert:
+            count = write_archive(archive.attributes, archive, args.convert)
+            print(f"{count} commands written to {args.convert}")
+        elif args.type:
+            try:
+                message_type = MessageType[args.type.upper()]
+            except KeyError:
+                args_parser.error(f"unknown message type {args.type}")
+            print_commands(archive, archive.sequences_of_type(message_type))
+        elif args.uuid:
+            collection = archive.collection(args.uuid)
+            if collection:
+                print(f"Collection: {collection}")
+            print_commands(archive, archive.sequences_of_uuid(args.uuid))
+        elif args.sequence:
+            for sequence in args.sequence:
+                if not 0 <= sequence < len(archive):
+                    args_parser.error(f"sequence {sequence} out of range [0, {len(archive)})")
+            print_commands(archive, args.sequence)
+        elif args.json:
+            json.dump(archive.statistics(), sys.stdout, indent=2)
+            print()
+        else:
+            print_statistics(archive)
+
+
+def parse_cli_args():
+    parser = argparse.ArgumentParser(description="Inspect a Mixer room file")
+    add_logging_cli_args(parser)
+    parser.add_argument("file", help="Room archive, legacy room file or room journal")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--json", action="store_true", help="Print the statistics as json")
+    group.add_argument("--type", help="List the commands of a message type, like BLENDER_DATA_UPDATE")
+    group.add_argument("--uuid", help="List the commands that reference a datablock")
+    group.add_argument("--sequence", type=int, nargs="+", help="List the commands with these sequence numbers")
+    group.add_argument("--convert", metavar="OUTPUT", help="Write the room to an indexed archive")
+    return parser.parse_args(), parser
+
+
+if __name__ == "__main__":
+    main()
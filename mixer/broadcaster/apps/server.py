@@ -28,18 +28,33 @@ Can be launched from command line, or from the Mixer addon in Blender.
 
 from __future__ import annotations
 
+import asyncio
+import bisect
+from collections import defaultdict
+import copy
 import logging
 import argparse
 import select
 import threading
 import time
 import socket
-import queue
-from typing import List, Mapping, Dict, Optional, Any
+from pathlib import Path
+import tempfile
+from typing import Callable, List, Mapping, Dict, Optional, Any, Set, Tuple, Union
 
 from mixer.broadcaster.cli_utils import init_logging, add_logging_cli_args
 import mixer.broadcaster.common as common
+from mixer.broadcaster.command_queue import (
+    CommandQueue,
+    OverflowPolicy,
+    QueueOverflow,
+    DEFAULT_BLOCK_TIMEOUT,
+    DEFAULT_HIGH_WATER,
+    DEFAULT_LOW_WATER,
+)
 from mixer.broadcaster.common import update_attributes_and_get_diff
+from mixer.broadcaster.room_compaction import RoomCompactor
+from mixer.broadcaster.room_journal import RoomJournal, checkpoint_path, journal_paths, room_name_from_path
 from mixer.broadcaster.socket import Socket
 
 SHUTDOWN = False
@@ -51,6 +66,15 @@ _log_server_updates: bool = False
 # client, then release the room mutex while broadcasting
 MAX_BROADCAST_COMMAND_COUNT = 64
 
+# Delay without new commands after which a room history is compacted or checkpointed
+DEFAULT_IDLE_DELAY = 5.0  # seconds
+
+# Interval during which the custom attribute updates of a client are accumulated before being broadcast
+DEFAULT_CLIENT_UPDATE_INTERVAL = 0.05  # seconds
+
+# Polling interval of a sender waiting for congested clients with the BLOCK overflow policy
+CONGESTION_POLL_INTERVAL = 0.01  # seconds
+
 
 class Connection:
     """ Represent a connection with a client """
@@ -63,9 +87,19 @@ class Connection:
         self.unique_id = f"{address[0]}:{address[1]}"
 
         self.custom_attributes: Dict[str, Any] = {}  # custom attributes are used between clients, but not by the server
-
-        self._command_queue: queue.Queue = queue.Queue()  # Pending commands to send to the client
+        self._broadcast_custom_attributes: Dict[str, Any] = {}  # custom attributes as last broadcast to the clients
+        self.accepts_patches = False  # the client has sent SET_CLIENT_CUSTOM_ATTRIBUTES_PATCH
+        self.media_hashes: Set[str] = set()  # content hashes of the media that the client has, in any room
+        self._skipped_media_transfers: Set[str] = set()  # content hashes of the chunked media not sent to the client
+
+        # Pending commands to send to the client
+        self._command_queue = CommandQueue(
+            server.queue_high_water, server.queue_low_water, server.queue_overflow_policy, server.queue_block_timeout
+        )
+        self._overflowed = False  # disconnecting after a queue overflow
         self._server = server
+        self._command_handlers = self._make_command_handlers()
+        self.latency: float = 0.0  # seconds
 
         self.thread: threading.Thread = threading.Thread(None, self.run)
 
@@ -79,12 +113,70 @@ class Connection:
             common.ClientAttributes.IP: self.address[0],
             common.ClientAttributes.PORT: self.address[1],
             common.ClientAttributes.ROOM: self.room.name if self.room is not None else None,
+            **self.queue_attributes(),
+        }
+
+    def queue_attributes(self) -> Dict[str, Any]:
+        """
+        Return the metrics of the queue of the commands pending for the client.
+        """
+        metrics = self._command_queue.metrics()
+        return {
+            common.ClientAttributes.QUEUE_BYTE_SIZE: metrics["byte_size"],
+            common.ClientAttributes.QUEUE_COMMAND_COUNT: metrics["command_count"],
+            common.ClientAttributes.QUEUE_LAG: self._command_queue.lag(),
+            common.ClientAttributes.QUEUE_MAX_BYTE_SIZE: metrics["max_byte_size"],
+            common.ClientAttributes.QUEUE_COALESCED_COUNT: metrics["coalesced_count"],
+            common.ClientAttributes.QUEUE_BLOCKED_TIME: metrics["blocked_time"],
         }
 
+    def take_custom_attributes_patch(self) -> Dict[str, Any]:
+        """
+        Return the merge patch of the custom attributes since the previous call.
+        """
+        patch = common.diff_attributes(self._broadcast_custom_attributes, self.custom_attributes)
+        if patch:
+            self._broadcast_custom_attributes = copy.deepcopy(self.custom_attributes)
+        return patch
+
+    @property
+    def congested(self) -> bool:
+        return self._command_queue.congested
+
+    def add_room_command(self, command: common.Command, bounded: bool = True):
+        """
+        Queue a room command for the client, unless it is a media that the client already has.
+
+        A media sent in chunks is skipped as a whole, and the client has the media once it has received MEDIA_END.
+        """
+        if command.type in common.MEDIA_MESSAGE_TYPES:
+            content_hash = common.media_content_hash(command)
+            if content_hash is not None:
+                if command.type == common.MessageType.BLENDER_DATA_MEDIA:
+                    if content_hash in self.media_hashes:
+                        return
+                    self.media_hashes.add(content_hash)
+                elif command.type == common.MessageType.MEDIA_BEGIN:
+                    if content_hash in self.media_hashes:
+                        self._skipped_media_transfers.add(content_hash)
+                        return
+                    self._skipped_media_transfers.discard(content_hash)
+                elif content_hash in self._skipped_media_transfers:
+                    if command.type == common.MessageType.MEDIA_END:
+                        self._skipped_media_transfers.discard(content_hash)
+                    return
+                elif command.type == common.MessageType.MEDIA_END:
+                    self.media_hashes.add(content_hash)
+        self.add_command(command, bounded)
+
     def broadcast_error(self, command: common.Command):
         self._server.broadcast_to_all_clients(command)
 
-    def run(self):
+    def close(self):
+        self._command_queue.close()
+        self.socket.close()
+
+    def _make_command_handlers(self) -> Dict[common.MessageType, Callable[[common.Command], None]]:
         def _send_error(s: str):
             logger.error("Sending error %s", s)
             self.send_command(common.Command(common.MessageType.SEND_ERROR, common.encode_string(s)))
@@ -109,7 +201,7 @@ class Connection:
             if self.room is None:
                 _send_error("Received leave_room but no room is joined")
                 return
-            _ = command.data.decode()  # todo remove room_name from protocol
+            _ = str(command.data, "utf-8")  # todo remove room_name from protocol
             self._server.leave_room(self)
             self.send_command(common.Command(common.MessageType.LEAVE_ROOM))
 
@@ -117,14 +209,13 @@ class Connection:
             self.send_command(self._server.get_list_rooms_command())
 
         def _delete_room(command: common.Command):
-            self._server.delete_room(command.data.decode())
+            self._server.delete_room(str(command.data, "utf-8"))
 
         def _set_custom_attributes(custom_attributes: Mapping[str, Any]):
-            diff = update_attributes_and_get_diff(self.custom_attributes, custom_attributes)
-            self._server.broadcast_client_update(self, diff)
+            self._server.update_client_attributes(self, custom_attributes)
 
         def _set_client_name(command: common.Command):
-            _set_custom_attributes({common.ClientAttributes.USERNAME: command.data.decode()})
+            _set_custom_attributes({common.ClientAttributes.USERNAME: str(command.data, "utf-8")})
 
         def _list_clients(command: common.Command):
             self.send_command(self._server.get_list_clients_command())
@@ -132,6 +223,10 @@ class Connection:
         def _set_client_custom_attributes(command: common.Command):
             _set_custom_attributes(common.decode_json(command.data, 0)[0])
 
+        def _set_client_custom_attributes_patch(command: common.Command):
+            self.accepts_patches = True
+            self._server.update_client_attributes(self, common.decode_json(command.data, 0)[0], is_patch=True)
+
         def _set_room_custom_attributes(command: common.Command):
             room_name, offset = common.decode_string(command.data, 0)
             custom_attributes, _ = common.decode_json(command.data, offset)
@@ -147,6 +242,12 @@ class Connection:
                 common.Command(common.MessageType.CLIENT_ID, f"{self.address[0]}:{self.address[1]}".encode("utf8"))
             )
 
+        def _media_hashes(command: common.Command):
+            # sent before JOIN_ROOM, so that the media the client has are not sent with the room content.
+            # Replaces the previous announce, the client may have evicted media since
+            content_hashes, _ = common.decode_string_array(command.data, 0)
+            self.media_hashes = set(content_hashes)
+
         def _content(command: common.Command):
             if self.room is None:
                 _send_error("Unjoined client trying to set room joinable")
@@ -155,9 +256,10 @@ class Connection:
                 _send_error(f"Trying to set joinable room {self.room.name} which is already joinable")
                 return
             self.room.joinable = True
+            self.room.save_attributes()
             self._server.broadcast_room_update(self.room, {common.RoomAttributes.JOINABLE: True})
 
-        command_handlers = {
+        return {
             common.MessageType.JOIN_ROOM: _join_room,
             common.MessageType.LEAVE_ROOM: _leave_room,
             common.MessageType.LIST_ROOMS: _list_rooms,
@@ -168,81 +270,159 @@ class Connection:
             common.MessageType.LIST_CLIENTS: _list_clients,
             common.MessageType.SET_CLIENT_NAME: _set_client_name,
             common.MessageType.SET_CLIENT_CUSTOM_ATTRIBUTES: _set_client_custom_attributes,
+            common.MessageType.SET_CLIENT_CUSTOM_ATTRIBUTES_PATCH: _set_client_custom_attributes_patch,
             common.MessageType.CLIENT_ID: _client_id,
             common.MessageType.CONTENT: _content,
+            common.MessageType.MEDIA_HASHES: _media_hashes,
         }
 
+    def process_commands(self, received_commands: List[common.Command]):
+        """
+        Handle commands received from the client, either server protocol commands or room commands.
+        """
+        for command in received_commands:
+            if _log_server_updates or command.type not in (common.MessageType.SET_CLIENT_CUSTOM_ATTRIBUTES,):
+                logger.debug("Received from %s - %s", self.unique_id, command.type)
+
+            if command.type in self._command_handlers:
+                self._command_handlers[command.type](command)
+            elif command.type.value > common.MessageType.COMMAND.value:
+                if self.room is not None:
+                    self.room.add_command(command, self)
+                else:
+                    logger.warning(
+                        "%s:%s - %s received but no room was joined",
+                        self.address[0],
+                        self.address[1],
+                        command.type,
+                    )
+            else:
+                logger.error("Command %s received but no handler for it on server", command.type)
+
+    def run(self):
+        command_reader = common.CommandReader(self.socket)
+
         def _handle_incoming_commands():
-            received_commands = common.read_all_messages(self.socket)
+            received_commands = command_reader.read_commands()
             count = len(received_commands)
             if count > 0:
                 # upstream
                 time.sleep(self.latency)
                 logger.debug("Received from %s - %d commands ", self.unique_id, count)
 
-            for command in received_commands:
-                if _log_server_updates or command.type not in (common.MessageType.SET_CLIENT_CUSTOM_ATTRIBUTES,):
-                    logger.debug("Received from %s - %s", self.unique_id, command.type)
-
-                if command.type in command_handlers:
-                    command_handlers[command.type](command)
-                elif command.type.value > common.MessageType.COMMAND.value:
-                    if self.room is not None:
-                        self.room.add_command(command, self)
-                    else:
-                        logger.warning(
-                            "%s:%s - %s received but no room was joined",
-                            self.address[0],
-                            self.address[1],
-                            command.type,
-                        )
-                else:
-                    logger.error("Command %s received but no handler for it on server", command.type)
+            self.process_commands(received_commands)
+            if count > 0:
+                self._wait_for_congested_clients()
 
         def _handle_outgoing_commands():
             self.fetch_outgoing_commands()
 
         global SHUTDOWN
-        while not SHUTDOWN:
+        while not SHUTDOWN and not self._overflowed:
             try:
                 _handle_incoming_commands()
                 _handle_outgoing_commands()
             except common.ClientDisconnectedException:
                 break
             except Exception:
+                if self._overflowed:
+                    # the socket was shut down by _handle_overflow()
+                    break
                 logger.exception("Exception during command processing. Disconnecting")
                 logger.error(f"Disconnecting {self.custom_attributes.get(common.ClientAttributes.USERNAME, 'Unknown')}")
                 break
 
         self._server.handle_client_disconnect(self)
 
-    def fetch_outgoing_commands(self):
-        while True:
-            try:
-                command = self._command_queue.get_nowait()
-            except queue.Empty:
-                break
+    def _wait_for_congested_clients(self):
+        """
+        With the BLOCK overflow policy, wait until the other clients of the room have drained their queue below the
+        low water mark, for at most queue_block_timeout.
+        """
+        if self.room is None or self._server.queue_overflow_policy != OverflowPolicy.BLOCK:
+            return
 
-            self.send_command(command)
-            self._command_queue.task_done()
+        deadline = time.monotonic() + self._server.queue_block_timeout
+        for connection in self.room.congested_clients(self):
+            while not connection._command_queue.wait_drained(CONGESTION_POLL_INTERVAL):
+                # the congested client may itself be waiting for our queue to drain
+                self.fetch_outgoing_commands()
+                if time.monotonic() > deadline:
+                    logger.warning("%s - timeout while waiting for congested clients", self.unique_id)
+                    return
 
-    def add_command(self, command: common.Command):
+    def fetch_outgoing_commands(self):
+        commands = self._command_queue.get_all()
+        if commands:
+            self.send_commands(commands)
+
+    def add_command(self, command: common.Command, bounded: bool = True):
         """
         Add command to be consumed later. Meant to be used by other threads.
+
+        The overflow policy of the queue applies if bounded is True.
         """
-        self._command_queue.put(command)
+        if self._overflowed:
+            return
+        try:
+            self._command_queue.put(command, bounded)
+        except QueueOverflow as e:
+            logger.warning("%s - send queue overflow, disconnecting: %s", self.unique_id, e)
+            self._overflowed = True
+            self._handle_overflow()
+
+    def _handle_overflow(self):
+        """
+        Disconnect after a queue overflow.
+
+        The pending commands are dropped and the socket is shut down, so that the connection thread fails if it is
+        blocked sending to the stalled client, then exits its loop since _overflowed is set.
+        """
+        self._command_queue.get_all()
+        self._command_queue.close()
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError as e:
+            logger.info("%s - socket shutdown failed: %r", self.unique_id, e)
 
     def send_command(self, command: common.Command):
         """
         Directly send a command to the socket. Meant to be used by this thread.
         """
         assert threading.current_thread() is self.thread
+        self._log_send(command)
+        common.write_message(self.socket, command)
+
+    def send_commands(self, commands: List[common.Command]):
+        """
+        Directly send commands to the socket, batched into few system calls. Meant to be used by this thread.
+        """
+        assert threading.current_thread() is self.thread
+        for command in commands:
+            self._log_send(command)
+        common.write_messages(self.socket, commands, self._server.max_batch_size)
+
+    def _log_send(self, command: common.Command):
         if _log_server_updates or command.type not in (
             common.MessageType.CLIENT_UPDATE,
             common.MessageType.ROOM_UPDATE,
         ):
             logger.debug("Sending to %s:%s - %s", self.address[0], self.address[1], command.type)
-        common.write_message(self.socket, command)
+
+
+def _supersedes(command: common.Command, stored_command: common.Command) -> bool:
+    """
+    Return True if command replaces stored_command, the last command of the room.
+    """
+    command_type = command.type
+    if (
+        common.MessageType.OPTIMIZED_COMMANDS.value
+        < command_type.value
+        < common.MessageType.END_OPTIMIZED_COMMANDS.value
+    ):
+        command_path = common.decode_string(command.data, 0)[0]
+        return command_type == stored_command.type and command_path == common.decode_string(stored_command.data, 0)[0]
+    return False
 
 
 class Room:
@@ -261,8 +441,12 @@ class Room:
         mixer_version: str,
         ignore_version_check: bool,
         generic_protocol: bool,
-        creator: Connection,
+        creator: Optional[Connection],
     ):
+        """
+        creator is None for a room recovered from its journal.
+        """
+        self._server = server
         self.name = room_name
         self.blender_version = blender_version
         self.mixer_version = mixer_version
@@ -274,21 +458,213 @@ class Room:
 
         self.custom_attributes: Dict[str, Any] = {}  # custom attributes are used between clients, but not by the server
 
-        self._commands: List[common.Command] = []
+        self._commands: Union[List[common.Command], RoomJournal] = []
+        self._journal: Optional[RoomJournal] = None
+
+        # content hashes of the media of the room, that holds one BLENDER_DATA_MEDIA command or chunked transfer per
+        # media content
+        self.media_hashes: Set[str] = set()
+        # the clients sending the chunked media of the room that are not complete, by content hash
+        self._media_senders: Dict[str, Connection] = {}
+        # the client unique ids and content hashes of the chunked media already in the room, that are not stored
+        self._dropped_media_transfers: Set[Tuple[str, str]] = set()
+        # the number of GROUP_BEGIN not yet matched by GROUP_END, by sending client, closed if the client leaves
+        self._open_groups: Dict[Connection, int] = {}
+        self._compactor = RoomCompactor()
+
+        # Compacted equivalent of self._commands[:self._checkpoint_command_count], sent to joining clients
+        # instead of these commands. Stored next to the journal, if any
+        self._checkpoint: Union[List[common.Command], RoomJournal] = []
+        self._checkpoint_command_count = 0
+        self._checkpoint_compactor = RoomCompactor()
+        self.last_command_time = time.monotonic()
 
         self._commands_mutex: threading.RLock = threading.RLock()
-        self._connections: List[Connection] = [creator]
+        self._connections: List[Connection] = []
 
         self.join_count: int = 0
         # this is used to ensure a room cannot be deleted while clients are joining (creator is not considered to be joining)
         # Server is responsible of increasing / decreasing join_count, with mutex protection
 
+        if creator is None:
+            return
+
+        self._connections.append(creator)
         creator.room = self
         creator.send_command(common.Command(common.MessageType.JOIN_ROOM, common.encode_string(self.name)))
         creator.send_command(
             common.Command(common.MessageType.CONTENT)
         )  # self.joinable will be set to true by creator later
 
+    def start_journal(self, directory: Path):
+        """
+        Store the room commands in a journal file instead of memory.
+        """
+        assert self.command_count() == 0
+        self._journal = RoomJournal.create(directory, self.name, self.attributes_dict())
+        self._commands = self._journal
+        self._checkpoint = RoomJournal.create_file(checkpoint_path(self._journal.path), {})
+
+    def recover_journal(self, path: Path):
+        """
+        Restore the room commands and attributes from a journal file written by a previous server run.
+        """
+        attributes, journal = RoomJournal.recover(path, _supersedes)
+        self._journal = journal
+        self._commands = journal
+        # the checkpoint is rebuilt from the recovered commands
+        self._checkpoint = RoomJournal.create_file(checkpoint_path(path), {})
+
+        self.keep_open = attributes.pop(common.RoomAttributes.KEEP_OPEN, False)
+        self.joinable = attributes.pop(common.RoomAttributes.JOINABLE, False)
+        self.blender_version = attributes.pop(common.RoomAttributes.BLENDER_VERSION, "")
+        self.mixer_version = attributes.pop(common.RoomAttributes.MIXER_VERSION, "")
+        self.ignore_version_check = attributes.pop(common.RoomAttributes.IGNORE_VERSION_CHECK, False)
+        self.generic_protocol = attributes.pop(common.RoomAttributes.GENERIC_PROTOCOL, True)
+        attributes.pop(common.RoomAttributes.COMMAND_COUNT, None)
+        attributes.pop(common.RoomAttributes.BYTE_SIZE, None)
+        self.custom_attributes = attributes
+        self.byte_size = sum(journal[i].byte_size() for i in range(len(journal)))
+        open_groups = 0
+        media_transfers = set()
+        for i in range(len(journal)):
+            command = journal[i]
+            if command.type == common.MessageType.GROUP_BEGIN:
+                open_groups += 1
+            elif command.type == common.MessageType.GROUP_END:
+                open_groups -= 1
+            # the transfers without MEDIA_END were interrupted and the media must be sent again
+            if command.type in (
+                common.MessageType.BLENDER_DATA_MEDIA,
+                common.MessageType.MEDIA_BEGIN,
+                common.MessageType.MEDIA_END,
+            ):
+                content_hash = common.media_content_hash(command)
+                if content_hash is None:
+                    continue
+                if command.type == common.MessageType.MEDIA_BEGIN:
+                    media_transfers.add(content_hash)
+                    continue
+                if command.type == common.MessageType.MEDIA_END:
+                    media_transfers.discard(content_hash)
+                self.media_hashes.add(content_hash)
+
+        for content_hash in media_transfers:
+            self._compactor.interrupted(content_hash)
+            self._checkpoint_compactor.interrupted(content_hash)
+
+        # the sender of a group disconnected with the previous server
+        for _ in range(open_groups):
+            group_end = common.Command(common.MessageType.GROUP_END)
+            self._commands.append(group_end)
+            self.byte_size += group_end.byte_size()
+
+    def save_attributes(self):
+        """
+        Save the room attributes in the journal, if any, so that they are available for recovery.
+        """
+        if self._journal is not None:
+            self._journal.save_attributes(self.attributes_dict())
+
+    def close(self):
+        """
+        Delete the room journal, if any. Called when the room is deleted.
+        """
+        if self._journal is not None:
+            self._journal.delete()
+            self._journal = None
+            self._checkpoint.delete()
+            self._checkpoint = []
+
+    def compact(self) -> int:
+        """
+        Drop the commands of the room history that are superseded by later commands, so that joining clients
+        receive fewer commands. Return the number of bytes reclaimed.
+        """
+        with self._commands_mutex:
+            dropped = self._compactor.scan(self._commands)
+            if not dropped:
+                return 0
+
+            with self._server._mutex:
+                if self.join_count > 0:
+                    # joining clients read the history without holding the commands mutex, try again later
+                    return 0
+
+                reclaimed = sum(self._commands[i].byte_size() for i in dropped)
+                if self._journal is not None:
+                    self._journal.drop(dropped)
+                else:
+                    dropped_set = set(dropped)
+                    self._commands = [command for i, command in enumerate(self._commands) if i not in dropped_set]
+                self._compactor.purged()
+                self._checkpoint_command_count -= bisect.bisect_left(dropped, self._checkpoint_command_count)
+                self.byte_size -= reclaimed
+
+                logger.info(
+                    "Room %s compacted: %d commands dropped, %d bytes reclaimed", self.name, len(dropped), reclaimed
+                )
+                self._server.broadcast_room_update(
+                    self,
+                    {
+                        common.RoomAttributes.BYTE_SIZE: self.byte_size,
+                        common.RoomAttributes.COMMAND_COUNT: self.command_count(),
+                    },
+                )
+                return reclaimed
+
+    def update_checkpoint(self, min_command_count: int = 1) -> bool:
+        """
+        Extend the room checkpoint with the commands added since it was built, and compact it.
+
+        Joining clients receive the checkpoint then the commands that follow it, so that the join time depends
+        on the room content rather than on the session length. The history itself is kept unchanged.
+        The checkpoint is updated only if at least min_command_count commands were added since it was built.
+        Return True if the checkpoint was updated.
+        """
+        with self._commands_mutex:
+            command_count = self.command_count()
+            if command_count - self._checkpoint_command_count < max(min_command_count, 1):
+                return False
+
+            if self._journal is not None:
+                with self._server._mutex:
+                    if self.join_count > 0:
+                        # joining clients read the checkpoint file without holding the commands mutex, try again later
+                        return False
+                checkpoint = self._checkpoint
+            else:
+                # joining clients may be reading the current checkpoint
+                checkpoint = list(self._checkpoint)
+
+            for i in range(self._checkpoint_command_count, command_count):
+                checkpoint.append(self._commands[i])
+            dropped = self._checkpoint_compactor.scan(checkpoint)
+            if self._journal is not None:
+                if dropped:
+                    checkpoint.drop(dropped)
+            else:
+                dropped_set = set(dropped)
+                checkpoint = [command for i, command in enumerate(checkpoint) if i not in dropped_set]
+            self._checkpoint_compactor.purged()
+            self.set_checkpoint(checkpoint, command_count)
+            return True
+
+    def set_checkpoint(self, commands: Union[List[common.Command], RoomJournal], command_count: int):
+        """
+        Set the commands that joining clients receive instead of the first command_count commands of the history.
+        """
+        with self._commands_mutex:
+            assert command_count <= self.command_count()
+            self._checkpoint = commands
+            self._checkpoint_command_count = command_count
+            logger.info(
+                "Room %s checkpoint: %d commands instead of %d",
+                self.name,
+                len(commands),
+                self._checkpoint_command_count,
+            )
+
     def client_count(self):
         return len(self._connections) + self.join_count
 
@@ -300,7 +676,12 @@ class Room:
 
         connection.send_command(common.Command(common.MessageType.CLEAR_CONTENT))  # todo temporary size stored here
 
-        offset = 0
+        with self._commands_mutex:
+            checkpoint = self._checkpoint
+            checkpoint_count = len(checkpoint)
+            offset = self._checkpoint_command_count
+        for i in range(checkpoint_count):
+            connection.add_room_command(checkpoint[i], bounded=False)
 
         def _try_finish_sync():
             connection.fetch_outgoing_commands()
@@ -313,12 +694,23 @@ class Room:
                 # now is time to synchronize all room participants: broadcast remaining commands to new client
                 for i in range(offset, command_count):
                     command = self._commands[i]
-                    connection.add_command(command)
+                    connection.add_room_command(command, bounded=False)
+
+                if self.media_hashes:
+                    # so that the client does not send the media that the room already has
+                    connection.add_command(
+                        common.Command(
+                            common.MessageType.MEDIA_HASHES, common.encode_string_array(sorted(self.media_hashes))
+                        ),
+                        bounded=False,
+                    )
 
                 # now he's part of the room, let him/her know
                 self._connections.append(connection)
                 connection.room = self
-                connection.add_command(common.Command(common.MessageType.JOIN_ROOM, common.encode_string(self.name)))
+                connection.add_command(
+                    common.Command(common.MessageType.JOIN_ROOM, common.encode_string(self.name)), bounded=False
+                )
                 return True
 
         while True:
@@ -328,12 +720,38 @@ class Room:
             command_count = self.command_count()
             for i in range(offset, command_count):
                 command = self._commands[i]  # atomic wrt. the GIL
-                connection.add_command(command)
+                connection.add_room_command(command, bounded=False)
             offset = command_count
 
     def remove_client(self, connection: Connection):
         logger.info("Remove Client % s from Room % s", connection.address, self.name)
-        self._connections.remove(connection)
+        with self._commands_mutex:
+            self._connections.remove(connection)
+            for content_hash, sender in list(self._media_senders.items()):
+                if sender is connection:
+                    # the transfer will not complete, so that another client may send the media again
+                    logger.info("Room %s: media %s transfer interrupted", self.name, content_hash)
+                    del self._media_senders[content_hash]
+                    self.media_hashes.discard(content_hash)
+                    # its stored commands are dropped by the compaction and are not included in the checkpoint
+                    self._compactor.interrupted(content_hash)
+                    self._checkpoint_compactor.interrupted(content_hash)
+            self._dropped_media_transfers = {
+                transfer for transfer in self._dropped_media_transfers if transfer[0] != connection.unique_id
+            }
+            open_groups = self._open_groups.pop(connection, 0)
+            if open_groups:
+                # otherwise the other clients wait for the end of the group forever
+                logger.info("Room %s: closing %d command groups of %s", self.name, open_groups, connection.address)
+                for _ in range(open_groups):
+                    self.add_command(common.Command(common.MessageType.GROUP_END), connection)
+
+    def congested_clients(self, sender: Connection) -> List[Connection]:
+        """
+        Return the connections of the room, other than sender, with a queue above its high water mark.
+        """
+        with self._commands_mutex:
+            return [connection for connection in self._connections if connection is not sender and connection.congested]
 
     def attributes_dict(self):
         return {
@@ -348,35 +766,70 @@ class Room:
             common.RoomAttributes.JOINABLE: self.joinable,
         }
 
+    def _accept_media_command(self, message_type: common.MessageType, content_hash: str, sender: Connection) -> bool:
+        """
+        Tell if a media command must be stored and broadcast, which is not the case for a media already in the room,
+        whatever the client that sends it and whether it is sent in chunks or not.
+        """
+        transfer = (sender.unique_id, content_hash)
+        if message_type in (common.MessageType.BLENDER_DATA_MEDIA, common.MessageType.MEDIA_BEGIN):
+            if content_hash in self.media_hashes:
+                # the room clients already have the media or received it when they joined
+                logger.info("Room %s: media %s already in room, not stored", self.name, content_hash)
+                if message_type == common.MessageType.MEDIA_BEGIN:
+                    self._dropped_media_transfers.add(transfer)
+                return False
+            self.media_hashes.add(content_hash)
+            if message_type == common.MessageType.MEDIA_BEGIN:
+                self._media_senders[content_hash] = sender
+            return True
+
+        if transfer in self._dropped_media_transfers:
+            if message_type == common.MessageType.MEDIA_END:
+                self._dropped_media_transfers.discard(transfer)
+            return False
+        if message_type == common.MessageType.MEDIA_END:
+            self._media_senders.pop(content_hash, None)
+        return True
+
     def add_command(self, command, sender: Connection):
         def merge_command():
             """
             Add the command to the room list, possibly merge with the previous command.
             """
             command_type = command.type
-            if (
-                common.MessageType.OPTIMIZED_COMMANDS.value
-                < command_type.value
-                < common.MessageType.END_OPTIMIZED_COMMANDS.value
-            ):
-                command_path = common.decode_string(command.data, 0)[0]
-                if self.command_count() > 0:
-                    stored_command = self._commands[-1]
-                    if (
-                        command_type == stored_command.type
-                        and command_path == common.decode_string(stored_command.data, 0)[0]
-                    ):
-                        self._commands.pop()
-                        self.byte_size -= stored_command.byte_size()
+            if self.command_count() > 0 and _supersedes(command, self._commands[-1]):
+                stored_command = self._commands.pop()
+                self.byte_size -= stored_command.byte_size()
+                # the checkpoint still contains the popped command, send its replacement after the checkpoint
+                self._checkpoint_command_count = min(self._checkpoint_command_count, self.command_count())
             if (
                 command_type != common.MessageType.CLIENT_ID_WRAPPER
                 and command_type != common.MessageType.FRAME
                 and command_type != common.MessageType.QUERY_ANIMATION_DATA
             ):
-                self._commands.append(command)
+                # the journal copies the data to its file
+                self._commands.append(command if self._journal is not None else command.detached())
                 self.byte_size += command.byte_size()
 
+        content_hash = None
+        if command.type in common.MEDIA_MESSAGE_TYPES:
+            content_hash = common.media_content_hash(command)
+            if content_hash is not None:
+                sender.media_hashes.add(content_hash)
+
         with self._commands_mutex:
+            if content_hash is not None and not self._accept_media_command(command.type, content_hash, sender):
+                return
+
+            if command.type == common.MessageType.GROUP_BEGIN:
+                self._open_groups[sender] = self._open_groups.get(sender, 0) + 1
+            elif command.type == common.MessageType.GROUP_END and sender in self._open_groups:
+                self._open_groups[sender] -= 1
+                if self._open_groups[sender] == 0:
+                    del self._open_groups[sender]
+
+            self.last_command_time = time.monotonic()
             current_byte_size = self.byte_size
             current_command_count = self.command_count()
             merge_command()
@@ -391,7 +844,7 @@ class Room:
 
             for connection in self._connections:
                 if connection != sender:
-                    connection.add_command(command)
+                    connection.add_room_command(command)
 
 
 class Server:
@@ -401,6 +854,54 @@ class Server:
         self._mutex = threading.RLock()
         self.latency: float = 0.0  # seconds
         self.bandwidth: float = 0.0  # MBps
+        self.max_batch_size: int = common.DEFAULT_MAX_BATCH_SIZE  # bytes
+        self.journal_directory: Optional[Path] = None  # store room commands on disk if set
+        self.compaction: bool = False  # compact idle room histories
+        self.checkpoint_command_count: int = 0  # checkpoint idle rooms with more commands after their checkpoint
+        self.idle_delay: float = DEFAULT_IDLE_DELAY  # seconds
+        self.queue_high_water: int = DEFAULT_HIGH_WATER  # bytes pending for a client before the overflow policy applies
+        self.queue_low_water: int = DEFAULT_LOW_WATER  # bytes pending for a client below which the queue is drained
+        self.queue_overflow_policy: OverflowPolicy = OverflowPolicy.COALESCE
+        self.queue_block_timeout: float = DEFAULT_BLOCK_TIMEOUT  # seconds
+        self.client_update_interval: float = DEFAULT_CLIENT_UPDATE_INTERVAL  # seconds, 0 to broadcast immediately
+        self._maintained_command_counts: Dict[str, int] = {}
+        # connections with custom attribute updates not yet broadcast, by client id
+        self._updated_clients: Dict[str, Connection] = {}
+
+    def maintenance_enabled(self) -> bool:
+        return self.compaction or self.checkpoint_command_count > 0
+
+    def maintain_idle_rooms(self):
+        """
+        Compact and checkpoint the rooms that received no command for idle_delay.
+        """
+        with self._mutex:
+            rooms = list(self._rooms.values())
+        now = time.monotonic()
+        for room in rooms:
+            if now - room.last_command_time < self.idle_delay:
+                continue
+            if self._maintained_command_counts.get(room.name) == room.command_count():
+                # nothing new since the last maintenance
+                continue
+            try:
+                if self.compaction:
+                    room.compact()
+                if self.checkpoint_command_count > 0:
+                    room.update_checkpoint(self.checkpoint_command_count)
+            except Exception:
+                logger.exception("Maintenance of room %s failed", room.name)
+            self._maintained_command_counts[room.name] = room.command_count()
+
+    def _run_maintenance(self):
+        while not SHUTDOWN:
+            time.sleep(self.idle_delay)
+            self.maintain_idle_rooms()
+
+    def _run_client_update_flush(self):
+        while not SHUTDOWN:
+            time.sleep(self.client_update_interval)
+            self.flush_client_updates()
 
     def delete_room(self, room_name: str):
         with self._mutex:
@@ -411,6 +912,7 @@ class Server:
                 logger.warning("Room %s is not empty.", room_name)
                 return
 
+            self._rooms[room_name].close()
             del self._rooms[room_name]
             logger.info(f"Room {room_name} deleted")
 
@@ -434,6 +936,8 @@ class Server:
             room = Room(
                 self, room_name, blender_version, mixer_version, ignore_version_check, generic_protocol, connection
             )
+            if self.journal_directory is not None:
+                room.start_journal(self.journal_directory)
             self._rooms[room_name] = room
             # room is now visible to others, but not joinable until the client has sent CONTENT
             logger.info(
@@ -483,13 +987,29 @@ class Server:
             room = self._rooms.get(connection.room.name)
             if room is None:
                 raise ValueError(f"Room not found {connection.room.name})")
-            room.remove_client(connection)
+
+        # Room methods lock the room commands mutex then the server mutex, never the reverse. The room is not deleted
+        # meanwhile since the connection is still one of its clients
+        room.remove_client(connection)
+
+        with self._mutex:
             connection.room = None
-            self.broadcast_client_update(connection, {common.ClientAttributes.ROOM: None})
+            if self.client_update_interval > 0.0:
+                # the clients of other rooms did not receive the updates of the connection while in the room
+                self.broadcast_client_update(
+                    connection, {**connection.custom_attributes, common.ClientAttributes.ROOM: None}
+                )
+                if connection.unique_id in self._connections:
+                    # and conversely
+                    connection.add_command(self.get_list_clients_command())
+            else:
+                self.broadcast_client_update(connection, {common.ClientAttributes.ROOM: None})
 
             if room.client_count() == 0 and not room.keep_open:
-                logger.info('No more clients in room "%s" and not keep_open', room.name)
-                self.delete_room(room.name)
+                if self._rooms.get(room.name) is room:
+                    # not already deleted by a client that left meanwhile
+                    logger.info('No more clients in room "%s" and not keep_open', room.name)
+                    self.delete_room(room.name)
             else:
                 logger.info(f"Connections left in room {room.name}: {room.client_count()}.")
 
@@ -499,12 +1019,86 @@ class Server:
                 connection.add_command(command)
 
     def broadcast_client_update(self, connection: Connection, attributes: Dict[str, Any]):
+        """
+        Broadcast an update of the attributes of connection to all the clients, after the pending updates.
+        """
         if attributes == {}:
             return
 
-        self.broadcast_to_all_clients(
-            common.Command(common.MessageType.CLIENT_UPDATE, common.encode_json({connection.unique_id: attributes}))
-        )
+        with self._mutex:
+            self.flush_client_updates()
+            self.broadcast_to_all_clients(
+                common.Command(common.MessageType.CLIENT_UPDATE, common.encode_json({connection.unique_id: attributes}))
+            )
+
+    def update_client_attributes(self, connection: Connection, attributes: Dict[str, Any], is_patch: bool = False):
+        """
+        Update the custom attributes of connection, broadcast by the next flush_client_updates().
+
+        Clients send their custom attributes at a high rate, with view matrices and selections. Accumulating them
+        reduces the number of updates sent, and only the clients that may use them receive them.
+
+        Args:
+            attributes: the new values of top level attributes, or a merge patch if is_patch is True
+        """
+        with self._mutex:
+            if is_patch:
+                common.apply_attributes_patch(connection.custom_attributes, attributes)
+            else:
+                connection.custom_attributes.update(attributes)
+            self._updated_clients[connection.unique_id] = connection
+            if self.client_update_interval <= 0.0:
+                self._flush_client_updates(scoped=False)
+
+    def flush_client_updates(self):
+        """
+        Broadcast the accumulated client updates, batched into one message per receiving client.
+
+        The updates of a client in a room are sent to the clients of the same room and to the clients that have
+        not joined a room. The updates of a client that has not joined a room are sent to all the clients.
+        """
+        self._flush_client_updates(scoped=True)
+
+    def _flush_client_updates(self, scoped: bool):
+        with self._mutex:
+            if not self._updated_clients:
+                return
+            updated_clients = self._updated_clients
+            self._updated_clients = {}
+
+            # CLIENT_UPDATE_PATCH for the clients that accept patches, CLIENT_UPDATE with the whole top level
+            # attributes for the others
+            patches: Dict[Optional[str], Dict[str, Dict[str, Any]]] = defaultdict(dict)
+            updates: Dict[Optional[str], Dict[str, Dict[str, Any]]] = defaultdict(dict)
+            for client_id, connection in updated_clients.items():
+                patch = connection.take_custom_attributes_patch()
+                if not patch:
+                    continue
+                room_name = connection.room.name if connection.room is not None and scoped else None
+                patches[room_name][client_id] = patch
+                updates[room_name][client_id] = {key: connection.custom_attributes.get(key) for key in patch}
+
+            commands: Dict[Tuple[Optional[str], bool], Optional[common.Command]] = {}
+            for connection in self._connections.values():
+                room_name = connection.room.name if connection.room is not None and scoped else None
+                key = (room_name, connection.accepts_patches)
+                if key not in commands:
+                    if connection.accepts_patches:
+                        message_type, updates_by_room = common.MessageType.CLIENT_UPDATE_PATCH, patches
+                    else:
+                        message_type, updates_by_room = common.MessageType.CLIENT_UPDATE, updates
+                    if room_name is None:
+                        received = {
+                            client_id: update
+                            for room_updates in updates_by_room.values()
+                            for client_id, update in room_updates.items()
+                        }
+                    else:
+                        received = {**updates_by_room.get(None, {}), **updates_by_room.get(room_name, {})}
+                    commands[key] = common.Command(message_type, common.encode_json(received)) if received else None
+                command = commands[key]
+                if command is not None:
+                    connection.add_command(command)
 
     def broadcast_room_update(self, room: Room, attributes: Dict[str, Any]):
         if attributes == {}:
@@ -524,6 +1118,8 @@ class Server:
                 return
 
             diff = update_attributes_and_get_diff(self._rooms[room_name].custom_attributes, custom_attributes)
+            if diff:
+                self._rooms[room_name].save_attributes()
             self.broadcast_room_update(self._rooms[room_name], diff)
 
     def set_room_keep_open(self, room_name: str, value: bool):
@@ -534,8 +1130,33 @@ class Server:
             room = self._rooms[room_name]
             if room.keep_open != value:
                 room.keep_open = value
+                room.save_attributes()
                 self.broadcast_room_update(room, {common.RoomAttributes.KEEP_OPEN: room.keep_open})
 
+    def recover_rooms(self):
+        """
+        Recover the rooms kept open from the journals of a previous run. Journals of other rooms are deleted, since
+        these rooms would have been deleted when their last client left.
+        """
+        assert self.journal_directory is not None
+        for path in journal_paths(self.journal_directory):
+            room_name = room_name_from_path(path)
+            room = Room(self, room_name, "", "", False, True, None)
+            try:
+                room.recover_journal(path)
+            except Exception:
+                logger.exception("Cannot recover room %s from journal %s", room_name, path)
+                continue
+
+            if not room.keep_open:
+                logger.warning("Room %s was not kept open, deleting its journal %s", room_name, path)
+                room.close()
+                continue
+
+            logger.warning("Room %s recovered from journal with %d commands", room_name, room.command_count())
+            with self._mutex:
+                self._rooms[room_name] = room
+
     def get_list_rooms_command(self) -> common.Command:
         with self._mutex:
             result_dict = {room_name: value.attributes_dict() for room_name, value in self._rooms.items()}
@@ -543,6 +1164,8 @@ class Server:
 
     def get_list_clients_command(self) -> common.Command:
         with self._mutex:
+            # otherwise, a value changed back before the next flush would not be patched in the returned attributes
+            self.flush_client_updates()
             result_dict = {cid: c.client_attributes() for cid, c in self._connections.items()}
             return common.Command(common.MessageType.LIST_CLIENTS, common.encode_json(result_dict))
 
@@ -550,13 +1173,15 @@ class Server:
         # First remove connection from server state, to avoid further broadcasting tentatives
         with self._mutex:
             del self._connections[connection.unique_id]
+            # would be received after CLIENT_DISCONNECTED
+            self._updated_clients.pop(connection.unique_id, None)
 
         # Clean leaving of the room
         if connection.room is not None:
             self.leave_room(connection)
 
         try:
-            connection.socket.close()
+            connection.close()
         except Exception as e:
             logger.warning(e)
         logger.info("%s closed", connection.address)
@@ -573,6 +1198,11 @@ class Server:
         sock.setblocking(0)
         sock.listen(1000)
 
+        if self.maintenance_enabled():
+            threading.Thread(None, self._run_maintenance, daemon=True).start()
+        if self.client_update_interval > 0.0:
+            threading.Thread(None, self._run_client_update_flush, daemon=True).start()
+
         logger.info("Listening on port % s", port)
         while True:
             try:
@@ -598,6 +1228,170 @@ class Server:
         sock.close()
 
 
+class AsyncioConnection(Connection):
+    """
+    Connection served by coroutines of the server event loop instead of a dedicated thread.
+
+    All the server state is accessed from the event loop thread only, so the mutexes of Room and Server
+    are never contended. Commands are written into the StreamWriter buffer, and flushed by a writer task.
+    """
+
+    def __init__(self, server: AsyncioServer, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        super().__init__(server, None, writer.get_extra_info("peername"))
+        self._reader = reader
+        self._writer = writer
+        self._outgoing_event = asyncio.Event()
+
+    def start(self):
+        raise RuntimeError("AsyncioConnection is run by AsyncioServer, use run_async()")
+
+    def close(self):
+        self._command_queue.close()
+        self._writer.close()
+
+    async def run_async(self):
+        writer_task = asyncio.ensure_future(self._write_outgoing_commands())
+        try:
+            while True:
+                command = await self._read_command()
+                if self.latency > 0.0:
+                    # upstream
+                    await asyncio.sleep(self.latency)
+                self.process_commands([command])
+                await self._wait_for_congested_clients_async()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception:
+            logger.exception("Exception during command processing. Disconnecting")
+            logger.error(f"Disconnecting {self.custom_attributes.get(common.ClientAttributes.USERNAME, 'Unknown')}")
+        finally:
+            writer_task.cancel()
+
+        self._server.handle_client_disconnect(self)
+
+    async def _read_command(self) -> common.Command:
+        msg = await self._reader.readexactly(common.HEADER_SIZE)
+        frame_size, command_id, message_type = common.unpack_header(msg)
+        msg = await self._reader.readexactly(frame_size)
+        return common.make_command(message_type, msg, command_id)
+
+    async def _wait_for_congested_clients_async(self):
+        """
+        Same as Connection._wait_for_congested_clients(), without blocking the event loop.
+        """
+        if self.room is None or self._server.queue_overflow_policy != OverflowPolicy.BLOCK:
+            return
+
+        start = time.monotonic()
+        deadline = start + self._server.queue_block_timeout
+        for connection in self.room.congested_clients(self):
+            wait_start = time.monotonic()
+            while connection.congested and time.monotonic() < deadline:
+                await asyncio.sleep(CONGESTION_POLL_INTERVAL)
+            connection._command_queue.blocked_time += time.monotonic() - wait_start
+            if time.monotonic() >= deadline:
+                logger.warning("%s - timeout while waiting for congested clients", self.unique_id)
+                return
+
+    async def _write_outgoing_commands(self):
+        while True:
+            await self._outgoing_event.wait()
+            self._outgoing_event.clear()
+            while True:
+                # leave the commands in the queue until they can be written, so that they are accounted for
+                command = self._command_queue.pop()
+                if command is None:
+                    break
+
+                self.send_command(command)
+                # only waits when the transport buffer is above its high-water mark
+                await self._writer.drain()
+
+    def fetch_outgoing_commands(self):
+        """
+        Wake up the writer task. Commands are not sent synchronously since this would block the event loop.
+        """
+        self._outgoing_event.set()
+
+    def add_command(self, command: common.Command, bounded: bool = True):
+        super().add_command(command, bounded)
+        self._outgoing_event.set()
+
+    def _handle_overflow(self):
+        self._command_queue.get_all()
+        # the reader of run_async() fails when the transport is closed
+        self._writer.close()
+
+    def send_command(self, command: common.Command):
+        """
+        Directly write a command into the transport buffer. Meant to be used from the event loop thread.
+        """
+        self._log_send(command)
+        self._writer.write(command.header())
+        if command.data:
+            self._writer.write(command.data)
+
+
+class AsyncioServer(Server):
+    """
+    Server that serves all its connections from a single asyncio event loop, with the same Room and
+    Connection semantics and the same wire protocol as the threaded Server.
+
+    The threaded Server uses a thread per connection that polls its socket, which keeps CPU busy even when
+    the clients are idle.
+    """
+
+    def run(self, port):
+        if self.bandwidth > 0.0:
+            logger.warning("Bandwidth limitation is not supported by the asyncio engine and is ignored")
+
+        try:
+            asyncio.run(self._serve(port))
+        except KeyboardInterrupt:
+            pass
+
+        logger.info("Shutting down server")
+
+    async def _serve(self, port):
+        binding_host = ""
+        server = await asyncio.start_server(
+            self._handle_new_connection, binding_host, port, family=socket.AF_INET, backlog=1000
+        )
+        if self.maintenance_enabled():
+            asyncio.ensure_future(self._run_maintenance_async())
+        if self.client_update_interval > 0.0:
+            asyncio.ensure_future(self._flush_client_updates_async())
+
+        logger.info("Listening on port % s", port)
+        async with server:
+            await server.serve_forever()
+
+    async def _run_maintenance_async(self):
+        while True:
+            await asyncio.sleep(self.idle_delay)
+            self.maintain_idle_rooms()
+
+    async def _flush_client_updates_async(self):
+        while True:
+            await asyncio.sleep(self.client_update_interval)
+            self.flush_client_updates()
+
+    async def _handle_new_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = AsyncioConnection(self, reader, writer)
+        connection.latency = self.latency
+        with self._mutex:
+            self._connections[connection.unique_id] = connection
+        logger.info(f"New connection from {connection.address}")
+        self.broadcast_client_update(connection, connection.client_attributes())
+        await connection.run_async()
+
+
+_server_engines = {
+    "thread": Server,
+    "asyncio": AsyncioServer,
+}
+
+
 def main():
     global _log_server_updates
     args, args_parser = parse_cli_args()
@@ -608,9 +1402,25 @@ def main():
         logger.warning(f"Bandwidth limited to {args.bandwidth} Mbps")
     _log_server_updates = args.log_server_updates
 
-    server = Server()
+    server = _server_engines[args.engine]()
     server.latency = args.latency / 1000.0
     server.bandwidth = args.bandwidth
+    server.max_batch_size = args.max_batch_size
+    if args.journal:
+        server.journal_directory = Path(args.journal_dir)
+        logger.warning(f"Room journals in {server.journal_directory}")
+        server.journal_directory.mkdir(parents=True, exist_ok=True)
+        server.recover_rooms()
+    server.compaction = args.compaction
+    server.checkpoint_command_count = args.checkpoint_commands
+    server.idle_delay = args.idle_delay
+    server.queue_high_water = int(args.queue_high_water * 1024 * 1024)
+    server.queue_low_water = int(args.queue_low_water * 1024 * 1024)
+    server.queue_overflow_policy = OverflowPolicy(args.queue_overflow)
+    server.queue_block_timeout = args.queue_block_timeout
+    server.client_update_interval = args.client_update_interval / 1000.0
+    if server.queue_low_water > server.queue_high_water:
+        args_parser.error("--queue-low-water must not be above --queue-high-water")
     server.run(args.port)
 
 
@@ -623,6 +1433,76 @@ def parse_cli_args():
         "--bandwidth", type=float, default=0.0, help="simulate bandwidth limitation (megabytes per second)"
     )
     parser.add_argument("--latency", type=float, default=0.0, help="simulate network latency (in milliseconds)")
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=common.DEFAULT_MAX_BATCH_SIZE,
+        help="maximum byte size of the commands sent to a client by a single system call",
+    )
+    parser.add_argument(
+        "--journal", action="store_true", help="store room commands on disk, and recover rooms kept open on restart"
+    )
+    parser.add_argument(
+        "--journal-dir",
+        default=str(Path(tempfile.gettempdir()) / "mixer" / "journal"),
+        help="directory of the room journals",
+    )
+    parser.add_argument(
+        "--compaction",
+        action="store_true",
+        help="drop superseded BLENDER_DATA_UPDATE and removed datablock commands from idle room histories",
+    )
+    parser.add_argument(
+        "--checkpoint-commands",
+        type=int,
+        default=0,
+        help="build a compacted checkpoint of idle rooms with this number of commands after their checkpoint, "
+        "sent to joining clients instead of the history and stored next to the journal, if any (0 to disable)",
+    )
+    parser.add_argument(
+        "--idle-delay",
+        type=float,
+        default=DEFAULT_IDLE_DELAY,
+        help="delay without new commands after which a room is compacted or checkpointed (in seconds)",
+    )
+    parser.add_argument(
+        "--queue-high-water",
+        type=float,
+        default=DEFAULT_HIGH_WATER / (1024 * 1024),
+        help="size of the commands pending for a client above which the overflow policy applies (in megabytes)",
+    )
+    parser.add_argument(
+        "--queue-low-water",
+        type=float,
+        default=DEFAULT_LOW_WATER / (1024 * 1024),
+        help="size of the commands pending for a client below which the overflow policy stops (in megabytes)",
+    )
+    parser.add_argument(
+        "--queue-overflow",
+        choices=[policy.value for policy in OverflowPolicy],
+        default=OverflowPolicy.COALESCE.value,
+        help="block: senders wait for slow clients, coalesce: drop superseded TRANSFORM, FRAME... commands "
+        "pending for slow clients, disconnect: disconnect slow clients",
+    )
+    parser.add_argument(
+        "--queue-block-timeout",
+        type=float,
+        default=DEFAULT_BLOCK_TIMEOUT,
+        help="maximum delay a sender waits for slow clients with the block overflow policy (in seconds)",
+    )
+    parser.add_argument(
+        "--client-update-interval",
+        type=float,
+        default=DEFAULT_CLIENT_UPDATE_INTERVAL * 1000.0,
+        help="interval during which client attribute updates are accumulated before being broadcast to the clients "
+        "of the same room and the clients outside rooms (in milliseconds, 0 to broadcast each update to all clients)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=list(_server_engines.keys()),
+        default="thread",
+        help="thread: one thread per connection, asyncio: all connections served by one event loop",
+    )
     return parser.parse_args(), parser
 
 
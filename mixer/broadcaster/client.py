@@ -22,16 +22,26 @@
 
 import socket
 import logging
+import queue
+import threading
 import time
-from typing import Dict, Any, Mapping, Optional, List, Callable
+from collections import deque
+from typing import Deque, Dict, Any, Iterable, Iterator, Mapping, Optional, List, Callable, Set, Tuple
 
 import mixer.broadcaster.common as common
 from mixer.broadcaster.socket import Socket
 from mixer.broadcaster.common import MessageType
-from mixer.broadcaster.common import update_attributes_and_get_diff, update_named_attributes
+from mixer.broadcaster.common import patch_named_attributes, update_attributes_and_get_patch, update_named_attributes
+from mixer.broadcaster.media_transfer import DEFAULT_MEDIA_BYTES_PER_FETCH, DEFAULT_MEDIA_CHUNK_SIZE, MediaUpload
 
 logger = logging.getLogger() if __name__ == "__main__" else logging.getLogger(__name__)
 
+# Seconds the I/O thread waits for incoming bytes before sending the commands queued in the meantime
+IO_POLL_INTERVAL = 0.005
+
+# Seconds disconnect() waits for the I/O thread to send the queued commands
+IO_STOP_TIMEOUT = 1.0
+
 
 class Client:
     """
@@ -47,12 +57,31 @@ class Client:
         self.port = port
         self.pending_commands: List[common.Command] = []
         self.socket: Socket = None
+        self._command_reader: Optional[common.CommandReader] = None
+        self.max_batch_size: int = common.DEFAULT_MAX_BATCH_SIZE  # bytes sent by a single system call
+        # compress added commands larger than this, if set. Only for rooms with RoomAttributes.COMPRESSION
+        self.compression_threshold: Optional[int] = None
 
         self.client_id: Optional[str] = None  # Will be filled with a unique string identifying this client
         self.current_custom_attributes: Dict[str, Any] = {}
         self.clients_attributes: Dict[str, Dict[str, Any]] = {}
         self.rooms_attributes: Dict[str, Dict[str, Any]] = {}
         self.current_room: Optional[str] = None
+        # content hashes of the media of the current room, that must not be sent to the room again
+        self.room_media_hashes: Set[str] = set()
+
+        self.media_chunk_size: int = DEFAULT_MEDIA_CHUNK_SIZE  # media larger than this are sent in chunks
+        self.media_bytes_per_fetch: int = DEFAULT_MEDIA_BYTES_PER_FETCH
+        # See add_media_upload(), the commands of the uploads and the commands to send after each upload
+        self._media_uploads: Deque[Tuple[Iterator[common.Command], List[common.Command]]] = deque()
+
+        # See start_io_thread()
+        self._io_thread: Optional[threading.Thread] = None
+        self._io_stop = threading.Event()
+        # received commands, then None when the I/O thread stops
+        self._inbound: "queue.SimpleQueue[Optional[common.Command]]" = queue.SimpleQueue()
+        # commands to send, with the commands_send_interval to apply
+        self._outbound: "queue.SimpleQueue[Tuple[List[common.Command], float]]" = queue.SimpleQueue()
 
     def __del__(self):
         if self.socket is not None:
@@ -74,6 +103,7 @@ class Client:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket = Socket(sock)
             self.socket.connect((self.host, self.port))
+            self._command_reader = common.CommandReader(self.socket)
             local_address = self.socket.getsockname()
             logger.info(
                 "Connecting from local %s:%s to %s:%s",
@@ -87,29 +117,172 @@ class Client:
             self.send_command(common.Command(common.MessageType.LIST_ROOMS))
         except ConnectionRefusedError:
             self.socket = None
+            self._command_reader = None
         except common.ClientDisconnectedException:
             self.handle_connection_lost()
         except Exception as e:
             logger.error("Connection error %s", e, exc_info=True)
             self.socket = None
+            self._command_reader = None
             raise
 
     def disconnect(self):
         if self.socket:
+            self._stop_io_thread()
             self.socket.shutdown(socket.SHUT_RDWR)
             self.socket.close()
             self.socket = None
+            self._command_reader = None
 
     def is_connected(self):
         return self.socket is not None
 
-    def add_command(self, command: common.Command):
+    def start_io_thread(self):
+        """
+        Start a thread that continuously receives commands into an inbound queue and sends the queued commands.
+
+        Afterwards fetch_incoming_commands() only dequeues the received commands, while fetch_outgoing_commands()
+        and send_command() hand the commands over to the thread. The network throughput then no longer depends on
+        how often the caller polls the client.
+        """
+        if self._io_thread is not None or not self.is_connected():
+            return
+
+        self._io_stop.clear()
+        self._io_thread = threading.Thread(
+            target=self._io_loop, args=(self.socket, self._command_reader), name="mixer_client_io", daemon=True
+        )
+        self._io_thread.start()
+
+    def _stop_io_thread(self):
+        if self._io_thread is None:
+            return
+
+        # the thread sends the queued commands before it exits
+        self._io_stop.set()
+        self._io_thread.join(IO_STOP_TIMEOUT)
+        if self._io_thread.is_alive():
+            logger.warning("I/O thread did not stop, queued commands may be lost")
+        self._io_thread = None
+
+    def _io_loop(self, sock: Socket, command_reader: common.CommandReader):
+        try:
+            while True:
+                stopping = self._io_stop.is_set()
+                while True:
+                    try:
+                        commands, commands_send_interval = self._outbound.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._write_commands(sock, commands, commands_send_interval)
+
+                if stopping:
+                    break
+
+                for command in command_reader.read_commands(IO_POLL_INTERVAL):
+                    self._inbound.put(command)
+        except (common.ClientDisconnectedException, OSError, ValueError) as e:
+            if not self._io_stop.is_set():
+                logger.info("I/O thread: connection lost (%r)", e)
+        except Exception:
+            logger.error("I/O thread: unexpected exception", exc_info=True)
+        finally:
+            # the connection loss is handled by fetch_incoming_commands(), in the thread that uses this client
+            self._inbound.put(None)
+
+    def _write_commands(self, sock: Socket, commands: List[common.Command], commands_send_interval: float):
+        if commands_send_interval > 0:
+            for command in commands:
+                common.write_message(sock, command)
+                time.sleep(commands_send_interval)
+        else:
+            common.write_messages(sock, commands, self.max_batch_size)
+
+    def _dequeue_incoming_commands(self) -> List[common.Command]:
+        commands: List[common.Command] = []
+        while True:
+            try:
+                command = self._inbound.get_nowait()
+            except queue.Empty:
+                return commands
+
+            if command is None:
+                # the I/O thread has stopped. Deliver what was received before reporting the connection loss
+                if commands:
+                    self._inbound.put(None)
+                    return commands
+                self.handle_connection_lost()
+                raise common.ClientDisconnectedException()
+
+            commands.append(command)
+
+    def add_command(self, command: common.Command, compress: bool = True):
+        """
+        Queue command for sending.
+
+        Args:
+            command: the command to send
+            compress: False if the command data was already compressed with common.compress_data() when possible
+        """
+        if compress and self.compression_threshold is not None:
+            command = common.compress_command(command, self.compression_threshold)
         self.pending_commands.append(command)
 
+    def add_media_upload(self, upload: MediaUpload, commands: Iterable[common.Command] = (), compress: bool = True):
+        """
+        Queue a media for sending in chunks, and commands to send after it, like the creation of the datablock that
+        uses the media.
+
+        The chunks are queued by fetch_outgoing_commands() with a budget of media_bytes_per_fetch bytes at each call,
+        so that the commands added in the meantime are not delayed by the whole media.
+
+        Args:
+            upload: the media to send
+            commands: the commands to send after the media
+            compress: False if the commands data was already compressed with common.compress_data() when possible
+        """
+        if compress and self.compression_threshold is not None:
+            commands = [common.compress_command(command, self.compression_threshold) for command in commands]
+        self._media_uploads.append((upload.commands(), list(commands)))
+
+    def has_media_uploads(self) -> bool:
+        return bool(self._media_uploads)
+
+    def _queue_media_chunks(self):
+        """
+        Move the next chunks of the media uploads to pending_commands, then the commands to send after each
+        completed upload.
+
+        With an I/O thread, no chunks are queued until the thread has taken the previous ones, so that the media are
+        read from their source at the pace they are sent.
+        """
+        if self._io_thread is not None and not self._outbound.empty():
+            return
+
+        budget = self.media_bytes_per_fetch
+        while self._media_uploads:
+            upload_commands, commands = self._media_uploads[0]
+            try:
+                for command in upload_commands:
+                    if self.compression_threshold is not None:
+                        command = common.compress_command(command, self.compression_threshold)
+                    self.pending_commands.append(command)
+                    budget -= command.byte_size()
+                    if budget <= 0:
+                        return
+            except OSError as e:
+                # the receivers drop the incomplete media, and the server when this client leaves the room
+                logger.error(f"Media upload failed: {e!r}")
+            self._media_uploads.popleft()
+            self.pending_commands.extend(commands)
+
     def handle_connection_lost(self):
         logger.info("Connection lost for %s:%s", self.host, self.port)
         # Set socket to None before putting CONNECTION_LIST message to avoid sending/reading new messages
         self.socket = None
+        self._command_reader = None
+        # the I/O thread, if any, has stopped or will stop on the socket error
+        self._io_thread = None
 
     def wait(self, message_type: MessageType) -> bool:
         """
@@ -128,6 +301,12 @@ class Client:
         return False
 
     def send_command(self, command: common.Command):
+        if self._io_thread is not None:
+            if not self.is_connected():
+                return False
+            self._outbound.put(([command], 0.0))
+            return True
+
         try:
             common.write_message(self.socket, command)
             return True
@@ -148,14 +327,26 @@ class Client:
         mix_version = common.encode_string(mixer_version)
         version_check = common.encode_bool(ignore_version_check)
         protocol = common.encode_bool(generic_protocol)
+        self.room_media_hashes.clear()
         return self.send_command(
             common.Command(common.MessageType.JOIN_ROOM, name + bl_version + mix_version + version_check + protocol, 0)
         )
 
     def leave_room(self, room_name: str):
         self.current_room = None
+        self.room_media_hashes.clear()
+        # the server discards the incomplete media of a client that leaves
+        self._media_uploads.clear()
         return self.send_command(common.Command(common.MessageType.LEAVE_ROOM, room_name.encode("utf8"), 0))
 
+    def send_media_hashes(self, content_hashes: Iterable[str]):
+        """
+        Announce the media that this client already has, so that the server does not send them when joining a room.
+        """
+        return self.send_command(
+            common.Command(common.MessageType.MEDIA_HASHES, common.encode_string_array(list(content_hashes)), 0)
+        )
+
     def delete_room(self, room_name: str):
         return self.send_command(common.Command(common.MessageType.DELETE_ROOM, room_name.encode("utf8"), 0))
 
@@ -163,12 +354,15 @@ class Client:
         return self.send_command(common.Command(common.MessageType.SEND_ERROR, common.encode_string(message), 0))
 
     def set_client_attributes(self, attributes: dict):
-        diff = update_attributes_and_get_diff(self.current_custom_attributes, attributes)
-        if diff == {}:
+        """
+        Set the values of the custom attributes in attributes. Only the changed nested values are sent.
+        """
+        patch = update_attributes_and_get_patch(self.current_custom_attributes, attributes)
+        if patch == {}:
             return True
 
         return self.send_command(
-            common.Command(common.MessageType.SET_CLIENT_CUSTOM_ATTRIBUTES, common.encode_json(diff), 0)
+            common.Command(common.MessageType.SET_CLIENT_CUSTOM_ATTRIBUTES_PATCH, common.encode_json(patch), 0)
         )
 
     def set_room_attributes(self, room_name: str, attributes: dict):
@@ -193,7 +387,7 @@ class Client:
         update_named_attributes(self.rooms_attributes, rooms_attributes)
 
     def _handle_client_id(self, command: common.Command):
-        self.client_id = command.data.decode()
+        self.client_id = str(command.data, "utf-8")
 
     def _handle_room_update(self, command: common.Command):
         rooms_attributes_update, _ = common.decode_json(command.data, 0)
@@ -211,6 +405,10 @@ class Client:
         clients_attributes_update, _ = common.decode_json(command.data, 0)
         update_named_attributes(self.clients_attributes, clients_attributes_update)
 
+    def _handle_client_update_patch(self, command: common.Command):
+        clients_attributes_patch, _ = common.decode_json(command.data, 0)
+        patch_named_attributes(self.clients_attributes, clients_attributes_patch)
+
     def _handle_client_disconnected(self, command: common.Command):
         client_id, _ = common.decode_string(command.data, 0)
 
@@ -225,6 +423,10 @@ class Client:
         logger.info("Info: Join room '%s' confirmed by server", room_name)
         self.current_room = room_name
 
+    def _handle_media_hashes(self, command: common.Command):
+        content_hashes, _ = common.decode_string_array(command.data, 0)
+        self.room_media_hashes.update(content_hashes)
+
     def _handle_send_error(self, command: common.Command):
         error_message, _ = common.decode_string(command.data, 0)
 
@@ -237,24 +439,37 @@ class Client:
         MessageType.ROOM_UPDATE: _handle_room_update,
         MessageType.ROOM_DELETED: _handle_room_deleted,
         MessageType.CLIENT_UPDATE: _handle_client_update,
+        MessageType.CLIENT_UPDATE_PATCH: _handle_client_update_patch,
         MessageType.CLIENT_DISCONNECTED: _handle_client_disconnected,
         MessageType.JOIN_ROOM: _handle_join_room,
         MessageType.SEND_ERROR: _handle_send_error,
+        MessageType.MEDIA_HASHES: _handle_media_hashes,
     }
 
     def has_default_handler(self, message_type: MessageType):
         return message_type in self._default_command_handlers
 
-    def fetch_incoming_commands(self) -> List[common.Command]:
+    def fetch_incoming_commands(self, decompress: bool = True) -> List[common.Command]:
         """
         Gather incoming commands from the socket and return them as a list.
         Process those that have a default handler with the one registered.
+        Compressed commands are decompressed, unless decompress is False.
         """
-        try:
-            received_commands = common.read_all_messages(self.socket)
-        except common.ClientDisconnectedException:
-            self.handle_connection_lost()
-            raise
+        if self._command_reader is None:
+            logger.warning("fetch_incoming_commands called with no socket")
+            return []
+
+        if self._io_thread is not None:
+            received_commands = self._dequeue_incoming_commands()
+        else:
+            try:
+                received_commands = self._command_reader.read_commands()
+            except common.ClientDisconnectedException:
+                self.handle_connection_lost()
+                raise
+
+        if decompress:
+            received_commands = [common.decompress_command(command) for command in received_commands]
 
         count = len(received_commands)
         if count > 0:
@@ -268,16 +483,30 @@ class Client:
 
     def fetch_outgoing_commands(self, commands_send_interval=0):
         """
-        Send commands in pending_commands queue to the server.
-        """
-        for idx, command in enumerate(self.pending_commands):
-            logger.debug("Send %s (%d / %d)", command.type, idx + 1, len(self.pending_commands))
+        Send commands in pending_commands queue to the server, followed by the next chunks of the media uploads.
 
-            if not self.send_command(command):
-                break
+        The commands are sent in batches, unless commands_send_interval is set. With an I/O thread, they are
+        queued for the thread that sends them.
+        """
+        if self._media_uploads:
+            self._queue_media_chunks()
+        if self._io_thread is not None:
+            if self.pending_commands:
+                self._outbound.put((self.pending_commands, commands_send_interval))
+        elif commands_send_interval > 0:
+            for idx, command in enumerate(self.pending_commands):
+                logger.debug("Send %s (%d / %d)", command.type, idx + 1, len(self.pending_commands))
+
+                if not self.send_command(command):
+                    break
 
-            if commands_send_interval > 0:
                 time.sleep(commands_send_interval)
+        elif self.pending_commands:
+            logger.debug("Send %d commands", len(self.pending_commands))
+            try:
+                common.write_messages(self.socket, self.pending_commands, self.max_batch_size)
+            except common.ClientDisconnectedException:
+                self.handle_connection_lost()
 
         self.pending_commands = []
 
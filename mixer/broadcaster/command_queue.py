@@ -0,0 +1,237 @@
+# MIT License
+#
+# Copyright (c) 2020 Ubisoft
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Bounded queue of the commands the server sends to a client.
+
+The size of the queue is measured in bytes. When a client reads slower than the room produces commands, the queue
+grows above its high-water mark and the overflow policy applies until it drains below its low-water mark:
+- BLOCK: the senders of room commands wait, up to a timeout, until the queue is drained,
+- COALESCE: a queued optimized command, like TRANSFORM or FRAME, is dropped when a command with the same type and path
+  is queued,
+- DISCONNECT: the client is disconnected.
+
+Commands are never refused below the high-water mark, and commands enqueued with bounded=False, like the room
+history sent to a joining client, are never refused nor coalesced.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from enum import Enum
+import threading
+import time
+from typing import Any, Deque, Dict, Hashable, List, Optional
+
+from mixer.broadcaster.common import Command, MessageType, decode_string
+
+DEFAULT_HIGH_WATER = 64 * 1024 * 1024  # bytes
+DEFAULT_LOW_WATER = 32 * 1024 * 1024  # bytes
+DEFAULT_BLOCK_TIMEOUT = 5.0  # seconds
+
+# Optimized commands without a path, superseded by the next command of the same type
+_PATHLESS_COMMANDS = {MessageType.FRAME, MessageType.PLAY, MessageType.PAUSE}
+
+
+class OverflowPolicy(Enum):
+    BLOCK = "block"
+    COALESCE = "coalesce"
+    DISCONNECT = "disconnect"
+
+
+class QueueOverflow(Exception):
+    """Raised by CommandQueue.put() with the DISCONNECT policy when the queue is above its high-water mark"""
+
+
+def coalescing_key(command: Command) -> Optional[Hashable]:
+    """
+    Return a key shared by the commands that supersede each other, or None if command cannot be coalesced.
+    """
+    command_type = command.type
+    if not MessageType.OPTIMIZED_COMMANDS < command_type < MessageType.END_OPTIMIZED_COMMANDS:
+        return None
+    if command_type in _PATHLESS_COMMANDS:
+        return command_type
+    try:
+        return command_type, decode_string(command.data, 0)[0]
+    except Exception:
+        # compressed or unexpected payload
+        return None
+
+
+class _Entry:
+    __slots__ = ("command", "time", "key")
+
+    def __init__(self, command: Command, key: Optional[Hashable]):
+        self.command: Optional[Command] = command  # None when coalesced
+        self.time = time.monotonic()
+        self.key = key
+
+
+class CommandQueue:
+    """
+    Thread safe queue of the commands pending for a connection, bounded by byte size.
+    """
+
+    def __init__(
+        self,
+        high_water: int = DEFAULT_HIGH_WATER,
+        low_water: int = DEFAULT_LOW_WATER,
+        policy: OverflowPolicy = OverflowPolicy.COALESCE,
+        block_timeout: float = DEFAULT_BLOCK_TIMEOUT,
+    ):
+        if low_water > high_water:
+            raise ValueError(f"low water mark {low_water} is above high water mark {high_water}")
+        self.high_water = high_water
+        self.low_water = low_water
+        self.policy = policy
+        self.block_timeout = block_timeout
+
+        self._entries: Deque[_Entry] = deque()
+        self._latest: Dict[Hashable, _Entry] = {}  # latest queued entry for each coalescing key
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self.byte_size = 0
+        self.command_count = 0
+        self.congested = False  # above high_water, until drained below low_water
+
+        # metrics
+        self.max_byte_size = 0
+        self.coalesced_count = 0
+        self.overflow_count = 0
+        self.blocked_time = 0.0  # seconds
+
+    def put(self, command: Command, bounded: bool = True):
+        """
+        Enqueue command, applying the overflow policy if bounded is True.
+
+        Raises:
+            QueueOverflow with the DISCONNECT policy, if the queue is above its high-water mark
+        """
+        with self._condition:
+            congested = bounded and self._update_congestion(command.byte_size())
+            if congested and self.policy == OverflowPolicy.DISCONNECT:
+                self.overflow_count += 1
+                raise QueueOverflow(f"{self.byte_size} bytes pending, high water mark is {self.high_water}")
+
+            key = coalescing_key(command) if bounded else None
+            if congested and self.policy == OverflowPolicy.COALESCE and key in self._latest:
+                self._remove(self._latest[key])
+                self.coalesced_count += 1
+
+            entry = _Entry(command, key)
+            self._entries.append(entry)
+            if key is not None:
+                self._latest[key] = entry
+            self.byte_size += command.byte_size()
+            self.command_count += 1
+            self.max_byte_size = max(self.max_byte_size, self.byte_size)
+
+    def pop(self) -> Optional[Command]:
+        """
+        Return the oldest pending command, or None if the queue is empty.
+        """
+        with self._condition:
+            while self._entries:
+                entry = self._entries.popleft()
+                if entry.command is not None:
+                    command = entry.command
+                    self._remove(entry)
+                    self._notify_if_drained()
+                    return command
+            return None
+
+    def get_all(self) -> List[Command]:
+        """
+        Return and remove all the pending commands, oldest first.
+        """
+        with self._condition:
+            commands = [entry.command for entry in self._entries if entry.command is not None]
+            self._entries.clear()
+            self._latest.clear()
+            self.byte_size = 0
+            self.command_count = 0
+            self._notify_if_drained()
+            return commands
+
+    def wait_drained(self, timeout: float) -> bool:
+        """
+        Wait until the queue is not congested or closed, for at most timeout seconds.
+
+        Returns:
+            True if the queue is not congested
+        """
+        with self._condition:
+            if not self.congested or self._closed:
+                return True
+            start = time.monotonic()
+            self._condition.wait_for(lambda: not self.congested or self._closed, timeout)
+            self.blocked_time += time.monotonic() - start
+            return not self.congested
+
+    def close(self):
+        """
+        Release the threads waiting for the queue to drain.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def lag(self) -> float:
+        """
+        Return the time in seconds the oldest pending command has been waiting in the queue.
+        """
+        with self._condition:
+            for entry in self._entries:
+                if entry.command is not None:
+                    return time.monotonic() - entry.time
+            return 0.0
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "byte_size": self.byte_size,
+                "command_count": self.command_count,
+                "max_byte_size": self.max_byte_size,
+                "coalesced_count": self.coalesced_count,
+                "overflow_count": self.overflow_count,
+                "blocked_time": self.blocked_time,
+            }
+
+    def _update_congestion(self, incoming_byte_size: int) -> bool:
+        if self.byte_size + incoming_byte_size > self.high_water:
+            self.congested = True
+        return self.congested
+
+    def _notify_if_drained(self):
+        if self.congested and self.byte_size <= self.low_water:
+            self.congested = False
+            self._condition.notify_all()
+
+    def _remove(self, entry: _Entry):
+        """Account for the removal of entry, which is left in _entries with a None command if still there"""
+        self.byte_size -= entry.command.byte_size()
+        self.command_count -= 1
+        entry.command = None
+        if entry.key is not None and self._latest.get(entry.key) is entry:
+            del self._latest[entry.key]
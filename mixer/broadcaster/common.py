@@ -25,12 +25,14 @@ This module defines types and utilities used by client and server code.
 """
 
 import array
+import copy
 from enum import IntEnum
-from typing import Dict, Mapping, Any, Optional, List, Tuple
+from typing import Dict, Mapping, Any, Optional, List, Sequence, Tuple
 import select
 import struct
 import json
 import logging
+import zlib
 
 from mixer.broadcaster.socket import Socket
 
@@ -75,6 +77,12 @@ class MessageType(IntEnum):
 
     CLIENT_DISCONNECTED = 22  # Server: Notify a client has diconnected
 
+    SET_CLIENT_CUSTOM_ATTRIBUTES_PATCH = 23  # Client: update custom attributes with a merge patch
+    CLIENT_UPDATE_PATCH = 24  # Server: Notify that data of a client have changed, as a merge patch
+
+    # Client: announce the content hashes of the media it already has, Server: the content hashes of the room media
+    MEDIA_HASHES = 25
+
     COMMAND = 100
     DELETE = 101
     CAMERA = 102
@@ -148,6 +156,9 @@ class MessageType(IntEnum):
     REMOVE_CONSTRAINT = 155
     ASSET_BANK = 156
     SAVE = 157
+    MEDIA_BEGIN = 158  # start of a media sent in chunks, see mixer.broadcaster.media_transfer
+    MEDIA_CHUNK = 159
+    MEDIA_END = 160
 
     OPTIMIZED_COMMANDS = 200
     TRANSFORM = 201
@@ -191,6 +202,14 @@ class ClientAttributes:
     PORT = "port"  # Sent by server only, type = int
     ROOM = "room"  # Sent by server only, type = str
 
+    # Sent by server only, metrics of the queue of the commands pending for the client
+    QUEUE_BYTE_SIZE = "queue_byte_size"  # type = int
+    QUEUE_COMMAND_COUNT = "queue_command_count"  # type = int
+    QUEUE_LAG = "queue_lag"  # type = float, seconds the oldest pending command has been waiting
+    QUEUE_MAX_BYTE_SIZE = "queue_max_byte_size"  # type = int
+    QUEUE_COALESCED_COUNT = "queue_coalesced_count"  # type = int, superseded commands dropped from the queue
+    QUEUE_BLOCKED_TIME = "queue_blocked_time"  # type = float, seconds other clients waited for this client
+
     # Client to server attributes, not used by the server but clients are encouraged to use these keys for the same semantic
     USERNAME = "user_name"  # type = str
     USERCOLOR = "user_color"  # type = float3 (as list)
@@ -234,6 +253,10 @@ class RoomAttributes:
     BYTE_SIZE = "byte_size"  # Sent by server only, type = int, indicate the size in byte of the room
     JOINABLE = "joinable"  # Sent by server only, type = bool, indicate if the room is joinable
 
+    # Client to server attributes
+    COMPRESSION = "compression"  # type = bool, indicate that the room commands may be compressed
+    PROXY_CODEC = "proxy_codec"  # type = str, "json" or "binary", the encoding of the Blender data proxies
+
 
 class ClientDisconnectedException(Exception):
     """When a client is disconnected and we try to read from it."""
@@ -275,7 +298,8 @@ def decode_string(data, index):
     string_length = bytes_to_int(data[index : index + 4])
     start = index + 4
     end = start + string_length
-    value = data[start:end].decode()
+    # data may be a memoryview, that has no decode()
+    value = str(data[start:end], "utf-8")
     return value, end
 
 
@@ -384,36 +408,24 @@ def decode_string_array(data, index):
 def decode_array(data, index, schema, inc):
     count = bytes_to_int(data[index : index + 4])
     start = index + 4
-    end = start
-    values = []
-    for _ in range(count):
-        end = start + inc
-        values.append(struct.unpack(schema, data[start:end]))
-        start = end
+    end = start + count * inc
+    values = list(struct.iter_unpack(schema, data[start:end]))
     return values, end
 
 
 def decode_float_array(data, index):
     count = bytes_to_int(data[index : index + 4])
     start = index + 4
-    values = []
-    end = start
-    for _ in range(count):
-        end = start + 4
-        values.extend(struct.unpack("f", data[start:end]))
-        start = end
+    end = start + count * 4
+    values = list(struct.unpack(f"{count}f", data[start:end]))
     return values, end
 
 
 def decode_int_array(data, index):
     count = bytes_to_int(data[index : index + 4])
     start = index + 4
-    values = []
-    end = start
-    for _ in range(count):
-        end = start + 4
-        values.extend(struct.unpack("I", data[start:end]))
-        start = end
+    end = start + count * 4
+    values = list(struct.unpack(f"{count}I", data[start:end]))
     return values, end
 
 
@@ -433,6 +445,69 @@ def decode_vector2_array(data, index):
     return decode_array(data, index, "2f", 2 * 4)
 
 
+def _typed_array_range(data, index: int, typecode: str, components: int) -> Tuple[int, int]:
+    count = bytes_to_int(data[index : index + 4])
+    start = index + 4
+    end = start + count * components * array.array(typecode).itemsize
+    if end > len(data):
+        raise ValueError(f"Array of {count} x {components} '{typecode}' overflows buffer of size {len(data)}")
+    return start, end
+
+
+def encode_typed_array(values, typecode: str, components: int = 1) -> bytes:
+    """
+    Encode a flat sequence of numbers as an element count followed by the values in native layout.
+
+    The element count is len(values) // components, so that the result can be read by decode_array() and its
+    variants, or in bulk by decode_typed_array().
+    """
+    if not isinstance(values, array.array) or values.typecode != typecode:
+        values = array.array(typecode, values)
+    return int_to_bytes(len(values) // components, 4) + values.tobytes()
+
+
+def interleave_arrays(typecode: str, columns: Sequence[Sequence[int]]) -> array.array:
+    """
+    Interleave columns of equal length into a flat array.array, one value of each column per element.
+
+    For instance columns (x0, x1), (y0, y1) give x0, y0, x1, y1.
+    """
+    stride = len(columns)
+    count = len(columns[0]) if columns else 0
+    values = array.array(typecode, [0]) * (stride * count)
+    for offset, column in enumerate(columns):
+        if len(column) != count:
+            raise ValueError(f"Column {offset} has {len(column)} values, expected {count}")
+        if not isinstance(column, array.array) or column.typecode != typecode:
+            column = array.array(typecode, column)
+        values[offset::stride] = column
+    return values
+
+
+def decode_typed_array(data, index: int, typecode: str, components: int = 1) -> Tuple[array.array, int]:
+    """
+    Decode an array written by encode_typed_array() into a flat array.array in one call.
+
+    With components > 1, each element of the encoded array spans components consecutive values, e.g. typecode "f"
+    and components 3 for an array of vector3.
+    """
+    start, end = _typed_array_range(data, index, typecode, components)
+    values = array.array(typecode)
+    values.frombytes(data[start:end])
+    return values, end
+
+
+def decode_typed_array_view(data, index: int, typecode: str, components: int = 1) -> Tuple[memoryview, int]:
+    """
+    Like decode_typed_array(), but return a flat memoryview on data instead of a copy.
+
+    The view remains valid as long as data is not resized. It can be passed to foreach_set() or wrapped without
+    copy with numpy.frombuffer() where numpy is available.
+    """
+    start, end = _typed_array_range(data, index, typecode, components)
+    return memoryview(data)[start:end].cast(typecode), end
+
+
 def encode_py_array(data: array.array) -> bytes:
     typecode = data.typecode
     count = data.buffer_info()[1]
@@ -450,26 +525,154 @@ def decode_py_array(buffer: bytes, index: int) -> Tuple[array.array, int]:
     return array_, index + byte_count
 
 
+# Command header: data size (int64), command id (int32), message type (int16)
+_header_struct = struct.Struct("<QIH")
+HEADER_SIZE = _header_struct.size
+
+
+def pack_header(size: int, command_id: int, message_type: int) -> bytes:
+    return _header_struct.pack(size, command_id, message_type)
+
+
+def unpack_header(buffer, offset: int = 0) -> Tuple[int, int, int]:
+    """
+    Return the data size, command id and message type from the command header located at offset in buffer
+    """
+    return _header_struct.unpack_from(buffer, offset)
+
+
+# Bit of the header message type that is set when the command data is compressed with zlib
+COMPRESSED_FLAG = 0x8000
+
+# Commands with less data are not compressed
+DEFAULT_COMPRESSION_THRESHOLD = 1024  # bytes
+
+COMPRESSION_LEVEL = 1
+
+
 class Command:
     _id = 100
 
-    def __init__(self, command_type: MessageType, data=b"", command_id=0):
+    def __init__(self, command_type: MessageType, data=b"", command_id=0, compressed=False):
         self.data = data or b""
         self.type = command_type
         self.id = command_id
+        self.compressed = compressed
         if command_id == 0:
             self.id = Command._id
             Command._id += 1
 
     def byte_size(self):
-        return 8 + 4 + 2 + len(self.data)
+        return HEADER_SIZE + len(self.data)
+
+    def detached(self) -> "Command":
+        """
+        Return this command, or a copy with its own data if its data is a view on a larger buffer.
+
+        Use it for the commands that are kept, so that they do not keep alive the receive buffer of CommandReader.
+        """
+        if isinstance(self.data, bytes):
+            return self
+        return Command(self.type, bytes(self.data), self.id, self.compressed)
+
+    def header(self) -> bytes:
+        message_type = self.type.value | COMPRESSED_FLAG if self.compressed else self.type.value
+        return pack_header(len(self.data), self.id, message_type)
 
     def to_byte_buffer(self):
-        size = int_to_bytes(len(self.data), 8)
-        command_id = int_to_bytes(self.id, 4)
-        mtype = int_to_bytes(self.type.value, 2)
+        return self.header() + self.data
+
+
+def make_command(message_type: int, data, command_id: int) -> Command:
+    """
+    Create a command from the message type field of a command header, that includes the compression flag.
+    """
+    compressed = bool(message_type & COMPRESSED_FLAG)
+    return Command(int_to_message_type(message_type & ~COMPRESSED_FLAG), data, command_id, compressed)
+
+
+def is_compressible(message_type: MessageType) -> bool:
+    """
+    Tell if commands of this type may be compressed.
+
+    The server reads the data of server commands, and of optimized commands to merge them.
+    """
+    if message_type <= MessageType.COMMAND or message_type == MessageType.CLIENT_ID_WRAPPER:
+        return False
+    return not MessageType.OPTIMIZED_COMMANDS < message_type < MessageType.END_OPTIMIZED_COMMANDS
+
+
+def compress_data(
+    message_type: MessageType, data: bytes, threshold: int = DEFAULT_COMPRESSION_THRESHOLD
+) -> Optional[bytes]:
+    """
+    Return data compressed for a command of type message_type, or None if data is small, not compressible or does
+    not compress well.
+
+    zlib releases the GIL, so this can run in worker threads.
+    """
+    if len(data) < threshold or not is_compressible(message_type):
+        return None
+    compressed = zlib.compress(data, COMPRESSION_LEVEL)
+    if len(compressed) >= len(data):
+        return None
+    return compressed
+
+
+def compress_command(command: Command, threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> Command:
+    """
+    Return a compressed version of command, or command itself if it is small, not compressible or does not
+    compress well.
+    """
+    if command.compressed:
+        return command
+    data = compress_data(command.type, command.data, threshold)
+    if data is None:
+        return command
+    return Command(command.type, data, command.id, True)
+
+
+def decompress_command(command: Command) -> Command:
+    """
+    Return an uncompressed version of command.
+    """
+    if not command.compressed:
+        return command
+    return Command(command.type, zlib.decompress(command.data), command.id)
 
-        return size + command_id + mtype + self.data
+
+# Maximum size of the content hash at the start of a media command
+MAX_MEDIA_HASH_SIZE = 128
+
+# Commands that start with the content hash of a media
+MEDIA_MESSAGE_TYPES = (
+    MessageType.BLENDER_DATA_MEDIA,
+    MessageType.MEDIA_BEGIN,
+    MessageType.MEDIA_CHUNK,
+    MessageType.MEDIA_END,
+)
+
+
+def media_content_hash(command: Command) -> Optional[str]:
+    """
+    Return the content hash of the media of a command of MEDIA_MESSAGE_TYPES, or None if the command has no hash.
+
+    The hash is the first string of the command data (layouts from mixer.blender_data.messages.BlenderMediaMessage
+    and mixer.broadcaster.media_transfer), so compressed commands are only partially decompressed.
+    """
+    data = command.data
+    if command.compressed:
+        try:
+            data = zlib.decompressobj().decompress(data, 4 + MAX_MEDIA_HASH_SIZE)
+        except zlib.error:
+            return None
+    if len(data) < 4 or bytes_to_int(data[:4]) > min(len(data) - 4, MAX_MEDIA_HASH_SIZE):
+        return None
+    try:
+        content_hash, _ = decode_string(data, 0)
+    except UnicodeDecodeError:
+        return None
+    return content_hash or None
 
 
 class CommandFormatter:
@@ -505,27 +708,143 @@ class CommandFormatter:
         return s
 
 
-def recv(socket: Socket, size: int):
+def recv(socket: Socket, size: int) -> bytearray:
     """
     Try to read size bytes from the socket.
     Raise ClientDisconnectedException if the socket is disconnected.
     """
-    result = b""
-    while size != 0:
+    result = bytearray(size)
+    view = memoryview(result)
+    offset = 0
+    while offset != size:
         r, _, _ = select.select([socket], [], [], 0.1)
         if len(r) > 0:
-            try:
-                tmp = socket.recv(size)
-            except (ConnectionAbortedError, ConnectionResetError) as e:
-                logger.warning(e)
-                raise ClientDisconnectedException()
+            offset += _recv_into(socket, view[offset:])
+    return result
 
-            if len(tmp) == 0:
-                raise ClientDisconnectedException()
 
-            result += tmp
-            size -= len(tmp)
-    return result
+def _recv_into(socket: Socket, view: memoryview) -> int:
+    try:
+        received = socket.recv_into(view)
+    except (ConnectionAbortedError, ConnectionResetError) as e:
+        logger.warning(e)
+        raise ClientDisconnectedException()
+
+    if received == 0:
+        raise ClientDisconnectedException()
+    return received
+
+
+class CommandReader:
+    """
+    Buffered reader for the commands received on a socket.
+
+    Bytes are received with recv_into() into a chunk, and the data of each command is a memoryview on the chunk,
+    so that received bytes are never copied. A chunk is never resized nor reused since commands may still reference
+    it: when it is full, a new chunk is allocated and only the incomplete trailing frame is moved into it.
+    A frame larger than the chunk size is received into a buffer of its own.
+
+    Command data being a memoryview, use str(data, "utf-8") or decode_string() instead of data.decode().
+    A command kept after it is processed keeps its whole chunk alive, so keep Command.detached() instead.
+    """
+
+    def __init__(self, socket: Socket, chunk_size: int = 1024 * 1024):
+        self._socket = socket
+        self._chunk_size = chunk_size
+        self._chunk = memoryview(bytearray(chunk_size))
+        self._start = 0  # start of the first unparsed frame in the chunk
+        self._end = 0  # end of received bytes in the chunk
+
+        # A frame too large for a chunk, being received
+        self._large_frame: Optional[memoryview] = None
+        self._large_frame_offset = 0
+        self._large_frame_header: Tuple[int, int, int] = (0, 0, 0)
+
+    def _new_chunk(self):
+        """
+        Allocate a new chunk and move the unparsed bytes of the current chunk into it.
+        """
+        chunk = memoryview(bytearray(self._chunk_size))
+        pending = self._end - self._start
+        chunk[:pending] = self._chunk[self._start : self._end]
+        self._chunk = chunk
+        self._start = 0
+        self._end = pending
+
+    def read_commands(self, timeout: Optional[float] = None) -> List[Command]:
+        """
+        Receive the bytes waiting on the socket and return the commands that are complete.
+        Raise ClientDisconnectedException if the socket is disconnected.
+        Return an empty list if no complete command is available.
+        """
+        commands: List[Command] = []
+        select_timeout = timeout if timeout is not None else 0.0001
+        received = 0
+        while not commands or received < self._chunk_size:
+            r, _, _ = select.select([self._socket._socket], [], [], select_timeout)
+            if len(r) == 0:
+                break
+            select_timeout = 0.0
+
+            if self._large_frame is not None:
+                received += self._receive_large_frame(commands)
+                continue
+
+            if self._end == self._chunk_size:
+                self._new_chunk()
+            count = _recv_into(self._socket, self._chunk[self._end :])
+            self._end += count
+            received += count
+            self._parse(commands)
+
+        return commands
+
+    def _parse(self, commands: List[Command]):
+        chunk = self._chunk
+        while self._end - self._start >= HEADER_SIZE:
+            frame_size, command_id, message_type = unpack_header(chunk, self._start)
+            data_start = self._start + HEADER_SIZE
+            if frame_size > self._chunk_size - HEADER_SIZE:
+                self._start_large_frame(frame_size, command_id, message_type, data_start, commands)
+                return
+
+            data_end = data_start + frame_size
+            if data_end > self._end:
+                if data_end > self._chunk_size:
+                    # make room for the rest of the frame
+                    self._new_chunk()
+                return
+
+            commands.append(make_command(message_type, chunk[data_start:data_end], command_id))
+            self._start = data_end
+
+    def _start_large_frame(
+        self, frame_size: int, command_id: int, message_type: int, data_start: int, commands: List[Command]
+    ):
+        # the frame does not fit in a chunk, so the chunk does not contain bytes beyond the frame
+        self._large_frame = memoryview(bytearray(frame_size))
+        self._large_frame_header = (frame_size, command_id, message_type)
+        received = self._end - data_start
+        self._large_frame[:received] = self._chunk[data_start : self._end]
+        self._large_frame_offset = received
+        self._start = self._end
+        self._end_large_frame(commands)
+
+    def _receive_large_frame(self, commands: List[Command]) -> int:
+        assert self._large_frame is not None
+        received = _recv_into(self._socket, self._large_frame[self._large_frame_offset :])
+        self._large_frame_offset += received
+        self._end_large_frame(commands)
+        return received
+
+    def _end_large_frame(self, commands: List[Command]):
+        frame_size, command_id, message_type = self._large_frame_header
+        if self._large_frame_offset != frame_size:
+            return
+
+        commands.append(make_command(message_type, self._large_frame, command_id))
+        self._large_frame = None
+        self._large_frame_offset = 0
 
 
 def read_message(socket: Socket, timeout: Optional[float] = None) -> Optional[Command]:
@@ -544,16 +863,11 @@ def read_message(socket: Socket, timeout: Optional[float] = None) -> Optional[Co
         return None
 
     try:
-        prefix_size = 14
-        msg = recv(socket, prefix_size)
-
-        frame_size = bytes_to_int(msg[:8])
-        command_id = bytes_to_int(msg[8:12])
-        message_type = bytes_to_int(msg[12:])
-
+        msg = recv(socket, HEADER_SIZE)
+        frame_size, command_id, message_type = unpack_header(msg)
         msg = recv(socket, frame_size)
 
-        return Command(int_to_message_type(message_type), msg, command_id)
+        return make_command(message_type, msg, command_id)
 
     except ClientDisconnectedException:
         raise
@@ -588,7 +902,69 @@ def write_message(sock: Optional[Socket], command: Command):
         _, w, _ = select.select([], [sock._socket], [])
         if sock.sendall(buffer) is not None:
             raise ClientDisconnectedException()
-    except (ConnectionAbortedError, ConnectionResetError) as e:
+    except (BrokenPipeError, ConnectionAbortedError, ConnectionResetError) as e:
+        logger.warning(e)
+        raise ClientDisconnectedException()
+
+
+# Default maximum byte size of the commands sent by a single write_messages() system call
+DEFAULT_MAX_BATCH_SIZE = 4 * 1024 * 1024
+
+# Maximum number of buffers for a sendmsg() call, IOV_MAX is 1024 on Linux
+_MAX_SENDMSG_BUFFERS = 1024
+
+
+def write_messages(sock: Optional[Socket], commands: List[Command], max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
+    """
+    Send commands with as few system calls as possible.
+
+    Command headers and data are passed as separate buffers to a scatter-gather sendmsg(), so that command data is
+    never copied. Each call sends at most max_batch_size bytes, or a single command if it is larger.
+    On platforms without sendmsg() (Windows), the buffers of a batch are joined then sent with sendall().
+    """
+    if not sock:
+        logger.warning("write_messages called with no socket")
+        return
+
+    buffers: List[Any] = []
+    batch_size = 0
+    for command in commands:
+        command_size = command.byte_size()
+        if buffers and (batch_size + command_size > max_batch_size or len(buffers) + 2 > _MAX_SENDMSG_BUFFERS):
+            _send_buffers(sock, buffers)
+            buffers = []
+            batch_size = 0
+
+        buffers.append(command.header())
+        if command.data:
+            buffers.append(command.data)
+        batch_size += command_size
+
+    if buffers:
+        _send_buffers(sock, buffers)
+
+
+def _send_buffers(sock: Socket, buffers: List[Any]):
+    try:
+        _, w, _ = select.select([], [sock._socket], [])
+        if not hasattr(sock._socket, "sendmsg"):
+            # no scatter/gather send on Windows, do not copy the buffers into a single one
+            for buffer in buffers:
+                if sock.sendall(buffer) is not None:
+                    raise ClientDisconnectedException()
+            return
+
+        views = [memoryview(buffer) for buffer in buffers]
+        index = 0
+        while index < len(views):
+            sent = sock.sendmsg(views[index:])
+            # skip what was sent, sendmsg() may send a part of the buffers only
+            while index < len(views) and sent >= views[index].nbytes:
+                sent -= views[index].nbytes
+                index += 1
+            if sent:
+                views[index] = views[index][sent:]
+    except (BrokenPipeError, ConnectionAbortedError, ConnectionResetError) as e:
         logger.warning(e)
         raise ClientDisconnectedException()
 
@@ -627,3 +1003,72 @@ def update_named_attributes(current: Dict[str, Dict[str, Any]], updates: Mapping
             attrs = current[name]
             for attr_name, attr_value in attrs_updates.items():
                 attrs[attr_name] = attr_value
+
+
+_UNCHANGED = object()
+
+
+def _diff_value(current: Any, updated: Any) -> Any:
+    if isinstance(current, dict) and isinstance(updated, dict):
+        patch = {key: None for key in current if key not in updated}
+        for key, value in updated.items():
+            if key not in current:
+                patch[key] = copy.deepcopy(value)
+            else:
+                value_patch = _diff_value(current[key], value)
+                if value_patch is not _UNCHANGED:
+                    patch[key] = value_patch
+        return patch if patch else _UNCHANGED
+    if current == updated and type(current) is type(updated):
+        return _UNCHANGED
+    return copy.deepcopy(updated)
+
+
+def diff_attributes(current: Mapping[str, Any], updated: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Return the merge patch (RFC 7396) that transforms current into updated, empty if they are equal.
+
+    Nested dictionaries are compared key by key, so that a change in a leaf produces a patch with the path to this
+    leaf only. Other values, including lists, are replaced as a whole. A removed key has a None value in the patch,
+    so None values cannot be stored in nested attributes.
+    """
+    patch = _diff_value(dict(current), dict(updated))
+    return {} if patch is _UNCHANGED else patch
+
+
+def apply_attributes_patch(current: Dict[str, Any], patch: Mapping[str, Any]):
+    """
+    Apply the merge patch (RFC 7396) patch to current, in place.
+    """
+    for key, value in patch.items():
+        if value is None:
+            current.pop(key, None)
+        elif isinstance(value, dict):
+            target = current.get(key)
+            if not isinstance(target, dict):
+                target = current[key] = {}
+            apply_attributes_patch(target, value)
+        else:
+            current[key] = value
+
+
+def update_attributes_and_get_patch(current: Dict[str, Any], updates: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Replace the values of current by those of updates, and return the merge patch for this change.
+    """
+    patch = {}
+    for key, value in updates.items():
+        if key not in current:
+            if value is not None:
+                patch[key] = copy.deepcopy(value)
+        else:
+            value_patch = _diff_value(current[key], value)
+            if value_patch is not _UNCHANGED:
+                patch[key] = value_patch
+    apply_attributes_patch(current, patch)
+    return patch
+
+
+def patch_named_attributes(current: Dict[str, Dict[str, Any]], patches: Mapping[str, Dict[str, Any]]):
+    for name, patch in patches.items():
+        apply_attributes_patch(current.setdefault(name, {}), patch)
@@ -0,0 +1,443 @@
+# MIT License
+#
+# Copyright (c) 2020 Ubisoft
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+A size capped cache of media files, named after their content hash.
+
+The cache directory contains the media files and an index file that records, for each media, its size, its source
+path and its last use, to evict the least recently used media when the cache exceeds its size cap. The index also
+maps the source paths to the content hashes, for the media referenced by path only.
+
+Several processes may use the same directory. Files are written to a temporary file then renamed, so that a cache
+file is either absent or complete, and the index is merged with the one on disk before it is written. The directory
+is the reference: entries whose file was evicted by another process are dropped and cache files missing from the
+index are added to it.
+"""
+
+from contextlib import contextmanager
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Union
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = "index.json"
+INDEX_VERSION = 1
+
+DEFAULT_MEDIA_CACHE_SIZE = 10 * 1024 * 1024 * 1024
+
+STALE_TEMPORARY_FILE_AGE = 24 * 3600
+"""Seconds after which a temporary file is considered left by a process that crashed while writing it"""
+
+_cache_file_re = re.compile(r"^([0-9a-f]{64}|[0-9a-f]{40})(\.[^.]*)?$")
+"""Cache file names, content hash and source suffix. The versions without index named the files after the sha1 of
+their source path, these files are indexed under this name so that they are evicted like the others."""
+
+CONTENT_HASH_LENGTH = 64
+"""Length of the sha256 hex digests that name the cache files"""
+
+
+def _unlink(path: Path):
+    try:
+        path.unlink()
+    except OSError as e:
+        logger.info(f"Media cache: cannot remove {path}: {e!r}")
+
+
+class CacheEntry(NamedTuple):
+    file_name: str
+    size: int
+    source: str  # path of the media for the client that sent it
+    last_use: float  # seconds since the epoch
+
+
+@contextmanager
+def map_file(path: Union[str, Path]):
+    """
+    Map a file in memory for reading. Slicing the map returns a copy of the data.
+    """
+    with open(path, "rb") as file_:
+        if os.fstat(file_.fileno()).st_size == 0:
+            # cannot map an empty file
+            yield b""
+            return
+        with mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def write_file_atomic(path: Path, data):
+    """
+    Write data to a temporary file in the directory of path, then rename it to path.
+    """
+    fd, temporary_path = tempfile.mkstemp(suffix=".part", prefix=path.name, dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as file_:
+            file_.write(data)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+class MediaCache:
+    """
+    A media cache in directory, that evicts the least recently used media when larger than max_size bytes.
+
+    The media used by this process are not evicted, since Blender may reload them from their file, nor the pinned
+    media.
+    """
+
+    def __init__(self, directory: Union[str, Path], max_size: int = DEFAULT_MEDIA_CACHE_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self._entries: Dict[str, CacheEntry] = {}
+        self._references: Dict[str, str] = {}  # content hashes by source path
+        self._used: Set[str] = set()
+        self._pinned: Set[str] = set()
+        self._dirty = False
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.hit_bytes = 0
+        self.added_bytes = 0
+        self.evicted_count = 0
+        self.evicted_bytes = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    @property
+    def index_path(self) -> Path:
+        return self.directory / INDEX_FILE_NAME
+
+    @property
+    def size(self) -> int:
+        return sum(entry.size for entry in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, content_hash: str) -> bool:
+        return content_hash in self._entries
+
+    def content_hashes(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def pin(self) -> List[str]:
+        """
+        Return the content hashes of the cached media and keep these media from eviction until unpin().
+
+        Used for the media announced to the server, that will not send them. Their last use is also updated, so
+        that other processes evict them last.
+        """
+        with self._lock:
+            # not the files of the versions without index, that are named after their source path
+            content_hashes = [name for name in self._entries if len(name) == CONTENT_HASH_LENGTH]
+            for content_hash in content_hashes:
+                self._touch(content_hash, used=False)
+            self._pinned.update(content_hashes)
+            self.flush()
+            return content_hashes
+
+    def unpin(self):
+        with self._lock:
+            self._pinned.clear()
+
+    def file_path(self, content_hash: str, suffix: str) -> Path:
+        """
+        Return the path of the cache file for a media, that may not exist.
+        """
+        entry = self._entries.get(content_hash)
+        if entry is not None:
+            return self.directory / entry.file_name
+        return self.directory / (content_hash + suffix)
+
+    def lookup(self, content_hash: str) -> Optional[Path]:
+        """
+        Return the cache file of a media, or None if the cache does not have it.
+        """
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is not None and not (self.directory / entry.file_name).exists():
+                # evicted by another process
+                del self._entries[content_hash]
+                self._dirty = True
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.hit_bytes += entry.size
+            self._touch(content_hash)
+            return self.directory / entry.file_name
+
+    def lookup_source(self, source: str) -> Optional[str]:
+        """
+        Return the content hash of the media last cached for source, if any.
+        """
+        return self._references.get(source)
+
+    def source(self, cache_path: Union[str, Path]) -> Optional[str]:
+        """
+        Return the source path of a cache file, or None if cache_path is not a file of this cache.
+        """
+        cache_path = Path(cache_path)
+        if cache_path.parent != self.directory:
+            return None
+        entry = self._entries.get(cache_path.name.split(".", 1)[0])
+        if entry is None or entry.file_name != cache_path.name:
+            return None
+        return entry.source
+
+    def add(self, content_hash: str, suffix: str, data, source: str) -> Path:
+        """
+        Store data as the media with content_hash, unless the cache already has it, and return its cache file.
+        """
+        with self._lock:
+            cache_path = self.lookup(content_hash)
+            if cache_path is None:
+                cache_path = self.directory / (content_hash + suffix)
+                write_file_atomic(cache_path, data)
+                self._record(content_hash, cache_path, source)
+            else:
+                self._reference(content_hash, source)
+            self.flush()
+            return cache_path
+
+    def add_reference(self, content_hash: str, source: str):
+        """
+        Record that source refers to the media with content_hash.
+        """
+        with self._lock:
+            if content_hash in self._entries:
+                self._reference(content_hash, source)
+                self.flush()
+
+    def register(self, content_hash: str, cache_path: Path, source: str):
+        """
+        Record a media file written in the cache directory by another mean, like a chunked download.
+        """
+        with self._lock:
+            self._record(content_hash, cache_path, source)
+            self.flush()
+
+    @contextmanager
+    def map(self, content_hash: str):
+        """
+        Map the cache file of a media in memory, None if the cache does not have it.
+        """
+        cache_path = self.lookup(content_hash)
+        if cache_path is None:
+            yield None
+            return
+        with map_file(cache_path) as mapped:
+            yield mapped
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used media until the cache is not larger than max_size, and return the number of
+        media removed.
+        """
+        with self._lock:
+            size = self.size
+            count = 0
+            for content_hash, entry in sorted(self._entries.items(), key=lambda item: item[1].last_use):
+                if size <= self.max_size:
+                    break
+                if content_hash in self._used or content_hash in self._pinned:
+                    continue
+                try:
+                    (self.directory / entry.file_name).unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # in use by another process on Windows
+                    logger.info(f"Media cache: cannot evict {entry.file_name}: {e!r}")
+                    continue
+                del self._entries[content_hash]
+                size -= entry.size
+                count += 1
+                self.evicted_count += 1
+                self.evicted_bytes += entry.size
+            if count:
+                self._references = {
+                    source: content_hash
+                    for source, content_hash in self._references.items()
+                    if content_hash in self._entries
+                }
+                self._dirty = True
+                logger.info(f"Media cache: evicted {count} media, {size} bytes left")
+            if size > self.max_size:
+                logger.warning(f"Media cache: {size} bytes in use, larger than the {self.max_size} bytes limit")
+            return count
+
+    def set_max_size(self, max_size: int):
+        with self._lock:
+            self.max_size = max_size
+            self.evict()
+            self.flush()
+
+    def flush(self):
+        """
+        Write the index, merged with the index written by other processes since it was read.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            for content_hash, entry in list(self._entries.items()):
+                if not (self.directory / entry.file_name).exists():
+                    # evicted by another process
+                    del self._entries[content_hash]
+            entries, references = self._read_index()
+            for content_hash, entry in entries.items():
+                own_entry = self._entries.get(content_hash)
+                if own_entry is None:
+                    # unless evicted since the index was written
+                    if (self.directory / entry.file_name).exists():
+                        self._entries[content_hash] = entry
+                elif entry.last_use > own_entry.last_use:
+                    self._entries[content_hash] = own_entry._replace(last_use=entry.last_use)
+            for source, content_hash in references.items():
+                if content_hash in self._entries:
+                    self._references.setdefault(source, content_hash)
+
+            index = {
+                "version": INDEX_VERSION,
+                "entries": {content_hash: entry._asdict() for content_hash, entry in self._entries.items()},
+                "references": self._references,
+            }
+            try:
+                write_file_atomic(self.index_path, json.dumps(index, indent=1).encode())
+            except OSError as e:
+                logger.warning(f"Media cache: cannot write {self.index_path}: {e!r}")
+                return
+            self._dirty = False
+
+    def statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "count": len(self._entries),
+                "size": self.size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_bytes": self.hit_bytes,
+                "added_bytes": self.added_bytes,
+                "evicted_count": self.evicted_count,
+                "evicted_bytes": self.evicted_bytes,
+            }
+
+    def _touch(self, content_hash: str, used: bool = True):
+        self._entries[content_hash] = self._entries[content_hash]._replace(last_use=time.time())
+        if used:
+            self._used.add(content_hash)
+        self._dirty = True
+
+    def _reference(self, content_hash: str, source: str):
+        if self._references.get(source) != content_hash:
+            self._references[source] = content_hash
+            self._dirty = True
+
+    def _record(self, content_hash: str, cache_path: Path, source: str):
+        size = cache_path.stat().st_size
+        if content_hash not in self._entries:
+            self.added_bytes += size
+        self._entries[content_hash] = CacheEntry(cache_path.name, size, source, time.time())
+        self._used.add(content_hash)
+        self._reference(content_hash, source)
+        self._dirty = True
+        self.evict()
+
+    def _read_index(self):
+        entries: Dict[str, CacheEntry] = {}
+        references: Dict[str, str] = {}
+        try:
+            index = json.loads(self.index_path.read_text())
+            if index.get("version") != INDEX_VERSION:
+                raise ValueError(f"unsupported version {index.get('version')}")
+            for content_hash, entry in index["entries"].items():
+                entries[content_hash] = CacheEntry(**entry)
+            references = index["references"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # rebuilt from the directory content
+            logger.warning(f"Media cache: cannot read {self.index_path}: {e!r}")
+        return entries, references
+
+    def _load(self):
+        """
+        Read the index, and reconcile it with the cache directory content.
+        """
+        entries, references = self._read_index()
+        legacy = not self.index_path.exists()
+        now = time.time()
+        for path in self.directory.iterdir():
+            name = path.name
+            if path.suffix == ".part":
+                try:
+                    if now - path.stat().st_mtime > STALE_TEMPORARY_FILE_AGE:
+                        _unlink(path)
+                except OSError:
+                    # renamed in the meantime
+                    pass
+                continue
+            if not _cache_file_re.match(name):
+                continue
+            content_hash = name.split(".", 1)[0]
+            entry = entries.get(content_hash)
+            if entry is not None and entry.file_name == name:
+                self._entries[content_hash] = entry._replace(size=path.stat().st_size)
+                continue
+            if path.suffix == ".metadata":
+                continue
+
+            # a file written by another process that did not update the index, or by a version without index
+            stat = path.stat()
+            source = name
+            metadata_path = path.with_suffix(".metadata")
+            if metadata_path.exists():
+                source = metadata_path.read_text()
+            self._entries[content_hash] = CacheEntry(name, stat.st_size, source, stat.st_mtime)
+            self._dirty = True
+
+        self._references = {
+            source: content_hash for source, content_hash in references.items() if content_hash in self._entries
+        }
+        if legacy:
+            # the .metadata and .ref files of the previous versions are replaced by the index
+            for path in self.directory.glob("*.metadata"):
+                _unlink(path)
+            for path in self.directory.glob("*.ref"):
+                _unlink(path)
+            self._dirty = bool(self._entries)
+        self.evict()
+        self.flush()
@@ -0,0 +1,195 @@
+# MIT License
+#
+# Copyright (c) 2020 Ubisoft
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Chunked transfer of media files.
+
+A media larger than the chunk size is not sent as a single BLENDER_DATA_MEDIA command but as a MEDIA_BEGIN command,
+MEDIA_CHUNK commands and a MEDIA_END command. The chunks are read from the source as they are sent and written to
+the destination file as they are received, so no hop holds the whole media in memory, and the commands of other
+clients are interleaved with the chunks in the server queues.
+
+Command layouts, the content hash comes first for mixer.broadcaster.common.media_content_hash():
+- MEDIA_BEGIN: content hash (string), source path (string), size (8 bytes int)
+- MEDIA_CHUNK: content hash (string), offset (8 bytes int), data
+- MEDIA_END: content hash (string)
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+import tempfile
+from typing import Iterator, Tuple, Union
+
+from mixer.broadcaster.common import (
+    bytes_to_int,
+    Command,
+    decode_string,
+    encode_string,
+    int_to_bytes,
+    MessageType,
+)
+from mixer.broadcaster.media_cache import map_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEDIA_CHUNK_SIZE = 1024 * 1024
+"""Media larger than this are sent in chunks of this size"""
+
+DEFAULT_MEDIA_BYTES_PER_FETCH = 4 * DEFAULT_MEDIA_CHUNK_SIZE
+"""Chunk bytes queued for sending by each Client.fetch_outgoing_commands() call"""
+
+
+class MediaTransferError(Exception):
+    pass
+
+
+def encode_media_begin(content_hash: str, path: str, size: int) -> bytes:
+    return encode_string(content_hash) + encode_string(path) + int_to_bytes(size, 8)
+
+
+def decode_media_begin(data) -> Tuple[str, str, int]:
+    """
+    Return the content hash, source path and size of a MEDIA_BEGIN command data.
+    """
+    content_hash, index = decode_string(data, 0)
+    path, index = decode_string(data, index)
+    return content_hash, path, bytes_to_int(data[index : index + 8])
+
+
+def encode_media_chunk(content_hash: str, offset: int, chunk) -> bytes:
+    return b"".join([encode_string(content_hash), int_to_bytes(offset, 8), chunk])
+
+
+def decode_media_chunk(data) -> Tuple[str, int, memoryview]:
+    """
+    Return the content hash, offset and bytes of a MEDIA_CHUNK command data. The bytes are a view into data.
+    """
+    content_hash, index = decode_string(data, 0)
+    offset = bytes_to_int(data[index : index + 8])
+    return content_hash, offset, memoryview(data)[index + 8 :]
+
+
+def encode_media_end(content_hash: str) -> bytes:
+    return encode_string(content_hash)
+
+
+def decode_media_end(data) -> str:
+    content_hash, _ = decode_string(data, 0)
+    return content_hash
+
+
+class MediaUpload:
+    """
+    The commands that send a media in chunks.
+
+    The source is either the media data, for instance packed data, or the path of the file that contains it, mapped
+    in memory and read one chunk at a time while the commands are consumed.
+    """
+
+    def __init__(
+        self, content_hash: str, path: str, source: Union[bytes, str], chunk_size: int = DEFAULT_MEDIA_CHUNK_SIZE
+    ):
+        if chunk_size <= 0:
+            raise ValueError(f"Invalid media chunk size {chunk_size}")
+        self.content_hash = content_hash
+        self.path = path
+        self.source = source
+        self.chunk_size = chunk_size
+        self.size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+
+    def __repr__(self):
+        return f"MediaUpload({self.path!r}, {self.content_hash}, {self.size} bytes)"
+
+    def _chunks(self) -> Iterator[bytes]:
+        if isinstance(self.source, bytes):
+            view = memoryview(self.source)
+            for offset in range(0, self.size, self.chunk_size):
+                yield view[offset : offset + self.chunk_size]
+            return
+
+        with map_file(self.source) as mapped:
+            for offset in range(0, len(mapped), self.chunk_size):
+                yield mapped[offset : offset + self.chunk_size]
+
+    def commands(self) -> Iterator[Command]:
+        yield Command(MessageType.MEDIA_BEGIN, encode_media_begin(self.content_hash, self.path, self.size))
+        offset = 0
+        for chunk in self._chunks():
+            yield Command(MessageType.MEDIA_CHUNK, encode_media_chunk(self.content_hash, offset, chunk))
+            offset += len(chunk)
+        if offset != self.size:
+            # the file was modified while it was sent, the receivers will reject the media
+            logger.warning("%s: sent %d bytes", self, offset)
+        yield Command(MessageType.MEDIA_END, encode_media_end(self.content_hash))
+
+
+class MediaDownload:
+    """
+    The reception of a media sent in chunks into file_path.
+
+    The chunks are written to a temporary file in the directory of file_path as they are received, then the file is
+    checked against the content hash and atomically renamed to file_path, so that a partial or corrupt file is never
+    visible at file_path.
+    """
+
+    def __init__(self, content_hash: str, size: int, file_path: Union[str, Path]):
+        self.content_hash = content_hash
+        self.size = size
+        self.file_path = Path(file_path)
+        self.received = 0
+        self._hash = hashlib.sha256()
+
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temporary_path = tempfile.mkstemp(suffix=".part", prefix=self.file_path.name, dir=self.file_path.parent)
+        self._temporary_path = Path(temporary_path)
+        self._file = os.fdopen(fd, "wb")
+
+    def __repr__(self):
+        return f"MediaDownload({str(self.file_path)!r}, {self.received} / {self.size} bytes)"
+
+    def write(self, offset: int, chunk):
+        if offset != self.received:
+            raise MediaTransferError(f"{self}: unexpected chunk at offset {offset}")
+        if self.received + len(chunk) > self.size:
+            raise MediaTransferError(f"{self}: chunk at offset {offset} is past the end of the media")
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.received += len(chunk)
+
+    def finish(self):
+        """
+        Move the received media to file_path, or raise MediaTransferError if it does not match its content hash.
+        """
+        self._file.close()
+        if self.received != self.size or self._hash.hexdigest() != self.content_hash:
+            self._temporary_path.unlink()
+            raise MediaTransferError(f"{self}: content does not match hash {self.content_hash}")
+        os.replace(self._temporary_path, self.file_path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            self._temporary_path.unlink()
+        except OSError as e:
+            logger.warning(f"{self}: cannot remove {self._temporary_path}: {e!r}")
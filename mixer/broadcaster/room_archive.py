@@ -0,0 +1,452 @@
+# MIT License
+#
+# Copyright (c) 2020 Ubisoft
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Indexed room archive files.
+
+An archive starts with a prefix and the room attributes, followed by the commands of the room and by an index that
+allows random access to the commands without scanning the file:
+
+- prefix: ARCHIVE_MAGIC, format version (uint32)
+- room attributes, encoded with encode_json()
+- commands: header and data of each command, as sent on the network
+- index records: for each command, the offset of its header, its data size, the message type field of its header and
+  the position of its first datablock uuid in the uuid table, or -1
+- index metadata, encoded with encode_json(): the uuid table, the bpy.data collection of each uuid and the uuids of the
+  commands that reference more than one datablock
+- trailer: offset of the index records (uint64), command count (uint64), INDEX_MAGIC
+
+Room files without the prefix use the legacy layout: room attributes followed by the commands. Legacy files, room
+journals and archives whose index was not written are indexed by scanning the commands when they are opened.
+
+The server does not know the proxy classes of the Blender addon: datablock uuids are found in the json of the
+BLENDER_DATA_* commands, like in room_compaction.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+import json
+import logging
+import mmap
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from mixer.broadcaster.common import (
+    COMPRESSED_FLAG,
+    HEADER_SIZE,
+    Command,
+    MessageType,
+    bytes_to_int,
+    decode_json,
+    decode_string,
+    decode_string_array,
+    decompress_command,
+    encode_json,
+    int_to_message_type,
+    make_command,
+    unpack_header,
+)
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_MAGIC = b"MXRA"
+INDEX_MAGIC = b"MXRI"
+ARCHIVE_VERSION = 1
+
+# magic, version
+_prefix_struct = struct.Struct("<4sI")
+
+# command header offset, data size, header message type, uuid table position
+_record_struct = struct.Struct("<QQHi")
+
+# index records offset, command count, magic
+_trailer_struct = struct.Struct("<QQ4s")
+
+_DATABLOCK_MESSAGE_TYPES = {
+    MessageType.BLENDER_DATA_CREATE,
+    MessageType.BLENDER_DATA_UPDATE,
+    MessageType.BLENDER_DATA_REMOVE,
+    MessageType.BLENDER_DATA_RENAME,
+}
+
+
+class RoomArchiveError(Exception):
+    pass
+
+
+class IndexEntry(NamedTuple):
+    offset: int
+    """Offset of the command header in the file"""
+
+    size: int
+    """Size of the command data, compressed or not"""
+
+    type: MessageType
+
+    compressed: bool
+
+    @property
+    def byte_size(self) -> int:
+        return HEADER_SIZE + self.size
+
+
+def _make_entry(offset: int, size: int, message_type: int) -> IndexEntry:
+    # message_type is the message type field of a command header, that includes the compression flag
+    compressed = bool(message_type & COMPRESSED_FLAG)
+    return IndexEntry(offset, size, int_to_message_type(message_type & ~COMPRESSED_FLAG), compressed)
+
+
+def datablock_uuids(command: Command) -> Tuple[List[str], Optional[str]]:
+    """
+    Return the uuids of the datablocks referenced by a BLENDER_DATA_* command and the bpy.data collection of the
+    datablock if the command contains it.
+    """
+    if command.type not in _DATABLOCK_MESSAGE_TYPES:
+        return [], None
+
+    command = decompress_command(command)
+    try:
+        if command.type == MessageType.BLENDER_DATA_REMOVE:
+            uuid, _ = decode_string(command.data, 0)
+            return [uuid], None
+
+        if command.type == MessageType.BLENDER_DATA_RENAME:
+            # uuid, old name, new name for each renamed datablock
+            renames, _ = decode_string_array(command.data, 0)
+            return renames[::3], None
+
+        # layout from mixer.blender_data.messages.BlenderDataMessage, the proxy of a BLENDER_DATA_UPDATE is a delta
+        proxy = json.loads(decode_string(command.data, 0)[0])
+        if command.type == MessageType.BLENDER_DATA_UPDATE:
+            proxy = proxy.get("value")
+        uuid = proxy.get("_datablock_uuid")
+        if not uuid:
+            return [], None
+        return [uuid], proxy.get("_bpy_data_collection") or None
+    except Exception as e:
+        # a proxy encoded by the binary codec, or a delta that is not an update
+        logger.debug("datablock_uuids: cannot decode %s: %r", command.type, e)
+        return [], None
+
+
+class _UuidTable:
+    """
+    Datablock uuids referenced by the commands of a room, with their bpy.data collection.
+    """
+
+    def __init__(self):
+        self.uuids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.collections: Dict[str, str] = {}
+        self.command_uuids: Dict[int, List[str]] = {}
+        """Uuids referenced by each command, by sequence number"""
+
+    def add(self, sequence: int, uuids: List[str], collection: Optional[str]):
+        if not uuids:
+            return
+        for uuid in uuids:
+            if uuid not in self.positions:
+                self.positions[uuid] = len(self.uuids)
+                self.uuids.append(uuid)
+        if collection:
+            self.collections[uuids[0]] = collection
+        self.command_uuids[sequence] = uuids
+
+    def metadata(self) -> Dict[str, Any]:
+        multiple_uuids = {
+            str(sequence): [self.positions[uuid] for uuid in uuids]
+            for sequence, uuids in self.command_uuids.items()
+            if len(uuids) > 1
+        }
+        collections = [self.collections.get(uuid, "") for uuid in self.uuids]
+        return {"uuids": self.uuids, "collections": collections, "multiple_uuids": multiple_uuids}
+
+
+class RoomArchiveWriter:
+    """
+    Write a room archive, one command at a time. The index is written by close().
+    """
+
+    def __init__(self, file_path: str, room_attributes: Dict[str, Any]):
+        self._file = open(file_path, "wb")
+        self._file.write(_prefix_struct.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+        self._file.write(encode_json(room_attributes))
+        self._offset = self._file.tell()
+        self._records = bytearray()
+        self._uuids = _UuidTable()
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def command_count(self) -> int:
+        return self._count
+
+    def write(self, command: Command):
+        header = command.header()
+        self._file.write(header)
+        self._file.write(command.data)
+
+        uuids, collection = datablock_uuids(command)
+        self._uuids.add(self._count, uuids, collection)
+        position = self._uuids.positions[uuids[0]] if uuids else -1
+        message_type = unpack_header(header)[2]
+        self._records += _record_struct.pack(self._offset, len(command.data), message_type, position)
+
+        self._offset += len(header) + len(command.data)
+        self._count += 1
+
+    def write_all(self, commands: Iterable[Command]):
+        for command in commands:
+            self.write(command)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.write(self._records)
+        self._file.write(encode_json(self._uuids.metadata()))
+        self._file.write(_trailer_struct.pack(self._offset, self._count, INDEX_MAGIC))
+        self._file.close()
+
+
+class RoomArchive:
+    """
+    Read-only random access to the commands of a room file, through a memory map of the file.
+
+    Commands are addressed by their sequence number, the position of the command in the room. The commands returned
+    are copies, so that they can be referenced after the archive is closed.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        with open(file_path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._open()
+        except Exception:
+            self._buffer.close()
+            raise
+
+    def _open(self):
+        buffer = self._buffer
+        magic, version = _prefix_struct.unpack_from(buffer, 0)
+        if magic == ARCHIVE_MAGIC:
+            if version > ARCHIVE_VERSION:
+                raise RoomArchiveError(f"{self.file_path}: unsupported archive version {version}")
+            self.version = version
+            attributes_offset = _prefix_struct.size
+        else:
+            self.version = 0
+            attributes_offset = 0
+
+        self.attributes, commands_offset = decode_json(buffer, attributes_offset)
+
+        self._uuids: Optional[_UuidTable] = None
+        self.entries: List[IndexEntry] = []
+        self.indexed = self.version > 0 and self._read_index()
+        if not self.indexed:
+            self._scan(commands_offset, len(buffer))
+
+        self._sequences_by_type: Optional[Dict[MessageType, List[int]]] = None
+        self._sequences_by_uuid: Optional[Dict[str, List[int]]] = None
+
+    def _read_index(self) -> bool:
+        buffer = self._buffer
+        if len(buffer) < _prefix_struct.size + _trailer_struct.size:
+            return False
+        records_offset, count, magic = _trailer_struct.unpack_from(buffer, len(buffer) - _trailer_struct.size)
+        if magic != INDEX_MAGIC:
+            logger.warning("Room archive %s has no index, scanning commands", self.file_path)
+            return False
+
+        records_end = records_offset + count * _record_struct.size
+        positions = []
+        for offset, size, message_type, position in _record_struct.iter_unpack(buffer[records_offset:records_end]):
+            self.entries.append(_make_entry(offset, size, message_type))
+            positions.append(position)
+
+        metadata, _ = decode_json(buffer, records_end)
+        uuids = metadata["uuids"]
+        table = _UuidTable()
+        table.uuids = uuids
+        table.positions = {uuid: i for i, uuid in enumerate(uuids)}
+        table.collections = {uuid: collection for uuid, collection in zip(uuids, metadata["collections"]) if collection}
+        table.command_uuids = {
+            sequence: [uuids[position]] for sequence, position in enumerate(positions) if position >= 0
+        }
+        for sequence, multiple in metadata["multiple_uuids"].items():
+            table.command_uuids[int(sequence)] = [uuids[position] for position in multiple]
+        self._uuids = table
+        return True
+
+    def _scan(self, offset: int, end: int):
+        buffer = self._buffer
+        while offset + HEADER_SIZE <= end:
+            size, _, message_type = unpack_header(buffer, offset)
+            if offset + HEADER_SIZE + size > end:
+                logger.warning("Room file %s: incomplete command at offset %d", self.file_path, offset)
+                break
+            self.entries.append(_make_entry(offset, size, message_type))
+            offset += HEADER_SIZE + size
+
+    def close(self):
+        self._buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, sequence: int) -> Command:
+        offset = self.entries[sequence].offset
+        size, command_id, message_type = unpack_header(self._buffer, offset)
+        start = offset + HEADER_SIZE
+        return make_command(message_type, self._buffer[start : start + size], command_id)
+
+    def __iter__(self) -> Iterator[Command]:
+        for sequence in range(len(self.entries)):
+            yield self[sequence]
+
+    def commands(self, sequences: Iterable[int]) -> Iterator[Command]:
+        for sequence in sequences:
+            yield self[sequence]
+
+    def _uuid_table(self) -> _UuidTable:
+        if self._uuids is None:
+            # not indexed, decode the BLENDER_DATA_* commands once
+            table = _UuidTable()
+            for sequence, entry in enumerate(self.entries):
+                if entry.type in _DATABLOCK_MESSAGE_TYPES:
+                    table.add(sequence, *datablock_uuids(self[sequence]))
+            self._uuids = table
+        return self._uuids
+
+    def sequences_of_type(self, message_type: MessageType) -> List[int]:
+        """
+        Sequence numbers of the commands of message_type.
+        """
+        if self._sequences_by_type is None:
+            self._sequences_by_type = defaultdict(list)
+            for sequence, entry in enumerate(self.entries):
+                self._sequences_by_type[entry.type].append(sequence)
+        return self._sequences_by_type.get(message_type, [])
+
+    def sequences_of_uuid(self, uuid: str) -> List[int]:
+        """
+        Sequence numbers of the BLENDER_DATA_* commands that reference the datablock with uuid.
+        """
+        if self._sequences_by_uuid is None:
+            self._sequences_by_uuid = defaultdict(list)
+            for sequence, uuids in sorted(self._uuid_table().command_uuids.items()):
+                for uuid_ in uuids:
+                    self._sequences_by_uuid[uuid_].append(sequence)
+        return self._sequences_by_uuid.get(uuid, [])
+
+    def uuids(self) -> List[str]:
+        """
+        Uuids of the datablocks referenced by the commands, in the order of their first reference.
+        """
+        return list(self._uuid_table().uuids)
+
+    def collection(self, uuid: str) -> Optional[str]:
+        """
+        The bpy.data collection of the datablock with uuid, if known.
+        """
+        return self._uuid_table().collections.get(uuid)
+
+    def command_uuids(self, sequence: int) -> List[str]:
+        return list(self._uuid_table().command_uuids.get(sequence, []))
+
+    def statistics(self) -> Dict[str, Any]:
+        """
+        Command count and bytes, in total, per message type and per bpy.data collection of the datablocks.
+
+        Bytes include the command headers, and are compressed bytes for compressed commands.
+        """
+        table = self._uuid_table()
+        types: Dict[str, Dict[str, int]] = defaultdict(lambda: {"count": 0, "bytes": 0, "compressed": 0})
+        collections: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"count": 0, "bytes": 0, "datablocks": set()})
+        total_bytes = 0
+        for sequence, entry in enumerate(self.entries):
+            byte_size = entry.byte_size
+            total_bytes += byte_size
+            type_stats = types[entry.type.name]
+            type_stats["count"] += 1
+            type_stats["bytes"] += byte_size
+            type_stats["compressed"] += entry.compressed
+
+            uuids = table.command_uuids.get(sequence)
+            if uuids:
+                collection = table.collections.get(uuids[0], "")
+                collection_stats = collections[collection]
+                collection_stats["count"] += 1
+                collection_stats["bytes"] += byte_size
+                collection_stats["datablocks"].update(uuids)
+
+        for collection_stats in collections.values():
+            collection_stats["datablocks"] = len(collection_stats["datablocks"])
+
+        return {
+            "version": self.version,
+            "indexed": self.indexed,
+            "commands": len(self.entries),
+            "bytes": total_bytes,
+            "datablocks": len(table.uuids),
+            "types": dict(types),
+            "collections": dict(collections),
+        }
+
+
+def is_archive(file_path: str) -> bool:
+    with open(file_path, "rb") as f:
+        return f.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+
+
+def read_attributes(file_path: str) -> Dict[str, Any]:
+    """
+    Return the room attributes of an archive or of a legacy room file, without reading the commands.
+    """
+    with open(file_path, "rb") as f:
+        prefix = f.read(_prefix_struct.size)
+        if prefix[: len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            f.seek(0)
+        string_length = bytes_to_int(f.read(4))
+        return json.loads(f.read(string_length).decode())
+
+
+def write_archive(room_attributes: Dict[str, Any], commands: Iterable[Command], file_path: str) -> int:
+    """
+    Write an archive and return the number of commands written.
+    """
+    with RoomArchiveWriter(file_path, room_attributes) as writer:
+        writer.write_all(commands)
+    return writer.command_count
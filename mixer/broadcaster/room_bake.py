@@ -23,77 +23,163 @@
 """
 This module defines an API to download, upload, save and load rooms.
 
-An known issue is that all these functions are synchronous, so we cannot inform the user of completion.
+The commands of a room are streamed: download_room_to_file() writes them to the file as they are received,
+iter_room_file() reads them lazily from a memory map of the file and upload_room() sends them in batches, so that the
+memory used does not depend on the size of the room. Progress callbacks report the number of commands transferred.
+
+Rooms are saved as indexed archives, see room_archive. Room files with the legacy layout can still be loaded.
 """
 
-from mixer.broadcaster.common import MessageType, encode_json
+from mixer.broadcaster.common import MessageType
 from mixer.broadcaster.common import Command
 from mixer.broadcaster.common import ClientDisconnectedException
-from mixer.broadcaster.common import read_all_messages
 from mixer.broadcaster.client import Client
-from typing import List, Tuple, Dict, Any
+from mixer.broadcaster.room_archive import RoomArchive, RoomArchiveWriter, read_attributes, write_archive
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sized, Tuple
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+ProgressCallback = Callable[[int, Optional[int]], None]
+"""Called with the number of commands transferred and the total number of commands, if known"""
+
+# Maximum number of commands sent by upload_room() before reading what the server sent. The server responds to each
+# command with a ROOM_UPDATE, and would block if the client socket buffer was full
+UPLOAD_BATCH_COMMAND_COUNT = 128
+
+
+class RoomTransferError(Exception):
+    pass
+
+
+def _fetch_room_attributes(client: Client, room_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the attributes of room_name from the LIST_ROOMS response requested by Client.connect().
+    """
+    from mixer.broadcaster.common import decode_json
+
+    while client.is_connected():
+        for command in client.fetch_incoming_commands(decompress=False):
+            if command.type == MessageType.LIST_ROOMS:
+                rooms_attributes, _ = decode_json(command.data, 0)
+                return rooms_attributes.get(room_name)
+    raise ClientDisconnectedException()
+
+
+def iter_download_room(
+    client: Client, room_name: str, blender_version: str, mixer_version: str, generic_protocol: bool
+) -> Iterator[Command]:
+    """
+    Join room_name and yield the room commands sent by the server, until the server confirms the join.
+    """
+    from mixer.broadcaster.common import decode_string
+
+    client.join_room(room_name, blender_version, mixer_version, False, generic_protocol)
+    while client.is_connected():
+        # keep compressed commands as is, to upload them later
+        for command in client.fetch_incoming_commands(decompress=False):
+            if command.type == MessageType.JOIN_ROOM:
+                # sent after the room content
+                return
+            if command.type == MessageType.SEND_ERROR:
+                raise RoomTransferError(decode_string(command.data, 0)[0])
+            if command.type > MessageType.COMMAND:
+                # do not store server protocol commands
+                yield command
+    raise ClientDisconnectedException()
+
+
+def download_room_to_file(
+    host: str,
+    port: int,
+    room_name: str,
+    blender_version: str,
+    mixer_version: str,
+    generic_protocol: bool,
+    file_path: str,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """
+    Download a room into an archive file, without keeping its commands in memory.
+
+    Returns:
+        the room attributes, or an empty dictionary if the download failed, in which case no file is written
+    """
+    from mixer.broadcaster.common import RoomAttributes
+
+    logger.info("Downloading room %s to %s", room_name, file_path)
+
+    tmp_path = file_path + ".tmp"
+    try:
+        with Client(host, port) as client:
+            room_attributes = _fetch_room_attributes(client, room_name)
+            if room_attributes is None:
+                logger.error("Room %s does not exist on server", room_name)
+                return {}
+
+            total = room_attributes.get(RoomAttributes.COMMAND_COUNT)
+            with RoomArchiveWriter(tmp_path, room_attributes) as writer:
+                for command in iter_download_room(client, room_name, blender_version, mixer_version, generic_protocol):
+                    writer.write(command)
+                    if progress is not None:
+                        progress(writer.command_count, total)
+
+            client.leave_room(room_name)
+            client.wait(MessageType.LEAVE_ROOM)
+        os.replace(tmp_path, file_path)
+    except (ClientDisconnectedException, RoomTransferError) as e:
+        logger.error(f"Failed to download room {room_name} from {host}:{port}: {e!r}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return {}
+
+    logger.info("Room %s downloaded: %d commands", room_name, writer.command_count)
+    return room_attributes
+
 
 def download_room(
     host: str, port: int, room_name: str, blender_version: str, mixer_version: str, generic_protocol: bool
 ) -> Tuple[Dict[str, Any], List[Command]]:
-    from mixer.broadcaster.common import decode_json, RoomAttributes
-
     logger.info("Downloading room %s", room_name)
 
-    commands = []
+    try:
+        with Client(host, port) as client:
+            room_attributes = _fetch_room_attributes(client, room_name)
+            if room_attributes is None:
+                logger.error("Room %s does not exist on server", room_name)
+                return {}, []
 
-    with Client(host, port) as client:
-        client.join_room(room_name, blender_version, mixer_version, False, generic_protocol)
-
-        room_attributes = None
-
-        try:
-            while room_attributes is None or len(commands) < room_attributes[RoomAttributes.COMMAND_COUNT]:
-                received_commands = client.fetch_incoming_commands()
-
-                for command in received_commands:
-                    if room_attributes is None and command.type == MessageType.LIST_ROOMS:
-                        rooms_attributes, _ = decode_json(command.data, 0)
-                        if room_name not in rooms_attributes:
-                            logger.error("Room %s does not exist on server", room_name)
-                            return {}, []
-                        room_attributes = rooms_attributes[room_name]
-                        logger.info(
-                            "Meta data received, number of commands in the room: %d",
-                            room_attributes[RoomAttributes.COMMAND_COUNT],
-                        )
-                    elif command.type <= MessageType.COMMAND:
-                        continue  # don't store server protocol commands
-
-                    commands.append(command)
-                    if room_attributes is not None:
-                        logger.debug(
-                            "Command %d / %d received", len(commands), room_attributes[RoomAttributes.COMMAND_COUNT]
-                        )
-        except ClientDisconnectedException:
-            logger.error(f"Disconnected while downloading room {room_name} from {host}:{port}")
-            return {}, []
-
-        assert room_attributes is not None
-
-        client.leave_room(room_name)
+            commands = list(iter_download_room(client, room_name, blender_version, mixer_version, generic_protocol))
+            client.leave_room(room_name)
+            client.wait(MessageType.LEAVE_ROOM)
+    except (ClientDisconnectedException, RoomTransferError) as e:
+        logger.error(f"Failed to download room {room_name} from {host}:{port}: {e!r}")
+        return {}, []
 
     return room_attributes, commands
 
 
-def upload_room(host: str, port: int, room_name: str, room_attributes: dict, commands: List[Command]):
+def upload_room(
+    host: str,
+    port: int,
+    room_name: str,
+    room_attributes: dict,
+    commands: Iterable[Command],
+    progress: Optional[ProgressCallback] = None,
+):
     """
     Upload a room to the server.
-    Warning: This function is blocking, so when run from Blender the client dedicated to the user will be blocked and will accumulate lot of
-    room updates that will be processed later.
-    Todo: Write a non blocking version of this function to be used inside Blender, some kind of UploadClient that can exist side by side with BlenderClient.
+
+    The commands are sent in batches without waiting for the server. They may be an iterator, like iter_room_file(),
+    in which case the total reported to progress is the COMMAND_COUNT room attribute.
+
+    This function is blocking, but it does not use Blender data, so it can run in a thread.
     """
     from mixer.broadcaster.common import RoomAttributes
 
+    total = len(commands) if isinstance(commands, Sized) else room_attributes.get(RoomAttributes.COMMAND_COUNT)
+
     with Client(host, port) as client:
         client.join_room(
             room_name,
@@ -105,13 +191,27 @@ def upload_room(host: str, port: int, room_name: str, room_attributes: dict, com
         client.set_room_attributes(room_name, room_attributes)
         client.set_room_keep_open(room_name, True)
 
-        for idx, c in enumerate(commands):
-            logger.debug("Sending command %s (%d / %d)", c.type, idx, len(commands))
-            client.send_command(c)
-
+        def send_pending_commands():
+            client.fetch_outgoing_commands()
             # The server will send back room update messages since the room is joined.
             # Consume them to avoid a client/server deadlock on broadcaster full send socket
-            read_all_messages(client.socket, timeout=0.0)
+            client.fetch_incoming_commands()
+            if not client.is_connected():
+                raise ClientDisconnectedException("Client disconnected during upload room")
+            if progress is not None:
+                progress(sent, total)
+
+        sent = 0
+        batch_size = 0
+        for command in commands:
+            # keep compressed commands as they were downloaded
+            client.add_command(command, compress=False)
+            sent += 1
+            batch_size += command.byte_size()
+            if len(client.pending_commands) >= UPLOAD_BATCH_COMMAND_COUNT or batch_size >= client.max_batch_size:
+                send_pending_commands()
+                batch_size = 0
+        send_pending_commands()
 
         client.send_command(Command(MessageType.CONTENT))
 
@@ -120,39 +220,22 @@ def upload_room(host: str, port: int, room_name: str, room_attributes: dict, com
             raise ClientDisconnectedException("Client disconnected before the end of upload room")
 
 
-def save_room(room_attributes: dict, commands: List[Command], file_path: str):
-    with open(file_path, "wb") as f:
-        f.write(encode_json(room_attributes))
-        for c in commands:
-            f.write(c.to_byte_buffer())
+def save_room(room_attributes: dict, commands: Iterable[Command], file_path: str):
+    write_archive(room_attributes, commands, file_path)
+
+
+def read_room_attributes(file_path: str) -> Dict[str, Any]:
+    return read_attributes(file_path)
+
+
+def iter_room_file(file_path: str) -> Iterator[Command]:
+    """
+    Yield the commands of an archive or of a legacy room file, read lazily from a memory map of the file.
+    """
+    with RoomArchive(file_path) as archive:
+        yield from archive
 
 
 def load_room(file_path: str) -> Tuple[dict, List[Command]]:
-    from mixer.broadcaster.common import bytes_to_int, int_to_message_type
-    import json
-
-    # todo factorize file reading with network reading
-    room_medata = None
-    commands = []
-    with open(file_path, "rb") as f:
-        data = f.read(4)
-        string_length = bytes_to_int(data)
-        attributes_string = f.read(string_length).decode()
-        room_medata = json.loads(attributes_string)
-        while True:
-            prefix_size = 14
-            msg = f.read(prefix_size)
-            if not msg:
-                break
-
-            frame_size = bytes_to_int(msg[:8])
-            command_id = bytes_to_int(msg[8:12])
-            message_type = bytes_to_int(msg[12:])
-
-            msg = f.read(frame_size)
-
-            commands.append(Command(int_to_message_type(message_type), msg, command_id))
-
-    assert room_medata is not None
-
-    return room_medata, commands
+    with RoomArchive(file_path) as archive:
+        return archive.attributes, list(archive)
@@ -0,0 +1,349 @@
+# MIT License
+#
+# Copyright (c) 2020 Ubisoft
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Compaction of the BLENDER_DATA_* commands of a room history, so that joining clients receive fewer commands.
+
+Three rules are applied:
+- a BLENDER_DATA_UPDATE is dropped when the next update of the same datablock overwrites all the values it contains,
+- the BLENDER_DATA_CREATE, BLENDER_DATA_UPDATE and BLENDER_DATA_REMOVE commands of a removed datablock are dropped,
+  unless another command of the room references the datablock,
+- the MEDIA_BEGIN and MEDIA_CHUNK commands of an interrupted chunked media transfer are dropped.
+
+The server does not know the proxy classes of the Blender addon, so it only inspects the json of updates: an update
+can be superseded only if it contains value replacements, not collection insertions or deletions.
+"""
+
+from __future__ import annotations
+
+import bisect
+from collections import defaultdict
+import json
+import logging
+import re
+from typing import Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+
+from mixer.broadcaster.common import (
+    Command,
+    MEDIA_MESSAGE_TYPES,
+    MessageType,
+    decode_int,
+    decode_string,
+    decompress_command,
+    media_content_hash,
+)
+
+logger = logging.getLogger(__name__)
+
+# must match mixer.blender_data.json_codec.MIXER_CLASS
+MIXER_CLASS = "__mixer_class__"
+
+# must match mixer.blender_data.messages.SOA_SPANS
+SOA_SPANS = "spans"
+
+# Proxies that are sent as a whole in an update
+_VALUE_PROXIES = {"DatablockRefProxy", "NonePtrProxy"}
+
+# DatablockProxy members that identify the datablock
+_IDENTITY_MEMBERS = {MIXER_CLASS, "_data", "_datablock_uuid", "_bpy_data_collection", "_type_name"}
+
+UpdateSignature = Tuple[str, FrozenSet[Tuple[str, ...]]]
+"""The datablock uuid and the paths of the values an update overwrites"""
+
+
+def _collect_paths(data: dict, path: Tuple[str, ...], paths: Set[Tuple[str, ...]]) -> bool:
+    """
+    Add to paths the paths of the values overwritten by the _data of a struct update.
+    Return False if the update contains deltas that do not simply overwrite values.
+    """
+    for key, delta in data.items():
+        if not isinstance(delta, dict):
+            return False
+        delta_class = delta.get(MIXER_CLASS)
+        item_path = path + (str(key),)
+        if delta_class == "DeltaReplace":
+            paths.add(item_path)
+        elif delta_class == "DeltaUpdate":
+            value = delta.get("value")
+            if not isinstance(value, dict):
+                # a builtin value
+                paths.add(item_path)
+            elif value.get(MIXER_CLASS) in _VALUE_PROXIES:
+                paths.add(item_path)
+            elif set(value.keys()) <= {MIXER_CLASS, "_data"}:
+                # a struct update
+                if not _collect_paths(value.get("_data", {}), item_path, paths):
+                    return False
+            else:
+                return False
+        else:
+            # DeltaAddition, DeltaDeletion
+            return False
+    return True
+
+
+def update_signature(data) -> Optional[UpdateSignature]:
+    """
+    Return the signature of a BLENDER_DATA_UPDATE command data, or None if it cannot be superseded.
+    """
+    try:
+        proxy_string, index = decode_string(data, 0)
+        delta = json.loads(proxy_string)
+        if not isinstance(delta, dict) or delta.get(MIXER_CLASS) != "DeltaUpdate":
+            return None
+        value = delta.get("value")
+        if not isinstance(value, dict):
+            return None
+        uuid = value.get("_datablock_uuid")
+        if not uuid:
+            return None
+
+        paths: Set[Tuple[str, ...]] = set()
+        if not _collect_paths(value.get("_data", {}), (), paths):
+            return None
+
+        # the other datablock members are sent as a whole
+        paths.update((key,) for key in value.keys() if key not in _IDENTITY_MEMBERS)
+
+        # layout from mixer.blender_data.messages.BlenderDataMessage
+        soa_count, index = decode_int(data, index)
+        for _ in range(soa_count):
+            soa_path, index = decode_string(data, index)
+            element_count, index = decode_int(data, index)
+            for _ in range(element_count):
+                element_name, index = decode_string(data, index)
+                typecode, _ = decode_string(data, index)
+                if typecode == SOA_SPANS:
+                    # only some ranges of the array are overwritten
+                    return None
+                index = _skip_py_array(data, index)
+                paths.add(("#soa", soa_path, element_name))
+
+        array_group_count, index = decode_int(data, index)
+        for _ in range(array_group_count):
+            group_name, index = decode_string(data, index)
+            array_count, index = decode_int(data, index)
+            for _ in range(array_count):
+                key, index = decode_string(data, index)
+                index = _skip_py_array(data, index)
+                paths.add(("#array", group_name, key))
+    except Exception as e:
+        logger.debug("update_signature: cannot decode update: %r", e)
+        return None
+
+    return uuid, frozenset(paths)
+
+
+def _skip_py_array(data, index: int) -> int:
+    _, index = decode_string(data, index)
+    byte_count, index = decode_int(data, index)
+    return index + byte_count
+
+
+# Strings that may be a datablock uuid. A uuid is delimited by quotes in json, and by its length prefix and the next
+# type tag in mixer.blender_data.binary_codec, that are smaller than "-" for uuids
+_UUID_TOKEN = re.compile(rb"[0-9A-Za-z-]+")
+
+
+class RoomCompactor:
+    """
+    Finds the commands of a room that can be dropped.
+
+    Commands are scanned incrementally, and the room state is kept with the index of the commands in the room list.
+    After the room has removed the dropped commands from its list, purged() must be called to update the indices.
+    """
+
+    def __init__(self):
+        self._scanned = 0
+        """Number of room commands already scanned"""
+
+        self._last_updates: Dict[str, Tuple[int, Optional[UpdateSignature]]] = {}
+        """Index and signature of the last update of a datablock"""
+
+        self._datablock_commands: Dict[str, List[int]] = defaultdict(list)
+        """Indices of the retained BLENDER_DATA_CREATE and BLENDER_DATA_UPDATE of a datablock"""
+
+        self._created: Set[str] = set()
+        """Datablocks whose BLENDER_DATA_CREATE is retained"""
+
+        self._references: Dict[str, List[int]] = defaultdict(list)
+        """Indices of the commands that contain the uuid of a created datablock, and may reference it"""
+
+        self._media_transfers: Dict[str, List[int]] = {}
+        """Indices of the MEDIA_BEGIN and MEDIA_CHUNK of the chunked media transfers without MEDIA_END"""
+
+        self._interrupted: Dict[str, int] = defaultdict(int)
+        """Number of interrupted chunked media transfers, by content hash, whose commands are not dropped yet"""
+
+        self._dropped: List[int] = []
+
+    def interrupted(self, content_hash: str):
+        """
+        Record that the last chunked transfer of content_hash added to the room will not complete, so that its
+        commands are dropped.
+        """
+        self._interrupted[content_hash] += 1
+
+    def dropped(self) -> List[int]:
+        """
+        Sorted indices of the commands that can be dropped.
+        """
+        return sorted(self._dropped)
+
+    def scan(self, commands: Sequence[Command]) -> List[int]:
+        """
+        Scan the commands added since the previous call and return the sorted indices of all the commands that can
+        be dropped.
+        """
+        start = min(self._scanned, len(commands))
+        for i in range(start, len(commands)):
+            command = commands[i]
+            if command.type in MEDIA_MESSAGE_TYPES:
+                # media content does not reference datablocks
+                self._scan_media(i, command)
+                continue
+            command = decompress_command(command)
+            if command.type == MessageType.BLENDER_DATA_CREATE:
+                self._scan_create(i, command)
+            elif command.type == MessageType.BLENDER_DATA_UPDATE:
+                self._scan_update(i, command)
+            elif command.type == MessageType.BLENDER_DATA_REMOVE:
+                self._scan_remove(i, command)
+                continue
+            self._scan_references(i, command)
+        self._scanned = len(commands)
+
+        # the interrupted transfers that were not followed by another transfer of the same media
+        for content_hash, count in list(self._interrupted.items()):
+            if count > 0:
+                self._drop_media_transfer(content_hash)
+        self._interrupted.clear()
+        return self.dropped()
+
+    def _scan_media(self, i: int, command: Command):
+        if command.type not in (MessageType.MEDIA_BEGIN, MessageType.MEDIA_CHUNK, MessageType.MEDIA_END):
+            return
+        content_hash = media_content_hash(command)
+        if content_hash is None:
+            return
+
+        if command.type == MessageType.MEDIA_END:
+            self._media_transfers.pop(content_hash, None)
+        elif command.type == MessageType.MEDIA_BEGIN:
+            # the room accepts a transfer of a media only if the previous transfer of the same media was interrupted
+            self._drop_media_transfer(content_hash)
+            self._media_transfers[content_hash] = [i]
+        elif content_hash in self._media_transfers:
+            self._media_transfers[content_hash].append(i)
+
+    def _drop_media_transfer(self, content_hash: str):
+        indices = self._media_transfers.pop(content_hash, None)
+        if indices is None:
+            return
+        self._dropped.extend(indices)
+        if self._interrupted.get(content_hash, 0) > 0:
+            self._interrupted[content_hash] -= 1
+
+    def _scan_create(self, i: int, command: Command):
+        try:
+            proxy = json.loads(decode_string(command.data, 0)[0])
+            uuid = proxy.get("_datablock_uuid")
+        except Exception:
+            return
+        if uuid:
+            self._datablock_commands[uuid].append(i)
+            self._created.add(uuid)
+
+    def _scan_update(self, i: int, command: Command):
+        signature = update_signature(command.data)
+        if signature is None:
+            return
+
+        uuid, paths = signature
+        previous = self._last_updates.get(uuid)
+        if previous is not None:
+            previous_index, previous_signature = previous
+            if previous_signature is not None and previous_signature[1] <= paths:
+                self._dropped.append(previous_index)
+                self._datablock_commands[uuid].remove(previous_index)
+
+        self._last_updates[uuid] = (i, signature)
+        self._datablock_commands[uuid].append(i)
+
+    def _scan_references(self, i: int, command: Command):
+        """
+        Record the created datablocks whose uuid the command contains.
+
+        A command that contains the uuid of a datablock created later in the room is not recorded, but the addon
+        sends the creation of a datablock before the commands that reference it.
+        """
+        for token in set(_UUID_TOKEN.findall(command.data)):
+            uuid = token.decode()
+            if uuid in self._created:
+                self._references[uuid].append(i)
+
+    def _scan_remove(self, i: int, command: Command):
+        try:
+            uuid, _ = decode_string(command.data, 0)
+        except Exception:
+            return
+
+        self._last_updates.pop(uuid, None)
+        datablock_commands = self._datablock_commands.pop(uuid, [])
+        references = self._references.pop(uuid, [])
+        if uuid not in self._created:
+            return
+        self._created.remove(uuid)
+
+        candidates = set(datablock_commands)
+        candidates.add(i)
+        dropped = set(self._dropped)
+        for j in references:
+            if j not in candidates and j not in dropped:
+                logger.debug("Removed datablock %s is referenced by command %d, not dropped", uuid, j)
+                return
+
+        self._dropped.extend(candidates)
+
+    def purged(self):
+        """
+        Update the command indices after the room has removed the commands returned by dropped()
+        """
+        dropped = self.dropped()
+        if not dropped:
+            return
+
+        def new_index(index: int) -> int:
+            return index - bisect.bisect_left(dropped, index)
+
+        self._last_updates = {
+            uuid: (new_index(index), signature) for uuid, (index, signature) in self._last_updates.items()
+        }
+        for indices in self._datablock_commands.values():
+            indices[:] = [new_index(index) for index in indices]
+        for indices in self._media_transfers.values():
+            indices[:] = [new_index(index) for index in indices]
+        dropped_set = set(dropped)
+        for indices in self._references.values():
+            indices[:] = [new_index(index) for index in indices if index not in dropped_set]
+        self._scanned -= len(dropped)
+        self._dropped = []
@@ -0,0 +1,275 @@
+# MIT License
+#
+# Copyright (c) 2020 Ubisoft
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+On-disk journal of the commands of a room, used by the server to keep room histories out of memory and to recover
+rooms after a restart.
+
+A journal file uses the legacy layout of room files, without the index of room archives, so it can be loaded with
+room_bake.load_room() or room_archive.RoomArchive. Since the room attributes at the start of the file cannot be
+updated in place, the current room attributes are saved in a .json file next to the journal.
+
+The room checkpoint is stored in another journal file next to the room journal. It is not recovered, but rebuilt
+after a restart.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import urllib.parse
+
+from mixer.broadcaster.common import Command, HEADER_SIZE, encode_json, make_command, unpack_header
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = ".mixer"
+ATTRIBUTES_SUFFIX = ".json"
+COMPACTION_SUFFIX = ".compacting"
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+MAP_GROWTH = 16 * 1024 * 1024
+"""Bytes appended to the journal before its file is mapped again"""
+
+
+def journal_path(directory: Path, room_name: str) -> Path:
+    return directory / (urllib.parse.quote(room_name, safe="") + JOURNAL_SUFFIX)
+
+
+def room_name_from_path(path: Path) -> str:
+    return urllib.parse.unquote(path.stem)
+
+
+def journal_paths(directory: Path) -> List[Path]:
+    return sorted(directory.glob("*" + JOURNAL_SUFFIX))
+
+
+def checkpoint_path(path: Path) -> Path:
+    """
+    Path of the checkpoint journal of the room journal at path, that journal_paths() does not list.
+    """
+    return path.with_name(path.name + CHECKPOINT_SUFFIX)
+
+
+class RoomJournal:
+    """
+    Append-only file that stores the commands of a room.
+
+    It behaves like the list of commands of the room. Only an index of (offset, size, type) records is held in memory
+    and commands are read back from a memory map of the file. Popping the last command only updates the index, the
+    bytes remain in the file. So on recovery the same merge rules are applied by the supersedes callable to rebuild
+    the index.
+
+    The data of the commands read back is copied out of the map, so that the journal can close its map, then replace
+    or delete its file, which Windows does not allow while a map is in use. The commands appended since the file was
+    last mapped are kept in memory until they reach MAP_GROWTH bytes, so that the file is mapped again in large steps.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        # readable for the memory map
+        self._file = open(path, "a+b")
+        self._size = self._file.seek(0, os.SEEK_END)
+
+        # offset of the frame, size of the command data, message type
+        self._index: List[Tuple[int, int, int]] = []
+
+        self._map: Optional[mmap.mmap] = None
+        # commands appended after the end of the map, by frame offset
+        self._unmapped: Dict[int, Command] = {}
+        self._unmapped_size = 0
+        self._map_lock = threading.Lock()
+
+    @classmethod
+    def create(cls, directory: Path, room_name: str, attributes: Dict[str, Any]) -> RoomJournal:
+        directory.mkdir(parents=True, exist_ok=True)
+        return cls.create_file(journal_path(directory, room_name), attributes)
+
+    @classmethod
+    def create_file(cls, path: Path, attributes: Dict[str, Any]) -> RoomJournal:
+        """
+        Create an empty journal at path, replacing an existing one.
+        """
+        with open(path, "wb") as f:
+            f.write(encode_json(attributes))
+        journal = cls(path)
+        journal.save_attributes(attributes)
+        return journal
+
+    @classmethod
+    def recover(cls, path: Path, supersedes: Callable[[Command, Command], bool]) -> Tuple[Dict[str, Any], RoomJournal]:
+        """
+        Open an existing journal and return the room attributes and the journal.
+
+        supersedes(command, previous) tells if command replaces previous, the last command of the journal when
+        command was added.
+        """
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            attributes_size = int.from_bytes(buffer[:4], "little")
+            offset = 4 + attributes_size
+            attributes = json.loads(str(buffer[4:offset], "utf-8"))
+
+            index: List[Tuple[int, int, int]] = []
+            file_size = len(buffer)
+            while offset + HEADER_SIZE <= file_size:
+                size, command_id, message_type = unpack_header(buffer, offset)
+                if offset + HEADER_SIZE + size > file_size:
+                    break
+                data = buffer[offset + HEADER_SIZE : offset + HEADER_SIZE + size]
+                command = make_command(message_type, data, command_id)
+                if index:
+                    previous_offset, previous_size, previous_type = index[-1]
+                    previous_data_offset = previous_offset + HEADER_SIZE
+                    previous = make_command(
+                        previous_type, buffer[previous_data_offset : previous_data_offset + previous_size], 0
+                    )
+                    if supersedes(command, previous):
+                        index.pop()
+                index.append((offset, size, message_type))
+                offset += HEADER_SIZE + size
+        finally:
+            buffer.close()
+
+        if offset != file_size:
+            logger.warning("Journal %s: truncating incomplete command at offset %d", path, offset)
+            os.truncate(path, offset)
+
+        attributes_path = path.with_suffix(ATTRIBUTES_SUFFIX)
+        if attributes_path.exists():
+            with open(attributes_path, "r") as f:
+                attributes.update(json.load(f))
+
+        journal = cls(path)
+        journal._index = index
+        return attributes, journal
+
+    def save_attributes(self, attributes: Dict[str, Any]):
+        attributes_path = self.path.with_suffix(ATTRIBUTES_SUFFIX)
+        tmp_path = attributes_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(attributes, f)
+        os.replace(tmp_path, attributes_path)
+
+    def close(self):
+        self._file.close()
+        self._unmap()
+
+    def delete(self):
+        self.close()
+        for path in (self.path, self.path.with_suffix(ATTRIBUTES_SUFFIX)):
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning("Cannot delete journal file %s: %r", path, e)
+
+    def append(self, command: Command):
+        self._file.write(command.header())
+        self._file.write(command.data)
+        self._file.flush()
+        self._index.append((self._size, len(command.data), command.type.value))
+        with self._map_lock:
+            self._unmapped[self._size] = command.detached()
+            self._unmapped_size += command.byte_size()
+        self._size += command.byte_size()
+        if self._unmapped_size >= MAP_GROWTH:
+            self._remap()
+
+    def pop(self) -> Command:
+        command = self[-1]
+        offset, _, _ = self._index.pop()
+        with self._map_lock:
+            if self._unmapped.pop(offset, None) is not None:
+                self._unmapped_size -= command.byte_size()
+        return command
+
+    def drop(self, indices: Sequence[int]):
+        """
+        Remove commands from the journal. The file is rewritten without them, so that they are not recovered.
+        """
+        dropped = set(indices)
+        self._remap()
+        map_ = self._map
+        attributes_size = int.from_bytes(map_[:4], "little")
+        offset = 4 + attributes_size
+        index: List[Tuple[int, int, int]] = []
+        tmp_path = self.path.with_suffix(COMPACTION_SUFFIX)
+        with open(tmp_path, "wb") as f:
+            f.write(map_[:offset])
+            for i, (frame_offset, size, message_type) in enumerate(self._index):
+                if i in dropped:
+                    continue
+                f.write(map_[frame_offset : frame_offset + HEADER_SIZE + size])
+                index.append((offset, size, message_type))
+                offset += HEADER_SIZE + size
+
+        # the commands read before own their data, so the map and the file can be closed before the file is replaced
+        self._file.close()
+        self._unmap()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a+b")
+        self._size = offset
+        self._index = index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i: int) -> Command:
+        offset, size, _ = self._index[i]
+        end = offset + HEADER_SIZE + size
+        with self._map_lock:
+            command = self._unmapped.get(offset)
+            if command is not None:
+                return command
+        if self._map is None:
+            self._remap()
+        with self._map_lock:
+            # the map may be replaced by another thread, the data is copied while it is locked
+            map_ = self._map
+            _, command_id, message_type = unpack_header(map_, offset)
+            data = map_[offset + HEADER_SIZE : end]
+        return make_command(message_type, data, command_id)
+
+    def _remap(self):
+        """
+        Map the whole file, which makes the commands appended so far readable from the map.
+        """
+        with self._map_lock:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else None
+            self._unmapped.clear()
+            self._unmapped_size = 0
+
+    def _unmap(self):
+        with self._map_lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._unmapped.clear()
+            self._unmapped_size = 0
@@ -58,6 +58,14 @@ class Socket:
             time.sleep(delay)
         return self._socket.sendall(buffer, flags)
 
+    def sendmsg(self, buffers, *args):
+        size = sum(memoryview(buffer).nbytes for buffer in buffers)
+        if self._downstream_Bps > 0.0:
+            delay = size / self._downstream_Bps
+            logger.warning(f"sendmsg {self._downstream_Bps} Bps, buffer {size} bytes, delay {delay}")
+            time.sleep(delay)
+        return self._socket.sendmsg(buffers, *args)
+
     def recv(self, size):
         buffer = self._socket.recv(size)
         if self._upstream_Bps > 0.0:
@@ -65,3 +73,11 @@ class Socket:
             logger.warning(f"recv {self._upstream_Bps} Bps, buffer {len(buffer)} bytes, delay {delay}")
             time.sleep(delay)
         return buffer
+
+    def recv_into(self, buffer, nbytes: int = 0, flags: int = 0):
+        size = self._socket.recv_into(buffer, nbytes, flags)
+        if self._upstream_Bps > 0.0:
+            delay = size / self._upstream_Bps
+            logger.warning(f"recv_into {self._upstream_Bps} Bps, buffer {size} bytes, delay {delay}")
+            time.sleep(delay)
+        return size
@@ -26,7 +26,12 @@ import bpy
 import mixer
 from mixer.bl_utils import get_mixer_prefs
 from mixer.share_data import share_data
-from mixer.broadcaster.common import ClientAttributes, ClientDisconnectedException
+from mixer.broadcaster.common import (
+    ClientAttributes,
+    ClientDisconnectedException,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    RoomAttributes,
+)
 import subprocess
 import time
 from pathlib import Path
@@ -34,6 +39,7 @@ from pathlib import Path
 from mixer.draw_handlers import remove_draw_handlers
 from mixer.blender_client.client import SendSceneContentFailed, BlenderClient
 from mixer.handlers import HandlerManager
+from mixer.local_data import flush_media_cache, list_cached_media_hashes, set_media_cache_max_size
 from mixer.os_utils import addon_infos, tech_infos
 
 
@@ -53,6 +59,14 @@ def create_room(room_name: str, vrtist_protocol: bool = False, shared_folders=No
     if ignore_version_check:
         logger.warning("Ignoring version check")
     join_room(room_name, vrtist_protocol, shared_folders, ignore_version_check)
+    if not vrtist_protocol:
+        prefs = get_mixer_prefs()
+        room_attributes = {RoomAttributes.PROXY_CODEC: prefs.proxy_codec}
+        share_data.proxy_codec = prefs.proxy_codec
+        if prefs.compression:
+            room_attributes[RoomAttributes.COMPRESSION] = True
+            share_data.client.compression_threshold = DEFAULT_COMPRESSION_THRESHOLD
+        share_data.client.set_room_attributes(room_name, room_attributes)
 
 
 def join_room(room_name: str, vrtist_protocol: bool = False, shared_folders=None, ignore_version_check: bool = False):
@@ -72,8 +86,19 @@ def join_room(room_name: str, vrtist_protocol: bool = False, shared_folders=None
     share_data.client.current_room = room_name
     share_data.client._joining_room_name = room_name
     set_client_attributes()
+    room_attributes = share_data.client.rooms_attributes.get(room_name, {})
+    if room_attributes.get(RoomAttributes.COMPRESSION, False):
+        share_data.client.compression_threshold = DEFAULT_COMPRESSION_THRESHOLD
+    else:
+        share_data.client.compression_threshold = None
+    share_data.proxy_codec = room_attributes.get(RoomAttributes.PROXY_CODEC, "json")
+    share_data.client.media_chunk_size = prefs.media_chunk_size * 1024
     blender_version = bpy.app.version_string
     mixer_version = mixer.display_version
+    if not vrtist_protocol:
+        # before joining, so that the server does not send the media that are in the local cache
+        set_media_cache_max_size(int(prefs.media_cache_size * 1024 * 1024 * 1024))
+        share_data.client.send_media_hashes(list_cached_media_hashes())
     share_data.client.join_room(room_name, blender_version, mixer_version, ignore_version_check, not vrtist_protocol)
 
     if shared_folders is None:
@@ -91,6 +116,7 @@ def leave_current_room():
     if share_data.client and share_data.client.current_room:
         share_data.leave_current_room()
         HandlerManager.set_handlers(False)
+    flush_media_cache()
 
     share_data.clear_before_state()
 
@@ -195,8 +221,9 @@ def network_consumer_timer():
     # if we register it directly, then bpy.app.timers.is_registered(share_data.client.network_consumer)
     # return False...
     # However, with a simple function bpy.app.timers.is_registered works.
+    backlog = False
     try:
-        share_data.client.network_consumer()
+        backlog = share_data.client.network_consumer()
     except (ClientDisconnectedException, SendSceneContentFailed) as e:
         logger.warning(e)
         share_data.client = None
@@ -205,6 +232,10 @@ def network_consumer_timer():
     except Exception as e:
         logger.error(f"{e!r}", stack_info=True)
 
+    if backlog:
+        # received commands remain, process them after Blender has handled its events
+        return 0.0
+
     # Run every 1 / 100 seconds
     return 0.01
 
@@ -220,6 +251,9 @@ def create_main_client(host: str, port: int):
     if not client.is_connected():
         return False
 
+    # network_consumer() only processes the commands, the socket is read and written by the I/O thread
+    client.start_io_thread()
+
     share_data.client = client
     if not bpy.app.timers.is_registered(network_consumer_timer):
         bpy.app.timers.register(network_consumer_timer)
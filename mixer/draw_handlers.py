@@ -99,7 +99,8 @@ def remove_draw_handlers():
 def joining_percentage_draw():
     props = get_mixer_props()
 
-    if not share_data.client._joining:
+    joining = share_data.client._joining
+    if not joining and share_data.client.creation_encoding is None:
         return
 
     import blf
@@ -110,7 +111,7 @@ def joining_percentage_draw():
     blf.size(0, point_size, 1)
     blf.color(0, 1, 0, 1, 1.0)
 
-    blf.draw(0, f"{props.joining_percentage * 100:.2f} % (Mixer Join)")
+    blf.draw(0, f"{props.joining_percentage * 100:.2f} % (Mixer {'Join' if joining else 'Send'})")
 
 
 def users_frustrum_draw():
@@ -145,11 +145,13 @@ def handler_send_frame_changed(scene):
 
 
 processing_depsgraph_handler = False
+# a depsgraph update was deferred while received commands were partially applied, with the vrtist protocol
+deferred_vrtist_update = False
 
 
 @persistent
 def handler_send_scene_data_to_server(scene, dummy):
-    global processing_depsgraph_handler
+    global processing_depsgraph_handler, deferred_vrtist_update
     if processing_depsgraph_handler:
         # this happens when an operator is called during the depsgraph handler processing, which is common with armatures
         logger.debug("Depsgraph handler recursion attempt (safe with armatures)")
@@ -162,11 +164,25 @@ def handler_send_scene_data_to_server(scene, dummy):
         # Ensure we will rebuild accessors when a depsgraph update happens
         # todo investigate why we need this...
         share_data.set_dirty()
+        # a selection change is reported as a scene update without details, so any update invalidates the selection
+        share_data.client.selection_tracker.invalidate()
 
         if share_data.client.block_signals:
             logger.debug("handler_send_scene_data_to_server canceled (block_signals = True)")
             return
 
+        if share_data.client.deferring_local_changes():
+            # A room join or a command group is partially applied between two timer runs, or the creations are being
+            # encoded. The local changes are sent by send_deferred_scene_data() once it is complete. This update
+            # includes the one triggered by the received commands, if any
+            logger.debug("handler_send_scene_data_to_server deferred (applying received commands or encoding)")
+            share_data.client.skip_next_depsgraph_update = False
+            if share_data.use_vrtist_protocol():
+                deferred_vrtist_update = True
+            else:
+                generic.defer_scene_data_updates()
+            return
+
         if share_data.use_vrtist_protocol():
             send_scene_data_to_server(scene, dummy)
         else:
@@ -175,6 +191,30 @@ def handler_send_scene_data_to_server(scene, dummy):
         processing_depsgraph_handler = False
 
 
+def send_deferred_scene_data():
+    """
+    Send the local changes deferred by handler_send_scene_data_to_server() while received commands were partially
+    applied.
+    """
+    global deferred_vrtist_update
+    if share_data.use_vrtist_protocol():
+        if deferred_vrtist_update:
+            deferred_vrtist_update = False
+            # the vrtist protocol diffs the whole scene state
+            previous_skip_next = share_data.client.skip_next_depsgraph_update
+            share_data.client.skip_next_depsgraph_update = False
+            send_scene_data_to_server(None, None)
+            share_data.client.skip_next_depsgraph_update = previous_skip_next
+    else:
+        generic.send_deferred_scene_data()
+
+
+def clear_deferred_scene_data():
+    global deferred_vrtist_update
+    deferred_vrtist_update = False
+    generic.clear_deferred_scene_data()
+
+
 class TransformStruct:
     def __init__(self, translate, quaternion, scale, visible):
         self.translate = translate
@@ -882,6 +922,7 @@ def remap_objects_info():
 @persistent
 def handler_on_undo_redo_post(scene, dummy):
     logger.error(f"Undo/redo post on {scene}")
+    share_data.client.selection_tracker.invalidate()
     share_data.client.send_error(f"Undo/redo post from {get_mixer_prefs().user}")
 
     if not share_data.use_vrtist_protocol():
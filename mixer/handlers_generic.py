@@ -10,7 +10,7 @@ import bpy
 import bpy.types as T  # noqa N812
 
 from mixer.blender_client import data as data_api
-from mixer.blender_data.diff import BpyBlendDiff
+from mixer.blender_data.diff import BpyBlendDiff, updated_collection_names
 from mixer.blender_data.filter import safe_properties
 
 
@@ -18,6 +18,11 @@ from mixer.share_data import share_data
 
 logger = logging.getLogger(__name__)
 
+# The depsgraph updates that occurred while received commands were partially applied, see defer_scene_data_updates()
+_deferred_uuids: Set[str] = set()
+_deferred_collections: Set[str] = set()
+_has_deferred_updates = False
+
 
 def extra_updates(updates: Set[T.ID]) -> Set[T.ID]:
     extra_updates = set()
@@ -119,10 +124,59 @@ def send_scene_data_to_server(scene, dummy):
     if delayed_updates:
         bpy_data_proxy.append_delayed_updates(delayed_updates)
 
+    updated_collections = updated_collection_names(update.id.original for update in depsgraph.updates)
+    _send_changes(updates, process_delayed_updates, updated_collections)
+
+
+def defer_scene_data_updates():
+    """
+    Record the depsgraph updates that occur while received commands are partially applied, so that the local
+    changes are not diffed against a partial room state. send_deferred_scene_data() sends them later.
+    """
+    global _has_deferred_updates
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    updates, delayed_updates = updates_to_check(depsgraph)
+    if delayed_updates:
+        share_data.bpy_data_proxy.append_delayed_updates(delayed_updates)
+    # datablocks without uuid are created locally and found by the collection diff
+    _deferred_uuids.update(datablock.mixer_uuid for datablock in updates if datablock.mixer_uuid)
+    _deferred_collections.update(updated_collection_names(update.id.original for update in depsgraph.updates))
+    _has_deferred_updates = True
+
+
+def send_deferred_scene_data():
+    """
+    Send the local changes of the updates recorded by defer_scene_data_updates(), once the received commands are
+    completely applied.
+    """
+    if not _has_deferred_updates:
+        return
+
+    bpy_data_proxy = share_data.bpy_data_proxy
+    updates = {bpy_data_proxy.state.datablock(uuid) for uuid in _deferred_uuids}
+    updates.discard(None)
+    updated_collections = set(_deferred_collections)
+    clear_deferred_scene_data()
+
+    logger.info("send_deferred_scene_data: %d updates", len(updates))
+    _send_changes(updates, False, updated_collections)
+
+
+def clear_deferred_scene_data():
+    global _has_deferred_updates
+    _deferred_uuids.clear()
+    _deferred_collections.clear()
+    _has_deferred_updates = False
+
+
+def _send_changes(updates: Set[T.ID], process_delayed_updates: bool, updated_collections: Set[str]):
+    bpy_data_proxy = share_data.bpy_data_proxy
+
     # Compute the difference between the proxy state and the Blender state
     # It is a coarse difference at the ID level(created, removed, renamed)
+    # Only the collections of the updated datablocks and the collections whose length or names changed are scanned
     diff = BpyBlendDiff()
-    diff.diff(bpy_data_proxy, safe_properties)
+    diff.diff(bpy_data_proxy, safe_properties, updated_collections)
 
     # Ask the proxy to compute the list of elements to synchronize and update itself
     changeset = bpy_data_proxy.update(diff, updates, process_delayed_updates, safe_properties)
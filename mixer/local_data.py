@@ -17,6 +17,11 @@
 
 """
 This module defines utilities for local data.
+
+Media files received from other clients are stored in a size capped cache, named after the sha256 hash of their
+content, so that a file is stored once whatever its source path and can be announced to the server by its hash. The
+cache index records the source path of each media and the media last received for each source path, for the media
+that are referenced by path only. See mixer.broadcaster.media_cache.
 """
 
 import os
@@ -24,10 +29,22 @@ import logging
 import tempfile
 from pathlib import Path
 import hashlib
+from typing import Dict, List, Optional, Tuple
 import bpy
 
+from mixer.broadcaster.media_cache import DEFAULT_MEDIA_CACHE_SIZE, MediaCache
+
 logger = logging.getLogger(__name__)
 
+HASH_BLOCK_SIZE = 1024 * 1024
+"""Bytes read at once to hash a media file"""
+
+# content hashes of files, by path, modification time and size, so that an unmodified file is read once
+_file_content_hashes: Dict[Tuple[str, int, int], str] = {}
+
+_media_cache: Optional[MediaCache] = None
+_media_cache_max_size: int = DEFAULT_MEDIA_CACHE_SIZE
+
 
 def get_data_directory():
     if "MIXER_DATA_DIR" in os.environ:
@@ -40,62 +57,140 @@ def get_data_directory():
     return str(Path(os.fspath(tempfile.gettempdir())) / "mixer" / "data")
 
 
-def get_resolved_file_path(path: str):
+def get_media_directory() -> Path:
+    return Path(get_data_directory()) / "images"
+
+
+def get_media_cache() -> MediaCache:
+    """
+    Return the cache of the media directory, that may change with the MIXER_DATA_DIR environment variable.
+    """
+    global _media_cache
+    directory = get_media_directory()
+    if _media_cache is None or _media_cache.directory != directory:
+        if _media_cache is not None:
+            _media_cache.flush()
+        _media_cache = MediaCache(directory, _media_cache_max_size)
+    return _media_cache
+
+
+def set_media_cache_max_size(max_size: int):
+    global _media_cache_max_size
+    _media_cache_max_size = max_size
+    if _media_cache is not None:
+        _media_cache.set_max_size(max_size)
+
+
+def flush_media_cache():
+    """
+    Release the media pinned by list_cached_media_hashes() and write the last use of the cached media to the cache
+    index.
+    """
+    if _media_cache is not None:
+        _media_cache.unpin()
+        _media_cache.flush()
+
+
+def compute_content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def compute_file_content_hash(path: str) -> str:
+    """
+    Return the content hash of a file, without loading the whole file in memory.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    content_hash = _file_content_hashes.get(key)
+    if content_hash is None:
+        hash_ = hashlib.sha256()
+        with open(path, "rb") as data_file:
+            for block in iter(lambda: data_file.read(HASH_BLOCK_SIZE), b""):
+                hash_.update(block)
+        content_hash = hash_.hexdigest()
+        _file_content_hashes[key] = content_hash
+    return content_hash
+
+
+def get_resolved_file_path(path: str, content_hash: Optional[str] = None):
     abspath = bpy.path.abspath(path)
     if os.path.exists(abspath):
         return path
 
-    return str(get_cache_file_hash(Path(path)))
+    return get_cache_file_path(path, content_hash)
 
 
-def get_cache_file_path(path: str):
-    return str(get_cache_file_hash(Path(path)))
+def get_cache_file_path(path: str, content_hash: Optional[str] = None):
+    """
+    Return the cache file for the media with content_hash, or for the media last received for path if the hash is
+    not known. The file does not exist if the cache does not have the media.
+    """
+    cache = get_media_cache()
+    if content_hash is None:
+        content_hash = cache.lookup_source(path)
+        if content_hash is None:
+            return str(cache.directory / Path(path).name)
+
+    cache_path = cache.lookup(content_hash)
+    if cache_path is None:
+        return str(cache.file_path(content_hash, Path(path).suffix))
+    return str(cache_path)
 
 
 def get_source_file_path(cache_path: str):
+    """
+    Return the source path of the media in a cache file, or path itself if it is not a cache file.
+    """
     if cache_path is None:
         return None
-    metadata_path = Path(cache_path).with_suffix(".metadata")
-    try:
-        if not metadata_path.exists():
-            return cache_path
-    except Exception:
-        logger.warning("Error accessing file " + cache_path)
-        return None
-    return metadata_path.read_text()
+    source = get_media_cache().source(cache_path)
+    return cache_path if source is None else source
 
 
-def get_local_or_create_cache_file(str_path: str, data: bytes):
+def get_local_or_create_cache_file(str_path: str, data: bytes, content_hash: Optional[str] = None):
     path = Path(str_path)
     if path.exists():
         return str_path
 
-    cache_path = get_cache_file_hash(path)
-    if not cache_path.with_suffix(".metadata").exists():
-        create_cache_file(path, cache_path, data)
-    return str(cache_path)
+    return get_or_create_cache_file(str_path, data, content_hash)
 
 
-def get_or_create_cache_file(str_path: str, data: bytes):
-    path = Path(str_path)
-    cache_path = get_cache_file_hash(path)
+def get_or_create_cache_file(str_path: str, data: bytes, content_hash: Optional[str] = None):
+    if content_hash is None:
+        content_hash = compute_content_hash(data)
+    return str(get_media_cache().add(content_hash, Path(str_path).suffix, data, str_path))
 
-    if not cache_path.with_suffix(".metadata").exists():
-        create_cache_file(path, cache_path, data)
-    return str(cache_path)
 
+def get_download_cache_file(str_path: str, content_hash: str) -> Optional[Path]:
+    """
+    Return the cache file where to write a media received in chunks, or None if the media is already available
+    locally.
+    """
+    path = Path(str_path)
+    if path.exists():
+        return None
+    cache = get_media_cache()
+    if cache.lookup(content_hash) is not None:
+        cache.add_reference(content_hash, str_path)
+        return None
+    return cache.file_path(content_hash, path.suffix)
 
-def get_cache_file_hash(path: Path):
-    m = hashlib.sha1()
-    m.update(str(path).encode())
-    return Path(get_data_directory()) / "images" / str(m.hexdigest() + path.suffix)
 
+def add_downloaded_cache_file(str_path: str, content_hash: str, cache_path: Path):
+    """
+    Register a media received in chunks, once written at cache_path.
+    """
+    get_media_cache().register(content_hash, cache_path, str_path)
 
-def create_cache_file(path: Path, cache_path: Path, data: bytes):
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(cache_path, "wb") as data_file:
-        data_file.write(data)
+def list_cached_media_hashes() -> List[str]:
+    """
+    Return the content hashes of the media in the cache, to announce them to the server.
 
-    with open(cache_path.with_suffix(".metadata"), "w") as metadata_file:
-        metadata_file.write(str(path))
+    The server will not send these media, so they are pinned in the cache until flush_media_cache().
+    """
+    try:
+        return get_media_cache().pin()
+    except OSError as e:
+        logger.warning(f"Cannot list media cache {get_media_directory()}: {e!r}")
+        return []
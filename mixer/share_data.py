@@ -22,10 +22,11 @@ This module defines global state of the addon. It is encapsulated in a ShareData
 from collections import namedtuple
 from datetime import datetime
 import logging
-from typing import Dict, List, Mapping, Optional, Set
+from typing import Dict, List, Mapping, Optional, Set, Tuple
 from uuid import uuid4
 
 from mixer.blender_data.bpy_data_proxy import BpyDataProxy
+from mixer.broadcaster.media_transfer import MediaDownload
 
 import bpy
 import bpy.types as T  # noqa N812
@@ -101,6 +102,7 @@ class ShareData:
         self.run_id = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         self.session_id = 0  # For logging and debug
         self.client = None
+        self.proxy_codec = "json"  # see RoomAttributes.PROXY_CODEC
 
         self.local_server_process = None
         self.selected_objects_names = []
@@ -186,7 +188,13 @@ class ShareData:
 
         self.bpy_data_proxy: Optional[BpyDataProxy] = None
 
+        # media received in chunks, by content hash: source path and download, None if it failed
+        self.media_downloads: Dict[str, Tuple[str, Optional[MediaDownload]]] = {}
+
     def leave_current_room(self):
+        for _, download in self.media_downloads.values():
+            if download is not None:
+                download.abort()
         if self.client is not None:
             self.client.leave_room(share_data.client.current_room)
         self.clear_room_data()
@@ -0,0 +1,7 @@
+"""
+Micro benchmarks, not run by the unit tests.
+
+Run them from the repository root, for instance:
+
+    python -m tests.benchmarks.bench_server --help
+"""
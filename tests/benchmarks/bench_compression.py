@@ -0,0 +1,118 @@
+"""
+Measure the compression ratio and the compression cost of the room commands created from the .blend files of
+tests/files.
+
+    python -m tests.benchmarks.bench_compression
+    python -m tests.benchmarks.bench_compression --blend-files tests/files/basic.blend
+    python -m tests.benchmarks.bench_compression --room-files my_room.room
+
+With .blend files, Blender is started to create the room and requires MIXER_BLENDER_EXE_PATH. Room files written by
+the download room operator are read directly.
+"""
+
+import argparse
+from collections import defaultdict
+from pathlib import Path
+import time
+from typing import Dict, List
+
+from mixer.broadcaster.client import Client
+import mixer.broadcaster.common as common
+from mixer.broadcaster.room_bake import download_room, load_room
+
+FILES_DIR = Path(__file__).parent.parent / "files"
+
+
+def wait_joinable(client: Client, room_name: str, timeout: float = 60.0) -> bool:
+    start = time.time()
+    while time.time() - start < timeout:
+        client.send_list_rooms()
+        client.fetch_incoming_commands()
+        if client.rooms_attributes.get(room_name, {}).get(common.RoomAttributes.JOINABLE, False):
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def room_from_blend_file(path: Path, port: int, python_port: int) -> List[common.Command]:
+    """
+    Open the file in Blender, create a room with its content, and download the room commands.
+    """
+    from tests.blender_app import BlenderApp
+
+    room_name = "bench_compression_" + path.stem
+    blender = BlenderApp(python_port)
+    blender.setup([str(path)])
+    blender.connect_mixer()
+    blender.create_room(room_name, keep_room_open=True)
+    try:
+        with Client(common.DEFAULT_HOST, port) as client:
+            if not wait_joinable(client, room_name):
+                raise RuntimeError(f"Room {room_name} not joinable")
+        _, commands = download_room(common.DEFAULT_HOST, port, room_name, "", "", True)
+    finally:
+        blender.quit()
+        blender.wait()
+        blender.close()
+    return [common.decompress_command(command) for command in commands]
+
+
+def bench(name: str, commands: List[common.Command], threshold: int):
+    sizes: Dict[common.MessageType, List[int]] = defaultdict(lambda: [0, 0])
+    compressed_commands = []
+    start = time.perf_counter()
+    for command in commands:
+        compressed_commands.append(common.compress_command(command, threshold))
+    encode_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for command in compressed_commands:
+        common.decompress_command(command)
+    decode_duration = time.perf_counter() - start
+
+    for command, compressed in zip(commands, compressed_commands):
+        sizes[command.type][0] += command.byte_size()
+        sizes[command.type][1] += compressed.byte_size()
+
+    raw_size = sum(size[0] for size in sizes.values())
+    compressed_size = sum(size[1] for size in sizes.values())
+    print(f"{name}: {len(commands)} commands")
+    print(
+        f"  {raw_size} -> {compressed_size} bytes, ratio {raw_size / max(compressed_size, 1):.2f},"
+        f" compress {encode_duration * 1000:.1f} ms ({raw_size / max(encode_duration, 1e-9) / 1e6:.1f} MB/s),"
+        f" decompress {decode_duration * 1000:.1f} ms ({raw_size / max(decode_duration, 1e-9) / 1e6:.1f} MB/s)"
+    )
+    for message_type, (raw, compressed) in sorted(sizes.items(), key=lambda item: -item[1][0]):
+        print(f"    {message_type.name:<32} {raw:>10} -> {compressed:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compression of room commands")
+    parser.add_argument("--blend-files", nargs="*", help="default: all the .blend files of tests/files")
+    parser.add_argument("--room-files", nargs="*", default=[], help="room files saved by the download room operator")
+    parser.add_argument("--python-port", type=int, default=8081, help="port of the Blender python server")
+    parser.add_argument("--threshold", type=int, default=common.DEFAULT_COMPRESSION_THRESHOLD, help="bytes")
+    args = parser.parse_args()
+
+    for room_file in args.room_files:
+        _, commands = load_room(room_file)
+        bench(room_file, [common.decompress_command(command) for command in commands], args.threshold)
+
+    if args.blend_files is None and args.room_files:
+        return
+
+    from tests.process import ServerProcess
+
+    blend_files = args.blend_files or sorted(str(path) for path in FILES_DIR.glob("*.blend"))
+    server = ServerProcess()
+    server.start()
+    try:
+        for blend_file in blend_files:
+            commands = room_from_blend_file(Path(blend_file), server.port, args.python_port)
+            bench(Path(blend_file).name, commands, args.threshold)
+    finally:
+        server.kill()
+
+
+if __name__ == "__main__":
+    main()
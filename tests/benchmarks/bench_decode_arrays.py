@@ -0,0 +1,128 @@
+"""
+Compare the array decoders of mixer.broadcaster.common with the per-element struct.unpack loops they replace, on
+synthetic buffers.
+
+    python -m tests.benchmarks.bench_decode_arrays
+    python -m tests.benchmarks.bench_decode_arrays --count 1000000 --repeat 5
+"""
+
+import argparse
+import array
+import random
+import struct
+import time
+from typing import Callable
+
+import mixer.broadcaster.common as common
+
+
+def decode_array_loop(data, index, schema, inc):
+    count = common.bytes_to_int(data[index : index + 4])
+    start = index + 4
+    end = start
+    values = []
+    for _ in range(count):
+        end = start + inc
+        values.append(struct.unpack(schema, data[start:end]))
+        start = end
+    return values, end
+
+
+def decode_float_array_loop(data, index):
+    count = common.bytes_to_int(data[index : index + 4])
+    start = index + 4
+    values = []
+    end = start
+    for _ in range(count):
+        end = start + 4
+        values.extend(struct.unpack("f", data[start:end]))
+        start = end
+    return values, end
+
+
+def measure(func: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(name: str, candidates, repeat: int):
+    print(name)
+    reference = None
+    for label, func in candidates:
+        duration = measure(func, repeat)
+        if reference is None:
+            reference = duration
+        print(f"  {label:<32} {duration * 1000:>10.2f} ms  x{reference / max(duration, 1e-9):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bulk array decoders")
+    parser.add_argument("--count", type=int, default=100000, help="number of elements per array")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    floats = array.array("f", (random.random() for _ in range(args.count * 5)))
+    ints = array.array("I", (random.randrange(args.count) for _ in range(args.count)))
+
+    float_data = common.encode_typed_array(floats[: args.count], "f")
+    bench(
+        f"{args.count} floats",
+        [
+            ("struct.unpack per element", lambda: decode_float_array_loop(float_data, 0)),
+            ("decode_float_array", lambda: common.decode_float_array(float_data, 0)),
+            ("decode_typed_array", lambda: common.decode_typed_array(float_data, 0, "f")),
+            ("decode_typed_array_view", lambda: common.decode_typed_array_view(float_data, 0, "f")),
+        ],
+        args.repeat,
+    )
+
+    int_data = common.encode_typed_array(ints, "I")
+    bench(
+        f"{args.count} ints",
+        [
+            ("struct.unpack per element", lambda: decode_array_loop(int_data, 0, "I", 4)),
+            ("decode_int_array", lambda: common.decode_int_array(int_data, 0)),
+            ("decode_typed_array", lambda: common.decode_typed_array(int_data, 0, "I")),
+        ],
+        args.repeat,
+    )
+
+    vector3_data = common.encode_typed_array(floats[: args.count * 3], "f", 3)
+    bench(
+        f"{args.count} vector3",
+        [
+            ("struct.unpack per element", lambda: decode_array_loop(vector3_data, 0, "3f", 3 * 4)),
+            ("decode_vector3_array", lambda: common.decode_vector3_array(vector3_data, 0)),
+            ("decode_typed_array", lambda: common.decode_typed_array(vector3_data, 0, "f", 3)),
+        ],
+        args.repeat,
+    )
+
+    # grease pencil points: (x, y, z, pressure, strength)
+    points_data = common.encode_typed_array(floats, "f", 5)
+    bench(
+        f"{args.count} grease pencil points",
+        [
+            ("struct.unpack per element", lambda: decode_array_loop(points_data, 0, "5f", 5 * 4)),
+            ("decode_array", lambda: common.decode_array(points_data, 0, "5f", 5 * 4)),
+            ("decode_typed_array", lambda: common.decode_typed_array(points_data, 0, "f", 5)),
+        ],
+        args.repeat,
+    )
+
+    bench(
+        f"encode {args.count} grease pencil points",
+        [
+            ("struct.pack", lambda: common.int_to_bytes(args.count, 4) + struct.pack(f"{len(floats)}f", *floats)),
+            ("encode_typed_array", lambda: common.encode_typed_array(floats, "f", 5)),
+        ],
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Compare the mesh encoders of mixer.blender_client.mesh with the per-element versions they replace, on a subdivided
+cube. Runs inside Blender:
+
+    blender --background --factory-startup --python tests/benchmarks/bench_mesh_encoding.py
+    blender --background --factory-startup --python tests/benchmarks/bench_mesh_encoding.py -- --cuts 255 --repeat 3
+
+The default of 511 cuts per edge creates 1.5 million quads, that is 3 million triangles for the baked mesh.
+Both versions must produce the same bytes.
+"""
+
+import argparse
+import array
+from pathlib import Path
+import struct
+import sys
+import time
+from typing import Callable
+
+import bmesh
+import bpy
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mixer.blender_client import mesh as mesh_api  # noqa: E402
+from mixer.broadcaster import common  # noqa: E402
+
+
+def extract_layer_float(elmt, layer):
+    return (elmt[layer],)
+
+
+extract_layer_float.struct = "1f"
+
+
+def extract_layer_int(elmt, layer):
+    return (elmt[layer],)
+
+
+extract_layer_int.struct = "1i"
+
+
+def extract_layer_color(elmt, layer):
+    color = elmt[layer]
+    if len(color) == 3:
+        return (color[0], color[1], color[2], 1.0)
+    return (color[0], color[1], color[2], color[3])
+
+
+extract_layer_color.struct = "4f"
+
+
+def extract_layer_uv(elmt, layer):
+    return (elmt[layer].pin_uv, *elmt[layer].uv)
+
+
+extract_layer_uv.struct = "1I2f"
+
+
+def encode_bmesh_layer_loop(layer_collection, element_seq, extract_layer_tuple_func):
+    buffer = []
+    count = 0
+    for i in range(len(layer_collection)):
+        layer = layer_collection[i]
+        for elt in element_seq:
+            buffer.extend(extract_layer_tuple_func(elt, layer))
+            count += 1
+
+    binary_buffer = struct.pack("1I", len(layer_collection))
+    if len(layer_collection) > 0:
+        binary_buffer += struct.pack(extract_layer_tuple_func.struct * count, *buffer)
+    return binary_buffer
+
+
+def encode_base_mesh_geometry_loop(mesh_data):
+    bm = bmesh.new()
+    bm.from_mesh(mesh_data)
+
+    verts_array = []
+    for vert in bm.verts:
+        verts_array.extend((*vert.co,))
+    binary_buffer = struct.pack(f"1I{len(verts_array)}f", len(bm.verts), *verts_array)
+    binary_buffer += encode_bmesh_layer_loop(bm.verts.layers.bevel_weight, bm.verts, extract_layer_float)
+
+    edges_array = []
+    for edge in bm.edges:
+        edges_array.extend((edge.verts[0].index, edge.verts[1].index, edge.smooth, edge.seam))
+    binary_buffer += struct.pack(f"1I{len(edges_array)}I", len(bm.edges), *edges_array)
+    binary_buffer += encode_bmesh_layer_loop(bm.edges.layers.bevel_weight, bm.edges, extract_layer_float)
+    binary_buffer += encode_bmesh_layer_loop(bm.edges.layers.crease, bm.edges, extract_layer_float)
+
+    faces_array = []
+    for face in bm.faces:
+        faces_array.extend((face.material_index, face.smooth, len(face.verts)))
+        faces_array.extend((vert.index for vert in face.verts))
+    binary_buffer += struct.pack(f"1I{len(faces_array)}I", len(bm.faces), *faces_array)
+    binary_buffer += encode_bmesh_layer_loop(bm.faces.layers.face_map, bm.faces, extract_layer_int)
+
+    binary_buffer += encode_bmesh_layer_loop(bm.loops.layers.uv, mesh_api.loops_iterator(bm), extract_layer_uv)
+    binary_buffer += encode_bmesh_layer_loop(bm.loops.layers.color, mesh_api.loops_iterator(bm), extract_layer_color)
+
+    bm.free()
+    return binary_buffer
+
+
+def encode_baked_mesh_pack(obj):
+    # the triangulation is the same as in encode_baked_mesh(), only the packing differs
+    mesh = obj.data
+    original_bm = bmesh.new()
+    original_bm.from_mesh(mesh)
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bmesh.ops.triangulate(bm, faces=bm.faces)
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.calc_normals()
+    mesh.calc_normals_split()
+
+    vertices = array.array("d", (0.0,)) * len(mesh.vertices) * 3
+    mesh.vertices.foreach_get("co", vertices)
+    normals = array.array("d", (0.0,)) * len(mesh.loops) * 3
+    mesh.loops.foreach_get("normal", normals)
+    uvs = array.array("d", (0.0,)) * len(mesh.loops) * 2
+    mesh.uv_layers[0].data.foreach_get("uv", uvs)
+    indices = array.array("i", (0,)) * len(mesh.loops)
+    mesh.loops.foreach_get("vertex_index", indices)
+    material_indices = []
+
+    original_bm.to_mesh(mesh)
+    original_bm.free()
+
+    return (
+        common.int_to_bytes(len(vertices) // 3, 4)
+        + struct.pack(f"{len(vertices)}f", *vertices)
+        + common.int_to_bytes(len(normals) // 3, 4)
+        + struct.pack(f"{len(normals)}f", *normals)
+        + common.int_to_bytes(len(uvs) // 2, 4)
+        + struct.pack(f"{len(uvs)}f", *uvs)
+        + common.int_to_bytes(len(material_indices), 4)
+        + struct.pack(f"{len(material_indices)}I", *material_indices)
+        + common.int_to_bytes(len(indices) // 3, 4)
+        + struct.pack(f"{len(indices)}I", *indices)
+    )
+
+
+def create_cube(cuts: int) -> bpy.types.Object:
+    mesh = bpy.data.meshes.new("bench_cube")
+    bm = bmesh.new()
+    bmesh.ops.create_cube(bm, size=2.0)
+    bmesh.ops.subdivide_edges(bm, edges=bm.edges, cuts=cuts, use_grid_fill=True)
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.uv_layers.new()
+    obj = bpy.data.objects.new("bench_cube", mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+
+def measure(func: Callable, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench(name: str, old: Callable, new: Callable, repeat: int):
+    old_duration, old_buffer = measure(old, repeat)
+    new_duration, new_buffer = measure(new, repeat)
+    status = "same bytes" if old_buffer == new_buffer else "DIFFERENT BYTES"
+    print(
+        f"{name}: {len(new_buffer)} bytes, {status}\n"
+        f"  per element {old_duration * 1000:>10.1f} ms\n"
+        f"  typed arrays {new_duration * 1000:>9.1f} ms  x{old_duration / max(new_duration, 1e-9):.1f}"
+    )
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="Benchmark the mesh encoders")
+    parser.add_argument("--cuts", type=int, default=511, help="subdivision cuts of the cube edges")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    obj = create_cube(args.cuts)
+    mesh = obj.data
+    print(f"cube: {len(mesh.vertices)} vertices, {len(mesh.polygons)} faces, {len(mesh.loops)} loops")
+
+    bench(
+        "encode_base_mesh_geometry",
+        lambda: encode_base_mesh_geometry_loop(mesh),
+        lambda: mesh_api.encode_base_mesh_geometry(mesh),
+        args.repeat,
+    )
+    bench(
+        "encode_baked_mesh", lambda: encode_baked_mesh_pack(obj), lambda: mesh_api.encode_baked_mesh(obj), args.repeat
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Compare the broadcaster server engines: CPU used by the server while clients are idle, and throughput of the
+fan-out of room commands to the clients of a room.
+
+    python -m tests.benchmarks.bench_server --clients 30 --rooms 3
+
+The server CPU time is read with resource.getrusage(), so this benchmark is not available on Windows.
+"""
+
+import argparse
+import resource
+import signal
+import subprocess
+import sys
+import time
+from typing import List
+
+from mixer.broadcaster.client import Client
+import mixer.broadcaster.common as common
+
+HOST = "127.0.0.1"
+
+
+class ServerRun:
+    """
+    Run a server process and measure the CPU time it used once terminated
+    """
+
+    def __init__(self, engine: str, port: int):
+        self.engine = engine
+        self.port = port
+        self._process: subprocess.Popen = None
+        self.cpu_time = 0.0
+
+    def __enter__(self):
+        args = [sys.executable, "-m", "mixer.broadcaster.apps.server", "--port", str(self.port)]
+        args.extend(["--engine", self.engine, "--log-level", "ERROR"])
+        self._usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self._process = subprocess.Popen(args)
+        time.sleep(1.0)
+        return self
+
+    def __exit__(self, *args):
+        self._process.send_signal(signal.SIGINT)
+        try:
+            self._process.wait(10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.cpu_time = (usage.ru_utime - self._usage.ru_utime) + (usage.ru_stime - self._usage.ru_stime)
+
+
+def wait_for(clients: List[Client], message_type: common.MessageType, count: int, timeout: float = 60.0) -> bool:
+    received = {id(client): 0 for client in clients}
+    start = time.time()
+    while time.time() - start < timeout:
+        for client in clients:
+            commands = client.fetch_incoming_commands()
+            received[id(client)] += len([c for c in commands if c.type == message_type])
+        if all(value >= count for value in received.values()):
+            return True
+    return False
+
+
+def connect_clients(port: int, client_count: int, room_count: int) -> List[List[Client]]:
+    """
+    Connect client_count clients, evenly split into room_count rooms. The first client of each room creates it.
+    """
+    rooms: List[List[Client]] = [[] for _ in range(room_count)]
+    for i in range(client_count):
+        client = Client(HOST, port)
+        client.connect()
+        room_index = i % room_count
+        room_name = f"room_{room_index}"
+        if not rooms[room_index]:
+            client.join_room(room_name, "ignored", "ignored", True, True)
+            client.send_command(common.Command(common.MessageType.CONTENT))
+            wait_for([client], common.MessageType.JOIN_ROOM, 1)
+        else:
+            client.join_room(room_name, "ignored", "ignored", True, True)
+        rooms[room_index].append(client)
+
+    for clients in rooms:
+        wait_for(clients[1:], common.MessageType.JOIN_ROOM, 1)
+    return rooms
+
+
+def disconnect_clients(rooms: List[List[Client]]):
+    for clients in rooms:
+        for client in clients:
+            client.disconnect()
+    time.sleep(0.5)
+
+
+def bench_idle(engine: str, port: int, client_count: int, room_count: int, duration: float) -> float:
+    with ServerRun(engine, port) as server:
+        rooms = connect_clients(port, client_count, room_count)
+        time.sleep(duration)
+        disconnect_clients(rooms)
+    return server.cpu_time
+
+
+def bench_fan_out(engine: str, port: int, client_count: int, room_count: int, command_count: int, size: int):
+    with ServerRun(engine, port) as server:
+        rooms = connect_clients(port, client_count, room_count)
+        payload = bytes(size)
+        start = time.time()
+        for clients in rooms:
+            sender = clients[0]
+            for _ in range(command_count):
+                sender.add_command(common.Command(common.MessageType.BLENDER_DATA_UPDATE, payload))
+            sender.fetch_outgoing_commands()
+        receivers = [client for clients in rooms for client in clients[1:]]
+        ok = wait_for(receivers, common.MessageType.BLENDER_DATA_UPDATE, command_count)
+        duration = time.time() - start
+        disconnect_clients(rooms)
+
+    if not ok:
+        print(f"  {engine}: timeout during fan-out")
+    return duration, server.cpu_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark broadcaster server engines")
+    parser.add_argument("--port", type=int, default=common.DEFAULT_PORT + 100)
+    parser.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+    parser.add_argument("--clients", type=int, default=30)
+    parser.add_argument("--rooms", type=int, default=3)
+    parser.add_argument("--idle-duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--commands", type=int, default=1000, help="commands sent in each room")
+    parser.add_argument("--size", type=int, default=4096, help="command payload size in bytes")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients in {args.rooms} rooms")
+    for engine in args.engines:
+        idle_cpu = bench_idle(engine, args.port, args.clients, args.rooms, args.idle_duration)
+        duration, cpu = bench_fan_out(engine, args.port, args.clients, args.rooms, args.commands, args.size)
+        receiver_count = args.clients - args.rooms
+        received_bytes = receiver_count * args.commands * args.size
+        print(f"{engine}:")
+        print(f"  idle: server CPU {100.0 * idle_cpu / args.idle_duration:.1f} % during {args.idle_duration} s")
+        print(
+            f"  fan-out: {args.commands} x {args.size} bytes per room in {duration:.2f} s,"
+            f" {received_bytes / duration / 1e6:.1f} MB/s received, server CPU {cpu:.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
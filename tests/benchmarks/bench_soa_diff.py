@@ -0,0 +1,83 @@
+"""
+Compare SoaElement.diff() for unchanged arrays, the common case of a depsgraph update, with the previous version that
+allocated an array and compared it with the proxy array, on grid meshes of increasing size. Runs inside Blender:
+
+    blender --background --factory-startup --python tests/benchmarks/bench_soa_diff.py
+    blender --background --factory-startup --python tests/benchmarks/bench_soa_diff.py -- --sizes 100 1000 --repeat 5
+"""
+
+import argparse
+import array
+from pathlib import Path
+import sys
+import time
+from typing import Callable
+
+import bmesh
+import bpy
+import bpy.types as T  # noqa N812
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mixer.blender_data.aos_soa_proxy import SoaElement, soa_initializer  # noqa: E402
+from mixer.blender_data.specifics import soa_initializers  # noqa: E402
+
+
+def diff_compare(element: SoaElement, aos: T.bpy_prop_collection, bl_rna) -> bool:
+    """The previous change detection, without the delta creation"""
+    array_size, member_type = element.array_attr(aos, bl_rna)
+    element_init = soa_initializers[member_type]
+    initial_values = array.array(element_init.typecode, element_init.tolist() * array_size)
+    tmp_array = array.array(element_init.typecode, initial_values)
+    aos.foreach_get(element._member_name, tmp_array)
+    return element._array != tmp_array
+
+
+def create_grid(size: int) -> bpy.types.Mesh:
+    mesh = bpy.data.meshes.new(f"bench_grid_{size}")
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments=size, y_segments=size, size=1.0)
+    bm.to_mesh(mesh)
+    bm.free()
+    return mesh
+
+
+def measure(func: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="Benchmark SoaElement.diff() on unchanged arrays")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[100, 300, 1000, 1400], help="grid segments")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        mesh = create_grid(size)
+        for aos, member_name, bl_rna in (
+            (mesh.vertices, "co", T.MeshVertex.bl_rna),
+            (mesh.vertices, "normal", T.MeshVertex.bl_rna),
+            (mesh.loops, "vertex_index", T.MeshLoop.bl_rna),
+        ):
+            element = SoaElement(member_name)
+            array_size, member_type = element.array_attr(aos, bl_rna)
+            element._array = soa_initializer(member_type, array_size)
+            aos.foreach_get(member_name, element._array)
+
+            compare = measure(lambda: diff_compare(element, aos, bl_rna), args.repeat)
+            digest = measure(lambda: element.diff(aos, member_name, bl_rna, None), args.repeat)
+            print(
+                f"{len(aos):>9} {member_name:<14} compare {compare * 1000:>9.1f} ms"
+                f"  digest {digest * 1000:>8.1f} ms  x{compare / max(digest, 1e-9):.1f}"
+            )
+        bpy.data.meshes.remove(mesh)
+
+
+if __name__ == "__main__":
+    main()
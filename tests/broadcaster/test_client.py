@@ -0,0 +1,94 @@
+import socket
+import time
+import unittest
+
+from mixer.broadcaster.client import Client
+import mixer.broadcaster.common as common
+from mixer.broadcaster.socket import Socket
+
+
+class TestIoThread(unittest.TestCase):
+    def setUp(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        self.listener = listener
+
+        self.client = Client("127.0.0.1", listener.getsockname()[1])
+        self.client.connect()
+        server_socket, _ = listener.accept()
+        self.server = Socket(server_socket)
+        self.reader = common.CommandReader(self.server)
+
+        # CLIENT_ID, LIST_CLIENTS and LIST_ROOMS sent by connect()
+        self.assertEqual(len(self.read(3)), 3)
+        self.client.start_io_thread()
+
+    def tearDown(self):
+        if self.client.is_connected():
+            self.client.disconnect()
+        self.server.close()
+        self.listener.close()
+
+    def read(self, count: int):
+        commands = []
+        while len(commands) < count:
+            commands.extend(self.reader.read_commands(timeout=1.0))
+        return commands
+
+    def fetch(self, count: int):
+        commands = []
+        deadline = time.monotonic() + 5.0
+        while len(commands) < count and time.monotonic() < deadline:
+            commands.extend(self.client.fetch_incoming_commands())
+            time.sleep(0.001)
+        return commands
+
+    def test_send_in_order(self):
+        self.client.send_command(common.Command(common.MessageType.LIST_ROOMS, b"", 1))
+        for i in range(100):
+            self.client.add_command(common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes([i]) * i, i + 2))
+        self.client.fetch_outgoing_commands()
+        self.assertEqual(self.client.pending_commands, [])
+
+        received = self.read(101)
+        self.assertEqual([command.id for command in received], list(range(1, 102)))
+        self.assertEqual(bytes(received[-1].data), bytes([99]) * 99)
+
+    def test_receive(self):
+        for i in range(100):
+            command = common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes([i]) * 1000, i + 1)
+            self.server.sendall(command.to_byte_buffer())
+        # the I/O thread receives without being polled
+        time.sleep(0.1)
+        received = self.fetch(100)
+        self.assertEqual([command.id for command in received], list(range(1, 101)))
+
+        # default handlers are called by the consumer
+        self.server.sendall(common.Command(common.MessageType.JOIN_ROOM, common.encode_string("room")).to_byte_buffer())
+        self.fetch(1)
+        self.assertEqual(self.client.current_room, "room")
+
+    def test_connection_lost(self):
+        self.server.sendall(common.Command(common.MessageType.BLENDER_DATA_UPDATE, b"data", 1).to_byte_buffer())
+        time.sleep(0.1)
+        self.server.close()
+
+        # commands received before the connection loss are delivered first
+        self.assertEqual(len(self.fetch(1)), 1)
+        deadline = time.monotonic() + 5.0
+        with self.assertRaises(common.ClientDisconnectedException):
+            while time.monotonic() < deadline:
+                self.client.fetch_incoming_commands()
+                time.sleep(0.001)
+        self.assertFalse(self.client.is_connected())
+
+    def test_disconnect_sends_queued_commands(self):
+        self.client.send_command(common.Command(common.MessageType.LEAVE_ROOM, b"room", 1))
+        self.client.disconnect()
+        received = common.read_message(self.server, timeout=1.0)
+        self.assertEqual(received.type, common.MessageType.LEAVE_ROOM)
+
+
+if __name__ == "__main__":
+    unittest.main()
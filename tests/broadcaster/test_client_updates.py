@@ -0,0 +1,127 @@
+import copy
+import unittest
+
+from mixer.broadcaster.apps.server import Connection, Server
+import mixer.broadcaster.common as common
+
+
+class FakeRoom:
+    def __init__(self, name):
+        self.name = name
+
+
+class TestClientUpdates(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.server.client_update_interval = 0.05
+        room_a = FakeRoom("a")
+        room_b = FakeRoom("b")
+        self.a1 = self.connect(1, room_a)
+        self.a2 = self.connect(2, room_a)
+        self.b1 = self.connect(3, room_b)
+        self.lobby = self.connect(4)
+
+    def connect(self, port, room=None) -> Connection:
+        connection = Connection(self.server, None, ("127.0.0.1", port))
+        connection.room = room
+        self.server._connections[connection.unique_id] = connection
+        return connection
+
+    def updates(self, connection, message_type=common.MessageType.CLIENT_UPDATE):
+        commands = connection._command_queue.get_all()
+        for command in commands:
+            self.assertEqual(command.type, message_type)
+        return [common.decode_json(command.data, 0)[0] for command in commands]
+
+    def test_accumulate(self):
+        for i in range(10):
+            self.server.update_client_attributes(self.a1, {"frame": i})
+        self.server.update_client_attributes(self.a1, {"user_name": "a1"})
+        self.assertEqual(self.updates(self.a2), [])
+
+        self.server.flush_client_updates()
+        self.assertEqual(self.updates(self.a2), [{self.a1.unique_id: {"frame": 9, "user_name": "a1"}}])
+
+        # nothing pending
+        self.server.flush_client_updates()
+        self.assertEqual(self.updates(self.a2), [])
+
+    def test_scope(self):
+        a1, b1, lobby = self.a1.unique_id, self.b1.unique_id, self.lobby.unique_id
+        self.server.update_client_attributes(self.a1, {"frame": 1})
+        self.server.update_client_attributes(self.b1, {"frame": 2})
+        self.server.update_client_attributes(self.lobby, {"user_name": "lobby"})
+        self.server.flush_client_updates()
+
+        lobby_update = {"user_name": "lobby"}
+        self.assertEqual(self.updates(self.a1), [{a1: {"frame": 1}, lobby: lobby_update}])
+        self.assertEqual(self.updates(self.a2), [{a1: {"frame": 1}, lobby: lobby_update}])
+        self.assertEqual(self.updates(self.b1), [{b1: {"frame": 2}, lobby: lobby_update}])
+        self.assertEqual(self.updates(self.lobby), [{a1: {"frame": 1}, b1: {"frame": 2}, lobby: lobby_update}])
+
+    def test_immediate_after_pending(self):
+        a1 = self.a1.unique_id
+        self.server.update_client_attributes(self.a1, {"frame": 1})
+        self.server.broadcast_client_update(self.a1, {common.ClientAttributes.ROOM: None})
+        room_update = {a1: {common.ClientAttributes.ROOM: None}}
+        self.assertEqual(self.updates(self.b1), [room_update])
+        self.assertEqual(self.updates(self.a2), [{a1: {"frame": 1}}, room_update])
+
+    def test_disabled(self):
+        self.server.client_update_interval = 0.0
+        self.server.update_client_attributes(self.a1, {"frame": 1})
+        self.assertEqual(self.updates(self.b1), [{self.a1.unique_id: {"frame": 1}}])
+
+    def test_patches(self):
+        a1 = self.a1.unique_id
+        self.a2.accepts_patches = True
+        scenes = {"Scene": {"frame": 1, "views": {"1": {"eye": [0, 0, 0]}, "2": {"eye": [1, 1, 1]}}}}
+        self.server.update_client_attributes(self.a1, {"user_scenes": copy.deepcopy(scenes)})
+        self.server.flush_client_updates()
+        self.assertEqual(self.updates(self.a2, common.MessageType.CLIENT_UPDATE_PATCH), [{a1: {"user_scenes": scenes}}])
+        self.updates(self.b1)
+
+        patch = {"user_scenes": {"Scene": {"views": {"1": {"eye": [2, 2, 2]}, "2": None}}}}
+        self.server.update_client_attributes(self.a1, patch, is_patch=True)
+        self.server.flush_client_updates()
+        self.assertEqual(self.updates(self.a2, common.MessageType.CLIENT_UPDATE_PATCH), [{a1: patch}])
+
+        # the clients that do not accept patches receive the whole top level attribute
+        expected = {"Scene": {"frame": 1, "views": {"1": {"eye": [2, 2, 2]}}}}
+        self.assertEqual(self.updates(self.lobby), [{a1: {"user_scenes": scenes}}, {a1: {"user_scenes": expected}}])
+
+
+class TestAttributesPatch(unittest.TestCase):
+    def test_diff(self):
+        current = {"a": 1, "b": {"c": [1, 2], "d": {"e": 1, "f": 2}}, "g": "x"}
+        updated = {"a": 1, "b": {"c": [1, 3], "d": {"e": 1}}, "h": {"i": 1}}
+        patch = common.diff_attributes(current, updated)
+        self.assertEqual(patch, {"b": {"c": [1, 3], "d": {"f": None}}, "g": None, "h": {"i": 1}})
+        common.apply_attributes_patch(current, patch)
+        self.assertEqual(current, updated)
+        self.assertEqual(common.diff_attributes(current, updated), {})
+
+    def test_replace_value_by_dict(self):
+        current = {"a": 1}
+        patch = common.diff_attributes(current, {"a": {"b": 1}})
+        common.apply_attributes_patch(current, patch)
+        self.assertEqual(current, {"a": {"b": 1}})
+
+    def test_update_and_get_patch(self):
+        current = {"user_name": "x", "user_scenes": {"Scene": {"frame": 1, "selected_objects": ["Cube"]}}}
+        patch = common.update_attributes_and_get_patch(
+            current, {"user_scenes": {"Scene": {"frame": 2, "selected_objects": ["Cube"]}}}
+        )
+        self.assertEqual(patch, {"user_scenes": {"Scene": {"frame": 2}}})
+        self.assertEqual(current["user_scenes"]["Scene"]["frame"], 2)
+        self.assertEqual(current["user_name"], "x")
+        self.assertEqual(common.update_attributes_and_get_patch(current, {"user_name": "x"}), {})
+
+    def test_patch_named_attributes(self):
+        clients = {"c1": {"a": {"b": 1, "c": 2}}}
+        common.patch_named_attributes(clients, {"c1": {"a": {"c": None}}, "c2": {"a": 1}})
+        self.assertEqual(clients, {"c1": {"a": {"b": 1}}, "c2": {"a": 1}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import socket
+import threading
+import time
+import unittest
+
+from mixer.broadcaster.apps.server import Connection, Server
+from mixer.broadcaster.command_queue import CommandQueue, OverflowPolicy, QueueOverflow, coalescing_key
+from mixer.broadcaster.common import ClientDisconnectedException, Command, MessageType, encode_string, HEADER_SIZE
+from mixer.broadcaster.socket import Socket
+
+
+def transform(path: str, size: int = 100) -> Command:
+    return Command(MessageType.TRANSFORM, encode_string(path) + bytes(size))
+
+
+def data(size: int = 100) -> Command:
+    return Command(MessageType.BLENDER_DATA_UPDATE, bytes(size))
+
+
+class TestCoalescingKey(unittest.TestCase):
+    def test_keys(self):
+        self.assertEqual(coalescing_key(transform("a")), (MessageType.TRANSFORM, "a"))
+        self.assertNotEqual(coalescing_key(transform("a")), coalescing_key(transform("b")))
+        self.assertEqual(coalescing_key(Command(MessageType.FRAME, b"1234")), MessageType.FRAME)
+        self.assertIsNone(coalescing_key(data()))
+
+
+class TestCommandQueue(unittest.TestCase):
+    def test_fifo(self):
+        queue = CommandQueue()
+        commands = [transform("a"), data(), transform("a")]
+        for command in commands:
+            queue.put(command)
+        self.assertEqual(queue.command_count, 3)
+        self.assertEqual(queue.byte_size, sum(command.byte_size() for command in commands))
+        self.assertIs(queue.pop(), commands[0])
+        self.assertEqual(queue.get_all(), commands[1:])
+        self.assertIsNone(queue.pop())
+        self.assertEqual(queue.byte_size, 0)
+
+    def test_coalesce(self):
+        size = transform("a").byte_size()
+        queue = CommandQueue(high_water=3 * size, low_water=size, policy=OverflowPolicy.COALESCE)
+        commands = [transform("a"), transform("b"), data(), transform("a"), transform("b")]
+        for command in commands:
+            queue.put(command)
+
+        # the last two commands were above the high water mark and superseded queued commands
+        self.assertTrue(queue.congested)
+        self.assertEqual(queue.coalesced_count, 2)
+        self.assertEqual(queue.command_count, 3)
+        self.assertEqual(queue.get_all(), commands[2:])
+        self.assertFalse(queue.congested)
+
+    def test_no_coalesce_below_high_water(self):
+        queue = CommandQueue(policy=OverflowPolicy.COALESCE)
+        commands = [transform("a"), transform("a")]
+        for command in commands:
+            queue.put(command)
+        self.assertEqual(queue.get_all(), commands)
+
+    def test_unbounded(self):
+        size = transform("a").byte_size()
+        queue = CommandQueue(high_water=size, low_water=0, policy=OverflowPolicy.DISCONNECT)
+        for _ in range(3):
+            queue.put(transform("a"), bounded=False)
+        self.assertEqual(queue.command_count, 3)
+        self.assertFalse(queue.congested)
+
+    def test_disconnect(self):
+        size = data().byte_size()
+        queue = CommandQueue(high_water=2 * size, low_water=size, policy=OverflowPolicy.DISCONNECT)
+        queue.put(data())
+        queue.put(data())
+        with self.assertRaises(QueueOverflow):
+            queue.put(data())
+        self.assertEqual(queue.overflow_count, 1)
+        self.assertEqual(queue.command_count, 2)
+
+    def test_hysteresis(self):
+        size = data().byte_size()
+        queue = CommandQueue(high_water=2 * size, low_water=size, policy=OverflowPolicy.BLOCK)
+        for _ in range(3):
+            queue.put(data())
+        self.assertTrue(queue.congested)
+        queue.pop()
+        self.assertTrue(queue.congested)
+        queue.pop()
+        self.assertFalse(queue.congested)
+
+    def test_wait_drained(self):
+        size = data().byte_size()
+        queue = CommandQueue(high_water=size, low_water=0, policy=OverflowPolicy.BLOCK)
+        queue.put(data())
+        queue.put(data())
+        self.assertFalse(queue.wait_drained(0.01))
+
+        timer = threading.Timer(0.05, queue.get_all)
+        timer.start()
+        self.assertTrue(queue.wait_drained(5.0))
+        timer.join()
+        self.assertGreater(queue.metrics()["blocked_time"], 0.0)
+
+    def test_lag(self):
+        queue = CommandQueue()
+        self.assertEqual(queue.lag(), 0.0)
+        queue.put(data())
+        time.sleep(0.02)
+        self.assertGreaterEqual(queue.lag(), 0.01)
+        metrics = queue.metrics()
+        self.assertEqual(metrics["command_count"], 1)
+        self.assertEqual(metrics["byte_size"], HEADER_SIZE + 100)
+
+
+class TestConnectionOverflow(unittest.TestCase):
+    def test_disconnect_stalled_client(self):
+        server = Server()
+        server.queue_overflow_policy = OverflowPolicy.DISCONNECT
+        server.queue_high_water = 2 * data().byte_size()
+        server.queue_low_water = 0
+        server_socket, client_socket = socket.socketpair()
+        connection = Connection(server, Socket(server_socket), ("127.0.0.1", 1))
+        errors = []
+
+        def send():
+            # the client does not read, so that the send blocks once the socket buffers are full
+            try:
+                connection.send_commands([data(64 * 1024 * 1024)])
+            except (ClientDisconnectedException, OSError) as e:
+                errors.append(e)
+
+        connection.thread = threading.Thread(target=send)
+        connection.thread.start()
+        for _ in range(3):
+            connection.add_command(data())
+
+        # the socket is shut down, which unblocks the sending thread
+        connection.thread.join(5.0)
+        self.assertFalse(connection.thread.is_alive())
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(connection._command_queue.command_count, 0)
+        server_socket.close()
+        client_socket.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+import array
+import os
+import socket
+import threading
+import unittest
+import zlib
+
+import mixer.broadcaster.common as common
+from mixer.broadcaster.socket import Socket
+
+
+class TestCommandReader(unittest.TestCase):
+    def setUp(self):
+        sender, receiver = socket.socketpair()
+        self.sender = sender
+        self.receiver = Socket(receiver)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def read(self, reader: common.CommandReader, count: int):
+        commands = []
+        while len(commands) < count:
+            commands.extend(reader.read_commands(timeout=1.0))
+        return commands
+
+    def check_round_trip(self, sizes, chunk_size):
+        reader = common.CommandReader(self.receiver, chunk_size)
+        sent = [
+            common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes([i % 256]) * size, i + 1)
+            for i, size in enumerate(sizes)
+        ]
+        for command in sent:
+            self.sender.sendall(command.to_byte_buffer())
+
+        received = self.read(reader, len(sent))
+        self.assertEqual(len(received), len(sent))
+        for expected, command in zip(sent, received):
+            self.assertEqual(command.type, expected.type)
+            self.assertEqual(command.id, expected.id)
+            self.assertEqual(bytes(command.data), expected.data)
+
+    def test_small_commands(self):
+        self.check_round_trip([10, 0, 20, 1], 1024)
+
+    def test_commands_across_chunks(self):
+        self.check_round_trip([100] * 50, 256)
+
+    def test_large_commands(self):
+        self.check_round_trip([10, 5000, 20, 100000, 0], 1024)
+
+    def test_detached(self):
+        reader = common.CommandReader(self.receiver, 1024)
+        for i in range(2):
+            self.sender.sendall(
+                common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes([i]) * 10).to_byte_buffer()
+            )
+        commands = self.read(reader, 2)
+        detached = commands[0].detached()
+        self.assertIsInstance(detached.data, bytes)
+        self.assertEqual(detached.data, bytes(10))
+        self.assertEqual((detached.type, detached.id), (commands[0].type, commands[0].id))
+        self.assertIs(detached.detached(), detached)
+
+    def test_partial_frame(self):
+        reader = common.CommandReader(self.receiver, 64)
+        buffer = common.Command(common.MessageType.BLENDER_DATA_UPDATE, b"0123456789" * 10).to_byte_buffer()
+        self.sender.sendall(buffer[:10])
+        self.assertEqual(reader.read_commands(timeout=0.1), [])
+        self.sender.sendall(buffer[10:50])
+        self.assertEqual(reader.read_commands(timeout=0.1), [])
+        self.sender.sendall(buffer[50:])
+        commands = self.read(reader, 1)
+        self.assertEqual(bytes(commands[0].data), b"0123456789" * 10)
+
+    def test_data_is_not_copied(self):
+        reader = common.CommandReader(self.receiver)
+        self.sender.sendall(common.Command(common.MessageType.JOIN_ROOM, common.encode_string("room")).to_byte_buffer())
+        command = self.read(reader, 1)[0]
+        self.assertIsInstance(command.data, memoryview)
+        self.assertEqual(common.decode_string(command.data, 0)[0], "room")
+
+    def test_disconnected(self):
+        reader = common.CommandReader(self.receiver)
+        self.sender.close()
+        self.assertRaises(common.ClientDisconnectedException, reader.read_commands, 1.0)
+
+
+class _SocketWithoutSendmsg:
+    """A socket without sendmsg(), like on Windows"""
+
+    def __init__(self, sock: socket.socket):
+        self._socket = sock
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def sendall(self, *args):
+        return self._socket.sendall(*args)
+
+    def close(self):
+        self._socket.close()
+
+
+class TestWriteMessages(unittest.TestCase):
+    def setUp(self):
+        sender, receiver = socket.socketpair()
+        self.sender = Socket(sender)
+        self.receiver = Socket(receiver)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def test_batches(self):
+        self.check_batches()
+
+    def test_batches_without_sendmsg(self):
+        self.sender._socket = _SocketWithoutSendmsg(self.sender._socket)
+        self.check_batches()
+
+    def test_disconnected(self):
+        self.receiver.close()
+        sent = [common.Command(common.MessageType.BLENDER_DATA_UPDATE, b"x" * 1000, i + 1) for i in range(1000)]
+        self.assertRaises(common.ClientDisconnectedException, common.write_messages, self.sender, sent)
+
+    def check_batches(self):
+        sent = [
+            common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes([i % 256]) * (i * 37 % 3000), i + 1)
+            for i in range(2000)
+        ]
+        reader = common.CommandReader(self.receiver, 4096)
+        received = []
+
+        # the receiver must read while the sender writes, since the socket buffers are smaller than the commands
+        thread = threading.Thread(target=common.write_messages, args=(self.sender, sent, 64 * 1024))
+        thread.start()
+        while len(received) < len(sent):
+            received.extend(reader.read_commands(timeout=1.0))
+        thread.join()
+
+        self.assertEqual(len(received), len(sent))
+        for expected, command in zip(sent, received):
+            self.assertEqual(command.type, expected.type)
+            self.assertEqual(command.id, expected.id)
+            self.assertEqual(bytes(command.data), expected.data)
+
+
+class TestCompression(unittest.TestCase):
+    def test_compress(self):
+        data = common.encode_string("proxy" * 1000)
+        command = common.Command(common.MessageType.BLENDER_DATA_UPDATE, data, 12)
+        compressed = common.compress_command(command)
+        self.assertTrue(compressed.compressed)
+        self.assertLess(len(compressed.data), len(data))
+
+        # the flag is transmitted in the header
+        header = compressed.header()
+        received = common.make_command(common.unpack_header(header)[2], compressed.data, 12)
+        self.assertTrue(received.compressed)
+        self.assertEqual(received.type, common.MessageType.BLENDER_DATA_UPDATE)
+
+        decompressed = common.decompress_command(received)
+        self.assertFalse(decompressed.compressed)
+        self.assertEqual(decompressed.type, command.type)
+        self.assertEqual(decompressed.id, command.id)
+        self.assertEqual(decompressed.data, data)
+
+    def test_not_compressed(self):
+        data = bytes(10000)
+        for message_type in (
+            common.MessageType.SET_ROOM_CUSTOM_ATTRIBUTES,
+            common.MessageType.TRANSFORM,
+            common.MessageType.CLIENT_ID_WRAPPER,
+        ):
+            command = common.Command(message_type, data)
+            self.assertIs(common.compress_command(command), command)
+
+        command = common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes(100))
+        self.assertIs(common.compress_command(command), command)
+
+        # does not compress
+        command = common.Command(common.MessageType.BLENDER_DATA_UPDATE, os.urandom(10000))
+        self.assertIs(common.compress_command(command), command)
+
+    def test_compress_data(self):
+        data = common.encode_string("proxy" * 1000)
+        compressed = common.compress_data(common.MessageType.BLENDER_DATA_CREATE, data)
+        self.assertEqual(zlib.decompress(compressed), data)
+
+        # commands built from compress_data() results are not compressed again
+        command = common.Command(common.MessageType.BLENDER_DATA_CREATE, compressed, 0, True)
+        self.assertIs(common.compress_command(command), command)
+
+        self.assertIsNone(common.compress_data(common.MessageType.BLENDER_DATA_CREATE, bytes(100)))
+        self.assertIsNone(common.compress_data(common.MessageType.TRANSFORM, data))
+        self.assertIsNone(common.compress_data(common.MessageType.BLENDER_DATA_CREATE, os.urandom(10000)))
+
+
+class TestArrays(unittest.TestCase):
+    def test_legacy_decoders(self):
+        data = b"pad" + common.encode_typed_array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], "f", 3)
+        values, index = common.decode_vector3_array(data, 3)
+        self.assertEqual(values, [(1.0, 2.0, 3.0), (4.0, 5.0, 6.0)])
+        self.assertEqual(index, len(data))
+
+        values, index = common.decode_float_array(data, 3)
+        self.assertEqual(values, [1.0, 2.0])
+        self.assertEqual(index, 3 + 4 + 2 * 4)
+
+        data = common.encode_typed_array([3, 1, 2], "I")
+        self.assertEqual(common.decode_int_array(data, 0), ([3, 1, 2], len(data)))
+        self.assertEqual(common.decode_int_array(common.encode_int(0), 0), ([], 4))
+
+    def test_typed_array(self):
+        points = array.array("f", range(15))
+        data = common.encode_string("points") + common.encode_typed_array(points, "f", 5) + common.encode_int(42)
+        start = len(common.encode_string("points"))
+
+        values, index = common.decode_typed_array(data, start, "f", 5)
+        self.assertEqual(values, points)
+        self.assertEqual(common.decode_int(data, index)[0], 42)
+
+        view, index = common.decode_typed_array_view(data, start, "f", 5)
+        self.assertEqual(view.tolist(), points.tolist())
+        self.assertEqual(common.decode_int(data, index)[0], 42)
+
+    def test_interleave(self):
+        # (vertex 0, vertex 1, smooth, seam) for an odd edge count, as encoded by encode_base_mesh_geometry()
+        edge_vertices = array.array("i", range(10))
+        edge_sharp = array.array("i", [1, 0, 0, 1, 0])
+        edge_smooth = array.array("i", [1 - sharp for sharp in edge_sharp])
+        edge_seam = [0, 0, 1, 0, 0]
+        edges = common.interleave_arrays("i", (edge_vertices[0::2], edge_vertices[1::2], edge_smooth, edge_seam))
+        self.assertEqual(edges.typecode, "i")
+        self.assertEqual(edges[:8].tolist(), [0, 1, 0, 0, 2, 3, 1, 0])
+        self.assertEqual(edges[-4:].tolist(), [8, 9, 1, 0])
+        values, _ = common.decode_typed_array(common.encode_typed_array(edges, "i", 4), 0, "i", 4)
+        self.assertEqual(len(values), 20)
+
+        self.assertEqual(len(common.interleave_arrays("i", ())), 0)
+        with self.assertRaises(ValueError):
+            common.interleave_arrays("i", ([1, 2], [1]))
+
+    def test_overflow(self):
+        data = common.encode_typed_array([1, 2, 3], "I")
+        with self.assertRaises(ValueError):
+            common.decode_typed_array(data[:-1], 0, "I")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+import time
+import unittest
+
+from mixer.broadcaster.media_cache import map_file, MediaCache, write_file_atomic
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class TestMediaCache(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def files(self):
+        return sorted(path.name for path in self.directory.iterdir())
+
+    def test_add_lookup(self):
+        cache = MediaCache(self.directory)
+        data = b"image"
+        self.assertIsNone(cache.lookup(content_hash(data)))
+        cache_path = cache.add(content_hash(data), ".png", data, "/images/image.png")
+        self.assertEqual(cache_path, self.directory / (content_hash(data) + ".png"))
+        self.assertEqual(cache_path.read_bytes(), data)
+
+        # same content from another source
+        self.assertEqual(cache.add(content_hash(data), ".jpg", data, "/other/image.jpg"), cache_path)
+        self.assertEqual(cache.lookup(content_hash(data)), cache_path)
+        self.assertEqual(cache.lookup_source("/other/image.jpg"), content_hash(data))
+        self.assertEqual(cache.source(cache_path), "/images/image.png")
+        self.assertIsNone(cache.source(self.directory / "image.png"))
+        self.assertEqual(self.files(), [cache_path.name, "index.json"])
+
+        statistics = cache.statistics()
+        self.assertEqual((statistics["hits"], statistics["misses"]), (2, 2))
+        self.assertEqual(statistics["hit_bytes"], 2 * len(data))
+        self.assertEqual(statistics["added_bytes"], len(data))
+        self.assertEqual((statistics["count"], statistics["size"]), (1, len(data)))
+
+    def test_index(self):
+        cache = MediaCache(self.directory)
+        data = b"sound"
+        cache.add(content_hash(data), ".wav", data, "/sounds/sound.wav")
+
+        reloaded = MediaCache(self.directory)
+        self.assertEqual(reloaded.content_hashes(), [content_hash(data)])
+        self.assertEqual(reloaded.lookup_source("/sounds/sound.wav"), content_hash(data))
+        self.assertEqual(reloaded.source(reloaded.lookup(content_hash(data))), "/sounds/sound.wav")
+
+    def test_lru_eviction(self):
+        cache = MediaCache(self.directory, max_size=25)
+        media = [bytes([i]) * 10 for i in range(3)]
+        for i, data in enumerate(media[:2]):
+            cache.add(content_hash(data), ".png", data, f"/images/{i}.png")
+
+        # the media used by the process are not evicted
+        cache.add(content_hash(media[2]), ".png", media[2], "/images/2.png")
+        self.assertEqual(len(cache), 3)
+
+        other_process = MediaCache(self.directory)
+        other_process.lookup(content_hash(media[0]))
+        other_process.add(content_hash(b"other"), ".png", b"other", "/images/other.png")
+        other_process.set_max_size(15)
+        # the media used by the other process are kept, then the most recently used
+        expected = [content_hash(media[0]), content_hash(b"other")]
+        self.assertEqual(sorted(other_process.content_hashes()), sorted(expected))
+        self.assertIsNone(other_process.lookup_source("/images/1.png"))
+        self.assertEqual(other_process.statistics()["evicted_count"], 2)
+
+        # files evicted by another process
+        self.assertIsNone(cache.lookup(content_hash(media[1])))
+        cache.flush()
+        self.assertEqual(len(MediaCache(self.directory, max_size=100)), 2)
+
+    def test_pin(self):
+        cache = MediaCache(self.directory)
+        media = [bytes([i]) * 10 for i in range(3)]
+        for i, data in enumerate(media):
+            cache.add(content_hash(data), ".png", data, f"/images/{i}.png")
+
+        # the media announced to the server are not evicted while this process downloads other media
+        cache = MediaCache(self.directory, max_size=30)
+        self.assertEqual(sorted(cache.pin()), sorted(content_hash(data) for data in media))
+        cache.add(content_hash(b"downloaded"), ".png", b"downloaded", "/images/downloaded.png")
+        self.assertEqual(len(cache), 4)
+
+        cache.unpin()
+        cache.evict()
+        self.assertEqual(len(cache), 3)
+        self.assertIn(content_hash(b"downloaded"), cache)
+
+    def test_set_max_size(self):
+        cache = MediaCache(self.directory)
+        for i in range(4):
+            data = bytes([i]) * 10
+            cache.add(content_hash(data), ".png", data, f"/images/{i}.png")
+        cache = MediaCache(self.directory)
+        cache.set_max_size(20)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size, 20)
+
+    def test_reconcile(self):
+        data, unindexed = b"indexed", b"unindexed"
+        MediaCache(self.directory).add(content_hash(data), ".png", data, "/images/image.png")
+        # written by a process that did not update the index
+        write_file_atomic(self.directory / (content_hash(unindexed) + ".png"), unindexed)
+        (self.directory / "readme.txt").write_text("not a media")
+        stale = self.directory / "image.png1234.part"
+        stale.write_bytes(b"partial")
+        os.utime(stale, (time.time() - 2 * 24 * 3600,) * 2)
+
+        cache = MediaCache(self.directory)
+        self.assertEqual(sorted(cache.content_hashes()), sorted([content_hash(data), content_hash(unindexed)]))
+        self.assertFalse(stale.exists())
+        index = json.loads((self.directory / "index.json").read_text())
+        self.assertIn(content_hash(unindexed), index["entries"])
+
+    def test_legacy_layout(self):
+        data = b"legacy"
+        cache_path = self.directory / (content_hash(data) + ".png")
+        cache_path.write_bytes(data)
+        cache_path.with_suffix(".metadata").write_text("/images/legacy.png")
+        (self.directory / "0123.ref").write_text(cache_path.name)
+
+        cache = MediaCache(self.directory)
+        self.assertEqual(cache.source(cache_path), "/images/legacy.png")
+        self.assertEqual(self.files(), [cache_path.name, "index.json"])
+
+    def test_legacy_files(self):
+        # named after the sha1 of their source path by the versions without index
+        cache_path = self.directory / (hashlib.sha1(b"/images/legacy.png").hexdigest() + ".png")
+        cache_path.write_bytes(bytes(1000))
+        cache_path.with_suffix(".metadata").write_text("/images/legacy.png")
+
+        cache = MediaCache(self.directory)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.source(cache_path), "/images/legacy.png")
+        # not a content hash
+        self.assertEqual(cache.pin(), [])
+        cache.unpin()
+
+        cache = MediaCache(self.directory, max_size=10)
+        self.assertEqual(len(cache), 0)
+        self.assertFalse(cache_path.exists())
+
+    def test_corrupt_index(self):
+        data = b"image"
+        MediaCache(self.directory).add(content_hash(data), ".png", data, "/images/image.png")
+        (self.directory / "index.json").write_text("{")
+        self.assertEqual(MediaCache(self.directory).content_hashes(), [content_hash(data)])
+
+    def test_map(self):
+        cache = MediaCache(self.directory)
+        data = bytes(range(256))
+        cache.add(content_hash(data), ".png", data, "/images/image.png")
+        with cache.map(content_hash(data)) as mapped:
+            self.assertEqual(mapped[10:20], data[10:20])
+        with cache.map(content_hash(b"missing")) as mapped:
+            self.assertIsNone(mapped)
+
+        empty = self.directory / "empty"
+        empty.write_bytes(b"")
+        with map_file(empty) as mapped:
+            self.assertEqual(len(mapped), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
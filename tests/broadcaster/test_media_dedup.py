@@ -0,0 +1,175 @@
+import hashlib
+from pathlib import Path
+import tempfile
+import unittest
+
+from mixer.broadcaster.apps.server import Connection, Room, Server
+import mixer.broadcaster.common as common
+from mixer.broadcaster.room_journal import journal_paths
+
+
+def media_command(content, path="/images/image.png"):
+    # layout of mixer.blender_data.messages.BlenderMediaMessage
+    content_hash = hashlib.sha256(content).hexdigest()
+    data = common.encode_string(content_hash) + common.encode_string(path) + content
+    return common.Command(common.MessageType.BLENDER_DATA_MEDIA, data)
+
+
+class RecordingConnection(Connection):
+    def __init__(self, server, port):
+        super().__init__(server, None, ("127.0.0.1", port))
+        self.sent = []
+
+    def send_command(self, command):
+        self.sent.append(command)
+
+    def fetch_outgoing_commands(self):
+        self.sent.extend(self._command_queue.get_all())
+
+    def received(self, message_type=None):
+        self.fetch_outgoing_commands()
+        sent, self.sent = self.sent, []
+        return [command for command in sent if message_type is None or command.type == message_type]
+
+
+class TestMediaContentHash(unittest.TestCase):
+    def test_hash(self):
+        command = media_command(b"content" * 1000)
+        content_hash = hashlib.sha256(b"content" * 1000).hexdigest()
+        self.assertEqual(common.media_content_hash(command), content_hash)
+
+        compressed = common.compress_command(command, 0)
+        self.assertTrue(compressed.compressed)
+        self.assertEqual(common.media_content_hash(compressed), content_hash)
+
+    def test_no_hash(self):
+        self.assertIsNone(common.media_content_hash(common.Command(common.MessageType.BLENDER_DATA_MEDIA, b"")))
+        # data from an older version, that starts with the path
+        data = common.encode_string("/images/" + "a" * 200 + ".png") + bytes(10)
+        self.assertIsNone(common.media_content_hash(common.Command(common.MessageType.BLENDER_DATA_MEDIA, data)))
+
+
+class TestRoomMedia(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.room = Room(self.server, "room", "", "", False, True, None)
+        self.first = self.join(1)
+        self.second = self.join(2)
+
+    def join(self, port, media_hashes=()) -> RecordingConnection:
+        connection = RecordingConnection(self.server, port)
+        self.server._connections[connection.unique_id] = connection
+        if media_hashes:
+            command = common.Command(common.MessageType.MEDIA_HASHES, common.encode_string_array(list(media_hashes)))
+            connection.process_commands([command])
+        self.room.add_client(connection)
+        return connection
+
+    def test_one_copy_per_hash(self):
+        image = media_command(b"image")
+        self.room.add_command(image, self.first)
+        self.assertEqual(self.room.command_count(), 1)
+        self.assertEqual(len(self.second.received(common.MessageType.BLENDER_DATA_MEDIA)), 1)
+
+        # same content from another path or another client
+        self.room.add_command(media_command(b"image", "/other/image.png"), self.second)
+        self.room.add_command(media_command(b"image"), self.first)
+        self.assertEqual(self.room.command_count(), 1)
+        self.assertEqual(self.first.received(common.MessageType.BLENDER_DATA_MEDIA), [])
+        self.assertEqual(self.second.received(common.MessageType.BLENDER_DATA_MEDIA), [])
+
+        self.room.add_command(media_command(b"other image"), self.second)
+        self.assertEqual(self.room.command_count(), 2)
+        self.assertEqual(len(self.first.received(common.MessageType.BLENDER_DATA_MEDIA)), 1)
+
+    def test_join(self):
+        image, sound = media_command(b"image"), media_command(b"sound", "/sounds/sound.wav")
+        self.room.add_command(image, self.first)
+        self.room.add_command(sound, self.first)
+        image_hash, sound_hash = common.media_content_hash(image), common.media_content_hash(sound)
+
+        joiner = self.join(3, [image_hash, "not in room"])
+        received = joiner.received()
+        media = [command for command in received if command.type == common.MessageType.BLENDER_DATA_MEDIA]
+        self.assertEqual([common.media_content_hash(command) for command in media], [sound_hash])
+
+        types = [command.type for command in received]
+        self.assertEqual(types[-2:], [common.MessageType.MEDIA_HASHES, common.MessageType.JOIN_ROOM])
+        room_hashes, _ = common.decode_string_array(received[-2].data, 0)
+        self.assertEqual(set(room_hashes), {image_hash, sound_hash})
+
+        # the joiner received it, it is not sent again
+        self.assertIn(sound_hash, joiner.media_hashes)
+
+        other_joiner = self.join(4)
+        self.assertEqual(len(other_joiner.received(common.MessageType.BLENDER_DATA_MEDIA)), 2)
+
+    def test_stored_data(self):
+        # a view on the receive buffer of the connection
+        buffer = memoryview(bytearray(b"padding" + media_command(b"image").data + b"padding"))
+        command = common.Command(common.MessageType.BLENDER_DATA_MEDIA, buffer[7:-7])
+        self.room.add_command(command, self.first)
+        self.assertIsInstance(self.room._commands[0].data, bytes)
+        self.assertEqual(self.room._commands[0].data, bytes(command.data))
+
+    def test_announce_replaces(self):
+        connection = RecordingConnection(self.server, 3)
+        for media_hashes in (["evicted", "kept"], ["kept"]):
+            command = common.Command(common.MessageType.MEDIA_HASHES, common.encode_string_array(media_hashes))
+            connection.process_commands([command])
+        # the client may have evicted media since its previous announce
+        self.assertEqual(connection.media_hashes, {"kept"})
+
+    def test_recover_journal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            room = Room(self.server, "journaled", "", "", False, True, None)
+            room.start_journal(Path(directory))
+            image = media_command(b"image")
+            room.add_command(image, self.first)
+
+            recovered = Room(self.server, "journaled", "", "", False, True, None)
+            recovered.recover_journal(journal_paths(Path(directory))[0])
+            self.assertEqual(recovered.media_hashes, {common.media_content_hash(image)})
+            recovered.add_command(media_command(b"image"), self.first)
+            self.assertEqual(recovered.command_count(), 1)
+            room.close()
+
+
+class TestRoomGroups(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.room = Room(self.server, "room", "", "", False, True, None)
+        self.sender = RecordingConnection(self.server, 1)
+        self.receiver = RecordingConnection(self.server, 2)
+        for connection in (self.sender, self.receiver):
+            self.server._connections[connection.unique_id] = connection
+            self.room.add_client(connection)
+            connection.received()
+
+    def test_sender_leaves(self):
+        self.room.add_command(common.Command(common.MessageType.GROUP_BEGIN, common.encode_int(0)), self.sender)
+        self.room.add_command(common.Command(common.MessageType.GROUP_BEGIN, common.encode_int(0)), self.sender)
+        self.room.add_command(common.Command(common.MessageType.GROUP_END), self.sender)
+        self.room.remove_client(self.sender)
+
+        types = [command.type for command in self.receiver.received()]
+        self.assertEqual(types.count(common.MessageType.GROUP_END), 2)
+        # the joining clients receive the closed group
+        types = [command.type for command in self.room._commands]
+        self.assertEqual(types.count(common.MessageType.GROUP_BEGIN), types.count(common.MessageType.GROUP_END))
+
+    def test_recover_journal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            room = Room(self.server, "journaled", "", "", False, True, None)
+            room.start_journal(Path(directory))
+            room.add_command(common.Command(common.MessageType.GROUP_BEGIN, common.encode_int(0)), self.sender)
+
+            recovered = Room(self.server, "journaled", "", "", False, True, None)
+            recovered.recover_journal(journal_paths(Path(directory))[0])
+            self.assertEqual(recovered._commands[-1].type, common.MessageType.GROUP_END)
+            self.assertEqual(recovered.command_count(), 2)
+            room.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
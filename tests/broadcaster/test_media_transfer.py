@@ -0,0 +1,225 @@
+import hashlib
+from pathlib import Path
+import tempfile
+import unittest
+
+from mixer.broadcaster.apps.server import Room, Server
+from mixer.broadcaster.client import Client
+import mixer.broadcaster.common as common
+from mixer.broadcaster.media_transfer import (
+    decode_media_begin,
+    decode_media_chunk,
+    decode_media_end,
+    MediaDownload,
+    MediaTransferError,
+    MediaUpload,
+)
+from mixer.broadcaster.room_journal import journal_paths
+
+from tests.broadcaster.test_media_dedup import RecordingConnection
+
+MessageType = common.MessageType
+
+
+def received_media(connection: RecordingConnection):
+    return [command for command in connection.received() if command.type in common.MEDIA_MESSAGE_TYPES]
+
+
+def upload_of(content: bytes, chunk_size: int = 4) -> MediaUpload:
+    return MediaUpload(hashlib.sha256(content).hexdigest(), "/images/image.png", content, chunk_size)
+
+
+class TestMediaUpload(unittest.TestCase):
+    def test_commands(self):
+        content = b"0123456789"
+        upload = upload_of(content)
+        commands = list(upload.commands())
+        types = [command.type for command in commands]
+        self.assertEqual(types, [MessageType.MEDIA_BEGIN] + [MessageType.MEDIA_CHUNK] * 3 + [MessageType.MEDIA_END])
+        for command in commands:
+            self.assertEqual(common.media_content_hash(command), upload.content_hash)
+
+        self.assertEqual(decode_media_begin(commands[0].data), (upload.content_hash, "/images/image.png", 10))
+        chunks = [decode_media_chunk(command.data) for command in commands[1:-1]]
+        self.assertEqual([offset for _, offset, _ in chunks], [0, 4, 8])
+        self.assertEqual(b"".join(bytes(chunk) for _, _, chunk in chunks), content)
+        self.assertEqual(decode_media_end(commands[-1].data), upload.content_hash)
+
+    def test_file_source(self):
+        content = bytes(range(256)) * 10
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "image.png"
+            path.write_bytes(content)
+            upload = MediaUpload(hashlib.sha256(content).hexdigest(), "image.png", str(path), 1000)
+            self.assertEqual(upload.size, len(content))
+            chunks = [decode_media_chunk(command.data)[2] for command in upload.commands()][1:-1]
+            self.assertEqual([len(chunk) for chunk in chunks], [1000, 1000, 560])
+            self.assertEqual(b"".join(bytes(chunk) for chunk in chunks), content)
+
+
+class TestMediaDownload(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+        self.file_path = self.directory / "media" / "image.png"
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def download(self, content: bytes, size=None) -> MediaDownload:
+        size = len(content) if size is None else size
+        return MediaDownload(hashlib.sha256(content).hexdigest(), size, self.file_path)
+
+    def test_download(self):
+        content = b"0123456789"
+        download = self.download(content)
+        for command in upload_of(content).commands():
+            if command.type == MessageType.MEDIA_CHUNK:
+                _, offset, chunk = decode_media_chunk(command.data)
+                download.write(offset, chunk)
+                self.assertFalse(self.file_path.exists())
+        download.finish()
+        self.assertEqual(self.file_path.read_bytes(), content)
+        self.assertEqual([path.name for path in self.file_path.parent.iterdir()], ["image.png"])
+
+    def test_corrupt(self):
+        download = self.download(b"0123456789")
+        download.write(0, b"01234")
+        with self.assertRaises(MediaTransferError):
+            download.write(6, b"6789")
+        download.write(5, b"X6789")
+        with self.assertRaises(MediaTransferError):
+            download.write(10, b"0")
+        with self.assertRaises(MediaTransferError):
+            download.finish()
+        self.assertEqual(list(self.file_path.parent.iterdir()), [])
+
+    def test_abort(self):
+        download = self.download(b"0123456789")
+        download.write(0, b"01234")
+        download.abort()
+        self.assertEqual(list(self.file_path.parent.iterdir()), [])
+
+
+class TestClientMediaUpload(unittest.TestCase):
+    def test_interleaving(self):
+        client = Client()
+        client.media_bytes_per_fetch = 1  # one command per fetch
+        create = common.Command(MessageType.BLENDER_DATA_CREATE, b"create")
+        client.add_media_upload(upload_of(bytes(400), 100), [create])
+        self.assertTrue(client.has_media_uploads())
+
+        client._queue_media_chunks()
+        self.assertEqual([command.type for command in client.pending_commands], [MessageType.MEDIA_BEGIN])
+        client.pending_commands.clear()
+
+        # commands added during the upload are sent with the chunks, the creation after the media
+        transform = common.Command(MessageType.BLENDER_DATA_UPDATE, b"transform")
+        client.add_command(transform)
+        client._queue_media_chunks()
+        self.assertEqual(
+            [command.type for command in client.pending_commands],
+            [MessageType.BLENDER_DATA_UPDATE, MessageType.MEDIA_CHUNK],
+        )
+        client.pending_commands.clear()
+
+        while client.has_media_uploads():
+            client._queue_media_chunks()
+        self.assertEqual(
+            [command.type for command in client.pending_commands],
+            [MessageType.MEDIA_CHUNK] * 3 + [MessageType.MEDIA_END, MessageType.BLENDER_DATA_CREATE],
+        )
+
+    def test_leave_room(self):
+        client = Client()
+        client.add_media_upload(upload_of(bytes(400), 100))
+        client.send_command = lambda command: True
+        client.leave_room("room")
+        self.assertFalse(client.has_media_uploads())
+
+
+class TestRoomMediaTransfer(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.room = Room(self.server, "room", "", "", False, True, None)
+        self.first = self.join(1)
+        self.second = self.join(2)
+
+    def join(self, port) -> RecordingConnection:
+        connection = RecordingConnection(self.server, port)
+        self.server._connections[connection.unique_id] = connection
+        self.room.add_client(connection)
+        return connection
+
+    def send(self, commands, sender, room=None):
+        for command in commands:
+            (room or self.room).add_command(command, sender)
+
+    def test_one_copy_per_hash(self):
+        upload = upload_of(b"0123456789")
+        self.send(upload.commands(), self.first)
+        self.assertEqual(self.room.command_count(), 5)
+        self.assertEqual(len(received_media(self.second)), 5)
+        self.assertIn(upload.content_hash, self.second.media_hashes)
+
+        # the same media, in chunks or not
+        self.send(upload.commands(), self.second)
+        self.send(upload_of(b"0123456789", 3).commands(), self.first)
+        self.assertEqual(self.room.command_count(), 5)
+        self.assertEqual(received_media(self.first), [])
+        self.assertEqual(received_media(self.second), [])
+
+        # a transfer stored after the join of a client that has the media is not sent to it
+        joiner = self.join(3)
+        self.assertEqual(len(received_media(joiner)), 5)
+        other = upload_of(b"other")
+        joiner.media_hashes.add(other.content_hash)
+        self.send(other.commands(), self.first)
+        self.assertEqual(received_media(joiner), [])
+        self.assertEqual(len(received_media(self.second)), 4)
+
+    def test_interrupted(self):
+        upload = upload_of(b"0123456789")
+        commands = list(upload.commands())
+        self.send(commands[:2], self.first)
+        self.room.remove_client(self.first)
+        self.assertNotIn(upload.content_hash, self.room.media_hashes)
+        self.assertNotIn(upload.content_hash, self.second.media_hashes)
+
+        self.send(commands, self.second)
+        self.assertEqual(self.room.command_count(), 7)
+        self.assertIn(upload.content_hash, self.room.media_hashes)
+
+        # the commands of the interrupted transfer are not sent to joining clients
+        self.room.update_checkpoint()
+        self.assertEqual(len(received_media(self.join(3))), 5)
+        self.room.compact()
+        self.assertEqual(self.room.command_count(), 5)
+
+    def test_interrupted_not_resent(self):
+        upload = upload_of(b"0123456789")
+        self.send(list(upload.commands())[:2], self.first)
+        self.room.remove_client(self.first)
+        self.room.compact()
+        self.assertEqual(self.room.command_count(), 0)
+
+    def test_recover_journal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            room = Room(self.server, "journaled", "", "", False, True, None)
+            room.start_journal(Path(directory))
+            complete, interrupted = upload_of(b"complete"), upload_of(b"interrupted")
+            self.send(complete.commands(), self.first, room)
+            self.send(list(interrupted.commands())[:2], self.second, room)
+
+            recovered = Room(self.server, "journaled", "", "", False, True, None)
+            recovered.recover_journal(journal_paths(Path(directory))[0])
+            self.assertEqual(recovered.media_hashes, {complete.content_hash})
+            self.assertEqual(recovered.command_count(), 6)
+            recovered.compact()
+            self.assertEqual(recovered.command_count(), 4)
+            room.close()
+            recovered.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
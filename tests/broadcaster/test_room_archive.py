@@ -0,0 +1,156 @@
+import json
+from pathlib import Path
+import tempfile
+import unittest
+
+import mixer.broadcaster.common as common
+from mixer.broadcaster.room_archive import (
+    ARCHIVE_VERSION,
+    RoomArchive,
+    RoomArchiveError,
+    datablock_uuids,
+    is_archive,
+    read_attributes,
+    write_archive,
+)
+from mixer.broadcaster.room_bake import load_room
+
+
+def proxy_message(message_type, proxy):
+    # layout of mixer.blender_data.messages.BlenderDataMessage, without soas and arrays
+    data = common.encode_string(json.dumps(proxy)) + common.encode_int(0) + common.encode_int(0)
+    return common.Command(message_type, data)
+
+
+def datablock(uuid, collection, data=None):
+    proxy = {"__mixer_class__": "DatablockProxy", "_datablock_uuid": uuid, "_bpy_data_collection": collection}
+    proxy["_data"] = data or {}
+    return proxy
+
+
+def create(uuid, collection, data=None):
+    return proxy_message(common.MessageType.BLENDER_DATA_CREATE, datablock(uuid, collection, data))
+
+
+def update(uuid, collection):
+    return proxy_message(
+        common.MessageType.BLENDER_DATA_UPDATE, {"__mixer_class__": "DeltaUpdate", "value": datablock(uuid, collection)}
+    )
+
+
+def remove(uuid):
+    data = common.encode_string(uuid) + common.encode_string("debug")
+    return common.Command(common.MessageType.BLENDER_DATA_REMOVE, data)
+
+
+def rename(*items):
+    return common.Command(common.MessageType.BLENDER_DATA_RENAME, common.encode_string_array(list(items)))
+
+
+def write_legacy(path, attributes, commands):
+    with open(path, "wb") as f:
+        f.write(common.encode_json(attributes))
+        for command in commands:
+            f.write(command.to_byte_buffer())
+
+
+class TestRoomArchive(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = str(Path(self._directory.name) / "room.mixer")
+        self.attributes = {common.RoomAttributes.NAME: "room", "custom": [1, 2]}
+        self.commands = [
+            create("uuid_mesh", "meshes"),
+            create("uuid_object", "objects"),
+            update("uuid_mesh", "meshes"),
+            common.Command(common.MessageType.FRAME, common.encode_int(10)),
+            common.compress_command(create("uuid_image", "images", {"name": "x" * 2000}), 0),
+            rename("uuid_mesh", "Mesh", "Mesh.001", "uuid_object", "Cube", "Cube.001"),
+            update("uuid_mesh", "meshes"),
+            remove("uuid_object"),
+        ]
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def check_archive(self, archive: RoomArchive):
+        self.assertEqual(archive.attributes, self.attributes)
+        self.assertEqual(len(archive), len(self.commands))
+        for sequence in (7, 0, 4, 3):
+            command = archive[sequence]
+            expected = self.commands[sequence]
+            self.assertEqual(command.type, expected.type)
+            self.assertEqual(command.compressed, expected.compressed)
+            self.assertEqual(bytes(command.data), bytes(expected.data))
+
+        self.assertEqual(archive.sequences_of_type(common.MessageType.BLENDER_DATA_UPDATE), [2, 6])
+        self.assertEqual(archive.sequences_of_type(common.MessageType.BLENDER_DATA_MEDIA), [])
+        self.assertEqual(archive.sequences_of_uuid("uuid_mesh"), [0, 2, 5, 6])
+        self.assertEqual(archive.sequences_of_uuid("uuid_object"), [1, 5, 7])
+        self.assertEqual(archive.sequences_of_uuid("uuid_image"), [4])
+        self.assertEqual(archive.sequences_of_uuid("unknown"), [])
+        self.assertEqual(archive.uuids(), ["uuid_mesh", "uuid_object", "uuid_image"])
+        self.assertEqual(archive.collection("uuid_object"), "objects")
+        self.assertEqual(archive.command_uuids(5), ["uuid_mesh", "uuid_object"])
+
+        statistics = archive.statistics()
+        self.assertEqual(statistics["commands"], len(self.commands))
+        self.assertEqual(statistics["bytes"], sum(command.byte_size() for command in self.commands))
+        self.assertEqual(statistics["datablocks"], 3)
+        self.assertEqual(statistics["types"]["BLENDER_DATA_UPDATE"]["count"], 2)
+        self.assertEqual(statistics["types"]["BLENDER_DATA_CREATE"]["compressed"], 1)
+        self.assertEqual(statistics["collections"]["meshes"]["count"], 4)
+        self.assertEqual(statistics["collections"]["meshes"]["datablocks"], 2)
+        self.assertEqual(statistics["collections"]["objects"]["count"], 2)
+        self.assertEqual(statistics["collections"]["images"]["count"], 1)
+
+    def test_archive(self):
+        self.assertEqual(write_archive(self.attributes, iter(self.commands), self.path), len(self.commands))
+        self.assertTrue(is_archive(self.path))
+        self.assertEqual(read_attributes(self.path), self.attributes)
+        with RoomArchive(self.path) as archive:
+            self.assertEqual(archive.version, ARCHIVE_VERSION)
+            self.assertTrue(archive.indexed)
+            self.check_archive(archive)
+
+    def test_legacy(self):
+        write_legacy(self.path, self.attributes, self.commands)
+        self.assertFalse(is_archive(self.path))
+        self.assertEqual(read_attributes(self.path), self.attributes)
+        with RoomArchive(self.path) as archive:
+            self.assertEqual(archive.version, 0)
+            self.assertFalse(archive.indexed)
+            self.check_archive(archive)
+
+        attributes, commands = load_room(self.path)
+        self.assertEqual(attributes, self.attributes)
+        self.assertEqual(len(commands), len(self.commands))
+
+    def test_missing_index(self):
+        write_archive(self.attributes, self.commands, self.path)
+        with RoomArchive(self.path) as archive:
+            end = archive.entries[-1].offset + archive.entries[-1].byte_size
+        with open(self.path, "r+b") as f:
+            f.truncate(end)
+        with RoomArchive(self.path) as archive:
+            self.assertFalse(archive.indexed)
+            self.check_archive(archive)
+
+    def test_unsupported_version(self):
+        write_archive(self.attributes, self.commands, self.path)
+        with open(self.path, "r+b") as f:
+            f.seek(4)
+            f.write(common.int_to_bytes(ARCHIVE_VERSION + 1, 4))
+        with self.assertRaises(RoomArchiveError):
+            RoomArchive(self.path)
+
+    def test_datablock_uuids(self):
+        self.assertEqual(datablock_uuids(update("uuid", "meshes")), (["uuid"], "meshes"))
+        self.assertEqual(datablock_uuids(remove("uuid")), (["uuid"], None))
+        self.assertEqual(datablock_uuids(self.commands[3]), ([], None))
+        delta = proxy_message(common.MessageType.BLENDER_DATA_UPDATE, {"__mixer_class__": "DeltaReplace"})
+        self.assertEqual(datablock_uuids(delta), ([], None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+from pathlib import Path
+import tempfile
+import unittest
+
+import mixer.broadcaster.common as common
+from mixer.broadcaster.room_bake import iter_room_file, load_room, read_room_attributes, save_room
+
+
+class TestRoomFile(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = str(Path(self._directory.name) / "room.mixer")
+        self.attributes = {common.RoomAttributes.COMMAND_COUNT: 10, "custom": [1, 2]}
+        self.commands = [common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes([i]) * i, i) for i in range(10)]
+        create = common.Command(common.MessageType.BLENDER_DATA_CREATE, bytes(1000))
+        self.commands.append(common.compress_command(create, 0))
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_round_trip(self):
+        save_room(self.attributes, iter(self.commands), self.path)
+        self.assertEqual(read_room_attributes(self.path), self.attributes)
+
+        commands = list(iter_room_file(self.path))
+        self.assertEqual(len(commands), len(self.commands))
+        for command, expected in zip(commands, self.commands):
+            self.assertEqual(command.type, expected.type)
+            self.assertEqual(command.id, expected.id)
+            self.assertEqual(command.compressed, expected.compressed)
+            self.assertEqual(bytes(command.data), bytes(expected.data))
+
+        attributes, commands = load_room(self.path)
+        self.assertEqual(attributes, self.attributes)
+        self.assertEqual(len(commands), len(self.commands))
+
+    def test_truncated(self):
+        # legacy layout, like a room journal
+        with open(self.path, "wb") as f:
+            f.write(common.encode_json(self.attributes))
+            for command in self.commands[:3]:
+                f.write(command.to_byte_buffer())
+            f.write(self.commands[5].to_byte_buffer()[:-2])
+        self.assertEqual(len(list(iter_room_file(self.path))), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,339 @@
+import json
+from pathlib import Path
+import tempfile
+import unittest
+
+from mixer.broadcaster.apps.server import Room, Server
+import mixer.broadcaster.common as common
+from mixer.broadcaster.media_transfer import MediaUpload
+from mixer.broadcaster.room_compaction import RoomCompactor, update_signature
+from mixer.broadcaster.room_journal import checkpoint_path, journal_paths
+
+
+def delta_update(value):
+    return {"__mixer_class__": "DeltaUpdate", "value": value}
+
+
+def struct_update(data):
+    return delta_update({"__mixer_class__": "StructProxy", "_data": data})
+
+
+def datablock_message(message_type, proxy, soas=None):
+    # layout of mixer.blender_data.messages.BlenderDataMessage
+    data = common.encode_string(json.dumps(proxy))
+    soas = soas or {}
+    data += common.encode_int(len(soas))
+    for path, names in soas.items():
+        data += common.encode_string(path) + common.encode_int(len(names))
+        for name in names:
+            data += common.encode_string(name) + common.encode_string("f") + common.encode_int(4) + bytes(4)
+    data += common.encode_int(0)
+    return common.Command(message_type, data)
+
+
+def create(uuid, name="Cube"):
+    proxy = {"__mixer_class__": "DatablockProxy", "_datablock_uuid": uuid, "_data": {"name": name}}
+    return datablock_message(common.MessageType.BLENDER_DATA_CREATE, proxy)
+
+
+def update(uuid, data, soas=None):
+    proxy = delta_update({"__mixer_class__": "DatablockProxy", "_datablock_uuid": uuid, "_data": data})
+    return datablock_message(common.MessageType.BLENDER_DATA_UPDATE, proxy, soas)
+
+
+def remove(uuid):
+    return common.Command(
+        common.MessageType.BLENDER_DATA_REMOVE, common.encode_string(uuid) + common.encode_string("debug")
+    )
+
+
+class TestRoomCompactor(unittest.TestCase):
+    def test_signature(self):
+        command = update(
+            "u1",
+            {"location": delta_update([1.0, 2.0, 3.0]), "display": struct_update({"show_shadows": delta_update(True)})},
+            {"vertices": ["co"]},
+        )
+        uuid, paths = update_signature(command.data)
+        self.assertEqual(uuid, "u1")
+        self.assertEqual(paths, {("location",), ("display", "show_shadows"), ("#soa", "vertices", "co")})
+
+        addition = update("u1", {"modifiers": {"__mixer_class__": "DeltaAddition", "value": 1}})
+        self.assertIsNone(update_signature(addition.data))
+
+    def test_superseded_updates(self):
+        commands = [
+            create("u1"),
+            update("u1", {"location": delta_update([0.0, 0.0, 0.0])}),
+            update("u2", {"location": delta_update([0.0, 0.0, 0.0])}),
+            update("u1", {"location": delta_update([1.0, 0.0, 0.0]), "scale": delta_update([1.0, 1.0, 1.0])}),
+            # does not overwrite scale
+            update("u1", {"location": delta_update([2.0, 0.0, 0.0])}),
+            update("u1", {"location": delta_update([3.0, 0.0, 0.0])}),
+        ]
+        compactor = RoomCompactor()
+        self.assertEqual(compactor.scan(commands), [1, 4])
+
+        commands = [command for i, command in enumerate(commands) if i not in (1, 4)]
+        compactor.purged()
+        commands.append(update("u1", {"location": delta_update([4.0, 0.0, 0.0])}))
+        self.assertEqual(compactor.scan(commands), [3])
+
+    def test_soa_spans(self):
+        # an update with only some ranges of an array does not overwrite the previous array
+        spans = (
+            common.encode_string("co")
+            + common.encode_string("spans")
+            + common.encode_string("f")
+            + common.encode_int(3)
+            + common.encode_int(1)
+            + common.encode_int(1)
+            + common.encode_int(4)
+            + bytes(4)
+        )
+        data = common.encode_string(json.dumps(delta_update({"_datablock_uuid": "u1", "_data": {}})))
+        data += common.encode_int(1) + common.encode_string("vertices") + common.encode_int(1) + spans
+        data += common.encode_int(0)
+        span_update = common.Command(common.MessageType.BLENDER_DATA_UPDATE, data)
+        self.assertIsNone(update_signature(span_update.data))
+
+        commands = [create("u1"), update("u1", {}, {"vertices": ["co"]}), span_update]
+        self.assertEqual(RoomCompactor().scan(commands), [])
+
+    def test_removed_datablock(self):
+        commands = [
+            create("u1"),
+            update("u1", {"location": delta_update([0.0, 0.0, 0.0])}),
+            create("u2"),
+            remove("u1"),
+            # u2 has no create in the history
+            remove("u3"),
+        ]
+        compactor = RoomCompactor()
+        self.assertEqual(compactor.scan(commands), [0, 1, 3])
+
+    def test_referenced_datablock(self):
+        commands = [
+            create("u1"),
+            update("u2", {"data": delta_update({"__mixer_class__": "DatablockRefProxy", "_datablock_uuid": "u1"})}),
+            remove("u1"),
+        ]
+        compactor = RoomCompactor()
+        self.assertEqual(compactor.scan(commands), [])
+
+    def test_references_after_purge(self):
+        reference = {"__mixer_class__": "DatablockRefProxy", "_datablock_uuid": "u1"}
+        commands = [
+            create("u1"),
+            create("u2"),
+            update("u2", {"data": delta_update(reference)}),
+            update("u2", {"data": delta_update(reference)}),
+            create("u3"),
+            remove("u3"),
+        ]
+        compactor = RoomCompactor()
+        self.assertEqual(compactor.scan(commands), [2, 4, 5])
+        commands = [command for i, command in enumerate(commands) if i not in (2, 4, 5)]
+        compactor.purged()
+
+        # the reference of the remaining update is still known after the purge
+        commands.append(remove("u1"))
+        self.assertEqual(compactor.scan(commands), [])
+
+        # the referencing commands are dropped with u2
+        commands.append(remove("u2"))
+        self.assertEqual(compactor.scan(commands), [1, 2, 4])
+
+    def test_interrupted_media(self):
+        compactor = RoomCompactor()
+        # 4 chunks per transfer
+        first, second, third = [list(MediaUpload(name * 64, "/image.png", bytes(8), 2).commands()) for name in "abc"]
+        commands = [create("u1")] + first[:3]
+        self.assertEqual(compactor.scan(commands), [])
+
+        # the first media is sent again while the second one is sent
+        compactor.interrupted("a" * 64)
+        commands.extend(second + first[:2])
+        self.assertEqual(compactor.scan(commands), [1, 2, 3])
+        compactor.purged()
+        del commands[1:4]
+
+        # the transfer in progress is kept
+        commands.extend(first[2:])
+        self.assertEqual(compactor.scan(commands), [])
+
+        # interrupted before and after the scan of its commands
+        commands.extend(third[:2])
+        compactor.interrupted("c" * 64)
+        self.assertEqual(compactor.scan(commands), [13, 14])
+        compactor.purged()
+        del commands[13:15]
+
+        commands.extend(third[:3])
+        compactor.interrupted("c" * 64)
+        self.assertEqual(compactor.scan(commands), [13, 14, 15])
+
+
+class TestRoomCompact(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _test_compact(self, room: Room):
+        commands = [create("u1")] + [update("u1", {"location": delta_update([float(i), 0.0, 0.0])}) for i in range(10)]
+        for command in commands:
+            room._commands.append(command)
+            room.byte_size += command.byte_size()
+
+        reclaimed = room.compact()
+        self.assertEqual(reclaimed, sum(command.byte_size() for command in commands[1:-1]))
+        self.assertEqual(room.command_count(), 2)
+        self.assertEqual(room.byte_size, commands[0].byte_size() + commands[-1].byte_size())
+        self.assertEqual(bytes(room._commands[1].data), commands[-1].data)
+
+        # nothing new
+        self.assertEqual(room.compact(), 0)
+
+        room._commands.append(remove("u1"))
+        room.compact()
+        self.assertEqual(room.command_count(), 0)
+
+    def test_compact(self):
+        server = Server()
+        room = Room(server, "room", "", "", False, True, None)
+        self._test_compact(room)
+
+    def test_compact_journal(self):
+        server = Server()
+        room = Room(server, "room", "", "", False, True, None)
+        room.start_journal(self.directory)
+        self._test_compact(room)
+
+        room.close()
+
+    def test_joining(self):
+        server = Server()
+        room = Room(server, "room", "", "", False, True, None)
+        room._commands.extend([update("u1", {"location": delta_update([float(i), 0.0, 0.0])}) for i in range(2)])
+        room.join_count = 1
+        self.assertEqual(room.compact(), 0)
+        room.join_count = 0
+        self.assertGreater(room.compact(), 0)
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self._server = server
+        self.unique_id = "fake"
+        self.address = ("127.0.0.1", 0)
+        self.room = None
+        self.commands = []
+
+    def send_command(self, command):
+        self.commands.append(command)
+
+    def add_command(self, command, bounded=True):
+        self.commands.append(command)
+
+    def add_room_command(self, command, bounded=True):
+        self.commands.append(command)
+
+    def fetch_outgoing_commands(self):
+        pass
+
+
+class TestRoomCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.room = Room(self.server, "room", "", "", False, True, None)
+        self.sender = FakeConnection(self.server)
+
+    def _join(self):
+        connection = FakeConnection(self.server)
+        self.room.add_client(connection)
+        self.room.remove_client(connection)
+        types = [command.type for command in connection.commands]
+        self.assertEqual(types[0], common.MessageType.CLEAR_CONTENT)
+        self.assertEqual(types[-1], common.MessageType.JOIN_ROOM)
+        return [bytes(command.data) for command in connection.commands[1:-1]]
+
+    def test_join(self):
+        commands = [create("u1")] + [update("u1", {"location": delta_update([float(i), 0.0, 0.0])}) for i in range(10)]
+        for command in commands:
+            self.room.add_command(command, self.sender)
+
+        self.assertFalse(self.room.update_checkpoint(20))
+        self.assertTrue(self.room.update_checkpoint())
+        self.assertFalse(self.room.update_checkpoint())
+        self.assertEqual(self._join(), [commands[0].data, commands[-1].data])
+        # the history is unchanged
+        self.assertEqual(self.room.command_count(), len(commands))
+
+        tail = update("u1", {"location": delta_update([0.0, 1.0, 0.0])})
+        self.room.add_command(tail, self.sender)
+        self.assertEqual(self._join(), [commands[0].data, commands[-1].data, tail.data])
+
+        self.assertTrue(self.room.update_checkpoint())
+        self.assertEqual(self._join(), [commands[0].data, tail.data])
+
+    def test_merged_command(self):
+        transforms = [
+            common.Command(common.MessageType.TRANSFORM, common.encode_string("path") + bytes([i])) for i in range(2)
+        ]
+        self.room.add_command(transforms[0], self.sender)
+        self.room.update_checkpoint()
+        # replaces the last history command, which is in the checkpoint
+        self.room.add_command(transforms[1], self.sender)
+        self.assertEqual(self._join(), [transforms[0].data, transforms[1].data])
+
+    def test_compaction(self):
+        commands = [create("u1")] + [update("u1", {"location": delta_update([float(i), 0.0, 0.0])}) for i in range(4)]
+        for command in commands[:3]:
+            self.room.add_command(command, self.sender)
+        self.room.update_checkpoint()
+        for command in commands[3:]:
+            self.room.add_command(command, self.sender)
+        self.room.compact()
+        self.assertEqual(self.room.command_count(), 2)
+        self.assertEqual(self._join(), [commands[0].data, commands[2].data, commands[4].data])
+
+
+class TestRoomCheckpointJournal(TestRoomCheckpoint):
+    def setUp(self):
+        super().setUp()
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+        self.room.start_journal(self.directory)
+
+    def tearDown(self):
+        self.room.close()
+        self._directory.cleanup()
+
+    def test_checkpoint_file(self):
+        commands = [create("u1")] + [update("u1", {"location": delta_update([float(i), 0.0, 0.0])}) for i in range(4)]
+        for command in commands:
+            self.room.add_command(command, self.sender)
+        self.room.update_checkpoint()
+        self.assertEqual(len(self.room._checkpoint), 2)
+        self.assertTrue(checkpoint_path(self.room._journal.path).exists())
+        # not recovered as a room
+        self.assertEqual(journal_paths(self.directory), [self.room._journal.path])
+
+        # joining clients read the checkpoint file
+        self.room.add_command(update("u1", {"location": delta_update([0.0, 1.0, 0.0])}), self.sender)
+        self.room.join_count = 1
+        self.assertFalse(self.room.update_checkpoint())
+        self.room.join_count = 0
+        self.assertTrue(self.room.update_checkpoint())
+        self.assertEqual(len(self.room._checkpoint), 2)
+
+        path = self.room._journal.path
+        self.room.close()
+        self.assertFalse(checkpoint_path(path).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+from pathlib import Path
+import tempfile
+import unittest
+from unittest import mock
+
+from mixer.broadcaster.apps.server import _supersedes
+import mixer.broadcaster.common as common
+from mixer.broadcaster.room_bake import load_room
+from mixer.broadcaster import room_journal
+from mixer.broadcaster.room_journal import RoomJournal, journal_paths, room_name_from_path
+
+
+class TestRoomJournal(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_append_pop(self):
+        journal = RoomJournal.create(self.directory, "room", {"a": 1})
+        commands = [common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes([i]) * i) for i in range(10)]
+        for command in commands:
+            journal.append(command)
+        self.assertEqual(len(journal), 10)
+        popped = journal.pop()
+        self.assertEqual(bytes(popped.data), commands[-1].data)
+        self.assertEqual(len(journal), 9)
+
+        for i, command in enumerate(commands[:-1]):
+            self.assertEqual(journal[i].type, command.type)
+            self.assertEqual(journal[i].id, command.id)
+            self.assertEqual(bytes(journal[i].data), command.data)
+        journal.close()
+
+    def test_recover(self):
+        journal = RoomJournal.create(self.directory, "room/1", {"a": 1})
+        journal.append(common.Command(common.MessageType.BLENDER_DATA_CREATE, b"create"))
+        transforms = [
+            common.Command(common.MessageType.TRANSFORM, common.encode_string("path") + bytes([i])) for i in range(3)
+        ]
+        for command in transforms:
+            journal.append(command)
+        journal.save_attributes({"a": 2, common.RoomAttributes.KEEP_OPEN: True})
+        journal.close()
+
+        paths = journal_paths(self.directory)
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(room_name_from_path(paths[0]), "room/1")
+
+        attributes, journal = RoomJournal.recover(paths[0], _supersedes)
+        self.assertEqual(attributes, {"a": 2, common.RoomAttributes.KEEP_OPEN: True})
+        # consecutive transforms of the same path are merged
+        self.assertEqual(len(journal), 2)
+        self.assertEqual(bytes(journal[1].data), transforms[-1].data)
+        journal.close()
+
+        # journals are room files
+        attributes, commands = load_room(str(paths[0]))
+        self.assertEqual(attributes, {"a": 1})
+        self.assertEqual(len(commands), 4)
+
+    def test_drop(self):
+        journal = RoomJournal.create(self.directory, "room", {"a": 1})
+        commands = [common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes([i]) * i) for i in range(10)]
+        for command in commands:
+            journal.append(command)
+        before = journal[1]
+        journal.drop([1, 3, 5])
+        self.assertEqual(bytes(before.data), commands[1].data)
+
+        kept = [command for i, command in enumerate(commands) if i not in (1, 3, 5)]
+        self.assertEqual([bytes(journal[i].data) for i in range(len(journal))], [c.data for c in kept])
+        journal.append(commands[0])
+        journal.close()
+
+        _, journal = RoomJournal.recover(journal.path, _supersedes)
+        self.assertEqual(len(journal), len(kept) + 1)
+        journal.close()
+
+    def test_map_growth(self):
+        commands = [common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes([i]) * 10) for i in range(10)]
+        with mock.patch.object(room_journal, "MAP_GROWTH", 5 * commands[0].byte_size()):
+            journal = RoomJournal.create(self.directory, "room", {"a": 1})
+            for i, command in enumerate(commands):
+                journal.append(command)
+                self.assertEqual(journal[i].data, command.data)
+            # mapped every 5 commands, the last ones are read from the map
+            self.assertEqual(len(journal._unmapped), 0)
+            self.assertEqual([journal[i].data for i in range(10)], [command.data for command in commands])
+            journal.close()
+
+    def test_delete(self):
+        journal = RoomJournal.create(self.directory, "room", {"a": 1})
+        for i in range(3):
+            journal.append(common.Command(common.MessageType.BLENDER_DATA_UPDATE, bytes([i]) * 10))
+        journal.drop([0])
+        # the data of the commands read are not views on the map, which is closed before the file is deleted
+        kept = [journal[i] for i in range(len(journal))]
+        self.assertTrue(all(isinstance(command.data, bytes) for command in kept))
+        journal.delete()
+        self.assertEqual(list(self.directory.iterdir()), [])
+        self.assertEqual([command.data for command in kept], [bytes([1]) * 10, bytes([2]) * 10])
+
+
+if __name__ == "__main__":
+    unittest.main()